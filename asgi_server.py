@@ -0,0 +1,147 @@
+# asgi_server.py - ASGI模式的Web服务器（uvicorn + python-socketio 原生WebSocket）
+"""
+与 web_server 提供相同的 REST 接口和 Socket.IO 事件，区别在于：
+    - Socket.IO 连接由 AsyncServer 在事件循环中维护，空闲连接不占用线程
+    - uvicorn、Socket.IO 与 Agent 任务运行在同一个常驻事件循环（core.agent_runtime）上
+    - Flask 路由通过 WsgiToAsgi 挂载，在有上限的线程池中执行
+    - Socket 事件处理函数复用 web_server 中的实现，在线程池中执行以免阻塞事件循环
+
+依赖：pip install uvicorn asgiref python-socketio
+"""
+
+import asyncio
+import concurrent.futures
+import inspect
+import threading
+from typing import Any, Callable, Dict
+
+import flask
+import socketio as python_socketio
+import uvicorn
+from asgiref.wsgi import WsgiToAsgi
+
+import web_server
+from config import OUTPUT_FORMATS, ASGI_WS_PING_INTERVAL
+from core.agent_runtime import get_runtime
+
+
+class AsyncSocketBridge:
+    """把 web_server 中的同步Socket.IO调用转交给事件循环中的 AsyncServer"""
+
+    def __init__(self, sio: python_socketio.AsyncServer, loop: asyncio.AbstractEventLoop):
+        self.sio = sio
+        self.loop = loop
+
+    def _schedule(self, coro):
+        """在事件循环中执行（同一线程内按调用顺序排队，保证先入房间再发送）"""
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            self.loop.create_task(coro)
+        else:
+            asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def emit(self, event: str, data: Any = None, to: str = None):
+        self._schedule(self.sio.emit(event, data, to=to))
+
+    async def _call_room_method(self, method: Callable, sid: str, room: str):
+        result = method(sid, room)
+        if inspect.isawaitable(result):
+            await result
+
+    def enter_room(self, sid: str, room: str):
+        self._schedule(self._call_room_method(self.sio.enter_room, sid, room))
+
+    def leave_room(self, sid: str, room: str):
+        self._schedule(self._call_room_method(self.sio.leave_room, sid, room))
+
+    def start_background_task(self, target: Callable, *args) -> threading.Thread:
+        """阻塞型后台任务（任务调度、空闲回收）仍在独立线程中运行"""
+        thread = threading.Thread(target=target, args=args, daemon=True)
+        thread.start()
+        return thread
+
+
+def _request_environ(environ: Dict) -> Dict:
+    """补全Flask构造请求上下文所需的WSGI字段"""
+    environ = dict(environ)
+    environ.setdefault("wsgi.url_scheme", "http")
+    environ.setdefault("SERVER_NAME", "localhost")
+    environ.setdefault("SERVER_PORT", "80")
+    environ.setdefault("SCRIPT_NAME", "")
+    return environ
+
+
+def register_socket_handlers(sio: python_socketio.AsyncServer, loop: asyncio.AbstractEventLoop):
+    """把 web_server.socket_handlers 注册到 AsyncServer"""
+    environs: Dict[str, Dict] = {}
+
+    def call_in_context(handler: Callable, sid: str, args: tuple):
+        environ = environs.get(sid) or {}
+        with web_server.app.request_context(_request_environ(environ)):
+            # 与Flask-SocketIO一致：处理函数通过 request.sid 识别连接
+            flask.request.sid = sid
+            flask.request.namespace = "/"
+            return handler(*args)
+
+    def make_handler(event: str, handler: Callable):
+        param_count = len(inspect.signature(handler).parameters)
+
+        async def async_handler(sid, *args):
+            if event == "connect":
+                environs[sid] = args[0] if args else {}
+                args = ()
+            try:
+                return await loop.run_in_executor(None, call_in_context, handler, sid, args[:param_count])
+            finally:
+                if event == "disconnect":
+                    environs.pop(sid, None)
+
+        return async_handler
+
+    for event, handler in web_server.socket_handlers.items():
+        sio.on(event, make_handler(event, handler))
+
+
+def create_asgi_app(loop: asyncio.AbstractEventLoop):
+    """创建ASGI应用（Socket.IO + Flask），并让 web_server 改用异步桥接"""
+    sio = python_socketio.AsyncServer(
+        async_mode="asgi",
+        cors_allowed_origins="*",
+        ping_interval=ASGI_WS_PING_INTERVAL,
+        # 连接在connect处理函数执行前即建立，处理函数中的emit才能送达
+        always_connect=True
+    )
+    web_server.socket_bridge = AsyncSocketBridge(sio, loop)
+    register_socket_handlers(sio, loop)
+    return python_socketio.ASGIApp(sio, other_asgi_app=WsgiToAsgi(web_server.app))
+
+
+def run_asgi_server(path: str, thinking_mode: bool = False, port: int = 8091, host: str = "0.0.0.0"):
+    """以ASGI模式运行Web服务器（阻塞直到Ctrl+C）"""
+    runtime = get_runtime()
+    asgi_app = create_asgi_app(runtime.loop)
+    web_server.initialize_system(path, thinking_mode)
+
+    config = uvicorn.Config(asgi_app, host=host, port=port, log_level="warning", lifespan="off")
+    server = uvicorn.Server(config)
+    print(f"{OUTPUT_FORMATS['info']} ASGI模式：uvicorn 与 Agent 任务共享同一事件循环")
+
+    # uvicorn 运行在 Agent 运行时的事件循环上；主线程只负责等待和响应Ctrl+C
+    future = runtime.submit(server.serve())
+    try:
+        while not future.done():
+            try:
+                future.result(timeout=1)
+            except concurrent.futures.TimeoutError:
+                continue
+    except KeyboardInterrupt:
+        server.should_exit = True
+        future.result(timeout=10)
+    finally:
+        if web_server.session_registry is not None:
+            web_server.session_registry.close_all()
+        web_server.shutdown_multi_worker()
+        runtime.shutdown()
@@ -0,0 +1,18 @@
+# benchmarks - 离线性能基准（本地模拟LLM服务，不调用真实API）
+
+import tempfile
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+# 临时工作目录放在仓库内：FileManager 禁止访问 /tmp 等系统目录
+BENCH_TMP_ROOT = REPO_ROOT / ".bench_tmp"
+
+
+def make_workdir(prefix: str) -> Path:
+    """创建隔离的临时工作目录（含 project/ 与 data/）"""
+    BENCH_TMP_ROOT.mkdir(exist_ok=True)
+    workdir = Path(tempfile.mkdtemp(prefix=prefix, dir=BENCH_TMP_ROOT))
+    (workdir / "project").mkdir()
+    (workdir / "data").mkdir()
+    return workdir
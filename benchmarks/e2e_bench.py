@@ -0,0 +1,446 @@
+# benchmarks/e2e_bench.py - 端到端基准：用模拟LLM服务驱动Web任务循环和CLI主终端
+"""
+用法:
+    python -m benchmarks.e2e_bench --tasks 5 --output bench_e2e.json
+    python -m benchmarks.e2e_bench --target web --tokens-per-sec 300 --ttft-ms 200
+    python -m benchmarks.e2e_bench --check benchmarks/thresholds.json   # 超过阈值时退出码为1
+
+每个任务走完整脚本（create_file → append_to_file/APPEND → modify_file/MODIFY → 最终回复），
+运行在临时工作目录中（data/、prompts/ 均为副本），不会修改仓库内的数据。
+
+指标说明（每轮迭代）:
+    overhead_ms  迭代总耗时 - 模拟服务生成耗时 - 工具执行 - 界面节奏sleep
+                 即框架自身开销：token计算、持久化、广播、流解析等
+    sleep_ms     handle_task_with_sender 中的人为等待
+    persist_*    tracing 中 persist span 的次数与耗时
+    write_kb     进程写入字节数（/proc/self/io wchar，不可用时为null）
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import shutil
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from benchmarks import make_workdir
+from benchmarks.mock_llm_server import MockLLMServer
+from utils import tracing
+from utils.timeline import TaskTimeline
+
+
+# ----------------------------------------------------------------------
+# 采样工具
+# ----------------------------------------------------------------------
+
+def read_rss_bytes() -> Optional[int]:
+    """当前常驻内存（Linux读取/proc，其他平台退化为峰值RSS）"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except Exception:
+        return None
+
+
+def read_write_bytes() -> Optional[int]:
+    """进程累计写入字节数（含日志），不可用时返回None"""
+    try:
+        with open("/proc/self/io", "r") as f:
+            for line in f:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def dir_size(path: Path) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                continue
+    return total
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+def prepare_workdir() -> Path:
+    """创建临时工作目录：项目目录 + prompts副本 + 空data目录"""
+    workdir = make_workdir("e2e_")
+    prompts = REPO_ROOT / "prompts"
+    if prompts.exists():
+        shutil.copytree(prompts, workdir / "prompts")
+    return workdir
+
+
+def point_client_to_mock(api_client, base_url: str):
+    """让API客户端指向模拟服务"""
+    api_client.api_base_url = base_url
+    api_client.api_key = "bench"
+    api_client.headers["Authorization"] = "Bearer bench"
+
+
+# ----------------------------------------------------------------------
+# 时间线分析
+# ----------------------------------------------------------------------
+
+def _span_total(spans: List[Dict], kind: str, end_default: float) -> float:
+    total = 0.0
+    for span in spans:
+        if span["kind"] == kind:
+            end = span["end_ms"] if span["end_ms"] is not None else end_default
+            total += max(0.0, end - span["start_ms"])
+    return total
+
+
+def analyze_iterations(timeline: Dict, server_stats: List[Dict]) -> List[Dict]:
+    """把任务时间线和服务端记录对齐，计算每轮迭代的框架开销"""
+    rows = []
+    requests = iter(server_stats)
+    for it in timeline["iterations"]:
+        end_ms = it["end_ms"] if it["end_ms"] is not None else timeline["total_ms"]
+        wall_ms = end_ms - it["start_ms"]
+        tool_ms = _span_total(it["spans"], "tool", end_ms)
+        sleep_ms = _span_total(it["spans"], "sleep", end_ms)
+        save_ms = _span_total(it["spans"], "save", end_ms)
+        tokenize_ms = _span_total(it["spans"], "tokenize", end_ms)
+
+        server_ms = 0.0
+        if it["request_sent_ms"] is not None:
+            stat = next(requests, None)
+            server_ms = stat["server_ms"] if stat else 0.0
+
+        stream_ms = None
+        ttft_ms = None
+        if it["request_sent_ms"] is not None and it["last_byte_ms"] is not None:
+            stream_ms = it["last_byte_ms"] - it["request_sent_ms"]
+        if it["request_sent_ms"] is not None and it["first_byte_ms"] is not None:
+            ttft_ms = it["first_byte_ms"] - it["request_sent_ms"]
+
+        rows.append({
+            "iteration": it["iteration"],
+            "wall_ms": round(wall_ms, 3),
+            "server_ms": round(server_ms, 3),
+            "stream_ms": round(stream_ms, 3) if stream_ms is not None else None,
+            "ttft_ms": round(ttft_ms, 3) if ttft_ms is not None else None,
+            "tool_ms": round(tool_ms, 3),
+            "sleep_ms": round(sleep_ms, 3),
+            "save_ms": round(save_ms, 3),
+            "tokenize_ms": round(tokenize_ms, 3),
+            "overhead_ms": round(max(0.0, wall_ms - server_ms - tool_ms - sleep_ms), 3)
+        })
+    return rows
+
+
+def summarize(target: str, tasks: List[Dict], memory_start: Optional[int], memory_end: Optional[int],
+              workdir: Path, tracemalloc_growth: Optional[int]) -> Dict:
+    iterations = [row for task in tasks for row in task["iterations"]]
+    overheads = [row["overhead_ms"] for row in iterations]
+    total_iterations = len(iterations)
+    persist_count = sum(task["persist"]["count"] for task in tasks)
+    persist_ms = sum(task["persist"]["total_ms"] for task in tasks)
+    write_values = [task["write_bytes"] for task in tasks if task["write_bytes"] is not None]
+
+    memory_growth_mb = None
+    if memory_start is not None and memory_end is not None:
+        memory_growth_mb = round((memory_end - memory_start) / 1024 / 1024, 3)
+
+    def per_iteration(total: float) -> Optional[float]:
+        # 没有完成任何迭代时不给出按迭代平均的指标（由阈值检查判为失败）
+        return round(total / total_iterations, 3) if total_iterations else None
+
+    return {
+        "target": target,
+        "tasks": len(tasks),
+        "iterations": total_iterations,
+        "requests": sum(task["requests"] for task in tasks),
+        "errors": [f"task {task['task']}: {error}" for task in tasks for error in task["errors"]],
+        "overhead_ms_p50": round(percentile(overheads, 50), 3) if overheads else None,
+        "overhead_ms_p95": round(percentile(overheads, 95), 3) if overheads else None,
+        "overhead_ms_mean": round(statistics.fmean(overheads), 3) if overheads else None,
+        "sleep_ms_per_iteration": per_iteration(sum(r["sleep_ms"] for r in iterations)),
+        "save_ms_per_iteration": per_iteration(sum(r["save_ms"] for r in iterations)),
+        "tokenize_ms_per_iteration": per_iteration(sum(r["tokenize_ms"] for r in iterations)),
+        "persist_count_per_iteration": per_iteration(persist_count),
+        "persist_ms_per_iteration": per_iteration(persist_ms),
+        "write_kb_per_iteration": per_iteration(sum(write_values) / 1024) if write_values else None,
+        "memory_growth_mb": memory_growth_mb,
+        "tracemalloc_growth_mb": round(tracemalloc_growth / 1024 / 1024, 3) if tracemalloc_growth is not None else None,
+        "data_dir_kb": round(dir_size(workdir / "data") / 1024, 3)
+    }
+
+
+# ----------------------------------------------------------------------
+# 驱动器
+# ----------------------------------------------------------------------
+
+class _ErrorCollector(logging.Handler):
+    """收集任务期间被测系统记录的ERROR日志（任务循环内部捕获的异常只会写日志）"""
+
+    def __init__(self, errors: List[str]):
+        super().__init__(level=logging.ERROR)
+        self.errors = errors
+
+    def emit(self, record: logging.LogRecord):
+        self.errors.append(f"{record.name}: {record.getMessage()}")
+
+
+class _TaskProbe:
+    """单个任务前后的采样（persist span、写入字节、错误）"""
+
+    def __enter__(self):
+        self.errors: List[str] = []
+        self._collector = _ErrorCollector(self.errors)
+        logging.getLogger().addHandler(self._collector)
+        tracing.tracer.reset()
+        self.write_start = read_write_bytes()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.wall_ms = (time.perf_counter() - self.started) * 1000
+        write_end = read_write_bytes()
+        self.write_bytes = (write_end - self.write_start) if (write_end is not None and self.write_start is not None) else None
+        spans = tracing.get_metrics()["spans"]
+        self.persist = spans.get(tracing.SPAN_PERSIST, {"count": 0, "total_ms": 0.0})
+        logging.getLogger().removeHandler(self._collector)
+        if exc is not None:
+            # 记录异常后继续下一个任务，结果中该任务没有迭代
+            self.errors.append(f"{exc_type.__name__}: {exc}")
+            return True
+        return False
+
+
+def run_web(server: MockLLMServer, workdir: Path, tasks: int, thinking: bool) -> List[Dict]:
+    """驱动 web_server.handle_task_with_sender"""
+    import web_server
+    from core.agent_runtime import get_runtime
+    from core.web_terminal import WebTerminal
+
+    terminal = WebTerminal(
+        project_path=str(workdir / "project"),
+        thinking_mode=thinking,
+        message_callback=lambda event_type, data: None
+    )
+    point_client_to_mock(terminal.api_client, server.base_url)
+    terminal.create_new_conversation()
+
+    events: Dict[str, int] = {}
+
+    def sender(event_type, data):
+        events[event_type] = events.get(event_type, 0) + 1
+
+    # 与Web服务相同：任务在常驻运行时的事件循环中执行
+    runtime = get_runtime()
+    results = []
+    for i in range(tasks):
+        server.reset_stats()
+        timeline = None
+        with _TaskProbe() as probe:
+            runtime.run(web_server.handle_task_with_sender(terminal, f"benchmark task {i}", sender, "bench"))
+            timeline = terminal.context_manager.task_timeline
+            web_server.finish_task_timeline(terminal, "completed")
+
+        stats = server.take_stats()
+        results.append({
+            "task": i,
+            "wall_ms": round(probe.wall_ms, 3),
+            "iterations": analyze_iterations(timeline.to_dict(), stats) if timeline else [],
+            "requests": len(stats),
+            "errors": probe.errors,
+            "persist": probe.persist,
+            "write_bytes": probe.write_bytes
+        })
+    results[-1]["events"] = events
+    return results
+
+
+def run_cli(server: MockLLMServer, workdir: Path, tasks: int, thinking: bool) -> List[Dict]:
+    """驱动 MainTerminal.handle_task（CLI路径，按整个任务统计）"""
+    from core.main_terminal import MainTerminal
+
+    terminal = MainTerminal(project_path=str(workdir / "project"), thinking_mode=thinking)
+    point_client_to_mock(terminal.api_client, server.base_url)
+
+    results = []
+    for i in range(tasks):
+        message = f"benchmark task {i}"
+        server.reset_stats()
+        timeline = TaskTimeline(message)
+        terminal.context_manager.task_timeline = timeline
+        with _TaskProbe() as probe:
+            terminal._ensure_conversation()
+            terminal.context_manager.add_conversation("user", message)
+            asyncio.run(terminal.handle_task(message))
+        terminal.context_manager.task_timeline = None
+        timeline.finish("completed")
+
+        stats = server.take_stats()
+        timeline_data = timeline.to_dict()
+        server_ms = sum(s["server_ms"] for s in stats)
+        tool_ms = _span_total(timeline_data["task_spans"], "tool", timeline_data["total_ms"])
+        save_ms = _span_total(timeline_data["task_spans"], "save", timeline_data["total_ms"])
+        requests = max(1, len(stats))
+        # CLI没有迭代级时间线，按请求数平均
+        overhead = max(0.0, probe.wall_ms - server_ms - tool_ms) / requests
+        results.append({
+            "task": i,
+            "wall_ms": round(probe.wall_ms, 3),
+            "iterations": [{
+                "iteration": n + 1,
+                "wall_ms": round(probe.wall_ms / requests, 3),
+                "server_ms": round(stat["server_ms"], 3),
+                "stream_ms": None,
+                "ttft_ms": None,
+                "tool_ms": round(tool_ms / requests, 3),
+                "sleep_ms": 0.0,
+                "save_ms": round(save_ms / requests, 3),
+                "tokenize_ms": 0.0,
+                "overhead_ms": round(overhead, 3)
+            } for n, stat in enumerate(stats)],
+            "requests": len(stats),
+            "errors": probe.errors,
+            "persist": probe.persist,
+            "write_bytes": probe.write_bytes
+        })
+    return results
+
+
+def check_thresholds(summaries: List[Dict], thresholds: Dict) -> List[str]:
+    """返回所有超过阈值的指标描述；任务出错或没有跑完任何迭代的目标直接判为失败"""
+    failures = []
+    for summary in summaries:
+        target = summary["target"]
+        if summary["errors"]:
+            failures.append(f"{target}: {len(summary['errors'])} 个任务错误，首个: {summary['errors'][0]}")
+        if not summary["requests"]:
+            failures.append(f"{target}: 模拟服务没有收到任何请求")
+        if not summary["iterations"]:
+            failures.append(f"{target}: 没有完成任何迭代，指标无效")
+            continue
+        limits = thresholds.get(target, {})
+        for metric, limit in limits.items():
+            value = summary.get(metric)
+            if value is None:
+                continue
+            if value > limit:
+                failures.append(f"{target}.{metric} = {value} > {limit}")
+    return failures
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="端到端离线基准（模拟LLM服务）")
+    parser.add_argument("--target", choices=["web", "cli", "all"], default="all")
+    parser.add_argument("--tasks", type=int, default=3, help="每个目标运行的任务数")
+    parser.add_argument("--thinking", action="store_true", help="开启思考模式（首轮输出thinking内容）")
+    parser.add_argument("--tokens-per-sec", type=float, default=0, help="模拟输出速率，0为不限速")
+    parser.add_argument("--chunk-tokens", type=int, default=4)
+    parser.add_argument("--ttft-ms", type=float, default=0)
+    parser.add_argument("--append-lines", type=int, default=200)
+    parser.add_argument("--modify-blocks", type=int, default=5)
+    parser.add_argument("--tracemalloc", action="store_true", help="额外记录Python堆增长（会拖慢运行）")
+    parser.add_argument("--output", help="JSON结果输出路径（默认输出到stdout）")
+    parser.add_argument("--check", help="阈值文件，超过任一阈值时退出码为1")
+    parser.add_argument("--verbose", action="store_true", help="保留被测系统的控制台输出")
+    args = parser.parse_args(argv)
+
+    server = MockLLMServer(
+        tokens_per_sec=args.tokens_per_sec,
+        chunk_tokens=args.chunk_tokens,
+        ttft_ms=args.ttft_ms,
+        append_lines=args.append_lines,
+        modify_blocks=args.modify_blocks
+    ).start()
+
+    workdir = prepare_workdir()
+    original_cwd = os.getcwd()
+    tracing.tracer.set_enabled(True)
+    if args.tracemalloc:
+        import tracemalloc
+        tracemalloc.start()
+
+    targets = ["web", "cli"] if args.target == "all" else [args.target]
+    runners = {"web": run_web, "cli": run_cli}
+    summaries = []
+    details = {}
+
+    try:
+        # DATA_DIR / PROMPTS_DIR 都是相对路径，切换到临时目录后即隔离
+        os.chdir(workdir)
+        for target in targets:
+            traced_start = tracemalloc.get_traced_memory()[0] if args.tracemalloc else None
+            memory_start = read_rss_bytes()
+            sink = contextlib.nullcontext() if args.verbose else open(os.devnull, "w")
+            with sink as devnull:
+                redirect = contextlib.redirect_stdout(devnull) if devnull else contextlib.nullcontext()
+                with redirect:
+                    tasks = runners[target](server, workdir, args.tasks, args.thinking)
+            memory_end = read_rss_bytes()
+            traced_growth = (tracemalloc.get_traced_memory()[0] - traced_start) if args.tracemalloc else None
+            summaries.append(summarize(target, tasks, memory_start, memory_end, workdir, traced_growth))
+            details[target] = tasks
+    finally:
+        os.chdir(original_cwd)
+        server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": vars(args),
+        "summary": summaries,
+        "details": details
+    }
+
+    failures = []
+    if args.check:
+        with open(args.check, "r", encoding="utf-8") as f:
+            failures = check_thresholds(summaries, json.load(f))
+        report["threshold_failures"] = failures
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        for summary in summaries:
+            print(json.dumps(summary, ensure_ascii=False))
+    else:
+        print(text)
+
+    for summary in summaries:
+        for error in summary["errors"]:
+            print(f"⚠️ {summary['target']} 任务错误: {error}", file=sys.stderr)
+    for failure in failures:
+        print(f"❌ 超过阈值: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
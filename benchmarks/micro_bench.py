@@ -0,0 +1,369 @@
+# benchmarks/micro_bench.py - 热点函数微基准（合成数据，输出JSON便于跨版本对比）
+"""
+用法:
+    python -m benchmarks.micro_bench --output bench_micro.json
+    python -m benchmarks.micro_bench --filter conversation --rounds 10
+    python -m benchmarks.micro_bench --quick          # 缩小数据规模，用于快速自检
+
+覆盖:
+    ConversationManager.save_conversation       10 / 1k / 10k 条消息
+    ConversationManager.get_conversation_list   10k 条索引
+    ContextManager.calculate_input_tokens       1k 条消息 + 工具定义
+    ContextManager.get_project_structure        生成的 50k 文件目录树
+    FileManager.apply_modify_blocks             5MB 文件 + 200 个替换块
+    PersistentTerminal._process_output          高速逐行写入缓冲区
+
+结果格式与 pytest-benchmark 的 JSON 接近：每项包含 name/group/params/stats。
+某项依赖缺失（如 tiktoken）时记录 error 并继续执行其余项。
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import time
+import traceback
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from benchmarks import make_workdir
+
+
+# ----------------------------------------------------------------------
+# 计时框架
+# ----------------------------------------------------------------------
+
+_CASES: List[Dict] = []
+
+
+def case(group: str, name: str, **params):
+    """注册一个基准用例；被装饰函数接收(workdir, scale)并返回 (setup, run) 或 run"""
+    def decorator(func: Callable):
+        _CASES.append({"group": group, "name": name, "params": params, "factory": func})
+        return func
+    return decorator
+
+
+def measure(run: Callable, setup: Optional[Callable], rounds: int, warmup: int) -> Dict:
+    """执行warmup+rounds次，setup不计时"""
+    timings = []
+    for i in range(warmup + rounds):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+        if i >= warmup:
+            timings.append(elapsed)
+
+    return {
+        "rounds": len(timings),
+        "min": min(timings),
+        "max": max(timings),
+        "mean": statistics.fmean(timings),
+        "median": statistics.median(timings),
+        "stddev": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        "data": timings
+    }
+
+
+# ----------------------------------------------------------------------
+# 合成数据
+# ----------------------------------------------------------------------
+
+def make_messages(count: int) -> List[Dict]:
+    """生成接近真实分布的对话：用户提问、带工具调用的助手回复、工具结果"""
+    messages = []
+    base = datetime(2024, 1, 1)
+    tool_result = json.dumps({
+        "success": True,
+        "path": "src/app.py",
+        "content": "def handler(event):\n    return process(event)\n" * 20
+    }, ensure_ascii=False)
+
+    i = 0
+    while len(messages) < count:
+        timestamp = (base + timedelta(seconds=i)).isoformat()
+        kind = i % 4
+        if kind == 0:
+            messages.append({"role": "user", "content": f"请帮我实现第{i}个功能，并补充测试。", "timestamp": timestamp})
+        elif kind == 1:
+            messages.append({
+                "role": "assistant",
+                "content": "我先读取相关文件，然后修改实现。" * 5,
+                "timestamp": timestamp,
+                "tool_calls": [{
+                    "id": f"call_{i}",
+                    "type": "function",
+                    "function": {"name": "read_file", "arguments": json.dumps({"path": "src/app.py"})}
+                }]
+            })
+        elif kind == 2:
+            messages.append({
+                "role": "tool",
+                "content": tool_result,
+                "timestamp": timestamp,
+                "tool_call_id": f"call_{i - 1}",
+                "name": "read_file"
+            })
+        else:
+            messages.append({"role": "assistant", "content": "修改完成，已更新实现并补充说明。" * 10, "timestamp": timestamp})
+        i += 1
+    return messages
+
+
+def make_tools(count: int = 19) -> List[Dict]:
+    """生成与 define_tools 规模相近的工具定义"""
+    return [{
+        "type": "function",
+        "function": {
+            "name": f"tool_{i}",
+            "description": "示例工具描述，用于估算工具定义的token开销。" * 4,
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "path": {"type": "string", "description": "目标文件路径"},
+                    "content": {"type": "string", "description": "写入内容"},
+                    "mode": {"type": "string", "enum": ["w", "a"], "description": "写入模式"}
+                },
+                "required": ["path"]
+            }
+        }
+    } for i in range(count)]
+
+
+def make_file_tree(root: Path, total_files: int):
+    """生成多层目录树（每个目录约100个文件）"""
+    per_dir = 100
+    dirs = max(1, total_files // per_dir)
+    created = 0
+    for d in range(dirs):
+        folder = root / f"pkg_{d // 50:03d}" / f"mod_{d % 50:03d}"
+        folder.mkdir(parents=True, exist_ok=True)
+        for f in range(per_dir):
+            if created >= total_files:
+                return
+            (folder / f"file_{f:03d}.py").write_bytes(b"")
+            created += 1
+
+
+# ----------------------------------------------------------------------
+# 用例
+# ----------------------------------------------------------------------
+
+def _scaled(value: int, scale: float) -> int:
+    return max(1, int(value * scale))
+
+
+def _register_save_conversation(count: int):
+    @case("conversation", f"save_conversation[{count}]", messages=count)
+    def save_conversation(workdir: Path, scale: float):
+        from utils.conversation_manager import ConversationManager
+
+        manager = ConversationManager()
+        conversation_id = manager.create_conversation(project_path=str(workdir / "project"))
+        messages = make_messages(max(10, _scaled(count, scale)))
+
+        def run():
+            manager.save_conversation(conversation_id, messages)
+        return None, run
+
+
+for _count in (10, 1000, 10000):
+    _register_save_conversation(_count)
+
+
+@case("conversation", "get_conversation_list[10k]", index_entries=10000)
+def get_conversation_list(workdir: Path, scale: float):
+    from utils.conversation_manager import ConversationManager
+
+    manager = ConversationManager()
+    base = datetime(2024, 1, 1)
+    index = {}
+    for i in range(_scaled(10000, scale)):
+        stamp = (base + timedelta(minutes=i)).isoformat()
+        index[f"conv_bench_{i:05d}"] = {
+            "title": f"基准对话 {i}",
+            "created_at": stamp,
+            "updated_at": stamp,
+            "project_path": str(workdir / "project"),
+            "thinking_mode": bool(i % 2),
+            "total_messages": i % 200,
+            "total_tools": i % 50,
+            "status": "active"
+        }
+    manager._save_index(index)
+
+    def run():
+        manager.get_conversation_list(limit=20, offset=0)
+    return None, run
+
+
+@case("context", "calculate_input_tokens[1k]", messages=1000, tools=19)
+def calculate_input_tokens(workdir: Path, scale: float):
+    from utils.context_manager import ContextManager
+
+    context_manager = ContextManager(str(workdir / "project"))
+    if not context_manager.tokenizer.available:
+        raise RuntimeError("tokenizer不可用")
+    messages = make_messages(_scaled(1000, scale))
+    tools = make_tools()
+
+    def run():
+        context_manager.calculate_input_tokens(messages, tools)
+    return None, run
+
+
+@case("context", "get_project_structure[50k]", files=50000)
+def get_project_structure(workdir: Path, scale: float):
+    from utils.context_manager import ContextManager
+
+    tree_root = workdir / "tree_project"
+    make_file_tree(tree_root, _scaled(50000, scale))
+    context_manager = ContextManager(str(tree_root))
+
+    def run():
+        context_manager.get_project_structure(refresh=True)
+    return None, run
+
+
+@case("file", "apply_modify_blocks[5MB,200]", size_mb=5, blocks=200)
+def apply_modify_blocks(workdir: Path, scale: float):
+    from modules.file_manager import FileManager
+
+    project = workdir / "project"
+    target = project / "big.txt"
+    line = "x" * 90
+    total_lines = _scaled(5 * 1024 * 1024, scale) // (len(line) + 12)
+    content = "".join(f"{i:010d} {line}\n" for i in range(total_lines))
+    block_count = min(200, total_lines)
+    step = max(1, total_lines // block_count)
+    blocks = [{
+        "index": n + 1,
+        "old": f"{n * step:010d} {line}\n",
+        "new": f"{n * step:010d} modified\n"
+    } for n in range(block_count)]
+    manager = FileManager(str(project))
+
+    def setup():
+        target.write_text(content, encoding="utf-8")
+
+    def run():
+        result = manager.apply_modify_blocks("big.txt", blocks)
+        if not result.get("success"):
+            raise RuntimeError(result.get("error") or "apply_modify_blocks失败")
+    return setup, run
+
+
+@case("terminal", "persistent_terminal_buffer[100k lines]", lines=100000)
+def persistent_terminal_buffer(workdir: Path, scale: float):
+    from config import TERMINAL_BUFFER_SIZE, TERMINAL_DISPLAY_SIZE
+    from modules.persistent_terminal import PersistentTerminal
+
+    lines = [f"[{i:06d}] build step output with some typical width for compiler logs\n"
+             for i in range(_scaled(100000, scale))]
+    holder = {}
+
+    def setup():
+        holder["terminal"] = PersistentTerminal(
+            session_name="bench",
+            working_dir=str(workdir / "project"),
+            max_buffer_size=TERMINAL_BUFFER_SIZE,
+            display_size=TERMINAL_DISPLAY_SIZE
+        )
+
+    def run():
+        terminal = holder["terminal"]
+        for text in lines:
+            terminal._process_output(text)
+        terminal.get_output(50)
+        terminal.get_display_output()
+    return setup, run
+
+
+# ----------------------------------------------------------------------
+# 入口
+# ----------------------------------------------------------------------
+
+def run_cases(selected: List[Dict], rounds: int, warmup: int, scale: float, verbose: bool) -> List[Dict]:
+    results = []
+    for entry in selected:
+        workdir = make_workdir("micro_")
+        original_cwd = os.getcwd()
+        record = {"name": entry["name"], "group": entry["group"], "params": dict(entry["params"], scale=scale)}
+        try:
+            # DATA_DIR 为相对路径，切换目录即可隔离数据
+            os.chdir(workdir)
+            with open(os.devnull, "w") as devnull:
+                stdout = sys.stdout
+                if not verbose:
+                    sys.stdout = devnull
+                try:
+                    built = entry["factory"](workdir, scale)
+                    setup, run = built if isinstance(built, tuple) else (None, built)
+                    record["stats"] = measure(run, setup, rounds, warmup)
+                finally:
+                    sys.stdout = stdout
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+            if verbose:
+                traceback.print_exc()
+        finally:
+            os.chdir(original_cwd)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        if "stats" in record:
+            print(f"{record['name']:<45} median {record['stats']['median'] * 1000:10.3f} ms", file=sys.stderr)
+        else:
+            print(f"{record['name']:<45} 跳过: {record['error']}", file=sys.stderr)
+        results.append(record)
+    return results
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="热点函数微基准")
+    parser.add_argument("--filter", help="只运行名称或分组包含该字符串的用例")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--quick", action="store_true", help="数据规模缩小到1/10")
+    parser.add_argument("--output", help="JSON结果输出路径（默认输出到stdout）")
+    parser.add_argument("--verbose", action="store_true", help="保留被测代码的控制台输出")
+    args = parser.parse_args(argv)
+
+    selected = [
+        entry for entry in _CASES
+        if not args.filter or args.filter in entry["name"] or args.filter == entry["group"]
+    ]
+    scale = 0.1 if args.quick else 1.0
+    benchmarks = run_cases(selected, args.rounds, args.warmup, scale, args.verbose)
+
+    report = {
+        "machine_info": {
+            "python_version": platform.python_version(),
+            "python_implementation": platform.python_implementation(),
+            "system": platform.system(),
+            "machine": platform.machine(),
+            "processor": platform.processor()
+        },
+        "datetime": datetime.now().isoformat(),
+        "benchmarks": benchmarks
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,296 @@
+# benchmarks/mock_llm_server.py - 本地OpenAI兼容模拟服务（按脚本流式返回SSE）
+"""
+用法（单独启动，供手动调试）:
+    python -m benchmarks.mock_llm_server --port 18091 --tokens-per-sec 200
+
+服务只实现 POST /chat/completions（stream=True）以及 GET /stats。
+每个任务按脚本分轮返回：创建文件 → 追加(APPEND) → 修改(MODIFY) → 最终回复，
+轮次由请求中最后一条user消息之后的assistant消息数决定，因此服务本身无状态。
+"""
+
+import argparse
+import hashlib
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+# 每个"token"近似的字符数（仅用于控制输出速率）
+CHARS_PER_TOKEN = 4
+
+
+class ScriptTurn:
+    """脚本中的一轮模型输出"""
+
+    def __init__(self, content: str = "", tool_calls: List[Dict] = None, thinking: str = ""):
+        self.content = content
+        self.tool_calls = tool_calls or []
+        self.thinking = thinking
+
+
+def _task_file_path(user_message: str) -> str:
+    """根据用户消息生成任务专属的文件路径，保证多个任务互不干扰"""
+    digest = hashlib.sha1(user_message.encode("utf-8")).hexdigest()[:8]
+    return f"bench/task_{digest}.txt"
+
+
+def build_default_script(user_message: str, append_lines: int = 200, modify_blocks: int = 5) -> List[ScriptTurn]:
+    """
+    默认任务脚本
+
+    Args:
+        user_message: 本次任务的用户消息（用于生成文件路径）
+        append_lines: APPEND正文行数
+        modify_blocks: MODIFY替换块数量
+    """
+    path = _task_file_path(user_message)
+    body = "\n".join(f"line {i:04d}: benchmark payload for append streaming" for i in range(append_lines))
+
+    blocks = []
+    for i in range(min(modify_blocks, append_lines)):
+        blocks.append(
+            f"[replace:{i + 1}]\n"
+            f"<<OLD>>\nline {i:04d}: benchmark payload for append streaming\n<<END>>\n"
+            f"<<NEW>>\nline {i:04d}: modified by benchmark\n<<END>>\n"
+            f"[/replace]"
+        )
+
+    return [
+        ScriptTurn(
+            content="先创建文件。",
+            tool_calls=[{
+                "name": "create_file",
+                "arguments": {"path": path, "file_type": "txt", "annotation": "benchmark"}
+            }]
+        ),
+        ScriptTurn(tool_calls=[{"name": "append_to_file", "arguments": {"path": path}}]),
+        ScriptTurn(content=f"<<<APPEND:{path}>>>\n{body}\n<<<END_APPEND>>>"),
+        ScriptTurn(tool_calls=[{"name": "modify_file", "arguments": {"path": path}}]),
+        ScriptTurn(content=f"<<<MODIFY:{path}>>>\n" + "\n".join(blocks) + "\n<<<END_MODIFY>>>"),
+        ScriptTurn(content="任务完成：文件已创建、追加并修改。")
+    ]
+
+
+class MockLLMServer:
+    """
+    在后台线程中运行的模拟LLM服务
+
+    Args:
+        host/port: 监听地址，port为0时自动分配
+        tokens_per_sec: 输出速率，0表示不限速
+        chunk_tokens: 每个SSE块包含的token数
+        ttft_ms: 首字节延迟
+        thinking_chars: 请求开启thinking时输出的思考字符数
+        append_lines / modify_blocks: 默认脚本参数
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        tokens_per_sec: float = 0,
+        chunk_tokens: int = 4,
+        ttft_ms: float = 0,
+        thinking_chars: int = 400,
+        append_lines: int = 200,
+        modify_blocks: int = 5
+    ):
+        self.tokens_per_sec = tokens_per_sec
+        self.chunk_tokens = max(1, chunk_tokens)
+        self.ttft_ms = ttft_ms
+        self.thinking_chars = thinking_chars
+        self.append_lines = append_lines
+        self.modify_blocks = modify_blocks
+
+        # 每个请求的服务端耗时记录（按到达顺序）
+        self.stats: List[Dict] = []
+        self._stats_lock = threading.Lock()
+
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockLLMServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self.stats = []
+
+    def take_stats(self) -> List[Dict]:
+        """取出并清空请求记录"""
+        with self._stats_lock:
+            stats, self.stats = self.stats, []
+        return stats
+
+    # ------------------------------------------------------------------
+    # 脚本选择与SSE生成
+    # ------------------------------------------------------------------
+
+    def select_turn(self, payload: Dict) -> ScriptTurn:
+        """根据请求中的消息确定当前轮次"""
+        messages = payload.get("messages", [])
+        last_user = -1
+        for i, msg in enumerate(messages):
+            if msg.get("role") == "user":
+                last_user = i
+        user_message = messages[last_user].get("content", "") if last_user >= 0 else ""
+        turn_index = sum(1 for msg in messages[last_user + 1:] if msg.get("role") == "assistant")
+
+        script = build_default_script(user_message, self.append_lines, self.modify_blocks)
+        turn = script[min(turn_index, len(script) - 1)]
+
+        thinking_enabled = (payload.get("thinking") or {}).get("type") == "enabled"
+        if thinking_enabled and self.thinking_chars > 0:
+            seed = "分析任务需求，规划工具调用顺序。"
+            thinking = (seed * (self.thinking_chars // len(seed) + 1))[:self.thinking_chars]
+            turn = ScriptTurn(turn.content, turn.tool_calls, thinking)
+        return turn
+
+    def _pieces(self, text: str) -> List[str]:
+        size = CHARS_PER_TOKEN * self.chunk_tokens
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    def iter_chunks(self, turn: ScriptTurn, model: str):
+        """生成OpenAI格式的chunk字典"""
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+
+        def make(delta: Dict, finish_reason: str = None) -> Dict:
+            return {
+                "id": chunk_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+
+        for piece in self._pieces(turn.thinking):
+            yield make({"reasoning_content": piece}), len(piece)
+        for piece in self._pieces(turn.content):
+            yield make({"content": piece}), len(piece)
+        for index, call in enumerate(turn.tool_calls):
+            arguments = json.dumps(call["arguments"], ensure_ascii=False)
+            yield make({"tool_calls": [{
+                "index": index,
+                "id": f"call_{uuid.uuid4().hex[:16]}",
+                "type": "function",
+                "function": {"name": call["name"], "arguments": ""}
+            }]}), 0
+            for piece in self._pieces(arguments):
+                yield make({"tool_calls": [{"index": index, "function": {"arguments": piece}}]}), len(piece)
+
+        yield make({}, "tool_calls" if turn.tool_calls else "stop"), 0
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.rstrip("/") != "/stats":
+                    self.send_error(404)
+                    return
+                with server._stats_lock:
+                    body = json.dumps(server.stats).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+
+                started = time.perf_counter()
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                turn = server.select_turn(payload)
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+
+                if server.ttft_ms > 0:
+                    time.sleep(server.ttft_ms / 1000)
+
+                sent_bytes = 0
+                sent_chars = 0
+                try:
+                    for chunk, chars in server.iter_chunks(turn, payload.get("model", "mock")):
+                        data = f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8")
+                        self.wfile.write(data)
+                        self.wfile.flush()
+                        sent_bytes += len(data)
+                        sent_chars += chars
+                        if server.tokens_per_sec > 0 and chars:
+                            time.sleep(chars / CHARS_PER_TOKEN / server.tokens_per_sec)
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    # 客户端提前中断（如检测到END_APPEND后停止读取）
+                    pass
+
+                with server._stats_lock:
+                    server.stats.append({
+                        "server_ms": round((time.perf_counter() - started) * 1000, 3),
+                        "bytes": sent_bytes,
+                        "chars": sent_chars,
+                        "tool_calls": len(turn.tool_calls),
+                        "thinking": bool(turn.thinking)
+                    })
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地OpenAI兼容模拟LLM服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18091)
+    parser.add_argument("--tokens-per-sec", type=float, default=0, help="输出速率，0为不限速")
+    parser.add_argument("--chunk-tokens", type=int, default=4, help="每个SSE块的token数")
+    parser.add_argument("--ttft-ms", type=float, default=0, help="首字节延迟（毫秒）")
+    parser.add_argument("--thinking-chars", type=int, default=400)
+    parser.add_argument("--append-lines", type=int, default=200)
+    parser.add_argument("--modify-blocks", type=int, default=5)
+    args = parser.parse_args()
+
+    server = MockLLMServer(
+        host=args.host,
+        port=args.port,
+        tokens_per_sec=args.tokens_per_sec,
+        chunk_tokens=args.chunk_tokens,
+        ttft_ms=args.ttft_ms,
+        thinking_chars=args.thinking_chars,
+        append_lines=args.append_lines,
+        modify_blocks=args.modify_blocks
+    ).start()
+    print(f"模拟LLM服务已启动: {server.base_url}（Ctrl+C 退出）")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
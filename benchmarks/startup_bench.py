@@ -0,0 +1,181 @@
+# benchmarks/startup_bench.py - 冷启动基准：导入耗时分解 + Web服务就绪时间
+"""
+用法:
+    python -m benchmarks.startup_bench --output bench_startup.json
+    python -m benchmarks.startup_bench --top 30                          # 显示更多耗时最多的模块
+    python -m benchmarks.startup_bench --check benchmarks/thresholds.json   # 超过阈值时退出码为1
+
+每一轮都在新的子进程中测量（避免模块缓存）:
+    imports   python -X importtime -c "import web_server"，按模块自身耗时排序，并按顶层包汇总
+    ready     导入 web_server → initialize_system → 创建第一个WebTerminal → 首次 get_status
+              （即浏览器打开页面时的首个请求），各阶段耗时与总耗时
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from benchmarks import make_workdir
+
+# 在子进程中执行：工作目录为临时目录（DATA_DIR等相对路径落在其中）
+READY_SCRIPT = r"""
+import json, os, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {repo!r})
+marks = {{}}
+def mark(name):
+    marks[name] = round((time.perf_counter() - started) * 1000, 1)
+import contextlib, io
+with contextlib.redirect_stdout(io.StringIO()):
+    import web_server
+    mark("import")
+    web_server.initialize_system({project!r}, False)
+    mark("initialize")
+    terminal = web_server.session_registry.get("bench")
+    mark("first_terminal")
+    terminal.get_status()
+    mark("first_status")
+sys.stdout.write(json.dumps(marks) + "\n")
+sys.stdout.flush()
+os._exit(0)
+"""
+
+
+def parse_importtime(stderr: str) -> List[Dict]:
+    """解析 -X importtime 输出：[{module, self_us, cumulative_us, depth}]"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3:
+            continue
+        self_us, cumulative_us, name = fields
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append({
+            "module": name.strip(),
+            "self_us": int(self_us),
+            "cumulative_us": int(cumulative_us),
+            "depth": depth
+        })
+    return entries
+
+
+def measure_imports(module: str, top: int) -> Dict:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "导入失败")
+    entries = parse_importtime(result.stderr)
+    # 按顶层包汇总自身耗时（第三方依赖 vs 项目模块一目了然）
+    packages: Dict[str, int] = {}
+    for entry in entries:
+        package = entry["module"].split(".")[0]
+        packages[package] = packages.get(package, 0) + entry["self_us"]
+    total_us = sum(entry["self_us"] for entry in entries)
+    return {
+        "total_ms": round(total_us / 1000, 1),
+        "modules": len(entries),
+        "top_modules": [
+            {"module": e["module"], "self_ms": round(e["self_us"] / 1000, 1), "cumulative_ms": round(e["cumulative_us"] / 1000, 1)}
+            for e in sorted(entries, key=lambda e: e["self_us"], reverse=True)[:top]
+        ],
+        "top_packages": [
+            {"package": name, "self_ms": round(us / 1000, 1)}
+            for name, us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+        ]
+    }
+
+
+def measure_ready(rounds: int) -> Dict:
+    runs = []
+    for _ in range(rounds):
+        workdir = make_workdir("startup_")
+        prompts = REPO_ROOT / "prompts"
+        if prompts.exists():
+            shutil.copytree(prompts, workdir / "prompts")
+        try:
+            script = READY_SCRIPT.format(repo=str(REPO_ROOT), project=str(workdir / "project"))
+            started = time.perf_counter()
+            result = subprocess.run(
+                [sys.executable, "-c", script], cwd=workdir, capture_output=True, text=True, timeout=120
+            )
+            wall_ms = round((time.perf_counter() - started) * 1000, 1)
+            if result.returncode != 0 or not result.stdout.strip():
+                raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "子进程失败")
+            marks = json.loads(result.stdout.strip().splitlines()[-1])
+            marks["process_wall"] = wall_ms
+            runs.append(marks)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    summary = {name: statistics.median(run[name] for run in runs) for name in runs[0]}
+    return {"median_ms": summary, "runs": runs}
+
+
+def check_thresholds(summary: Dict, thresholds: Dict) -> List[str]:
+    """thresholds.json 中 startup 一节：time_to_ready_ms（首次status完成）、import_ms"""
+    limits = thresholds.get("startup", {})
+    values = {
+        "time_to_ready_ms": summary.get("ready", {}).get("median_ms", {}).get("first_status"),
+        "import_ms": summary.get("ready", {}).get("median_ms", {}).get("import")
+    }
+    failures = []
+    for metric, limit in limits.items():
+        value = values.get(metric)
+        if value is not None and value > limit:
+            failures.append(f"startup.{metric} = {value} > {limit}")
+    return failures
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="冷启动基准（导入耗时分解 + Web服务就绪时间）")
+    parser.add_argument("--module", default="web_server", help="分析导入耗时的入口模块")
+    parser.add_argument("--rounds", type=int, default=3, help="就绪时间测量轮数（取中位数）")
+    parser.add_argument("--top", type=int, default=15, help="列出耗时最多的模块/包数量")
+    parser.add_argument("--output", help="JSON结果输出路径（默认输出到stdout）")
+    parser.add_argument("--check", help="阈值文件，超过任一阈值时退出码为1")
+    args = parser.parse_args(argv)
+
+    report = {"generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "config": vars(args)}
+    for name, func in (("imports", lambda: measure_imports(args.module, args.top)),
+                       ("ready", lambda: measure_ready(args.rounds))):
+        try:
+            report[name] = func()
+        except Exception as e:
+            report[name] = {"error": str(e)}
+
+    failures = []
+    if args.check:
+        with open(args.check, "r", encoding="utf-8") as f:
+            failures = check_thresholds(report, json.load(f))
+        report["threshold_failures"] = failures
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(json.dumps(report.get("ready", {}).get("median_ms", report.get("ready")), ensure_ascii=False))
+    else:
+        print(text)
+
+    for failure in failures:
+        print(f"❌ 超过阈值: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
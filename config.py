@@ -38,6 +38,14 @@ TERMINAL_BUFFER_SIZE =100000  # 每个终端的最大缓冲区大小（字符）
 TERMINAL_DISPLAY_SIZE = 50000  # 终端显示大小限制（字符）
 TERMINAL_TIMEOUT = 300  # 终端空闲超时（秒）
 TERMINAL_OUTPUT_WAIT = 5  # 等待终端输出的默认时间（秒）
+TERMINAL_POOL_ENABLED = True  # 是否预启动空闲shell供 terminal_session open 直接取用
+TERMINAL_POOL_SIZE = 1  # 每个工作目录保留的空闲shell数量（0表示不使用终端池）
+TERMINAL_POOL_MAX_IDLE = 3  # 每个终端管理器最多保留的空闲shell总数
+TERMINAL_IDLE_ACTION = "hibernate"  # 终端空闲超过 TERMINAL_TIMEOUT 后：hibernate（结束shell进程、保留输出，下次发送命令时重新启动）/ close / none
+TERMINAL_SUPERVISOR_INTERVAL = 30  # 空闲终端检查间隔（秒）
+TERMINAL_LIMIT_CPU_SECONDS = 0  # 终端中每个进程的CPU时间上限（秒，RLIMIT_CPU），0表示不限制
+TERMINAL_LIMIT_MEMORY_MB = 0  # 终端中每个进程的虚拟地址空间上限（MB，RLIMIT_AS），0表示不限制；限制的是地址空间而非实际占用(RSS)，Node/WebAssembly、JVM等预留大块地址空间的程序会启动失败
+TERMINAL_LIMIT_PROCESSES = 0  # 运行用户的进程数上限（RLIMIT_NPROC，按用户计数），0表示不限制
 
 # 在 config.py 中添加以下配置项
 
@@ -165,7 +173,94 @@ CONVERSATION_INDEX_UPDATE_BATCH_SIZE = 100  # 批量更新索引的大小
 MAX_READ_FILE_CHARS = 30000      # read_file工具限制
 MAX_FOCUS_FILE_CHARS = 30000     # focus_file工具限制  
 MAX_RUN_COMMAND_CHARS = 10000    # run_command工具限制
+RUN_COMMAND_READ_CHUNK = 4096    # run_command/run_python 每次从输出管道读取的字节数
+RUN_COMMAND_STREAM_INTERVAL = 0.2  # 执行中的输出推送到界面的最小间隔（秒）
 MAX_EXTRACT_WEBPAGE_CHARS = 80000 # extract_webpage工具限制
 
 # 模型调用相关
 DEFAULT_RESPONSE_MAX_TOKENS = 16384  # 每次API响应的默认最大tokens，可在此调整
+STREAM_INCLUDE_USAGE = True  # 流式请求附带 stream_options.include_usage，使用服务端返回的用量统计token（服务端不支持时可关闭，改用本地估算）
+
+# ==========================================
+# 性能追踪配置
+# ==========================================
+TRACING_ENABLED = False  # 是否启用span追踪（关闭时为空操作，开启后通过 /api/metrics 查看）
+TASK_TIMELINE_MAX_PER_CONVERSATION = 20  # 每个对话元数据中保留的任务时间线数量
+
+# ==========================================
+# 多会话配置（Web模式）
+# ==========================================
+MAX_SESSIONS = 20  # 单进程最多保留的会话数（每个客户端一个独立的WebTerminal）
+SESSION_IDLE_TIMEOUT = 1800  # 会话无连接且无任务超过该秒数后被回收
+SESSION_REAP_INTERVAL = 60  # 空闲会话回收检查间隔（秒）
+SESSION_MEMORY_LIMIT_MB = 256  # 单会话内存估算上限（对话历史+聚焦文件+终端缓冲，按UTF-8字节计）
+MAX_CONCURRENT_TASKS = 4  # 同时执行的任务数（同一会话内串行，会话之间轮转）
+MAX_CONCURRENT_LLM_STREAMS = 4  # 同时进行的LLM流式请求数（超出时等待，不占用API并发）
+
+# ==========================================
+# Web服务器模式
+# ==========================================
+WEB_SERVER_MODE = "threading"  # threading: Flask-SocketIO线程模式；asgi: uvicorn + 原生WebSocket，单事件循环
+ASGI_WS_PING_INTERVAL = 25  # ASGI模式下Socket.IO心跳间隔（秒）
+STARTUP_WARM_UP_ENABLED = True  # 启动完成后在后台预加载HTTP客户端、分词器、终端探测，避免首个请求承担这些开销
+
+# ==========================================
+# JSON序列化
+# ==========================================
+JSON_PRETTY_PRINT = True  # 对话、索引、备注等数据文件是否缩进保存（关闭后文件更小、写入更快；安装orjson可进一步加速）
+
+# ==========================================
+# 数据文件写入
+# ==========================================
+ATOMIC_WRITE_FSYNC = True  # 原子写入时是否fsync（关闭后更快，但断电时可能丢失最近一次写入）
+
+# ==========================================
+# 多进程Worker（多个web_server共享同一data目录）
+# ==========================================
+MULTI_WORKER_ENABLED = False  # 开启后启用对话租约与跨进程事件总线
+WORKER_ID = None  # worker标识，None时使用环境变量AGENT_WORKER_ID或"主机名-进程号"
+PUBSUB_SOCKET_PATH = f"{DATA_DIR}/run/event_bus.sock"  # 本机事件总线的Unix socket
+CONVERSATION_LEASE_TTL = 180  # 对话租约有效期（秒），由空闲回收线程定期续期
+
+# ==========================================
+# 搜索与网页提取缓存
+# ==========================================
+SEARCH_DEPTH = "advanced"  # Tavily搜索深度：basic（更快、更省额度）或 advanced
+SEARCH_CACHE_ENABLED = True  # 相同查询（规范化后）在有效期内直接返回缓存结果
+SEARCH_CACHE_TTL = 3600  # 搜索缓存有效期（秒）
+SEARCH_CACHE_MAX_ENTRIES = 256  # 内存中最多缓存的查询数（磁盘缓存位于 data/searches/cache）
+EXTRACT_CACHE_ENABLED = True  # 网页提取结果按URL缓存，有效期内重复提取直接返回
+EXTRACT_CACHE_TTL = 86400  # 网页提取缓存有效期（秒）
+EXTRACT_CACHE_MAX_ENTRIES = 128  # 内存中最多缓存的URL数
+EXTRACT_CACHE_DIR = f"{DATA_DIR}/webpages"  # 提取内容按内容哈希压缩存放于 blobs/，URL索引位于 urls/
+EXTRACT_BLOB_COMPRESSION = "auto"  # auto（已安装zstandard时用zstd，否则gzip）/ zstd / gzip
+EXTRACT_BATCH_MAX_URLS = 10  # extract_webpage 批量模式（urls参数）单次最多提取的URL数
+EXTRACT_BATCH_CONCURRENCY = 4  # 批量提取时同时进行的请求数
+EXTRACT_URL_TIMEOUT = 30  # 批量提取中单个URL的超时（秒），超时的页面单独报告失败，不拖住整批
+EXTRACT_BATCH_MAX_TOTAL_CHARS = 160000  # 批量提取返回内容的总字符上限（单页仍受 MAX_EXTRACT_WEBPAGE_CHARS 限制）
+
+# ==========================================
+# HTTP接口缓存与压缩
+# ==========================================
+FILE_TREE_CACHE_TTL = 5  # 未启用文件监听时文件树缓存的有效期（秒），智能体之外的修改最迟在此时间后可见
+RESPONSE_COMPRESSION_ENABLED = True  # 按Accept-Encoding压缩JSON响应（已安装brotli时优先br，否则gzip）
+RESPONSE_COMPRESSION_MIN_BYTES = 1024  # 小于该大小的响应不压缩
+FILE_WATCHER_ENABLED = True  # 使用文件系统监听（需安装watchdog）增量更新文件树；未安装时在终端类工具执行后重新扫描
+FILE_WATCHER_DEBOUNCE = 0.3  # 文件系统事件合并窗口（秒）
+
+# ==========================================
+# Token计数
+# ==========================================
+TOKEN_GAUGE_MODE = "exact"  # 当前上下文token仪表的计数方式：exact（按模型分词）或 estimate（按每token字节数估算，几乎无开销）
+TOKENIZER_BATCH_THREADS = 4  # 批量分词（如加载对话后整体重算历史）使用的线程数
+
+# ==========================================
+# 终端输出持久化（服务重启后按会话名恢复）
+# ==========================================
+TERMINAL_SCROLLBACK_ENABLED = True  # 终端输出和命令历史分段压缩写入磁盘，重新打开同名会话时恢复
+TERMINAL_SCROLLBACK_DIR = f"{DATA_DIR}/terminals"  # 按 项目路径哈希/会话名 存放分段与索引
+TERMINAL_SCROLLBACK_COMPRESSION = "auto"  # auto（已安装zstandard时用zstd，否则gzip）/ zstd / gzip
+TERMINAL_SCROLLBACK_SEGMENT_CHARS = 65536  # 未写入的输出达到该字符数时写出一个分段
+TERMINAL_SCROLLBACK_FLUSH_INTERVAL = 5  # 未写入的输出最长保留时间（秒），超过后写出分段
+TERMINAL_SCROLLBACK_MAX_CHARS = 200000  # 每个会话在磁盘上保留的输出字符数（超出时删除最旧的分段）
+TERMINAL_SCROLLBACK_MAX_SEGMENTS = 32  # 分段数超过该值时合并为一个分段
@@ -0,0 +1,154 @@
+# core/agent_runtime.py - 常驻Agent运行时（独占一个事件循环的后台线程）
+
+import asyncio
+import concurrent.futures
+import threading
+from typing import Any, Coroutine, Optional
+try:
+    from config import OUTPUT_FORMATS
+except ImportError:
+    import sys
+    from pathlib import Path
+    project_root = Path(__file__).resolve().parents[1]
+    if str(project_root) not in sys.path:
+        sys.path.insert(0, str(project_root))
+    from config import OUTPUT_FORMATS
+
+from utils.http_pool import enable_pooling, close_pooled_clients
+
+
+class RuntimeTask:
+    """
+    运行时中一个可取消任务的句柄
+
+    cancel() 可在任意线程调用；result() 会等到协程真正结束（包括取消后的清理）才返回，
+    被取消时抛出 concurrent.futures.CancelledError。
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._task: Optional[asyncio.Task] = None
+        self._cancel_requested = False
+        self.future: Optional[concurrent.futures.Future] = None
+
+    async def _track(self, coro: Coroutine) -> Any:
+        self._task = asyncio.current_task()
+        if self._cancel_requested:
+            coro.close()
+            raise asyncio.CancelledError()
+        return await coro
+
+    def _cancel_in_loop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    def cancel(self) -> bool:
+        if self.done():
+            return False
+        self._cancel_requested = True
+        self._loop.call_soon_threadsafe(self._cancel_in_loop)
+        return True
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def result(self, timeout: float = None) -> Any:
+        return self.future.result(timeout)
+
+
+class AgentRuntime:
+    """
+    所有Agent任务共享的事件循环
+
+    任务通过 run_coroutine_threadsafe 提交：submit() 返回 concurrent.futures.Future，
+    spawn() 返回可在任意线程取消、并能等待取消清理完成的 RuntimeTask。
+    HTTP连接池等与事件循环绑定的资源在进程生命周期内复用。
+    """
+
+    def __init__(self, name: str = "agent-runtime"):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        self.start()
+        return self._loop
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> "AgentRuntime":
+        """启动运行时线程（重复调用无副作用）"""
+        with self._lock:
+            if self.is_running:
+                return self
+            self._ready.clear()
+            self._thread = threading.Thread(target=self._run_loop, name=self.name, daemon=True)
+            self._thread.start()
+        self._ready.wait()
+        return self
+
+    def _run_loop(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        enable_pooling(loop)
+        self._loop = loop
+        self._ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            try:
+                pending = asyncio.all_tasks(loop)
+                for task in pending:
+                    task.cancel()
+                if pending:
+                    loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+                loop.run_until_complete(close_pooled_clients())
+                loop.run_until_complete(loop.shutdown_asyncgens())
+            finally:
+                loop.close()
+
+    def submit(self, coro: Coroutine) -> concurrent.futures.Future:
+        """提交协程，立即返回Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def spawn(self, coro: Coroutine) -> RuntimeTask:
+        """提交可从其他线程取消的任务"""
+        handle = RuntimeTask(self.loop)
+        handle.future = self.submit(handle._track(coro))
+        return handle
+
+    def run(self, coro: Coroutine, timeout: float = None) -> Any:
+        """提交协程并阻塞等待结果（取消时抛出 concurrent.futures.CancelledError）"""
+        return self.submit(coro).result(timeout)
+
+    def call_soon(self, callback, *args):
+        """在运行时线程中执行普通回调"""
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    def shutdown(self, timeout: float = 10):
+        """停止事件循环，取消未完成的任务并关闭连接池"""
+        with self._lock:
+            if not self.is_running:
+                return
+            loop, thread = self._loop, self._thread
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        print(f"{OUTPUT_FORMATS['info']} Agent运行时已停止")
+
+
+_runtime: Optional[AgentRuntime] = None
+_runtime_lock = threading.Lock()
+
+
+def get_runtime() -> AgentRuntime:
+    """获取进程级的Agent运行时（首次调用时启动）"""
+    global _runtime
+    with _runtime_lock:
+        if _runtime is None:
+            _runtime = AgentRuntime()
+    return _runtime.start()
@@ -27,14 +27,21 @@ from modules.search_engine import SearchEngine
 from modules.terminal_ops import TerminalOperator
 from modules.memory_manager import MemoryManager
 from modules.terminal_manager import TerminalManager
-from modules.webpage_extractor import extract_webpage_content, tavily_extract
+from modules.webpage_extractor import extract_webpage_cached, extract_webpages_batch, tavily_extract
 from utils.api_client import DeepSeekClient
-from utils.context_manager import ContextManager
+from utils.context_manager import ContextManager, format_focused_files
+from utils import serialization
+from utils.revisions import RevisionLog, TrackedDict
 from utils.logger import setup_logger
+from utils.timeline import timeline_span
 
 logger = setup_logger(__name__)
 # 临时禁用长度检查
 DISABLE_LENGTH_CHECK = True
+# 可能绕过FileManager修改项目文件的工具（未启用文件监听时，执行后重新扫描文件树）
+EXTERNAL_FILE_CHANGE_TOOLS = {"run_command", "run_python", "terminal_input", "terminal_session"}
+# 在事件循环中执行的工具（网络请求、子进程、等待）；其余工具同步执行，放到线程池中
+ASYNC_TOOLS = {"sleep", "web_search", "extract_webpage", "save_webpage", "run_python", "run_command"}
 class MainTerminal:
     def __init__(self, project_path: str, thinking_mode: bool = False):
         self.project_path = project_path
@@ -45,6 +52,7 @@ class MainTerminal:
         self.context_manager = ContextManager(project_path)
         self.memory_manager = MemoryManager()
         self.file_manager = FileManager(project_path)
+        self.file_manager.change_listener = self.context_manager.apply_file_changes
         self.search_engine = SearchEngine()
         self.terminal_ops = TerminalOperator(project_path)
         
@@ -58,7 +66,13 @@ class MainTerminal:
         )
         
         # 聚焦文件管理
-        self.focused_files = {}  # {path: content} 存储聚焦的文件内容
+        self.focused_files = TrackedDict(RevisionLog("focused"))  # {path: content} 存储聚焦的文件内容（修改时记录版本）
+        
+        # 当前上下文token仪表的数据来源
+        self.context_manager.set_focused_files(self.focused_files)
+        self.context_manager.set_tool_definitions(self.define_tools())
+        self.context_manager.set_terminal_source(lambda: self.terminal_manager.get_active_terminal_content())
+        self.context_manager.set_main_memory(self.memory_manager.read_main_memory())
         
         # 新增：阅读工具使用跟踪
         self.read_file_usage_tracker = {}  # {file_path: first_read_session_id} 跟踪文件的首次读取
@@ -205,7 +219,7 @@ class MainTerminal:
             # 工具处理器：只执行工具，收集信息，绝不保存到对话历史
             async def tool_handler(tool_name: str, arguments: Dict) -> str:
                 # 执行工具调用
-                result = await self.handle_tool_call(tool_name, arguments)
+                result_data = await self.execute_tool(tool_name, arguments)
                 
                 # 生成工具调用ID
                 tool_call_id = f"call_{datetime.now().timestamp()}_{tool_name}"
@@ -216,21 +230,17 @@ class MainTerminal:
                     "type": "function", 
                     "function": {
                         "name": tool_name,
-                        "arguments": json.dumps(arguments, ensure_ascii=False)
+                        "arguments": serialization.dumps(arguments)
                     }
                 }
                 collected_tool_calls.append(tool_call_info)
                 
-                # 处理工具结果用于保存
-                try:
-                    result_data = json.loads(result)
-                    if tool_name == "read_file" and result_data.get("success"):
-                        file_content = result_data.get("content", "")
-                        tool_result_content = f"文件内容:\n```\n{file_content}\n```\n大小: {result_data.get('size')} 字节"
-                    else:
-                        tool_result_content = result
-                except:
-                    tool_result_content = result
+                # 处理工具结果用于保存（结果只在这里序列化一次）
+                if tool_name == "read_file" and result_data.get("success"):
+                    file_content = result_data.get("content", "")
+                    tool_result_content = f"文件内容:\n```\n{file_content}\n```\n大小: {result_data.get('size')} 字节"
+                else:
+                    tool_result_content = serialization.dumps(result_data)
                 
                 # 收集工具结果（不保存）
                 collected_tool_results.append({
@@ -239,7 +249,7 @@ class MainTerminal:
                     "content": tool_result_content
                 })
                 
-                return result
+                return tool_result_content
             
             # 调用带工具的API（模型自己决定是否使用工具）
             response = await self.api_client.chat_with_tools(
@@ -813,13 +823,17 @@ class MainTerminal:
                 "type": "function",
                 "function": {
                     "name": "extract_webpage",
-                    "description": "提取指定网页的完整内容进行详细分析。补充web_search功能，获取网页的具体内容而不仅仅是摘要。网页内容超过80000字符将被拒绝，请不要提取过长的网页。",
+                    "description": "提取指定网页的完整内容进行详细分析。补充web_search功能，获取网页的具体内容而不仅仅是摘要。网页内容超过80000字符将被拒绝，请不要提取过长的网页。需要阅读多个网页时，使用urls一次并发提取（最多10个），不要逐个调用。",
                     "parameters": {
                         "type": "object",
                         "properties": {
-                            "url": {"type": "string", "description": "要提取内容的网页URL"}
-                        },
-                        "required": ["url"]
+                            "url": {"type": "string", "description": "要提取内容的网页URL"},
+                            "urls": {
+                                "type": "array",
+                                "items": {"type": "string"},
+                                "description": "批量提取的网页URL列表（与url二选一），各页面并发提取，单个页面超时或失败不影响其他页面"
+                            }
+                        }
                     }
                 }
             },
@@ -885,48 +899,274 @@ class MainTerminal:
         ]
     
     async def handle_tool_call(self, tool_name: str, arguments: Dict) -> str:
+        """处理工具调用，返回序列化后的结果（用于直接作为工具消息内容）"""
+        return serialization.dumps(await self.execute_tool(tool_name, arguments))
+    
+    async def execute_tool(self, tool_name: str, arguments: Dict) -> Dict:
+        """执行工具调用并返回结果字典（执行区间记录到当前任务的时间线）"""
+        with timeline_span(self.context_manager.task_timeline, "tool", tool_name):
+            try:
+                return await self._execute_tool_call(tool_name, arguments)
+            finally:
+                # 终端类工具可能绕过FileManager修改文件
+                if tool_name in EXTERNAL_FILE_CHANGE_TOOLS:
+                    self.context_manager.notify_external_file_changes()
+    
+    async def _execute_tool_call(self, tool_name: str, arguments: Dict) -> Dict:
         """处理工具调用（添加参数预检查和改进错误处理）"""
         # 导入字符限制配置
-        from config import (
-            MAX_READ_FILE_CHARS, MAX_FOCUS_FILE_CHARS, 
-            MAX_RUN_COMMAND_CHARS, MAX_EXTRACT_WEBPAGE_CHARS
-        )
+        from config import MAX_RUN_COMMAND_CHARS, MAX_EXTRACT_WEBPAGE_CHARS
         
         # 检查是否需要确认
         if tool_name in NEED_CONFIRMATION:
             if not await self.confirm_action(tool_name, arguments):
-                return json.dumps({"success": False, "error": "用户取消操作"})
+                return {"success": False, "error": "用户取消操作"}
         
         # === 新增：预检查参数大小和格式 ===
         try:
             # 检查参数总大小
-            arguments_str = json.dumps(arguments, ensure_ascii=False)
+            arguments_str = serialization.dumps(arguments)
             if len(arguments_str) > 50000:  # 50KB限制
-                return json.dumps({
+                return {
                     "success": False,
                     "error": f"参数过大({len(arguments_str)}字符)，超过50KB限制",
                     "suggestion": "请分块处理或减少参数内容"
-                }, ensure_ascii=False)
+                }
             
             # 针对特定工具的内容检查
             if tool_name in ["modify_file", "create_file"] and "content" in arguments:
                 content = arguments.get("content", "")
                 if not DISABLE_LENGTH_CHECK and len(content) > 9999999999:  # 30KB内容限制
-                    return json.dumps({
+                    return {
                         "success": False,
                         "error": f"文件内容过长({len(content)}字符)，建议分块处理",
                         "suggestion": "请拆分内容或使用 modify_file 工具输出结构化补丁"
-                    }, ensure_ascii=False)
+                    }
                 
                 # 检查内容中的特殊字符
                 if '\\' in content and content.count('\\') > len(content) / 10:
                     print(f"{OUTPUT_FORMATS['warning']} 检测到大量转义字符，可能存在格式问题")
                 
         except Exception as e:
-            return json.dumps({
+            return {
                 "success": False,
                 "error": f"参数预检查失败: {str(e)}"
-            }, ensure_ascii=False)
+            }
+        
+        # 同步工具（文件读写、文件锁、终端交互）在线程池中执行，避免阻塞所有会话共享的事件循环
+        if tool_name not in ASYNC_TOOLS:
+            return await asyncio.to_thread(self._execute_sync_tool, tool_name, arguments)
+        
+        try:
+            # sleep工具
+            if tool_name == "sleep":
+                seconds = arguments.get("seconds", 1)
+                reason = arguments.get("reason", "等待操作完成")
+                
+                # 限制最大等待时间
+                max_sleep = 600  # 最多等待60秒
+                if seconds > max_sleep:
+                    result = {
+                        "success": False,
+                        "error": f"等待时间过长，最多允许 {max_sleep} 秒",
+                        "suggestion": f"建议分多次等待或减少等待时间"
+                    }
+                else:
+                    # 确保秒数为正数
+                    if seconds <= 0:
+                        result = {
+                            "success": False,
+                            "error": "等待时间必须大于0"
+                        }
+                    else:
+                        print(f"{OUTPUT_FORMATS['info']} 等待 {seconds} 秒: {reason}")
+                        
+                        # 执行等待
+                        await asyncio.sleep(seconds)
+                        
+                        result = {
+                            "success": True,
+                            "message": f"已等待 {seconds} 秒",
+                            "reason": reason,
+                            "timestamp": datetime.now().isoformat()
+                        }
+                        
+                        print(f"{OUTPUT_FORMATS['success']} 等待完成")
+                    
+            elif tool_name == "web_search":
+                summary = await self.search_engine.search_with_summary(
+                    arguments["query"],
+                    arguments.get("max_results")
+                )
+                result = {"success": True, "summary": summary}
+                
+            elif tool_name == "extract_webpage" and arguments.get("urls"):
+                result = await self._extract_webpages(arguments["urls"], MAX_EXTRACT_WEBPAGE_CHARS)
+                
+            elif tool_name == "extract_webpage":
+                url = arguments.get("url")
+                if not url:
+                    return {"success": False, "error": "请提供url或urls参数"}
+                try:
+                    # 从config获取API密钥
+                    from config import TAVILY_API_KEY
+                    extracted = await extract_webpage_cached(
+                        url,
+                        api_key=TAVILY_API_KEY,
+                        extract_depth="basic"
+                    )
+                    full_content = extracted["content"]
+                    
+                    # 字符数检查
+                    char_count = len(full_content)
+                    if char_count > MAX_EXTRACT_WEBPAGE_CHARS:
+                        result = {
+                            "success": False,
+                            "error": f"网页提取返回了过长的{char_count}字符，请不要提取这个网页，可以使用网页保存功能，然后使用终端命令查找或查看网页",
+                            "char_count": char_count,
+                            "limit": MAX_EXTRACT_WEBPAGE_CHARS,
+                            "url": url
+                        }
+                    else:
+                        result = {
+                            "success": True,
+                            "url": url,
+                            "content": full_content
+                        }
+                        # 内容哈希：保存对话时以引用代替全文
+                        if extracted.get("content_hash"):
+                            result["content_hash"] = extracted["content_hash"]
+                        if extracted.get("cached"):
+                            result["cached"] = True
+                            result["cache_age"] = extracted["cache_age"]
+                except Exception as e:
+                    result = {
+                        "success": False,
+                        "error": f"网页提取失败: {str(e)}",
+                        "url": url
+                    }
+
+            elif tool_name == "save_webpage":
+                url = arguments["url"]
+                target_path = arguments["target_path"]
+                try:
+                    from config import TAVILY_API_KEY
+                except ImportError:
+                    TAVILY_API_KEY = None
+
+                if not TAVILY_API_KEY or TAVILY_API_KEY == "your-tavily-api-key":
+                    result = {
+                        "success": False,
+                        "error": "Tavily API密钥未配置，无法保存网页",
+                        "url": url,
+                        "path": target_path
+                    }
+                else:
+                    try:
+                        extract_result = await tavily_extract(
+                            urls=url,
+                            api_key=TAVILY_API_KEY,
+                            extract_depth="basic",
+                            max_urls=1
+                        )
+
+                        if not extract_result or "error" in extract_result:
+                            error_message = extract_result.get("error", "提取失败，未返回任何内容") if isinstance(extract_result, dict) else "提取失败"
+                            result = {
+                                "success": False,
+                                "error": error_message,
+                                "url": url,
+                                "path": target_path
+                            }
+                        else:
+                            results_list = extract_result.get("results", []) if isinstance(extract_result, dict) else []
+
+                            primary_result = None
+                            for item in results_list:
+                                if item.get("raw_content"):
+                                    primary_result = item
+                                    break
+                            if primary_result is None and results_list:
+                                primary_result = results_list[0]
+
+                            if not primary_result:
+                                failed_list = extract_result.get("failed_results", []) if isinstance(extract_result, dict) else []
+                                result = {
+                                    "success": False,
+                                    "error": "提取成功结果为空，无法保存",
+                                    "url": url,
+                                    "path": target_path,
+                                    "failed": failed_list
+                                }
+                            else:
+                                content_to_save = primary_result.get("raw_content") or primary_result.get("content") or ""
+
+                                if not content_to_save:
+                                    result = {
+                                        "success": False,
+                                        "error": "网页内容为空，未写入文件",
+                                        "url": url,
+                                        "path": target_path
+                                    }
+                                else:
+                                    write_result = self.file_manager.write_file(target_path, content_to_save, mode="w")
+
+                                    if not write_result.get("success"):
+                                        result = {
+                                            "success": False,
+                                            "error": write_result.get("error", "写入文件失败"),
+                                            "url": url,
+                                            "path": target_path
+                                        }
+                                    else:
+                                        char_count = len(content_to_save)
+                                        byte_size = len(content_to_save.encode("utf-8"))
+                                        result = {
+                                            "success": True,
+                                            "url": url,
+                                            "path": write_result.get("path", target_path),
+                                            "char_count": char_count,
+                                            "byte_size": byte_size,
+                                            "message": f"网页内容已以纯文本保存到 {write_result.get('path', target_path)}，请使用终端命令查看（文件建议为 .txt）。"
+                                        }
+
+                                        if isinstance(extract_result, dict) and extract_result.get("failed_results"):
+                                            result["warnings"] = extract_result["failed_results"]
+
+                    except Exception as e:
+                        result = {
+                            "success": False,
+                            "error": f"网页保存失败: {str(e)}",
+                            "url": url,
+                            "path": target_path
+                        }
+
+            elif tool_name == "run_python":
+                result = await self.terminal_ops.run_python_code(
+                    arguments["code"],
+                    on_output=lambda stream, text: self.report_tool_output(tool_name, stream, text)
+                )
+                
+            elif tool_name == "run_command":
+                result = await self.terminal_ops.run_command(
+                    arguments["command"],
+                    on_output=lambda stream, text: self.report_tool_output(tool_name, stream, text)
+                )
+                
+                # 输出超过限制时只保留了开头和结尾
+                if result.get("truncated"):
+                    result["limit"] = MAX_RUN_COMMAND_CHARS
+                    result["note"] = f"输出共{result['char_count']}字符，超过{MAX_RUN_COMMAND_CHARS}字符限制，只保留了开头和结尾；需要中间内容时请使用限制字符数的获取内容方式（如重定向到文件后分段查看）"
+
+        except Exception as e:
+            logger.error(f"工具执行失败: {tool_name} - {e}")
+            result = {"success": False, "error": f"工具执行异常: {str(e)}"}
+    
+        return result
+    
+    def _execute_sync_tool(self, tool_name: str, arguments: Dict) -> Dict:
+        """执行同步工具（在工作线程中调用，不能使用事件循环）"""
+        from config import MAX_READ_FILE_CHARS, MAX_FOCUS_FILE_CHARS
         
         try:
             # ===== 新增：阅读工具拦截逻辑 =====
@@ -939,57 +1179,57 @@ class MainTerminal:
                     self.read_file_usage_tracker[file_path] = self.current_session_id
 
                     # 返回选择提示，要求AI使用confirm_read_or_focus工具
-                    return json.dumps({
+                    return {
                         "success": False,
                         "requires_confirmation": True,
                         "message": "阅读工具只能用于阅读小文件、临时文件、不重要的文件。如果要查看核心文件、需要多次修改的文件、重要的文件，请使用聚焦功能。请确认使用阅读还是聚焦？",
                         "instruction": f"请使用 confirm_read_or_focus 工具来选择操作方式，文件路径: {file_path}",
                         "file_path": file_path
-                    })
+                    }
 
                 # 如果不是首次读取，检查是否是同一会话
                 elif self.read_file_usage_tracker[file_path] != self.current_session_id:
                     # 新会话首次读取已读过的文件，也需要确认
                     self.read_file_usage_tracker[file_path] = self.current_session_id
 
-                    return json.dumps({
+                    return {
                         "success": False,
                         "requires_confirmation": True,
                         "message": f"检测到要重复读取文件 {file_path}。建议使用聚焦功能以避免频繁读取。请确认使用阅读还是聚焦？",
                         "instruction": f"请使用 confirm_read_or_focus 工具来选择操作方式，文件路径: {file_path}",
                         "file_path": file_path
-                    })
+                    }
 
                 # 同一会话内再次读取，直接执行读取逻辑
                 result = self.file_manager.read_file(file_path)
                 if not result["success"]:
-                    return json.dumps({
+                    return {
                         "success": False,
                         "error": f"读取文件失败: {result.get('error', '未知错误')}"
-                    })
+                    }
 
                 file_content = result["content"]
                 char_count = len(file_content)
 
                 if char_count > MAX_READ_FILE_CHARS:
-                    return json.dumps({
+                    return {
                         "success": False,
                         "error": f"文件过大，有{char_count}字符，请使用run_command限制字符数返回",
                         "char_count": char_count,
                         "limit": MAX_READ_FILE_CHARS
-                    })
+                    }
 
                 self.context_manager.load_file(result["path"])
                 print(f"{OUTPUT_FORMATS['info']} 文件已加载到上下文: {result['path']}")
 
-                return json.dumps({
+                return {
                     "success": True,
                     "action": "read",
                     "message": f"已使用读取方式查看文件: {file_path}",
                     "content": file_content,
                     "file_size": len(file_content),
                     "char_count": char_count
-                })
+                }
             
             # ===== 新增：处理确认选择工具 =====
             elif tool_name == "confirm_read_or_focus":
@@ -998,10 +1238,10 @@ class MainTerminal:
                 reason = arguments.get("reason", "")
                 
                 if not file_path or not choice:
-                    return json.dumps({
+                    return {
                         "success": False,
                         "error": "缺少必要参数：file_path 或 choice"
-                    })
+                    }
                 
                 if choice == "read":
                     # 执行读取操作
@@ -1014,10 +1254,10 @@ class MainTerminal:
                     
                     # ✅ 先检查是否读取成功
                     if not result["success"]:
-                        return json.dumps({
+                        return {
                             "success": False,
                             "error": f"读取文件失败: {result.get('error', '未知错误')}"
-                        })
+                        }
                     
                     # 读取成功，继续处理
                     file_content = result["content"]
@@ -1025,26 +1265,26 @@ class MainTerminal:
                     
                     # 字符数检查
                     if char_count > MAX_READ_FILE_CHARS:
-                        return json.dumps({
+                        return {
                             "success": False,
                             "error": f"文件过大，有{char_count}字符，请使用run_command限制字符数返回",
                             "char_count": char_count,
                             "limit": MAX_READ_FILE_CHARS
-                        })
+                        }
                     
                     # 加载到上下文管理器
                     self.context_manager.load_file(result["path"])
                     print(f"{OUTPUT_FORMATS['info']} 文件已加载到上下文: {result['path']}")
                     
                     # ✅ 返回完整内容
-                    return json.dumps({
+                    return {
                         "success": True,
                         "action": "read",
                         "message": f"已使用读取方式查看文件: {file_path}",
                         "content": file_content,  # ← 关键：包含完整内容
                         "file_size": len(file_content),
                         "char_count": char_count
-                    })
+                    }
                 elif choice == "focus":
                     # 执行聚焦操作
                     print(f"{OUTPUT_FORMATS['info']} 用户选择：聚焦文件 {file_path}")
@@ -1053,18 +1293,18 @@ class MainTerminal:
                     
                     # 检查是否已经聚焦
                     if file_path in self.focused_files:
-                        return json.dumps({
+                        return {
                             "success": False,
                             "error": f"文件已经处于聚焦状态: {file_path}"
-                        })
+                        }
                     
                     # 检查聚焦文件数量限制
                     if len(self.focused_files) >= 3:
-                        return json.dumps({
+                        return {
                             "success": False,
                             "error": f"已达到最大聚焦文件数量(3个)，当前聚焦: {list(self.focused_files.keys())}",
                             "suggestion": "请先使用 unfocus_file 取消部分文件的聚焦"
-                        })
+                        }
                     
                     # 读取文件内容并聚焦
                     read_result = self.file_manager.read_file(file_path)
@@ -1072,12 +1312,12 @@ class MainTerminal:
                         # 字符数检查
                         char_count = len(read_result["content"])
                         if char_count > MAX_FOCUS_FILE_CHARS:
-                            return json.dumps({
+                            return {
                                 "success": False,
                                 "error": f"文件过大，有{char_count}字符，请使用run_command限制字符数返回",
                                 "char_count": char_count,
                                 "limit": MAX_FOCUS_FILE_CHARS
-                            })
+                            }
                         
                         self.focused_files[file_path] = read_result["content"]
                         result = {
@@ -1095,13 +1335,13 @@ class MainTerminal:
                             "error": f"读取文件失败: {read_result.get('error', '未知错误')}"
                         }
                     
-                    return json.dumps(result)
+                    return result
                 
                 else:
-                    return json.dumps({
+                    return {
                         "success": False,
                         "error": f"无效的选择: {choice}，只能选择 'read' 或 'focus'"
-                    })
+                    }
             
             # ===== 以下是原有的工具处理逻辑 =====
             
@@ -1148,42 +1388,6 @@ class MainTerminal:
                 if result["success"]:
                     print(f"{OUTPUT_FORMATS['terminal']} 执行命令: {arguments['command']}")
                     
-            # sleep工具
-            elif tool_name == "sleep":
-                seconds = arguments.get("seconds", 1)
-                reason = arguments.get("reason", "等待操作完成")
-                
-                # 限制最大等待时间
-                max_sleep = 600  # 最多等待60秒
-                if seconds > max_sleep:
-                    result = {
-                        "success": False,
-                        "error": f"等待时间过长，最多允许 {max_sleep} 秒",
-                        "suggestion": f"建议分多次等待或减少等待时间"
-                    }
-                else:
-                    # 确保秒数为正数
-                    if seconds <= 0:
-                        result = {
-                            "success": False,
-                            "error": "等待时间必须大于0"
-                        }
-                    else:
-                        print(f"{OUTPUT_FORMATS['info']} 等待 {seconds} 秒: {reason}")
-                        
-                        # 执行等待
-                        import asyncio
-                        await asyncio.sleep(seconds)
-                        
-                        result = {
-                            "success": True,
-                            "message": f"已等待 {seconds} 秒",
-                            "reason": reason,
-                            "timestamp": datetime.now().isoformat()
-                        }
-                        
-                        print(f"{OUTPUT_FORMATS['success']} 等待完成")
-                    
             elif tool_name == "create_file":
                 result = self.file_manager.create_file(
                     path=arguments["path"],
@@ -1208,7 +1412,12 @@ class MainTerminal:
                     # 字符数检查
                     char_count = len(result["content"])
                     if char_count > MAX_READ_FILE_CHARS:
-                        return json.dumps({...})
+                        return {
+                            "success": False,
+                            "error": f"文件过大，有{char_count}字符，请使用run_command限制字符数返回",
+                            "char_count": char_count,
+                            "limit": MAX_READ_FILE_CHARS
+                        }
                     
                     # ✅ 先保存文件内容
                     file_content = result["content"]
@@ -1391,161 +1600,6 @@ class MainTerminal:
                 else:
                     result = {"success": False, "error": f"文件未处于聚焦状态: {path}"}
                 
-            elif tool_name == "web_search":
-                summary = await self.search_engine.search_with_summary(
-                    arguments["query"],
-                    arguments.get("max_results")
-                )
-                result = {"success": True, "summary": summary}
-                
-            elif tool_name == "extract_webpage":
-                url = arguments["url"]
-                try:
-                    # 从config获取API密钥
-                    from config import TAVILY_API_KEY
-                    full_content, _ = await extract_webpage_content(
-                        urls=url, 
-                        api_key=TAVILY_API_KEY,
-                        extract_depth="basic",
-                        max_urls=1
-                    )
-                    
-                    # 字符数检查
-                    char_count = len(full_content)
-                    if char_count > MAX_EXTRACT_WEBPAGE_CHARS:
-                        result = {
-                            "success": False,
-                            "error": f"网页提取返回了过长的{char_count}字符，请不要提取这个网页，可以使用网页保存功能，然后使用终端命令查找或查看网页",
-                            "char_count": char_count,
-                            "limit": MAX_EXTRACT_WEBPAGE_CHARS,
-                            "url": url
-                        }
-                    else:
-                        result = {
-                            "success": True,
-                            "url": url,
-                            "content": full_content
-                        }
-                except Exception as e:
-                    result = {
-                        "success": False,
-                        "error": f"网页提取失败: {str(e)}",
-                        "url": url
-                    }
-
-            elif tool_name == "save_webpage":
-                url = arguments["url"]
-                target_path = arguments["target_path"]
-                try:
-                    from config import TAVILY_API_KEY
-                except ImportError:
-                    TAVILY_API_KEY = None
-
-                if not TAVILY_API_KEY or TAVILY_API_KEY == "your-tavily-api-key":
-                    result = {
-                        "success": False,
-                        "error": "Tavily API密钥未配置，无法保存网页",
-                        "url": url,
-                        "path": target_path
-                    }
-                else:
-                    try:
-                        extract_result = await tavily_extract(
-                            urls=url,
-                            api_key=TAVILY_API_KEY,
-                            extract_depth="basic",
-                            max_urls=1
-                        )
-
-                        if not extract_result or "error" in extract_result:
-                            error_message = extract_result.get("error", "提取失败，未返回任何内容") if isinstance(extract_result, dict) else "提取失败"
-                            result = {
-                                "success": False,
-                                "error": error_message,
-                                "url": url,
-                                "path": target_path
-                            }
-                        else:
-                            results_list = extract_result.get("results", []) if isinstance(extract_result, dict) else []
-
-                            primary_result = None
-                            for item in results_list:
-                                if item.get("raw_content"):
-                                    primary_result = item
-                                    break
-                            if primary_result is None and results_list:
-                                primary_result = results_list[0]
-
-                            if not primary_result:
-                                failed_list = extract_result.get("failed_results", []) if isinstance(extract_result, dict) else []
-                                result = {
-                                    "success": False,
-                                    "error": "提取成功结果为空，无法保存",
-                                    "url": url,
-                                    "path": target_path,
-                                    "failed": failed_list
-                                }
-                            else:
-                                content_to_save = primary_result.get("raw_content") or primary_result.get("content") or ""
-
-                                if not content_to_save:
-                                    result = {
-                                        "success": False,
-                                        "error": "网页内容为空，未写入文件",
-                                        "url": url,
-                                        "path": target_path
-                                    }
-                                else:
-                                    write_result = self.file_manager.write_file(target_path, content_to_save, mode="w")
-
-                                    if not write_result.get("success"):
-                                        result = {
-                                            "success": False,
-                                            "error": write_result.get("error", "写入文件失败"),
-                                            "url": url,
-                                            "path": target_path
-                                        }
-                                    else:
-                                        char_count = len(content_to_save)
-                                        byte_size = len(content_to_save.encode("utf-8"))
-                                        result = {
-                                            "success": True,
-                                            "url": url,
-                                            "path": write_result.get("path", target_path),
-                                            "char_count": char_count,
-                                            "byte_size": byte_size,
-                                            "message": f"网页内容已以纯文本保存到 {write_result.get('path', target_path)}，请使用终端命令查看（文件建议为 .txt）。"
-                                        }
-
-                                        if isinstance(extract_result, dict) and extract_result.get("failed_results"):
-                                            result["warnings"] = extract_result["failed_results"]
-
-                    except Exception as e:
-                        result = {
-                            "success": False,
-                            "error": f"网页保存失败: {str(e)}",
-                            "url": url,
-                            "path": target_path
-                        }
-
-            elif tool_name == "run_python":
-                result = await self.terminal_ops.run_python_code(arguments["code"])
-                
-            elif tool_name == "run_command":
-                result = await self.terminal_ops.run_command(arguments["command"])
-                
-                # 字符数检查
-                if result.get("success") and "output" in result:
-                    char_count = len(result["output"])
-                    if char_count > MAX_RUN_COMMAND_CHARS:
-                        result = {
-                            "success": False,
-                            "error": f"结果内容过大，有{char_count}字符，请使用限制字符数的获取内容方式，根据程度选择10k以内的数",
-                            "char_count": char_count,
-                            "limit": MAX_RUN_COMMAND_CHARS,
-                            "command": arguments["command"]
-                        }
-                
             elif tool_name == "update_memory":
                 memory_type = arguments["memory_type"]
                 content = arguments["content"]
@@ -1556,6 +1610,8 @@ class MainTerminal:
                         success = self.memory_manager.append_main_memory(content)
                     else:
                         success = self.memory_manager.write_main_memory(content)
+                    if success:
+                        self.context_manager.set_main_memory(self.memory_manager.read_main_memory())
                 else:
                     if operation == "append":
                         success = self.memory_manager.append_task_memory(content)
@@ -1571,7 +1627,63 @@ class MainTerminal:
             logger.error(f"工具执行失败: {tool_name} - {e}")
             result = {"success": False, "error": f"工具执行异常: {str(e)}"}
     
-        return json.dumps(result, ensure_ascii=False)
+        return result
+    
+    async def _extract_webpages(self, urls: List[str], max_page_chars: int) -> Dict:
+        """批量提取网页：并发请求，每完成一个页面即报告进度，结果按完成顺序排列"""
+        from config import TAVILY_API_KEY, EXTRACT_BATCH_MAX_URLS, EXTRACT_BATCH_MAX_TOTAL_CHARS
+        
+        if isinstance(urls, str):
+            urls = [urls]
+        if len(urls) > EXTRACT_BATCH_MAX_URLS:
+            return {
+                "success": False,
+                "error": f"一次最多批量提取{EXTRACT_BATCH_MAX_URLS}个网页，当前{len(urls)}个，请分批提取"
+            }
+        
+        remaining = EXTRACT_BATCH_MAX_TOTAL_CHARS
+        
+        def on_page(page: Dict, done: int, total: int):
+            nonlocal remaining
+            # 超出单页或总长度限制的页面不返回正文
+            char_count = len(page.get("content", ""))
+            if page["success"] and char_count > max_page_chars:
+                page.update(success=False, char_count=char_count,
+                            error=f"网页内容过长（{char_count}字符），请使用save_webpage保存后用终端命令查看")
+            elif page["success"] and char_count > remaining:
+                page.update(success=False, char_count=char_count,
+                            error=f"批量提取内容总长度超过{EXTRACT_BATCH_MAX_TOTAL_CHARS}字符，本页未返回，请单独提取")
+            elif page["success"]:
+                remaining -= char_count
+            if not page["success"]:
+                for key in ("content", "content_hash", "etag", "cached", "cache_age"):
+                    page.pop(key, None)
+            self.report_tool_progress("extract_webpage", "extracting", f"已完成 {done}/{total}: {page['url']}", {
+                "page": page,
+                "completed": done,
+                "total": total
+            })
+        
+        pages = await extract_webpages_batch(urls, TAVILY_API_KEY, "basic", on_result=on_page)
+        succeeded = sum(1 for page in pages if page["success"])
+        result = {
+            "success": succeeded > 0,
+            "message": f"成功提取 {succeeded}/{len(pages)} 个网页",
+            "completed": succeeded,
+            "failed": len(pages) - succeeded,
+            "pages": pages
+        }
+        if not succeeded:
+            result["error"] = "所有网页提取失败"
+        return result
+    
+    def report_tool_progress(self, tool_name: str, status: str, detail: str, data: Dict = None):
+        """报告工具执行进度（命令行模式打印，Web模式由子类广播）"""
+        print(f"{OUTPUT_FORMATS['search']} {detail}")
+    
+    def report_tool_output(self, tool_name: str, stream: str, text: str):
+        """命令执行过程中的输出（命令行模式直接打印，Web模式由子类广播）"""
+        print(text, end="", flush=True)
     
     async def confirm_action(self, action: str, arguments: Dict) -> bool:
         """确认危险操作"""
@@ -1641,22 +1753,10 @@ class MainTerminal:
         
         # 在最后注入聚焦文件内容作为系统消息
         if self.focused_files:
-            focused_content = "\n\n=== 🔍 正在聚焦的文件 ===\n"
-            focused_content += f"(共 {len(self.focused_files)} 个文件处于聚焦状态)\n"
-            
-            for path, content in self.focused_files.items():
-                size_kb = len(content) / 1024
-                focused_content += f"\n--- 文件: {path} ({size_kb:.1f}KB) ---\n"
-                focused_content += f"```\n{content}\n```\n"
-            
-            focused_content += "\n=== 聚焦文件结束 ===\n"
-            focused_content += "提示：以上文件正在被聚焦，你可以直接看到完整内容并进行修改，禁止再次读取。"
-            
             messages.append({
                 "role": "system",
-                "content": focused_content
+                "content": format_focused_files(self.focused_files)
             })
-    
         
         # 最后添加终端内容（如果需要）
         terminal_content = self.terminal_manager.get_active_terminal_content()
@@ -0,0 +1,367 @@
+# core/multi_worker.py - 多个Web worker进程共享同一数据目录时的协调
+"""
+多个 web_server 进程（worker）放在负载均衡之后、共享 data/ 时：
+    - 文件写入由 utils.file_io 的原子写入与文件锁保证不损坏、不互相覆盖
+    - ConversationLeases：对话租约，同一对话同时只由一个worker持有（按对话ID粘滞）
+    - EventBus：本机Unix socket上的轻量发布/订阅，把房间事件转发给其他worker
+      第一个启动的worker同时充当broker，broker退出后由其他worker接管
+"""
+
+import os
+import re
+import selectors
+import socket
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set
+try:
+    from config import (
+        OUTPUT_FORMATS, CONVERSATIONS_DIR, WORKER_ID,
+        PUBSUB_SOCKET_PATH, CONVERSATION_LEASE_TTL
+    )
+except ImportError:
+    import sys
+    project_root = Path(__file__).resolve().parents[1]
+    if str(project_root) not in sys.path:
+        sys.path.insert(0, str(project_root))
+    from config import (
+        OUTPUT_FORMATS, CONVERSATIONS_DIR, WORKER_ID,
+        PUBSUB_SOCKET_PATH, CONVERSATION_LEASE_TTL
+    )
+
+from utils import serialization
+from utils.file_io import atomic_write, file_lock
+
+# 对话ID只允许安全字符（用作租约文件名）
+CONVERSATION_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,128}$')
+
+
+def get_worker_id() -> str:
+    """当前worker的标识：环境变量 AGENT_WORKER_ID > 配置 WORKER_ID > 主机名-进程号"""
+    return os.environ.get("AGENT_WORKER_ID") or WORKER_ID or f"{socket.gethostname()}-{os.getpid()}"
+
+
+class ConversationLeases:
+    """
+    对话租约
+
+    worker加载或创建对话时申领租约，并在后台定期续期；租约过期（worker退出或卡死）后
+    其他worker才能接手。保证同一对话不会被两个进程同时追加消息而互相覆盖。
+    """
+
+    def __init__(self, worker_id: str, lease_dir: str = None, ttl: int = None):
+        self.worker_id = worker_id
+        self.lease_dir = Path(lease_dir or Path(CONVERSATIONS_DIR) / ".leases")
+        self.ttl = ttl or CONVERSATION_LEASE_TTL
+        self.lease_dir.mkdir(parents=True, exist_ok=True)
+        self._held: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def _path(self, conversation_id: str) -> Path:
+        if not CONVERSATION_ID_PATTERN.match(conversation_id or ""):
+            raise ValueError(f"无效的对话ID: {conversation_id}")
+        return self.lease_dir / f"{conversation_id}.json"
+
+    def _read(self, path: Path) -> Optional[Dict]:
+        try:
+            return serialization.load_file(path)
+        except (OSError, ValueError):
+            return None
+
+    def _live_owner(self, lease: Optional[Dict], now: float) -> Optional[str]:
+        if lease and lease.get("expires_at", 0) > now:
+            return lease.get("worker")
+        return None
+
+    def owner(self, conversation_id: str) -> Optional[str]:
+        """当前持有租约的worker（无人持有或已过期时返回None）"""
+        return self._live_owner(self._read(self._path(conversation_id)), time.time())
+
+    def claim(self, conversation_id: str) -> Optional[str]:
+        """
+        申领或续期租约
+
+        Returns:
+            None 表示已由当前worker持有；否则返回持有该对话的其他worker
+        """
+        path = self._path(conversation_id)
+        with file_lock(path):
+            now = time.time()
+            owner = self._live_owner(self._read(path), now)
+            if owner and owner != self.worker_id:
+                return owner
+            atomic_write(path, serialization.dumps_bytes({
+                "worker": self.worker_id,
+                "pid": os.getpid(),
+                "expires_at": now + self.ttl
+            }))
+        with self._lock:
+            self._held.add(conversation_id)
+        return None
+
+    def release(self, conversation_id: str):
+        """释放当前worker持有的租约"""
+        with self._lock:
+            self._held.discard(conversation_id)
+        path = self._path(conversation_id)
+        with file_lock(path):
+            lease = self._read(path)
+            if lease and lease.get("worker") == self.worker_id:
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+
+    def sync(self, active_ids: Iterable[str]) -> Dict[str, str]:
+        """
+        续期正在使用的对话，释放不再使用的对话
+
+        Returns:
+            被其他worker持有而无法续期的对话 {对话ID: 持有者}
+        """
+        active = {cid for cid in active_ids if cid}
+        conflicts = {}
+        for conversation_id in active:
+            try:
+                owner = self.claim(conversation_id)
+            except ValueError:
+                continue
+            if owner:
+                conflicts[conversation_id] = owner
+        with self._lock:
+            stale = self._held - active
+        for conversation_id in stale:
+            self.release(conversation_id)
+        return conflicts
+
+    def release_all(self):
+        with self._lock:
+            held = list(self._held)
+        for conversation_id in held:
+            try:
+                self.release(conversation_id)
+            except Exception:
+                pass
+
+    def held(self) -> List[str]:
+        with self._lock:
+            return sorted(self._held)
+
+
+class EventBroker:
+    """在Unix socket上接收事件行并转发给其他所有连接（运行在某个worker的后台线程中）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._server: Optional[socket.socket] = None
+        self._selector = selectors.DefaultSelector()
+        self._buffers: Dict[socket.socket, bytes] = {}
+        self._closed = False
+
+    def start(self):
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.path)
+        server.listen(64)
+        server.setblocking(False)
+        self._server = server
+        self._selector.register(server, selectors.EVENT_READ)
+        threading.Thread(target=self._serve, name="event-broker", daemon=True).start()
+
+    def _serve(self):
+        while not self._closed:
+            for key, _ in self._selector.select(timeout=1):
+                if key.fileobj is self._server:
+                    self._accept()
+                else:
+                    self._read(key.fileobj)
+
+    def _accept(self):
+        try:
+            conn, _ = self._server.accept()
+        except OSError:
+            return
+        # 慢消费者最多阻塞1秒，超时即断开，避免拖住其他worker
+        conn.settimeout(1)
+        self._buffers[conn] = b""
+        self._selector.register(conn, selectors.EVENT_READ)
+
+    def _drop(self, conn: socket.socket):
+        self._buffers.pop(conn, None)
+        try:
+            self._selector.unregister(conn)
+        except (KeyError, ValueError):
+            pass
+        conn.close()
+
+    def _read(self, conn: socket.socket):
+        try:
+            data = conn.recv(65536)
+        except OSError:
+            data = b""
+        if not data:
+            self._drop(conn)
+            return
+        buffer = self._buffers.get(conn, b"") + data
+        end = buffer.rfind(b"\n")
+        if end == -1:
+            self._buffers[conn] = buffer
+            return
+        self._buffers[conn] = buffer[end + 1:]
+        payload = buffer[:end + 1]
+        for other in list(self._buffers):
+            if other is conn:
+                continue
+            try:
+                other.sendall(payload)
+            except OSError:
+                self._drop(other)
+
+    def close(self):
+        self._closed = True
+        for conn in list(self._buffers):
+            self._drop(conn)
+        if self._server:
+            self._server.close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+
+class EventBus:
+    """
+    跨进程事件总线客户端
+
+    publish() 把 (房间, 事件, 数据) 发给其他worker；收到的事件交给 handler 在本进程内投递。
+    连接不上broker时由当前进程启动broker；断线后自动重连（必要时接管broker）。
+    """
+
+    RECONNECT_DELAY = 1.0
+
+    def __init__(self, worker_id: str, handler: Callable[[str, str, Dict], None], path: str = None):
+        self.worker_id = worker_id
+        self.handler = handler
+        self.path = path or PUBSUB_SOCKET_PATH
+        self.broker: Optional[EventBroker] = None
+        self._sock: Optional[socket.socket] = None
+        self._send_lock = threading.Lock()
+        self._closed = False
+        self.published = 0
+        self.received = 0
+        self.dropped = 0
+
+    def start(self) -> "EventBus":
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        threading.Thread(target=self._run, name="event-bus", daemon=True).start()
+        return self
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            # 连接失败：在锁内确认没有存活的broker后，由本进程启动broker
+            with file_lock(self.path):
+                probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                try:
+                    probe.connect(self.path)
+                    sock = probe
+                except OSError:
+                    probe.close()
+                    try:
+                        os.unlink(self.path)
+                    except FileNotFoundError:
+                        pass
+                    self.broker = EventBroker(self.path)
+                    self.broker.start()
+                    print(f"{OUTPUT_FORMATS['info']} 事件总线broker已启动: {self.path}")
+                    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                    sock.connect(self.path)
+        return sock
+
+    def _run(self):
+        while not self._closed:
+            try:
+                sock = self._connect()
+            except OSError as e:
+                print(f"{OUTPUT_FORMATS['warning']} 连接事件总线失败: {e}")
+                time.sleep(self.RECONNECT_DELAY)
+                continue
+            with self._send_lock:
+                self._sock = sock
+            self._receive(sock)
+            with self._send_lock:
+                self._sock = None
+            sock.close()
+            if not self._closed:
+                time.sleep(self.RECONNECT_DELAY)
+
+    def _receive(self, sock: socket.socket):
+        buffer = b""
+        while not self._closed:
+            try:
+                data = sock.recv(65536)
+            except OSError:
+                return
+            if not data:
+                return
+            buffer += data
+            lines = buffer.split(b"\n")
+            buffer = lines.pop()
+            for line in lines:
+                if not line:
+                    continue
+                try:
+                    message = serialization.loads(line)
+                except ValueError:
+                    continue
+                if message.get("worker") == self.worker_id:
+                    continue
+                self.received += 1
+                try:
+                    self.handler(message.get("room"), message.get("event"), message.get("data"))
+                except Exception as e:
+                    print(f"{OUTPUT_FORMATS['warning']} 处理跨进程事件失败: {e}")
+
+    def publish(self, room: Optional[str], event: str, data) -> bool:
+        """发布事件到其他worker（未连接时丢弃，返回False）"""
+        line = serialization.dumps_bytes({
+            "worker": self.worker_id,
+            "room": room,
+            "event": event,
+            "data": data
+        }) + b"\n"
+        with self._send_lock:
+            if self._sock is None:
+                self.dropped += 1
+                return False
+            try:
+                self._sock.sendall(line)
+            except OSError:
+                self.dropped += 1
+                return False
+        self.published += 1
+        return True
+
+    def stats(self) -> Dict:
+        return {
+            "path": self.path,
+            "connected": self._sock is not None,
+            "is_broker": self.broker is not None,
+            "published": self.published,
+            "received": self.received,
+            "dropped": self.dropped
+        }
+
+    def close(self):
+        self._closed = True
+        with self._send_lock:
+            if self._sock:
+                try:
+                    self._sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        if self.broker:
+            self.broker.close()
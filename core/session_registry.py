@@ -0,0 +1,258 @@
+# core/session_registry.py - Web会话注册表（每个客户端一个独立的WebTerminal）
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Set
+try:
+    from config import OUTPUT_FORMATS, MAX_SESSIONS, SESSION_IDLE_TIMEOUT, SESSION_MEMORY_LIMIT_MB
+except ImportError:
+    import sys
+    from pathlib import Path
+    project_root = Path(__file__).resolve().parents[1]
+    if str(project_root) not in sys.path:
+        sys.path.insert(0, str(project_root))
+    from config import OUTPUT_FORMATS, MAX_SESSIONS, SESSION_IDLE_TIMEOUT, SESSION_MEMORY_LIMIT_MB
+
+
+class SessionLimitError(Exception):
+    """会话数已达上限且没有可回收的空闲会话"""
+
+
+class SessionEntry:
+    """注册表中的一个会话"""
+
+    def __init__(self, key: str, terminal: Any):
+        self.key = key
+        self.terminal = terminal
+        self.created_at = time.time()
+        self.last_active = self.created_at
+        self.connections: Set[str] = set()  # 当前连接的socket sid
+
+
+class SessionRegistry:
+    """
+    客户端 → WebTerminal 的映射
+
+    每个会话拥有独立的对话、聚焦文件和终端集合；
+    无连接且无任务的会话超过空闲时间后被回收，会话数达到上限时优先回收最久未活动的空闲会话。
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[str], Any],
+        busy_check: Callable[[str], bool] = None,
+        max_sessions: int = None,
+        idle_timeout: float = None,
+        memory_limit_mb: float = None
+    ):
+        """
+        Args:
+            factory: 根据会话key创建WebTerminal的函数
+            busy_check: 判断会话是否有任务在执行或排队（有任务的会话不会被回收）
+            max_sessions: 最大会话数
+            idle_timeout: 空闲回收时间（秒）
+            memory_limit_mb: 单会话内存估算上限
+        """
+        self.factory = factory
+        self.busy_check = busy_check or (lambda key: False)
+        self.max_sessions = max_sessions or MAX_SESSIONS
+        self.idle_timeout = idle_timeout if idle_timeout is not None else SESSION_IDLE_TIMEOUT
+        self.memory_limit_bytes = int((memory_limit_mb or SESSION_MEMORY_LIMIT_MB) * 1024 * 1024)
+
+        self._sessions: Dict[str, SessionEntry] = {}
+        self._sid_keys: Dict[str, str] = {}
+        self._lock = threading.RLock()
+
+    # ------------------------------------------------------------------
+    # 获取与连接管理
+    # ------------------------------------------------------------------
+
+    def get(self, key: str, create: bool = True) -> Optional[Any]:
+        """获取会话的WebTerminal，不存在时按需创建"""
+        if not key:
+            return None
+        evicted: List[SessionEntry] = []
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is None:
+                if not create:
+                    return None
+                entry = self._create(key, evicted)
+            entry.last_active = time.time()
+            terminal = entry.terminal
+        self._close_entries(evicted, "会话数达到上限")
+        return terminal
+
+    def _create(self, key: str, evicted: List[SessionEntry]) -> SessionEntry:
+        """创建会话（需持有锁）；为腾出名额移除的会话加入evicted，由调用方在释放锁后关闭"""
+        if len(self._sessions) >= self.max_sessions:
+            candidates = sorted(
+                (e for e in self._sessions.values() if self._is_idle(e)),
+                key=lambda e: (not self._over_limit(e), e.last_active)
+            )
+            if not candidates:
+                raise SessionLimitError(f"已达到最大会话数量限制 ({self.max_sessions})")
+            evicted.append(self._remove_entry(candidates[0]))
+
+        terminal = self.factory(key)
+        entry = SessionEntry(key, terminal)
+        self._sessions[key] = entry
+        print(f"{OUTPUT_FORMATS['session']} 新建会话: {key} (当前 {len(self._sessions)}/{self.max_sessions})")
+        return entry
+
+    def attach(self, key: str, sid: str):
+        """记录socket连接属于哪个会话"""
+        evicted: List[SessionEntry] = []
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is None:
+                entry = self._create(key, evicted)
+            entry.connections.add(sid)
+            entry.last_active = time.time()
+            self._sid_keys[sid] = key
+        self._close_entries(evicted, "会话数达到上限")
+
+    def detach(self, sid: str) -> Optional[str]:
+        """断开socket连接，返回其所属会话key"""
+        with self._lock:
+            key = self._sid_keys.pop(sid, None)
+            entry = self._sessions.get(key) if key else None
+            if entry:
+                entry.connections.discard(sid)
+                entry.last_active = time.time()
+            return key
+
+    def key_for_sid(self, sid: str) -> Optional[str]:
+        return self._sid_keys.get(sid)
+
+    def touch(self, key: str):
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry:
+                entry.last_active = time.time()
+
+    def _is_idle(self, entry: SessionEntry) -> bool:
+        return not entry.connections and not self.busy_check(entry.key)
+
+    # ------------------------------------------------------------------
+    # 内存估算
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def estimate_memory(terminal: Any) -> int:
+        """估算会话占用（UTF-8字节数，与内存上限同一单位）：对话历史 + 聚焦文件 + 终端缓冲"""
+        size = 0
+        context_manager = getattr(terminal, "context_manager", None)
+        if context_manager:
+            for message in context_manager.conversation_history:
+                content = message.get("content")
+                if isinstance(content, str):
+                    size += len(content.encode("utf-8"))
+        for content in getattr(terminal, "focused_files", {}).values():
+            if isinstance(content, str):
+                size += len(content.encode("utf-8"))
+        terminal_manager = getattr(terminal, "terminal_manager", None)
+        if terminal_manager:
+            for session in list(terminal_manager.terminals.values()):
+                size += sum(len(line.encode("utf-8")) for line in list(session.output_buffer))
+        return size
+
+    def _over_limit(self, entry: SessionEntry) -> bool:
+        return self.estimate_memory(entry.terminal) > self.memory_limit_bytes
+
+    def is_over_memory_limit(self, key: str) -> bool:
+        with self._lock:
+            entry = self._sessions.get(key)
+            return bool(entry) and self._over_limit(entry)
+
+    # ------------------------------------------------------------------
+    # 回收
+    # ------------------------------------------------------------------
+
+    def _remove_entry(self, entry: SessionEntry) -> SessionEntry:
+        """从注册表中移除会话（需持有锁），关闭由 _close_entries 在释放锁后完成"""
+        self._sessions.pop(entry.key, None)
+        for sid in list(entry.connections):
+            self._sid_keys.pop(sid, None)
+        return entry
+
+    def _close_entries(self, entries: List[SessionEntry], reason: str):
+        for entry in entries:
+            self._close_entry(entry, reason)
+
+    def _close_entry(self, entry: SessionEntry, reason: str):
+        """保存对话并关闭终端（不持有锁，关闭shell较慢时不阻塞其他会话的获取）"""
+        terminal = entry.terminal
+        try:
+            terminal.context_manager.auto_save_conversation()
+        except Exception as e:
+            print(f"{OUTPUT_FORMATS['warning']} 回收会话时保存对话失败: {e}")
+        try:
+            if terminal.terminal_manager:
+                terminal.terminal_manager.close_all()
+        except Exception as e:
+            print(f"{OUTPUT_FORMATS['warning']} 回收会话时关闭终端失败: {e}")
+        terminal.context_manager.stop_file_watcher()
+        print(f"{OUTPUT_FORMATS['info']} 回收会话: {entry.key}（{reason}）")
+
+    def evict(self, key: str, reason: str = "手动回收") -> bool:
+        with self._lock:
+            entry = self._sessions.get(key)
+            if not entry:
+                return False
+            self._remove_entry(entry)
+        self._close_entry(entry, reason)
+        return True
+
+    def evict_idle(self, now: float = None) -> List[str]:
+        """回收超时的空闲会话，以及超过内存上限的空闲会话"""
+        now = now or time.time()
+        removed = []
+        with self._lock:
+            for entry in list(self._sessions.values()):
+                if not self._is_idle(entry):
+                    continue
+                if now - entry.last_active >= self.idle_timeout:
+                    removed.append((self._remove_entry(entry), "空闲超时"))
+                elif self._over_limit(entry):
+                    removed.append((self._remove_entry(entry), "超过内存上限"))
+        for entry, reason in removed:
+            self._close_entry(entry, reason)
+        return [entry.key for entry, _ in removed]
+
+    def close_all(self):
+        with self._lock:
+            entries = [self._remove_entry(entry) for entry in list(self._sessions.values())]
+        self._close_entries(entries, "服务关闭")
+
+    # ------------------------------------------------------------------
+    # 状态
+    # ------------------------------------------------------------------
+
+    def list_sessions(self) -> List[Dict]:
+        with self._lock:
+            return [{
+                "key": entry.key,
+                "created_at": entry.created_at,
+                "last_active": entry.last_active,
+                "connections": len(entry.connections),
+                "busy": self.busy_check(entry.key),
+                "memory_estimate": self.estimate_memory(entry.terminal),
+                "conversation_id": entry.terminal.context_manager.current_conversation_id
+            } for entry in self._sessions.values()]
+
+    def conversation_ids(self) -> List[str]:
+        """各会话当前打开的对话ID"""
+        with self._lock:
+            return [
+                entry.terminal.context_manager.current_conversation_id
+                for entry in self._sessions.values()
+                if entry.terminal.context_manager.current_conversation_id
+            ]
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __bool__(self):
+        # 没有会话时注册表仍然可用，不能因为 __len__ 为0被当作未初始化
+        return True
@@ -0,0 +1,296 @@
+# core/task_scheduler.py - 多会话任务调度（会话内串行，会话间轮转，LLM流并发上限）
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Deque, Dict, List, Optional, Set, Tuple
+try:
+    from config import MAX_CONCURRENT_TASKS, MAX_CONCURRENT_LLM_STREAMS
+except ImportError:
+    import sys
+    from pathlib import Path
+    project_root = Path(__file__).resolve().parents[1]
+    if str(project_root) not in sys.path:
+        sys.path.insert(0, str(project_root))
+    from config import MAX_CONCURRENT_TASKS, MAX_CONCURRENT_LLM_STREAMS
+
+
+class _QueuedJob:
+    """排队中的任务"""
+
+    __slots__ = ("key", "run", "on_position", "submitted_at", "position")
+
+    def __init__(self, key: str, run: Callable[[], None], on_position: Optional[Callable[[int], None]]):
+        self.key = key
+        self.run = run
+        self.on_position = on_position
+        self.submitted_at = time.perf_counter()
+        self.position = None
+
+
+class FairTaskScheduler:
+    """
+    公平任务调度器
+
+    - 固定大小的工作线程池，全局最多同时执行 max_concurrent 个任务
+    - 每个会话一个FIFO队列，同一会话同时最多执行一个任务（任务共享会话的WebTerminal状态）
+    - 有空闲槽位时按会话轮转取任务，单个会话连续提交不会饿死其他会话
+    - 排队位置变化时通过 on_position 回调通知（0 表示开始执行）
+    """
+
+    def __init__(self, max_concurrent: int = None, spawn: Callable = None):
+        """
+        Args:
+            max_concurrent: 全局并发上限（即工作线程数）
+            spawn: 自定义的任务启动函数 spawn(func, *args)，默认使用内部线程池
+        """
+        self.max_concurrent = max(1, max_concurrent or MAX_CONCURRENT_TASKS)
+        if spawn is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent, thread_name_prefix="agent-task")
+            spawn = self._executor.submit
+        else:
+            self._executor = None
+        self._spawn = spawn
+
+        self._queues: "OrderedDict[str, Deque[_QueuedJob]]" = OrderedDict()
+        self._running: Set[str] = set()
+        self._lock = threading.Lock()
+
+        # 指标
+        self._submitted = 0
+        self._completed = 0
+        self._cancelled = 0
+        self._max_queue_depth = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._waited = 0
+
+    def submit(self, key: str, job: Callable[[], None], on_position: Callable[[int], None] = None) -> int:
+        """
+        提交任务
+
+        Args:
+            key: 会话标识
+            job: 任务函数（在工作线程中执行）
+            on_position: 排队位置变化回调，参数为预计的开始顺序（1为下一个），0表示开始执行
+
+        Returns:
+            提交时的排队位置（0表示立即执行）
+        """
+        queued = _QueuedJob(key, job, on_position)
+        with self._lock:
+            self._submitted += 1
+            self._queues.setdefault(key, deque()).append(queued)
+            ready = self._collect_ready()
+            self._max_queue_depth = max(self._max_queue_depth, self._queue_depth())
+            notices = self._position_notices()
+        self._start(ready)
+        self._notify(notices)
+        return queued.position or 0
+
+    def is_busy(self, key: str) -> bool:
+        """会话是否有正在执行或排队的任务"""
+        with self._lock:
+            return key in self._running or bool(self._queues.get(key))
+
+    def pending(self, key: str) -> int:
+        with self._lock:
+            return len(self._queues.get(key) or ())
+
+    def cancel_pending(self, key: str) -> int:
+        """丢弃会话中尚未开始的任务，返回丢弃数量"""
+        with self._lock:
+            queue = self._queues.pop(key, None)
+            dropped = len(queue) if queue else 0
+            self._cancelled += dropped
+            notices = self._position_notices()
+        self._notify(notices)
+        return dropped
+
+    def stats(self) -> Dict:
+        """队列深度与等待时间指标"""
+        with self._lock:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "running": len(self._running),
+                "queued": self._queue_depth(),
+                "max_queue_depth": self._max_queue_depth,
+                "sessions_waiting": sum(1 for q in self._queues.values() if q),
+                "queue_by_session": {key: len(q) for key, q in self._queues.items() if q},
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "cancelled": self._cancelled,
+                "avg_wait_ms": round(self._total_wait / self._waited * 1000, 3) if self._waited else 0.0,
+                "max_wait_ms": round(self._max_wait * 1000, 3)
+            }
+
+    def shutdown(self, wait: bool = False):
+        if self._executor:
+            self._executor.shutdown(wait=wait)
+
+    # ------------------------------------------------------------------
+    # 内部实现（_start/_notify/_run 之外的方法需在持锁状态下调用）
+    # ------------------------------------------------------------------
+
+    def _queue_depth(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def _collect_ready(self) -> List[_QueuedJob]:
+        """按轮转顺序取出可以开始的任务"""
+        ready = []
+        while len(self._running) < self.max_concurrent:
+            picked = None
+            for key, queue in self._queues.items():
+                if key not in self._running and queue:
+                    picked = key
+                    break
+            if picked is None:
+                break
+            queue = self._queues[picked]
+            job = queue.popleft()
+            if queue:
+                self._queues.move_to_end(picked)
+            else:
+                del self._queues[picked]
+            self._running.add(picked)
+
+            waited = time.perf_counter() - job.submitted_at
+            self._waited += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+            ready.append(job)
+        return ready
+
+    def _position_notices(self) -> List[Tuple[_QueuedJob, int]]:
+        """按轮转顺序估算每个排队任务的开始顺序，返回位置有变化的任务"""
+        notices = []
+        position = 0
+        waiting = [key for key, queue in self._queues.items() if queue]
+        # 正在执行任务的会话要等当前任务结束并轮到队尾后才能继续
+        active = [key for key in waiting if key not in self._running] + \
+                 [key for key in waiting if key in self._running]
+        cursors = {key: 0 for key in active}
+        while active:
+            next_active = []
+            for key in active:
+                queue = self._queues[key]
+                position += 1
+                job = queue[cursors[key]]
+                if job.position != position:
+                    job.position = position
+                    notices.append((job, position))
+                cursors[key] += 1
+                if cursors[key] < len(queue):
+                    next_active.append(key)
+            active = next_active
+        return notices
+
+    def _notify(self, notices: List[Tuple[_QueuedJob, int]]):
+        for job, position in notices:
+            if job.on_position:
+                try:
+                    job.on_position(position)
+                except Exception:
+                    pass
+
+    def _start(self, ready: List[_QueuedJob]):
+        for job in ready:
+            # 排过队的任务通知开始执行
+            if job.position:
+                job.position = 0
+                self._notify([(job, 0)])
+            self._spawn(self._run, job)
+
+    def _run(self, job: _QueuedJob):
+        try:
+            job.run()
+        finally:
+            with self._lock:
+                self._completed += 1
+                self._running.discard(job.key)
+                # 刚执行完的会话排到队尾，让其他等待中的会话先执行
+                if job.key in self._queues:
+                    self._queues.move_to_end(job.key)
+                ready = self._collect_ready()
+                notices = self._position_notices()
+            self._start(ready)
+            self._notify(notices)
+
+
+class StreamLimiter:
+    """
+    LLM流式请求的全局并发上限
+
+    所有任务运行在同一个事件循环上，信号量在首次使用时按当前循环创建。
+    """
+
+    def __init__(self, limit: int = None):
+        self.limit = max(1, limit or MAX_CONCURRENT_LLM_STREAMS)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.active = 0
+        self.waiting = 0
+        self._max_active = 0
+        self._streams = 0
+        self._waits = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    async def limit_stream(self, stream: AsyncIterator, on_wait: Callable[[int], None] = None) -> AsyncIterator:
+        """
+        占用一个流槽位后转发stream中的数据，流结束或关闭时释放
+
+        Args:
+            stream: 原始的异步迭代器（如 api_client.chat(...)）
+            on_wait: 需要等待槽位时的回调，参数为当前等待数
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+
+        started = time.perf_counter()
+        if self._semaphore.locked():
+            self.waiting += 1
+            if on_wait:
+                on_wait(self.waiting)
+            try:
+                await self._semaphore.acquire()
+            finally:
+                self.waiting -= 1
+            waited = time.perf_counter() - started
+            self._waits += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+        else:
+            await self._semaphore.acquire()
+
+        self.active += 1
+        self._streams += 1
+        self._max_active = max(self._max_active, self.active)
+        try:
+            async for item in stream:
+                yield item
+        finally:
+            try:
+                # 提前关闭时同时关闭底层流（释放HTTP连接）
+                aclose = getattr(stream, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+            finally:
+                self.active -= 1
+                self._semaphore.release()
+            aclose = getattr(stream, "aclose", None)
+            if aclose:
+                await aclose()
+
+    def stats(self) -> Dict:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "waiting": self.waiting,
+            "max_active": self._max_active,
+            "streams": self._streams,
+            "waits": self._waits,
+            "avg_wait_ms": round(self._total_wait / self._waits * 1000, 3) if self._waits else 0.0,
+            "max_wait_ms": round(self._max_wait * 1000, 3)
+        }
@@ -1,8 +1,7 @@
 # core/web_terminal.py - Web终端（集成对话持久化）
 
-import json
 from typing import Dict, List, Optional, Callable
-from core.main_terminal import MainTerminal
+from core.main_terminal import MainTerminal, EXTERNAL_FILE_CHANGE_TOOLS
 try:
     from config import MAX_TERMINALS, TERMINAL_BUFFER_SIZE, TERMINAL_DISPLAY_SIZE
 except ImportError:
@@ -13,6 +12,9 @@ except ImportError:
         sys.path.insert(0, str(project_root))
     from config import MAX_TERMINALS, TERMINAL_BUFFER_SIZE, TERMINAL_DISPLAY_SIZE
 from modules.terminal_manager import TerminalManager
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
 
 class WebTerminal(MainTerminal):
     """Web版本的终端，继承自MainTerminal，包含对话持久化功能"""
@@ -59,6 +61,9 @@ class WebTerminal(MainTerminal):
         if message_callback is not None:
             self.context_manager._web_terminal_callback = message_callback
             self.context_manager._focused_files = self.focused_files
+            self.context_manager.set_file_tree_listener(
+                lambda delta: self.broadcast('file_tree_delta', delta)
+            )
             print(f"[WebTerminal] 实时token统计已启用")
         else:
             print(f"[WebTerminal] 警告：message_callback为None，无法启用实时token统计")
@@ -292,9 +297,9 @@ class WebTerminal(MainTerminal):
     # 覆盖父类方法，添加Web特有的广播功能
     # ===========================================
     
-    async def handle_tool_call(self, tool_name: str, arguments: Dict) -> str:
+    async def execute_tool(self, tool_name: str, arguments: Dict) -> Dict:
         """
-        处理工具调用（Web版本）
+        执行工具调用（Web版本）
         覆盖父类方法，添加增强的实时广播功能
         """
         # 立即广播工具执行开始事件（不等待）
@@ -359,10 +364,11 @@ class WebTerminal(MainTerminal):
                 'detail': f'搜索: {arguments.get("query", "")}'
             })
         elif tool_name == "extract_webpage":
+            urls = arguments.get("urls")
             self.broadcast('tool_status', {
                 'tool': tool_name,
                 'status': 'extracting',
-                'detail': f'提取网页: {arguments.get("url", "")}'
+                'detail': f'批量提取 {len(urls)} 个网页' if urls else f'提取网页: {arguments.get("url", "")}'
             })
         elif tool_name == "save_webpage":
             self.broadcast('tool_status', {
@@ -409,77 +415,63 @@ class WebTerminal(MainTerminal):
             })
         
         # 调用父类的工具处理（包含我们的新逻辑）
-        result = await super().handle_tool_call(tool_name, arguments)
+        result_data = await super().execute_tool(tool_name, arguments)
         
-        # 解析结果并广播工具结束事件
-        try:
-            result_data = json.loads(result)
-            success = result_data.get('success', False)
+        # 根据结果广播工具结束事件
+        success = result_data.get('success', False)
+        
+        # 特殊处理某些错误类型
+        if not success:
+            error_msg = result_data.get('error', '执行失败')
             
-            # 特殊处理某些错误类型
-            if not success:
-                error_msg = result_data.get('error', '执行失败')
-                
-                # 检查是否是参数预检查失败
-                if '参数过大' in error_msg or '内容过长' in error_msg:
-                    self.broadcast('tool_execution_end', {
-                        'tool': tool_name,
-                        'success': False,
-                        'result': result_data,
-                        'message': f'{tool_name} 执行失败: 参数过长',
-                        'error_type': 'parameter_too_long',
-                        'suggestion': result_data.get('suggestion', '建议分块处理')
-                    })
-                elif 'JSON解析' in error_msg or '参数解析失败' in error_msg:
-                    self.broadcast('tool_execution_end', {
-                        'tool': tool_name,
-                        'success': False,
-                        'result': result_data,
-                        'message': f'{tool_name} 执行失败: 参数格式错误',
-                        'error_type': 'parameter_format_error',
-                        'suggestion': result_data.get('suggestion', '请检查参数格式')
-                    })
-                elif 'requires_confirmation' in result_data:
-                    # 特殊处理需要确认的情况（read_file拦截）
-                    self.broadcast('tool_execution_end', {
-                        'tool': tool_name,
-                        'success': False,
-                        'result': result_data,
-                        'message': f'{tool_name}: 需要用户确认操作方式',
-                        'error_type': 'requires_confirmation',
-                        'instruction': result_data.get('instruction', '')
-                    })
-                else:
-                    # 一般错误
-                    self.broadcast('tool_execution_end', {
-                        'tool': tool_name,
-                        'success': False,
-                        'result': result_data,
-                        'message': f'{tool_name} 执行失败: {error_msg}',
-                        'error_type': 'general_error'
-                    })
+            # 检查是否是参数预检查失败
+            if '参数过大' in error_msg or '内容过长' in error_msg:
+                self.broadcast('tool_execution_end', {
+                    'tool': tool_name,
+                    'success': False,
+                    'result': result_data,
+                    'message': f'{tool_name} 执行失败: 参数过长',
+                    'error_type': 'parameter_too_long',
+                    'suggestion': result_data.get('suggestion', '建议分块处理')
+                })
+            elif 'JSON解析' in error_msg or '参数解析失败' in error_msg:
+                self.broadcast('tool_execution_end', {
+                    'tool': tool_name,
+                    'success': False,
+                    'result': result_data,
+                    'message': f'{tool_name} 执行失败: 参数格式错误',
+                    'error_type': 'parameter_format_error',
+                    'suggestion': result_data.get('suggestion', '请检查参数格式')
+                })
+            elif 'requires_confirmation' in result_data:
+                # 特殊处理需要确认的情况（read_file拦截）
+                self.broadcast('tool_execution_end', {
+                    'tool': tool_name,
+                    'success': False,
+                    'result': result_data,
+                    'message': f'{tool_name}: 需要用户确认操作方式',
+                    'error_type': 'requires_confirmation',
+                    'instruction': result_data.get('instruction', '')
+                })
             else:
-                # 成功的情况
-                success_msg = result_data.get('message', f'{tool_name} 执行成功')
+                # 一般错误
                 self.broadcast('tool_execution_end', {
                     'tool': tool_name,
-                    'success': True,
+                    'success': False,
                     'result': result_data,
-                    'message': success_msg
+                    'message': f'{tool_name} 执行失败: {error_msg}',
+                    'error_type': 'general_error'
                 })
-                
-        except json.JSONDecodeError:
-            # 无法解析JSON结果
-            success = False
-            result_data = {'output': result, 'raw_result': True}
+        else:
+            # 成功的情况
+            success_msg = result_data.get('message', f'{tool_name} 执行成功')
             self.broadcast('tool_execution_end', {
                 'tool': tool_name,
-                'success': False,
+                'success': True,
                 'result': result_data,
-                'message': f'{tool_name} 返回了非JSON格式结果',
-                'error_type': 'invalid_result_format'
+                'message': success_msg
             })
-        
+            
         # 如果是终端相关操作，广播终端更新
         if tool_name in ['terminal_session', 'terminal_input'] and self.terminal_manager:
             try:
@@ -491,13 +483,12 @@ class WebTerminal(MainTerminal):
             except Exception as e:
                 logger.error(f"广播终端更新失败: {e}")
         
-        # 如果是文件操作，广播文件树更新
-        if tool_name in ['create_file', 'delete_file', 'rename_file', 'create_folder', 'confirm_read_or_focus', 'save_webpage']:
+        # 文件树变化由增量回调推送（file_tree_delta）；终端类工具执行后刷新一次以便及时推送
+        if tool_name in EXTERNAL_FILE_CHANGE_TOOLS:
             try:
-                structure = self.context_manager.get_project_structure()
-                self.broadcast('file_tree_update', structure)
+                self.context_manager.get_project_structure()
             except Exception as e:
-                logger.error(f"广播文件树更新失败: {e}")
+                logger.error(f"刷新文件树失败: {e}")
         
         
         # 如果是聚焦操作，广播聚焦文件更新
@@ -523,7 +514,7 @@ class WebTerminal(MainTerminal):
             except Exception as e:
                 logger.error(f"广播记忆更新失败: {e}")
         
-        return result
+        return result_data
     
     def build_context(self) -> Dict:
         """构建上下文（Web版本）"""
@@ -549,6 +540,25 @@ class WebTerminal(MainTerminal):
         
         return context
     
+    def report_tool_progress(self, tool_name: str, status: str, detail: str, data: Dict = None):
+        """广播工具执行进度（批量提取时每完成一个网页推送一次）"""
+        payload = {
+            'tool': tool_name,
+            'status': status,
+            'detail': detail
+        }
+        if data:
+            payload.update(data)
+        self.broadcast('tool_status', payload)
+    
+    def report_tool_output(self, tool_name: str, stream: str, text: str):
+        """推送run_command/run_python执行中的输出"""
+        self.broadcast('tool_output', {
+            'tool': tool_name,
+            'stream': stream,
+            'data': text
+        })
+    
     async def confirm_action(self, action: str, arguments: Dict) -> bool:
         """
         确认危险操作（Web版本）
@@ -14,6 +14,8 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 from config import *
 from core.main_terminal import MainTerminal
 from utils.logger import setup_logger
+from utils import serialization
+from utils.startup import start_warm_up
 
 logger = setup_logger(__name__)
 
@@ -30,6 +32,10 @@ class AgentSystem:
         print("🤖 AI Agent 系统启动")
         print("="*50)
         
+        # 用户输入路径和模式期间在后台预热（分词器、HTTP客户端、终端探测）
+        if STARTUP_WARM_UP_ENABLED:
+            start_warm_up()
+        
         # 1. 获取项目路径
         await self.setup_project_path()
         
@@ -255,11 +261,9 @@ class AgentSystem:
                         raise json.JSONDecodeError("Empty file", "", 0)
             except (json.JSONDecodeError, KeyError):
                 print(f"{OUTPUT_FORMATS['warning']} 修复对话历史文件...")
-                with open(conversation_file, 'w', encoding='utf-8') as f:
-                    json.dump({"conversations": []}, f, ensure_ascii=False, indent=2)
+                serialization.dump_file(conversation_file, {"conversations": []})
         else:
-            with open(conversation_file, 'w', encoding='utf-8') as f:
-                json.dump({"conversations": []}, f, ensure_ascii=False, indent=2)
+            serialization.dump_file(conversation_file, {"conversations": []})
     
     async def start_web_server(self):
         """启动Web服务器"""
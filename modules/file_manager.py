@@ -3,7 +3,7 @@
 import os
 import shutil
 from pathlib import Path
-from typing import Optional, Dict, List, Tuple
+from typing import Callable, Optional, Dict, List, Tuple
 from datetime import datetime
 try:
     from config import MAX_FILE_SIZE, FORBIDDEN_PATHS, FORBIDDEN_ROOT_PATHS, OUTPUT_FORMATS
@@ -19,6 +19,17 @@ DISABLE_LENGTH_CHECK = True
 class FileManager:
     def __init__(self, project_path: str):
         self.project_path = Path(project_path).resolve()
+        # 文件变更回调（参数为变化的相对路径列表），用于增量更新文件树
+        self.change_listener: Optional[Callable[[List[str]], None]] = None
+    
+    def _notify_change(self, *full_paths: Path):
+        """通知文件变更（回调异常不影响文件操作本身）"""
+        if not self.change_listener:
+            return
+        try:
+            self.change_listener([str(path.relative_to(self.project_path)) for path in full_paths])
+        except Exception as e:
+            print(f"{OUTPUT_FORMATS['warning']} 文件变更通知失败: {e}")
         
     def _validate_path(self, path: str) -> Tuple[bool, str, Path]:
         """
@@ -84,6 +95,7 @@ class FileManager:
             
             relative_path = str(full_path.relative_to(self.project_path))
             print(f"{OUTPUT_FORMATS['file']} 创建文件: {relative_path}")
+            self._notify_change(full_path)
             
             return {
                 "success": True,
@@ -109,6 +121,7 @@ class FileManager:
             relative_path = str(full_path.relative_to(self.project_path))
             full_path.unlink()
             print(f"{OUTPUT_FORMATS['file']} 删除文件: {relative_path}")
+            self._notify_change(full_path)
             
             # 删除文件备注（如果存在）
             # 这需要通过context_manager处理，但file_manager没有直接访问权限
@@ -144,6 +157,7 @@ class FileManager:
             old_relative = str(full_old_path.relative_to(self.project_path))
             new_relative = str(full_new_path.relative_to(self.project_path))
             print(f"{OUTPUT_FORMATS['file']} 重命名: {old_relative} -> {new_relative}")
+            self._notify_change(full_old_path, full_new_path)
             
             return {
                 "success": True,
@@ -167,6 +181,7 @@ class FileManager:
             full_path.mkdir(parents=True, exist_ok=True)
             relative_path = str(full_path.relative_to(self.project_path))
             print(f"{OUTPUT_FORMATS['file']} 创建文件夹: {relative_path}")
+            self._notify_change(full_path)
             
             return {"success": True, "path": relative_path}
         except Exception as e:
@@ -188,6 +203,7 @@ class FileManager:
             shutil.rmtree(full_path)
             relative_path = str(full_path.relative_to(self.project_path))
             print(f"{OUTPUT_FORMATS['file']} 删除文件夹: {relative_path}")
+            self._notify_change(full_path)
             
             return {"success": True, "path": relative_path}
         except Exception as e:
@@ -268,6 +284,7 @@ class FileManager:
             relative_path = str(full_path.relative_to(self.project_path))
             action = "覆盖" if mode == "w" else "追加"
             print(f"{OUTPUT_FORMATS['file']} {action}文件: {relative_path}")
+            self._notify_change(full_path)
             
             return {
                 "success": True,
@@ -378,6 +395,7 @@ class FileManager:
                 with open(full_path, 'w', encoding='utf-8') as f:
                     f.write(current_content)
                 write_performed = True
+                self._notify_change(full_path)
             except Exception as e:
                 write_error = f"写入文件失败: {e}"
                 # 写入失败时恢复原始内容
@@ -529,6 +547,7 @@ class FileManager:
             # 写回文件
             with open(full_path, 'w', encoding='utf-8') as f:
                 f.writelines(lines)
+            self._notify_change(full_path)
             
             relative_path = str(full_path.relative_to(self.project_path))
             
@@ -14,6 +14,7 @@ except ImportError:
     if str(project_root) not in sys.path:
         sys.path.insert(0, str(project_root))
     from config import MAIN_MEMORY_FILE, TASK_MEMORY_FILE, DATA_DIR, OUTPUT_FORMATS
+from utils.file_io import atomic_write, file_lock
 
 class MemoryManager:
     def __init__(self):
@@ -51,8 +52,8 @@ class MemoryManager:
 ## 待办事项
 
 """
-        with open(path, 'w', encoding='utf-8') as f:
-            f.write(template)
+        with file_lock(path):
+            atomic_write(path, template)
         
         print(f"{OUTPUT_FORMATS['memory']} 创建{title}: {path}")
     
@@ -77,8 +78,8 @@ class MemoryManager:
     def write_main_memory(self, content: str) -> bool:
         """写入主记忆"""
         try:
-            with open(self.main_memory_path, 'w', encoding='utf-8') as f:
-                f.write(content)
+            with file_lock(self.main_memory_path):
+                atomic_write(self.main_memory_path, content)
             print(f"{OUTPUT_FORMATS['memory']} 更新主记忆")
             return True
         except Exception as e:
@@ -88,8 +89,8 @@ class MemoryManager:
     def write_task_memory(self, content: str) -> bool:
         """写入任务记忆"""
         try:
-            with open(self.task_memory_path, 'w', encoding='utf-8') as f:
-                f.write(content)
+            with file_lock(self.task_memory_path):
+                atomic_write(self.task_memory_path, content)
             print(f"{OUTPUT_FORMATS['memory']} 更新任务记忆")
             return True
         except Exception as e:
@@ -99,36 +100,38 @@ class MemoryManager:
     def append_main_memory(self, content: str, section: str = None) -> bool:
         """追加内容到主记忆"""
         try:
-            current = self.read_main_memory()
-            
-            # 添加时间戳
-            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            
-            if section:
-                # 追加到特定部分
-                new_entry = f"\n### [{timestamp}] {section}\n{content}\n"
-                if f"## {section}" in current:
-                    # 在该部分后添加
-                    parts = current.split(f"## {section}")
-                    if len(parts) > 1:
-                        # 找到下一个##的位置
-                        next_section = parts[1].find("\n##")
-                        if next_section > 0:
-                            parts[1] = parts[1][:next_section] + new_entry + parts[1][next_section:]
+            # 读取与写回在同一把锁内，避免并发追加丢失内容
+            with file_lock(self.main_memory_path):
+                current = self.read_main_memory()
+                
+                # 添加时间戳
+                timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                
+                if section:
+                    # 追加到特定部分
+                    new_entry = f"\n### [{timestamp}] {section}\n{content}\n"
+                    if f"## {section}" in current:
+                        # 在该部分后添加
+                        parts = current.split(f"## {section}")
+                        if len(parts) > 1:
+                            # 找到下一个##的位置
+                            next_section = parts[1].find("\n##")
+                            if next_section > 0:
+                                parts[1] = parts[1][:next_section] + new_entry + parts[1][next_section:]
+                            else:
+                                parts[1] = parts[1] + new_entry
+                            current = f"## {section}".join(parts)
                         else:
-                            parts[1] = parts[1] + new_entry
-                        current = f"## {section}".join(parts)
+                            current += new_entry
                     else:
-                        current += new_entry
+                        # 创建新部分
+                        current += f"\n## {section}\n{new_entry}"
                 else:
-                    # 创建新部分
-                    current += f"\n## {section}\n{new_entry}"
-            else:
-                # 追加到末尾
-                current += f"\n### [{timestamp}]\n{content}\n"
-            
-            return self.write_main_memory(current)
-            
+                    # 追加到末尾
+                    current += f"\n### [{timestamp}]\n{content}\n"
+                
+                return self.write_main_memory(current)
+                
         except Exception as e:
             print(f"{OUTPUT_FORMATS['error']} 追加主记忆失败: {e}")
             return False
@@ -136,20 +139,22 @@ class MemoryManager:
     def append_task_memory(self, content: str, task_id: str = None) -> bool:
         """追加内容到任务记忆"""
         try:
-            current = self.read_task_memory()
-            
-            # 添加时间戳
-            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            
-            if task_id:
-                new_entry = f"\n### 任务 {task_id} - {timestamp}\n{content}\n"
-            else:
-                new_entry = f"\n### {timestamp}\n{content}\n"
-            
-            current += new_entry
-            
-            return self.write_task_memory(current)
-            
+            # 读取与写回在同一把锁内，避免并发追加丢失内容
+            with file_lock(self.task_memory_path):
+                current = self.read_task_memory()
+                
+                # 添加时间戳
+                timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                
+                if task_id:
+                    new_entry = f"\n### 任务 {task_id} - {timestamp}\n{content}\n"
+                else:
+                    new_entry = f"\n### {timestamp}\n{content}\n"
+                
+                current += new_entry
+                
+                return self.write_task_memory(current)
+                
         except Exception as e:
             print(f"{OUTPUT_FORMATS['error']} 追加任务记忆失败: {e}")
             return False
@@ -224,8 +229,9 @@ class MemoryManager:
             import shutil
             # 先备份当前文件
             self.backup_memory(memory_type)
-            # 恢复备份
-            shutil.copy2(backup_file, target)
+            # 恢复备份（原子替换，恢复中途失败不会留下半个文件）
+            with file_lock(target):
+                atomic_write(target, backup_file.read_bytes())
             print(f"{OUTPUT_FORMATS['success']} 恢复成功: {target}")
             return True
         except Exception as e:
@@ -20,6 +20,8 @@ except ImportError:
         sys.path.insert(0, str(project_root))
     from config import OUTPUT_FORMATS
 
+from utils.resource_limits import build_preexec_fn, get_process_usage, get_terminal_limits
+
 class PersistentTerminal:
     """单个持久化终端实例"""
     
@@ -70,12 +72,21 @@ class PersistentTerminal:
         self.is_interactive = False  # 是否在等待输入
         self.last_command = ""
         self.last_activity = time.time()
+        self.is_hibernated = False  # 空闲休眠：shell进程已结束，输出和历史保留
+        self.hibernated_at = None
+        self.scrollback = None  # ScrollbackWriter：输出与命令历史的磁盘持久化
+        self.restored_from = None  # 从磁盘恢复输出时，上次写入的时间
         
         # 系统特定设置
         self.is_windows = sys.platform == "win32"
     
-    def start(self) -> bool:
-        """启动终端进程（统一处理编码）"""
+    def start(self, announce: bool = True) -> bool:
+        """
+        启动终端进程（统一处理编码）
+        
+        Args:
+            announce: 是否输出启动信息并广播（预启动到终端池的空闲shell不通知）
+        """
         if self.is_running:
             return False
         
@@ -113,7 +124,7 @@ class PersistentTerminal:
                 env['LANG'] = 'en_US.UTF-8'
                 env['LC_ALL'] = 'en_US.UTF-8'
                 
-                # Unix也不使用text模式，统一处理
+                # Unix也不使用text模式，统一处理；资源上限由shell启动的命令继承
                 self.process = subprocess.Popen(
                     self.shell_command,
                     stdin=subprocess.PIPE,
@@ -122,7 +133,8 @@ class PersistentTerminal:
                     cwd=str(self.working_dir),
                     shell=False,
                     bufsize=0,
-                    env=env
+                    env=env,
+                    preexec_fn=build_preexec_fn()
                 )
             
             self.is_running = True
@@ -145,16 +157,8 @@ class PersistentTerminal:
                 self.output_buffer.clear()  # 清除初始化输出
                 self.total_output_size = 0
             
-            # 广播终端启动事件
-            if self.broadcast:
-                self.broadcast('terminal_started', {
-                    'session': self.session_name,
-                    'working_dir': str(self.working_dir),
-                    'shell': self.shell_command,
-                    'time': self.start_time.isoformat()
-                })
-            
-            print(f"{OUTPUT_FORMATS['success']} 终端会话启动: {self.session_name}")
+            if announce:
+                self._announce_started()
             return True
             
         except Exception as e:
@@ -162,6 +166,86 @@ class PersistentTerminal:
             self.is_running = False
             return False
     
+    def _announce_started(self):
+        # 广播终端启动事件
+        if self.broadcast:
+            self.broadcast('terminal_started', {
+                'session': self.session_name,
+                'working_dir': str(self.working_dir),
+                'shell': self.shell_command,
+                'time': self.start_time.isoformat()
+            })
+        
+        print(f"{OUTPUT_FORMATS['success']} 终端会话启动: {self.session_name}")
+    
+    def attach(
+        self,
+        session_name: str,
+        broadcast_callback: Callable = None,
+        max_buffer_size: int = None,
+        display_size: int = None
+    ):
+        """把终端池中已启动的空闲shell作为新会话使用"""
+        self.session_name = session_name
+        self.broadcast = broadcast_callback
+        if max_buffer_size:
+            self.max_buffer_size = max_buffer_size
+        if display_size:
+            self.display_size = display_size
+        self.start_time = datetime.now()
+        self.last_activity = time.time()
+        self._announce_started()
+    
+    def reset_state(self):
+        """清空输出缓冲、命令历史和交互状态（shell进程不变）"""
+        self.restored_from = None
+        self.output_buffer = []
+        self.command_history = []
+        self.total_output_size = 0
+        self.truncated_lines = 0
+        self.is_interactive = False
+        self.last_command = ""
+        self.drain_output_queue()
+    
+    def restore_scrollback(self, snapshot: Dict):
+        """
+        放回上次保存的输出与命令历史（服务重启后重新打开同名会话）
+        
+        Args:
+            snapshot: ScrollbackStore.load() 的返回值
+        """
+        updated_at = snapshot.get("updated_at") or "未知时间"
+        header = f"[已恢复 {updated_at} 之前的终端输出；shell为新启动，之前的环境变量和目录切换不保留]\n"
+        self.output_buffer = [header] + snapshot.get("output", []) + self.output_buffer
+        self.total_output_size = sum(len(line) for line in self.output_buffer)
+        self._truncate_buffer()
+        self.command_history = snapshot.get("commands", []) + self.command_history
+        if self.command_history:
+            self.last_command = self.command_history[-1]["command"]
+        self.restored_from = updated_at
+        if self.broadcast:
+            self.broadcast('terminal_output', {
+                'session': self.session_name,
+                'data': ''.join(self.output_buffer),
+                'timestamp': time.time()
+            })
+    
+    def detach_scrollback(self):
+        """写出剩余输出并停止持久化，返回原写入器"""
+        writer, self.scrollback = self.scrollback, None
+        if writer:
+            writer.close()
+        return writer
+    
+    def drain_output_queue(self) -> List[str]:
+        """取出输出队列中尚未读取的内容"""
+        lines = []
+        while True:
+            try:
+                lines.append(self.output_queue.get_nowait())
+            except queue.Empty:
+                return lines
+    
     def _read_output(self):
         """后台线程：持续读取输出（修复版，正确处理编码）"""
         while self.is_reading and self.process:
@@ -222,6 +306,8 @@ class PersistentTerminal:
         # 添加到缓冲区
         self.output_buffer.append(output)
         self.total_output_size += len(output)
+        if self.scrollback:
+            self.scrollback.append_output(output)
         
         # 检查是否需要截断
         if self.total_output_size > self.max_buffer_size:
@@ -283,6 +369,13 @@ class PersistentTerminal:
     
     def send_command(self, command: str, wait_for_output: bool = True) -> Dict:
         """发送命令到终端（统一编码处理）"""
+        if self.is_hibernated and not self.resume():
+            return {
+                "success": False,
+                "error": "终端恢复失败",
+                "session": self.session_name
+            }
+        
         if not self.is_running or not self.process:
             return {
                 "success": False,
@@ -298,6 +391,9 @@ class PersistentTerminal:
             })
             self.last_command = command
             self.is_interactive = False
+            self.last_activity = time.time()
+            if self.scrollback:
+                self.scrollback.append_command(command, self.command_history[-1]["timestamp"])
             
             # 广播输入事件
             if self.broadcast:
@@ -416,14 +512,69 @@ class PersistentTerminal:
             "buffer_size": self.total_output_size,
             "truncated_lines": self.truncated_lines,
             "last_activity": datetime.fromtimestamp(self.last_activity).isoformat(),
-            "uptime_seconds": (datetime.now() - self.start_time).total_seconds() if self.start_time else 0
+            "uptime_seconds": (datetime.now() - self.start_time).total_seconds() if self.start_time else 0,
+            "is_hibernated": self.is_hibernated,
+            "restored_from": self.restored_from,
+            "resources": self.get_resource_usage(),
+            "limits": get_terminal_limits()
         }
     
-    def close(self) -> bool:
-        """关闭终端"""
-        if not self.is_running:
+    def get_resource_usage(self) -> Optional[Dict]:
+        """shell及其子进程的CPU时间、内存和进程数（终端未运行或平台不支持时为None）"""
+        if not self.is_running or not self.process:
+            return None
+        return get_process_usage(self.process.pid)
+    
+    def has_running_job(self) -> bool:
+        """shell下是否还有正在运行的命令（无法统计时按有处理，避免误回收）"""
+        usage = self.get_resource_usage()
+        if usage is None:
+            return self.is_running
+        return usage["processes"] > 1
+    
+    def hibernate(self) -> bool:
+        """空闲休眠：结束shell进程和读取线程，保留输出缓冲与命令历史"""
+        if not self.is_running or self.is_hibernated:
             return False
-        
+        if not self._stop_process():
+            return False
+        if self.scrollback:
+            self.scrollback.flush()
+        self.is_hibernated = True
+        self.hibernated_at = time.time()
+        if self.broadcast:
+            self.broadcast('terminal_hibernated', {
+                'session': self.session_name,
+                'time': datetime.now().isoformat()
+            })
+        print(f"{OUTPUT_FORMATS['info']} 终端会话空闲休眠: {self.session_name}")
+        return True
+    
+    def resume(self) -> bool:
+        """从休眠恢复：在原工作目录重新启动shell（之前的环境变量和目录切换不保留）"""
+        if not self.is_hibernated:
+            return self.is_running
+        # Windows启动时会清空输出缓冲：先移开休眠前的内容，启动后再拼回
+        output_buffer, total_output_size = self.output_buffer, self.total_output_size
+        self.output_buffer, self.total_output_size = [], 0
+        started = self.start(announce=False)
+        self.output_buffer = output_buffer + self.output_buffer
+        self.total_output_size += total_output_size
+        if not started:
+            return False
+        self.is_hibernated = False
+        self.hibernated_at = None
+        self.last_activity = time.time()
+        if self.broadcast:
+            self.broadcast('terminal_resumed', {
+                'session': self.session_name,
+                'time': datetime.now().isoformat()
+            })
+        print(f"{OUTPUT_FORMATS['info']} 终端会话已恢复: {self.session_name}")
+        return True
+    
+    def _stop_process(self) -> bool:
+        """结束shell进程和读取线程"""
         try:
             # 停止读取线程
             self.is_reading = False
@@ -452,21 +603,32 @@ class PersistentTerminal:
             # 等待读取线程结束
             if self.reader_thread and self.reader_thread.is_alive():
                 self.reader_thread.join(timeout=1)
-            
-            # 广播终端关闭事件
-            if self.broadcast:
-                self.broadcast('terminal_closed', {
-                    'session': self.session_name,
-                    'time': datetime.now().isoformat()
-                })
-            
-            print(f"{OUTPUT_FORMATS['info']} 终端会话关闭: {self.session_name}")
             return True
             
         except Exception as e:
             print(f"{OUTPUT_FORMATS['error']} 关闭终端失败: {e}")
             return False
     
+    def close(self) -> bool:
+        """关闭终端"""
+        self.detach_scrollback()
+        if self.is_hibernated:
+            self.is_hibernated = False
+        elif not self.is_running:
+            return False
+        elif not self._stop_process():
+            return False
+        
+        # 广播终端关闭事件
+        if self.broadcast:
+            self.broadcast('terminal_closed', {
+                'session': self.session_name,
+                'time': datetime.now().isoformat()
+            })
+        
+        print(f"{OUTPUT_FORMATS['info']} 终端会话关闭: {self.session_name}")
+        return True
+    
     def __del__(self):
         """析构函数，确保进程被关闭"""
         if hasattr(self, 'is_running') and self.is_running:
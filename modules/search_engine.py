@@ -1,34 +1,64 @@
 # modules/search_engine.py - 网络搜索模块
 
-import httpx
-import json
+import time
 from typing import Dict, List, Optional
 from datetime import datetime
+from utils import serialization
+from utils.http_pool import http_client
+from utils.lazy_import import lazy_import
+from utils.result_cache import DiskCache, SingleFlight, TTLCache, cache_key
 try:
-    from config import TAVILY_API_KEY, SEARCH_MAX_RESULTS, OUTPUT_FORMATS
+    from config import (
+        TAVILY_API_KEY, SEARCH_MAX_RESULTS, OUTPUT_FORMATS, DATA_DIR,
+        SEARCH_DEPTH, SEARCH_CACHE_ENABLED, SEARCH_CACHE_TTL, SEARCH_CACHE_MAX_ENTRIES
+    )
 except ImportError:
     import sys
     from pathlib import Path
     project_root = Path(__file__).resolve().parents[1]
     if str(project_root) not in sys.path:
         sys.path.insert(0, str(project_root))
-    from config import TAVILY_API_KEY, SEARCH_MAX_RESULTS, OUTPUT_FORMATS
+    from config import (
+        TAVILY_API_KEY, SEARCH_MAX_RESULTS, OUTPUT_FORMATS, DATA_DIR,
+        SEARCH_DEPTH, SEARCH_CACHE_ENABLED, SEARCH_CACHE_TTL, SEARCH_CACHE_MAX_ENTRIES
+    )
+
+httpx = lazy_import("httpx")
+
+# 所有会话共享的搜索缓存：内存LRU + 磁盘（进程重启、多worker之间复用）
+_memory_cache = TTLCache(SEARCH_CACHE_MAX_ENTRIES, SEARCH_CACHE_TTL)
+_disk_cache = DiskCache(f"{DATA_DIR}/searches/cache", SEARCH_CACHE_TTL)
+_inflight = SingleFlight()
+
+
+def normalize_query(query: str) -> str:
+    """规范化查询（合并空白、忽略大小写），用于缓存键"""
+    return " ".join(query.split()).casefold()
+
+
+def search_cache_stats() -> Dict:
+    stats = _memory_cache.stats()
+    stats["coalesced"] = _inflight.coalesced
+    return stats
+
 
 class SearchEngine:
     def __init__(self):
         self.api_key = TAVILY_API_KEY
         self.api_url = "https://api.tavily.com/search"
         
-    async def search(self, query: str, max_results: int = None) -> Dict:
+    async def search(self, query: str, max_results: int = None, search_depth: str = None, use_cache: bool = True) -> Dict:
         """
-        执行网络搜索
+        执行网络搜索（相同查询在有效期内返回缓存，并发的相同查询只请求一次）
         
         Args:
             query: 搜索关键词
             max_results: 最大结果数
+            search_depth: 搜索深度（basic/advanced），默认使用配置 SEARCH_DEPTH
+            use_cache: 是否使用缓存
         
         Returns:
-            搜索结果字典
+            搜索结果字典（来自缓存时带有 cached=True 与 cache_age 秒数）
         """
         if not self.api_key or self.api_key == "your-tavily-api-key":
             return {
@@ -38,16 +68,42 @@ class SearchEngine:
             }
         
         max_results = max_results or SEARCH_MAX_RESULTS
+        search_depth = search_depth or SEARCH_DEPTH
+        key = cache_key("search", normalize_query(query), max_results, search_depth)
+        
+        if use_cache and SEARCH_CACHE_ENABLED:
+            cached = self._get_cached(key)
+            if cached:
+                print(f"{OUTPUT_FORMATS['search']} 搜索（缓存，{cached['cache_age']}秒前）: {query}")
+                return cached
         
+        result, shared = await _inflight.run(key, lambda: self._fetch(query, max_results, search_depth, key))
+        if shared:
+            # 复用了同时进行的相同查询
+            return dict(result, coalesced=True)
+        return result
+    
+    def _get_cached(self, key: str) -> Optional[Dict]:
+        """依次查内存与磁盘缓存，返回标记过的副本"""
+        result, age = _memory_cache.get_with_age(key)
+        if result is None:
+            result, age = _disk_cache.get_with_age(key)
+            if result is None:
+                return None
+            _memory_cache.set(key, result, stored_at=time.time() - age)
+        return dict(result, cached=True, cache_age=round(age, 1))
+    
+    async def _fetch(self, query: str, max_results: int, search_depth: str, key: str) -> Dict:
+        """请求Tavily搜索接口，成功的结果写入缓存"""
         print(f"{OUTPUT_FORMATS['search']} 搜索: {query}")
         
         try:
-            async with httpx.AsyncClient(timeout=30) as client:
+            async with http_client("tavily_search", timeout=30) as client:
                 response = await client.post(
                     self.api_url,
                     json={
                         "query": query,
-                        "search_depth": "advanced",
+                        "search_depth": search_depth,
                         "max_results": max_results,
                         "include_answer": True,
                         "include_images": False,
@@ -73,7 +129,11 @@ class SearchEngine:
                 
                 print(f"{OUTPUT_FORMATS['success']} 搜索完成，找到 {len(formatted_results['results'])} 条结果")
                 
-                return formatted_results
+                if SEARCH_CACHE_ENABLED:
+                    _memory_cache.set(key, formatted_results)
+                    _disk_cache.set(key, formatted_results, meta={"query": query})
+                
+                return dict(formatted_results, cached=False)
                 
         except httpx.TimeoutException:
             return {
@@ -134,6 +194,8 @@ class SearchEngine:
             f"📅 搜索时间: {results['timestamp']}",
             ""
         ]
+        if results.get("cached"):
+            summary_lines.insert(2, f"♻️ 缓存结果（{results['cache_age']}秒前）")
         
         # 添加AI答案（如果有）
         if results.get("answer"):
@@ -210,8 +272,7 @@ class SearchEngine:
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
         
         # 保存结果
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(results, f, ensure_ascii=False, indent=2)
+        serialization.dump_file(file_path, results)
         
         print(f"{OUTPUT_FORMATS['file']} 搜索结果已保存到: {file_path}")
         
@@ -230,8 +291,7 @@ class SearchEngine:
         file_path = f"./data/searches/{filename}"
         
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return serialization.load_file(file_path)
         except FileNotFoundError:
             print(f"{OUTPUT_FORMATS['error']} 文件不存在: {file_path}")
             return None
@@ -0,0 +1,170 @@
+# modules/shell_pool.py - 预启动的空闲shell池（terminal_session open 时直接取用）
+
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+try:
+    from config import (
+        TERMINAL_TIMEOUT,
+        TERMINAL_POOL_ENABLED,
+        TERMINAL_POOL_SIZE,
+        TERMINAL_POOL_MAX_IDLE
+    )
+except ImportError:
+    import sys
+    project_root = Path(__file__).resolve().parents[1]
+    if str(project_root) not in sys.path:
+        sys.path.insert(0, str(project_root))
+    from config import (
+        TERMINAL_TIMEOUT,
+        TERMINAL_POOL_ENABLED,
+        TERMINAL_POOL_SIZE,
+        TERMINAL_POOL_MAX_IDLE
+    )
+
+from modules.persistent_terminal import PersistentTerminal
+
+# 池中空闲shell的会话名（尚未被任何会话使用）
+POOL_SESSION_NAME = "__shell_pool__"
+
+
+class ShellPool:
+    """
+    按（工作目录, shell）保存已启动的空闲shell
+
+    - acquire(): 取出一个存活的空闲shell，没有时返回None（调用方自行启动）
+    - replenish(): 后台补足到 TERMINAL_POOL_SIZE 个（Windows下省去chcp/cls的等待）
+    - reap_idle(): 关闭空闲超过 TERMINAL_TIMEOUT 的shell（由TerminalManager的巡检线程定期调用）
+
+    池中只有从未被会话使用过的shell：会话关闭时shell直接结束，不放回池中
+    （环境变量、shell选项、后台任务等状态无法可靠清除）。每个TerminalManager独立一个池。
+    """
+
+    def __init__(
+        self,
+        size: int = None,
+        max_idle: int = None,
+        idle_timeout: float = None,
+        enabled: bool = None
+    ):
+        self.size = TERMINAL_POOL_SIZE if size is None else size
+        self.max_idle = TERMINAL_POOL_MAX_IDLE if max_idle is None else max_idle
+        self.idle_timeout = TERMINAL_TIMEOUT if idle_timeout is None else idle_timeout
+        self.enabled = (TERMINAL_POOL_ENABLED if enabled is None else enabled) and self.size > 0
+        self._idle: Dict[Tuple[str, str], List[Tuple[PersistentTerminal, float]]] = {}
+        self._pending: Dict[Tuple[str, str], int] = {}  # 正在启动中的数量
+        self._lock = threading.Lock()
+        self._closed = False
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(working_dir: str, shell_command: str) -> Tuple[str, str]:
+        return str(Path(working_dir).resolve()), shell_command or ""
+
+    def _idle_count(self) -> int:
+        return sum(len(shells) for shells in self._idle.values())
+
+    def acquire(self, working_dir: str, shell_command: str) -> Optional[PersistentTerminal]:
+        """取出一个存活的空闲shell（已清空状态，尚未attach）"""
+        if not self.enabled:
+            return None
+        key = self._key(working_dir, shell_command)
+        stale = []
+        terminal = None
+        with self._lock:
+            shells = self._idle.get(key, [])
+            while shells:
+                candidate, _ = shells.pop()
+                if candidate.is_running and candidate.process and candidate.process.poll() is None:
+                    terminal = candidate
+                    break
+                stale.append(candidate)
+            if terminal:
+                self.hits += 1
+            else:
+                self.misses += 1
+        for candidate in stale:
+            candidate.close()
+        return terminal
+
+    def replenish(self, working_dir: str, shell_command: str):
+        """在后台启动空闲shell，使该目录的空闲数达到池大小"""
+        if not self.enabled:
+            return
+        key = self._key(working_dir, shell_command)
+        with self._lock:
+            if self._closed:
+                return
+            missing = self.size - len(self._idle.get(key, [])) - self._pending.get(key, 0)
+            missing = min(missing, self.max_idle - self._idle_count() - sum(self._pending.values()))
+            if missing <= 0:
+                return
+            self._pending[key] = self._pending.get(key, 0) + missing
+        threading.Thread(
+            target=self._spawn, args=(key, missing), name="shell-pool-spawn", daemon=True
+        ).start()
+
+    def _spawn(self, key: Tuple[str, str], count: int):
+        working_dir, shell_command = key
+        for _ in range(count):
+            terminal = PersistentTerminal(
+                session_name=POOL_SESSION_NAME,
+                working_dir=working_dir,
+                shell_command=shell_command or None
+            )
+            started = terminal.start(announce=False)
+            if started:
+                # 丢弃启动时的输出（提示符、Windows代码页信息等）
+                terminal.reset_state()
+            self._finish_pending(key, terminal if started else None)
+
+    def _finish_pending(self, key: Tuple[str, str], terminal: Optional[PersistentTerminal]):
+        with self._lock:
+            self._pending[key] = max(0, self._pending.get(key, 0) - 1)
+            if terminal is not None and not self._closed:
+                self._idle.setdefault(key, []).append((terminal, time.time()))
+                return
+        if terminal is not None:
+            terminal.close()
+
+    def reap_idle(self) -> int:
+        """关闭空闲超过 idle_timeout 的shell，返回关闭数量"""
+        now = time.time()
+        expired = []
+        with self._lock:
+            for key, shells in list(self._idle.items()):
+                keep = []
+                for terminal, idle_since in shells:
+                    if now - idle_since > self.idle_timeout:
+                        expired.append(terminal)
+                    else:
+                        keep.append((terminal, idle_since))
+                if keep:
+                    self._idle[key] = keep
+                else:
+                    del self._idle[key]
+        for terminal in expired:
+            terminal.close()
+        return len(expired)
+
+    def close_all(self):
+        """关闭池中所有空闲shell，之后不再接收新的shell"""
+        with self._lock:
+            self._closed = True
+            terminals = [terminal for shells in self._idle.values() for terminal, _ in shells]
+            self._idle.clear()
+        for terminal in terminals:
+            terminal.close()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "idle": {f"{key[0]} ({key[1] or 'default'})": len(shells) for key, shells in self._idle.items()},
+                "pending": sum(self._pending.values()),
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
@@ -1,6 +1,9 @@
 # modules/terminal_manager.py - 终端会话管理器
 
 import json
+import threading
+import time
+import weakref
 from typing import Dict, List, Optional, Callable
 from pathlib import Path
 from datetime import datetime
@@ -9,7 +12,12 @@ try:
         OUTPUT_FORMATS,
         MAX_TERMINALS,
         TERMINAL_BUFFER_SIZE,
-        TERMINAL_DISPLAY_SIZE
+        TERMINAL_DISPLAY_SIZE,
+        TERMINAL_TIMEOUT,
+        TERMINAL_IDLE_ACTION,
+        TERMINAL_SUPERVISOR_INTERVAL,
+        TERMINAL_SCROLLBACK_ENABLED,
+        TERMINAL_SCROLLBACK_FLUSH_INTERVAL
     )
 except ImportError:
     import sys
@@ -20,10 +28,17 @@ except ImportError:
         OUTPUT_FORMATS,
         MAX_TERMINALS,
         TERMINAL_BUFFER_SIZE,
-        TERMINAL_DISPLAY_SIZE
+        TERMINAL_DISPLAY_SIZE,
+        TERMINAL_TIMEOUT,
+        TERMINAL_IDLE_ACTION,
+        TERMINAL_SUPERVISOR_INTERVAL,
+        TERMINAL_SCROLLBACK_ENABLED,
+        TERMINAL_SCROLLBACK_FLUSH_INTERVAL
     )
 
 from modules.persistent_terminal import PersistentTerminal
+from modules.shell_pool import ShellPool
+from utils.scrollback_store import ScrollbackStore
 from utils.terminal_factory import TerminalFactory
 
 class TerminalManager:
@@ -64,6 +79,15 @@ class TerminalManager:
         
         # 终端工厂（跨平台支持）
         self.factory = TerminalFactory()
+        
+        # 预启动的空闲shell（每个管理器独立，避免shell状态跨会话共享）
+        self.pool = ShellPool()
+        
+        # 终端输出的磁盘持久化（服务重启后重新打开同名会话时恢复）
+        self.scrollback_store = ScrollbackStore(str(self.project_path)) if TERMINAL_SCROLLBACK_ENABLED else None
+        
+        # 由共享巡检线程回收空闲终端
+        _register_manager(self)
     
     def open_terminal(
         self,
@@ -110,23 +134,49 @@ class TerminalManager:
         # 获取合适的shell命令
         shell_command = self.factory.get_shell_command()
         
-        # 创建终端实例
-        terminal = PersistentTerminal(
-            session_name=session_name,
-            working_dir=str(work_path),
-            shell_command=shell_command,
-            broadcast_callback=self.broadcast,
-            max_buffer_size=self.terminal_buffer_size,
-            display_size=self.terminal_display_size
-        )
-        
-        # 启动终端
-        if not terminal.start():
-            return {
-                "success": False,
-                "error": "终端启动失败",
-                "session": session_name
-            }
+        # 优先使用终端池中的空闲shell
+        terminal = self.pool.acquire(str(work_path), shell_command)
+        from_pool = terminal is not None
+        if from_pool:
+            terminal.attach(
+                session_name,
+                broadcast_callback=self.broadcast,
+                max_buffer_size=self.terminal_buffer_size,
+                display_size=self.terminal_display_size
+            )
+        else:
+            # 创建终端实例
+            terminal = PersistentTerminal(
+                session_name=session_name,
+                working_dir=str(work_path),
+                shell_command=shell_command,
+                broadcast_callback=self.broadcast,
+                max_buffer_size=self.terminal_buffer_size,
+                display_size=self.terminal_display_size
+            )
+            
+            # 启动终端
+            if not terminal.start():
+                return {
+                    "success": False,
+                    "error": "终端启动失败",
+                    "session": session_name
+                }
+        
+        # 后台补充该目录的空闲shell，供下次打开使用
+        self.pool.replenish(str(work_path), shell_command)
+        
+        # 恢复同名会话上次保存的输出（只在打开时读取），之后的输出继续写入
+        if self.scrollback_store:
+            snapshot = self.scrollback_store.load(session_name)
+            if snapshot:
+                terminal.restore_scrollback(snapshot)
+            terminal.scrollback = self.scrollback_store.open_writer(
+                session_name,
+                working_dir=str(work_path),
+                shell=terminal.shell_command,
+                index=snapshot["index"] if snapshot else None
+            )
         
         # 保存终端实例
         self.terminals[session_name] = terminal
@@ -150,15 +200,18 @@ class TerminalManager:
             "working_dir": str(work_path),
             "shell": shell_command,
             "is_active": make_active,
+            "from_pool": from_pool,
+            "restored_from": terminal.restored_from,
             "total_sessions": len(self.terminals)
         }
     
-    def close_terminal(self, session_name: str) -> Dict:
+    def close_terminal(self, session_name: str, keep_scrollback: bool = False) -> Dict:
         """
         关闭终端会话
         
         Args:
             session_name: 会话名称
+            keep_scrollback: 是否保留磁盘上的输出（服务关闭、空闲回收时保留；明确关闭会话时删除）
             
         Returns:
             操作结果
@@ -173,7 +226,12 @@ class TerminalManager:
         # 获取终端实例
         terminal = self.terminals[session_name]
         
-        # 关闭终端
+        # 写出剩余输出
+        terminal.detach_scrollback()
+        if self.scrollback_store and not keep_scrollback:
+            self.scrollback_store.discard(session_name)
+        
+        # 关闭终端（用过的shell不放回终端池）
         terminal.close()
         
         # 从字典中移除
@@ -387,21 +445,97 @@ Shell: {status['shell']}
                 "name": name,
                 "is_active": name == self.active_terminal,
                 "is_running": terminal.is_running,
+                "is_hibernated": terminal.is_hibernated,
                 "working_dir": str(terminal.working_dir)
             }
             for name, terminal in self.terminals.items()
         ]
     
+    def reap_idle_terminals(self, timeout: float = None, action: str = None) -> List[str]:
+        """
+        处理空闲超过timeout的终端（仍有命令在运行的终端不处理）
+        
+        Args:
+            timeout: 空闲秒数（默认 TERMINAL_TIMEOUT）
+            action: hibernate（保留输出，下次发送命令时重启shell）/ close / none
+            
+        Returns:
+            被处理的会话名称
+        """
+        timeout = TERMINAL_TIMEOUT if timeout is None else timeout
+        action = action or TERMINAL_IDLE_ACTION
+        if action not in ("hibernate", "close") or timeout <= 0:
+            return []
+        
+        now = time.time()
+        reaped = []
+        for session_name, terminal in list(self.terminals.items()):
+            if not terminal.is_running or now - terminal.last_activity <= timeout:
+                continue
+            if terminal.has_running_job():
+                continue
+            if action == "close":
+                if self.close_terminal(session_name, keep_scrollback=True).get("success"):
+                    reaped.append(session_name)
+            elif terminal.hibernate():
+                reaped.append(session_name)
+        
+        if reaped and action == "hibernate" and self.broadcast:
+            self.broadcast('terminal_list_update', {
+                'terminals': self.get_terminal_list(),
+                'active': self.active_terminal
+            })
+        return reaped
+    
+    def flush_scrollback(self):
+        """写出各终端累积超过刷新间隔的输出"""
+        for terminal in list(self.terminals.values()):
+            if terminal.scrollback:
+                terminal.scrollback.flush_if_due()
+    
     def close_all(self):
         """关闭所有终端会话"""
         print(f"{OUTPUT_FORMATS['info']} 关闭所有终端会话...")
         
         for session_name in list(self.terminals.keys()):
-            self.close_terminal(session_name)
+            self.close_terminal(session_name, keep_scrollback=True)
         
         self.active_terminal = None
+        self.pool.close_all()
         print(f"{OUTPUT_FORMATS['success']} 所有终端会话已关闭")
     
     def __del__(self):
         """析构函数，确保所有终端被关闭"""
         self.close_all()
+
+
+# 所有终端管理器共用一个巡检线程：写出终端输出、休眠/关闭空闲终端、回收终端池中过期的空闲shell
+_managers: "weakref.WeakSet[TerminalManager]" = weakref.WeakSet()
+_supervisor_lock = threading.Lock()
+_supervisor: Optional[threading.Thread] = None
+
+
+def _register_manager(manager: TerminalManager):
+    global _supervisor
+    with _supervisor_lock:
+        _managers.add(manager)
+        if _supervisor is None:
+            _supervisor = threading.Thread(target=_supervise_loop, name="terminal-supervisor", daemon=True)
+            _supervisor.start()
+
+
+def _supervise_loop():
+    interval = TERMINAL_SUPERVISOR_INTERVAL
+    if TERMINAL_SCROLLBACK_ENABLED:
+        interval = min(interval, TERMINAL_SCROLLBACK_FLUSH_INTERVAL)
+    while True:
+        time.sleep(interval)
+        for manager in list(_managers):
+            try:
+                manager.flush_scrollback()
+                manager.reap_idle_terminals()
+                closed = manager.pool.reap_idle()
+                if closed:
+                    print(f"{OUTPUT_FORMATS['info']} 回收空闲shell: {closed} 个")
+            except Exception as e:
+                print(f"{OUTPUT_FORMATS['warning']} 空闲终端回收失败: {e}")
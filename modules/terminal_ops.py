@@ -3,16 +3,21 @@
 import os
 import sys
 import asyncio
+import codecs
 import subprocess
 import shutil
+import time
 from pathlib import Path
-from typing import Dict, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 try:
     from config import (
         CODE_EXECUTION_TIMEOUT,
         TERMINAL_COMMAND_TIMEOUT,
         FORBIDDEN_COMMANDS,
-        OUTPUT_FORMATS
+        OUTPUT_FORMATS,
+        MAX_RUN_COMMAND_CHARS,
+        RUN_COMMAND_READ_CHUNK,
+        RUN_COMMAND_STREAM_INTERVAL
     )
 except ImportError:
     project_root = Path(__file__).resolve().parents[1]
@@ -22,16 +27,84 @@ except ImportError:
         CODE_EXECUTION_TIMEOUT,
         TERMINAL_COMMAND_TIMEOUT,
         FORBIDDEN_COMMANDS,
-        OUTPUT_FORMATS
+        OUTPUT_FORMATS,
+        MAX_RUN_COMMAND_CHARS,
+        RUN_COMMAND_READ_CHUNK,
+        RUN_COMMAND_STREAM_INTERVAL
     )
 
+# 检测到的Python命令（进程内只检测一次）
+_detected_python_cmd: Optional[str] = None
+
+
+class OutputCapture:
+    """
+    有上限的输出收集：保留开头和结尾各约一半，中间部分只计数
+
+    内存占用不超过 limit 字符（加上一个读取块），与命令实际输出多少无关。
+    """
+
+    def __init__(self, limit: int):
+        self.limit = max(limit, 2)
+        self.head_limit = self.limit // 2
+        self.tail_limit = self.limit - self.head_limit
+        self.head: List[str] = []
+        self.head_size = 0
+        self.tail: List[str] = []
+        self.tail_size = 0
+        self.total = 0
+
+    def append(self, text: str):
+        if not text:
+            return
+        self.total += len(text)
+        if self.head_size < self.head_limit:
+            part = text[:self.head_limit - self.head_size]
+            self.head.append(part)
+            self.head_size += len(part)
+            text = text[len(part):]
+            if not text:
+                return
+        self.tail.append(text)
+        self.tail_size += len(text)
+        while self.tail_size > self.tail_limit:
+            excess = self.tail_size - self.tail_limit
+            if len(self.tail[0]) <= excess:
+                self.tail_size -= len(self.tail.pop(0))
+            else:
+                self.tail[0] = self.tail[0][excess:]
+                self.tail_size -= excess
+
+    @property
+    def truncated(self) -> bool:
+        return self.total > self.head_size + self.tail_size
+
+    def text(self, limit: int = None) -> str:
+        """收集到的输出；limit小于收集上限时进一步只取开头和结尾"""
+        head = "".join(self.head)
+        tail = "".join(self.tail)
+        if limit is not None and limit < len(head) + len(tail):
+            head_limit = min(len(head), limit // 2)
+            tail_limit = limit - head_limit
+            head = head[:head_limit]
+            tail = tail[len(tail) - tail_limit:] if tail_limit > 0 else ""
+        omitted = self.total - len(head) - len(tail)
+        if not omitted:
+            return head + tail
+        return f"{head}\n...[中间省略 {omitted} 字符]...\n{tail}"
+
 class TerminalOperator:
     def __init__(self, project_path: str):
         self.project_path = Path(project_path).resolve()
         self.process = None
-        # 自动检测Python命令
-        self.python_cmd = self._detect_python_command()
-        print(f"{OUTPUT_FORMATS['info']} 检测到Python命令: {self.python_cmd}")
+    
+    @property
+    def python_cmd(self) -> str:
+        """可用的Python命令（第一次使用时检测，需要启动子进程验证，不在初始化时进行）"""
+        global _detected_python_cmd
+        if _detected_python_cmd is None:
+            _detected_python_cmd = self._detect_python_command()
+        return _detected_python_cmd
     
     def _detect_python_command(self) -> str:
         """
@@ -98,18 +171,25 @@ class TerminalOperator:
         self,
         command: str,
         working_dir: str = None,
-        timeout: int = None
+        timeout: int = None,
+        on_output: Callable[[str, str], None] = None,
+        max_chars: int = None
     ) -> Dict:
         """
         执行终端命令
         
+        stdout和stderr同时按块读取，执行过程中通过on_output推送；结果只保留开头和结尾
+        （各管道最多max_chars字符），超时时返回已收到的部分输出。
+        
         Args:
             command: 要执行的命令
             working_dir: 工作目录
             timeout: 超时时间（秒）
+            on_output: 输出回调 (stream, text)，stream为"stdout"或"stderr"
+            max_chars: 保留的输出字符数（默认 MAX_RUN_COMMAND_CHARS）
         
         Returns:
-            执行结果字典
+            执行结果字典（输出被截断时 truncated 为True，char_count 为实际输出字符数）
         """
         # 替换命令中的python3为实际可用的命令
         if "python3" in command and self.python_cmd != "python3":
@@ -149,6 +229,43 @@ class TerminalOperator:
         print(f"{OUTPUT_FORMATS['terminal']} 执行命令: {command}")
         print(f"{OUTPUT_FORMATS['info']} 工作目录: {work_path}")
         
+        limit = max_chars or MAX_RUN_COMMAND_CHARS
+        captures = {"stdout": OutputCapture(limit), "stderr": OutputCapture(limit)}
+        
+        # 推送到界面的输出按时间间隔合并，避免每个读取块都发送一次
+        pending: Dict[str, List[str]] = {"stdout": [], "stderr": []}
+        last_emit = 0.0
+        
+        def emit(force: bool = False):
+            nonlocal last_emit
+            if not on_output:
+                return
+            now = time.monotonic()
+            if not force and now - last_emit < RUN_COMMAND_STREAM_INTERVAL:
+                return
+            last_emit = now
+            for name, parts in pending.items():
+                if parts:
+                    text = "".join(parts)
+                    parts.clear()
+                    try:
+                        on_output(name, text)
+                    except Exception as e:
+                        print(f"{OUTPUT_FORMATS['warning']} 输出推送失败: {e}")
+        
+        async def pump(stream, name: str):
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            while True:
+                chunk = await stream.read(RUN_COMMAND_READ_CHUNK)
+                text = decoder.decode(chunk, final=not chunk)
+                if text:
+                    captures[name].append(text)
+                    if on_output:
+                        pending[name].append(text)
+                        emit()
+                if not chunk:
+                    return
+        
         try:
             # 创建进程
             process = await asyncio.create_subprocess_shell(
@@ -158,30 +275,60 @@ class TerminalOperator:
                 cwd=str(work_path),
                 shell=True
             )
+            self.process = process
             
-            # 等待执行完成
+            # 边执行边读取输出
+            timed_out = False
             try:
-                stdout, stderr = await asyncio.wait_for(
-                    process.communicate(),
+                await asyncio.wait_for(
+                    asyncio.gather(
+                        pump(process.stdout, "stdout"),
+                        pump(process.stderr, "stderr"),
+                        process.wait()
+                    ),
                     timeout=timeout
                 )
             except asyncio.TimeoutError:
-                process.kill()
+                timed_out = True
+                if process.returncode is None:
+                    process.kill()
                 await process.wait()
-                return {
-                    "success": False,
-                    "error": f"命令执行超时 ({timeout}秒)",
-                    "output": "",
-                    "return_code": -1
-                }
+            finally:
+                emit(force=True)
             
-            # 解码输出
-            stdout_text = stdout.decode('utf-8', errors='replace') if stdout else ""
-            stderr_text = stderr.decode('utf-8', errors='replace') if stderr else ""
+            # 合并后的output也不超过limit：stderr至少分到一半（不足一半时按实际长度）
+            stdout_size = min(captures["stdout"].total, limit)
+            stderr_size = min(captures["stderr"].total, limit)
+            if stdout_size + stderr_size > limit:
+                stderr_size = min(stderr_size, max(limit - stdout_size, limit // 2))
+                stdout_size = limit - stderr_size
+            output = captures["stdout"].text(stdout_size)
+            if captures["stderr"].total:
+                output += f"\n[错误输出]\n{captures['stderr'].text(stderr_size)}"
+            
+            char_count = captures["stdout"].total + captures["stderr"].total
+            truncated = char_count > limit
+            
+            result = {
+                "output": output,
+                "command": command,
+                "char_count": char_count,
+                "truncated": truncated
+            }
+            # 截断时只保留合并后的output，整个结果不超过limit
+            if not truncated:
+                result["stdout"] = captures["stdout"].text()
+                result["stderr"] = captures["stderr"].text()
             
-            output = stdout_text
-            if stderr_text:
-                output += f"\n[错误输出]\n{stderr_text}"
+            if timed_out:
+                print(f"{OUTPUT_FORMATS['error']} 命令执行超时 ({timeout}秒)")
+                result.update({
+                    "success": False,
+                    "error": f"命令执行超时 ({timeout}秒)，已返回超时前的输出",
+                    "timed_out": True,
+                    "return_code": -1
+                })
+                return result
             
             success = process.returncode == 0
             
@@ -190,14 +337,11 @@ class TerminalOperator:
             else:
                 print(f"{OUTPUT_FORMATS['error']} 命令执行失败 (返回码: {process.returncode})")
             
-            return {
+            result.update({
                 "success": success,
-                "output": output,
-                "stdout": stdout_text,
-                "stderr": stderr_text,
-                "return_code": process.returncode,
-                "command": command
-            }
+                "return_code": process.returncode
+            })
+            return result
             
         except Exception as e:
             return {
@@ -210,7 +354,8 @@ class TerminalOperator:
     async def run_python_code(
         self,
         code: str,
-        timeout: int = None
+        timeout: int = None,
+        on_output: Callable[[str, str], None] = None
     ) -> Dict:
         """
         执行Python代码
@@ -218,6 +363,7 @@ class TerminalOperator:
         Args:
             code: Python代码
             timeout: 超时时间（秒）
+            on_output: 输出回调 (stream, text)，执行过程中推送
         
         Returns:
             执行结果字典
@@ -237,7 +383,8 @@ class TerminalOperator:
             # 使用检测到的Python命令执行文件
             result = await self.run_command(
                 f'{self.python_cmd} "{temp_file}"',
-                timeout=timeout
+                timeout=timeout,
+                on_output=on_output
             )
             
             # 添加代码到结果
@@ -254,7 +401,8 @@ class TerminalOperator:
         self,
         file_path: str,
         args: str = "",
-        timeout: int = None
+        timeout: int = None,
+        on_output: Callable[[str, str], None] = None
     ) -> Dict:
         """
         执行Python文件
@@ -263,6 +411,7 @@ class TerminalOperator:
             file_path: Python文件路径
             args: 命令行参数
             timeout: 超时时间（秒）
+            on_output: 输出回调 (stream, text)，执行过程中推送
         
         Returns:
             执行结果字典
@@ -307,7 +456,7 @@ class TerminalOperator:
             command += f" {args}"
         
         # 执行命令
-        return await self.run_command(command, timeout=timeout)
+        return await self.run_command(command, timeout=timeout, on_output=on_output)
     
     async def install_package(self, package: str) -> Dict:
         """
@@ -1,12 +1,53 @@
 # modules/webpage_extractor.py - 网页内容提取模块
 
-import httpx
+import asyncio
+import time
 import json
-from typing import Dict, Any, List, Union, Tuple
+from typing import Dict, Any, Callable, List, Optional, Union, Tuple
 from utils.logger import setup_logger
+from utils.http_pool import http_client
+from utils.lazy_import import lazy_import
+from utils.blob_store import BlobStore
+from utils.result_cache import DiskCache, SingleFlight, TTLCache, cache_key
+try:
+    from config import (
+        EXTRACT_CACHE_ENABLED, EXTRACT_CACHE_TTL, EXTRACT_CACHE_MAX_ENTRIES,
+        EXTRACT_CACHE_DIR, EXTRACT_BLOB_COMPRESSION,
+        EXTRACT_BATCH_CONCURRENCY, EXTRACT_URL_TIMEOUT
+    )
+except ImportError:
+    import sys
+    from pathlib import Path
+    project_root = Path(__file__).resolve().parents[1]
+    if str(project_root) not in sys.path:
+        sys.path.insert(0, str(project_root))
+    from config import (
+        EXTRACT_CACHE_ENABLED, EXTRACT_CACHE_TTL, EXTRACT_CACHE_MAX_ENTRIES,
+        EXTRACT_CACHE_DIR, EXTRACT_BLOB_COMPRESSION,
+        EXTRACT_BATCH_CONCURRENCY, EXTRACT_URL_TIMEOUT
+    )
 
+httpx = lazy_import("httpx")
 logger = setup_logger(__name__)
 
+# 提取内容按内容哈希存放（相同内容只存一份），URL -> 内容哈希的索引带有效期
+extract_blobs = BlobStore(f"{EXTRACT_CACHE_DIR}/blobs", EXTRACT_BLOB_COMPRESSION)
+_url_memory = TTLCache(EXTRACT_CACHE_MAX_ENTRIES, EXTRACT_CACHE_TTL)
+_url_index = DiskCache(f"{EXTRACT_CACHE_DIR}/urls", EXTRACT_CACHE_TTL)
+_inflight = SingleFlight()
+
+
+def extract_cache_stats() -> Dict[str, Any]:
+    stats = _url_memory.stats()
+    stats["coalesced"] = _inflight.coalesced
+    stats["compression"] = extract_blobs.compression
+    return stats
+
+
+def load_extract_blob(content_hash: str) -> Optional[str]:
+    """按内容哈希读取已缓存的提取内容（对话历史中的引用由此还原）"""
+    return extract_blobs.get(content_hash)
+
 async def tavily_extract(urls: Union[str, List[str]], api_key: str, extract_depth: str = "basic", max_urls: int = 1) -> Dict[str, Any]:
     """
     执行Tavily网页内容提取
@@ -31,7 +72,7 @@ async def tavily_extract(urls: Union[str, List[str]], api_key: str, extract_dept
     urls = urls[:max_urls]
 
     try:
-        async with httpx.AsyncClient() as client:
+        async with http_client("tavily_extract") as client:
             response = await client.post(
                 "https://api.tavily.com/extract",
                 json={
@@ -122,4 +163,114 @@ async def extract_webpage_content(urls: Union[str, List[str]], api_key: str, ext
     formatted_content = format_extract_results(results)
     
     # 返回相同内容（简化版本，不需要长短版本区分）
-    return formatted_content, formatted_content
\ No newline at end of file
+    return formatted_content, formatted_content
+
+
+def _lookup_cached(key: str) -> Tuple[Optional[Dict[str, Any]], float]:
+    """查找URL索引（先内存后磁盘），返回 (索引记录, 年龄秒数)"""
+    record, age = _url_memory.get_with_age(key)
+    if record is None:
+        record, age = _url_index.get_with_age(key)
+        if record is not None:
+            _url_memory.set(key, record, stored_at=time.time() - age)
+    return record, age
+
+
+async def _fetch_and_store(url: str, api_key: str, extract_depth: str, key: str) -> Dict[str, Any]:
+    results = await tavily_extract(url, api_key, extract_depth, 1)
+    content = format_extract_results(results)
+    extracted = any(
+        (item.get("raw_content") or "").strip()
+        for item in results.get("results") or []
+    )
+    if "error" in results or not extracted:
+        # 失败或空内容不缓存
+        return {"content": content, "cached": False}
+
+    content_hash = extract_blobs.put(content)
+    record = {
+        "url": url,
+        "content_hash": content_hash,
+        "etag": f'"{content_hash[:32]}"',
+        "chars": len(content),
+        "fetched_at": time.time(),
+        "extract_depth": extract_depth
+    }
+    _url_memory.set(key, record, stored_at=record["fetched_at"])
+    _url_index.set(key, record)
+    return {"content": content, "content_hash": content_hash, "etag": record["etag"], "cached": False}
+
+
+async def extract_webpage_cached(url: str, api_key: str, extract_depth: str = "basic",
+                                 use_cache: bool = True) -> Dict[str, Any]:
+    """
+    带缓存的单个网页提取
+
+    同一URL在有效期内直接返回缓存内容；并发的相同提取只请求一次。
+
+    Returns:
+        {"content": 格式化内容, "content_hash": 内容哈希（仅成功时）,
+         "etag": 内容标识, "cached": 是否命中缓存, "cache_age": 缓存年龄（秒，命中时）}
+    """
+    url = url.strip()
+    key = cache_key("extract", url, extract_depth)
+
+    if use_cache and EXTRACT_CACHE_ENABLED:
+        record, age = _lookup_cached(key)
+        if record:
+            content = extract_blobs.get(record.get("content_hash"))
+            if content is not None:
+                return {
+                    "content": content,
+                    "content_hash": record["content_hash"],
+                    "etag": record.get("etag"),
+                    "cached": True,
+                    "cache_age": round(age, 1)
+                }
+
+    result, _ = await _inflight.run(key, lambda: _fetch_and_store(url, api_key, extract_depth, key))
+    return dict(result)
+
+
+async def extract_webpages_batch(urls: List[str], api_key: str, extract_depth: str = "basic",
+                                 on_result: Callable[[Dict[str, Any], int, int], None] = None) -> List[Dict[str, Any]]:
+    """
+    并发提取多个网页
+
+    每个URL单独请求（受 EXTRACT_BATCH_CONCURRENCY 限制并发），并各自受 EXTRACT_URL_TIMEOUT 超时限制，
+    慢的网站不会拖住整批。每完成一个页面就调用 on_result(页面结果, 已完成数, 总数)。
+
+    Returns:
+        按完成顺序排列的页面结果列表，每项为
+        {"url", "success", "content", "content_hash", "cached", "cache_age"} 或 {"url", "success": False, "error"}
+    """
+    # 去重并保持原顺序
+    unique_urls = list(dict.fromkeys(url.strip() for url in urls if url and url.strip()))
+    semaphore = asyncio.Semaphore(max(1, EXTRACT_BATCH_CONCURRENCY))
+
+    async def extract_one(url: str) -> Dict[str, Any]:
+        async with semaphore:
+            try:
+                extracted = await asyncio.wait_for(
+                    extract_webpage_cached(url, api_key, extract_depth),
+                    timeout=EXTRACT_URL_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                return {"url": url, "success": False, "error": f"提取超时（超过{EXTRACT_URL_TIMEOUT}秒）"}
+            except Exception as e:
+                logger.error(f"网页提取异常 {url}: {e}")
+                return {"url": url, "success": False, "error": f"提取异常: {str(e)}"}
+
+        if not extracted.get("content_hash"):
+            return {"url": url, "success": False, "error": extracted.get("content", "未能提取到任何内容")}
+        page = {"url": url, "success": True}
+        page.update(extracted)
+        return page
+
+    pages: List[Dict[str, Any]] = []
+    for future in asyncio.as_completed([extract_one(url) for url in unique_urls]):
+        page = await future
+        pages.append(page)
+        if on_result:
+            on_result(page, len(pages), len(unique_urls))
+    return pages
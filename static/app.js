@@ -42,8 +42,13 @@ window.onload = function() {
                 // 停止功能状态
                 stopRequested: false,
                 
+                // 任务排队位置（0表示未排队）
+                taskQueuePosition: 0,
+                
                 // 文件相关
                 fileTree: [],
+                fileTreeData: null,       // 服务器文件树（嵌套字典），增量更新在此基础上应用
+                fileTreeRevision: null,
                 focusedFiles: {},
                 expandedFolders: {},
 
@@ -208,8 +213,12 @@ window.onload = function() {
                             
                             console.log(`累计Token统计更新: 输入=${data.cumulative_input_tokens}, 输出=${data.cumulative_output_tokens}, 总计=${data.cumulative_total_tokens}`);
                             
-                            // 同时更新当前上下文Token（关键修复）
-                            this.updateCurrentContextTokens();
+                            // 同时更新当前上下文Token（后端随事件附带时直接使用）
+                            if (typeof data.context_tokens === 'number') {
+                                this.currentContextTokens = data.context_tokens;
+                            } else {
+                                this.updateCurrentContextTokens();
+                            }
                             
                             this.$forceUpdate();
                         }
@@ -466,6 +475,13 @@ window.onload = function() {
                                 if (action.type === 'tool' && action.tool.name === data.tool) {
                                     action.tool.statusDetail = data.detail;
                                     action.tool.statusType = data.status;
+                                    // 批量提取网页：每完成一个页面追加一项
+                                    if (data.page) {
+                                        if (!action.tool.pages) {
+                                            action.tool.pages = [];
+                                        }
+                                        action.tool.pages.push(data.page);
+                                    }
                                     this.$forceUpdate();
                                     break;
                                 }
@@ -473,6 +489,25 @@ window.onload = function() {
                         }
                     });
                     
+                    // 命令执行中的输出（run_command / run_python）
+                    this.socket.on('tool_output', (data) => {
+                        if (this.currentMessageIndex >= 0) {
+                            const msg = this.messages[this.currentMessageIndex];
+
+                            for (let i = msg.actions.length - 1; i >= 0; i--) {
+                                const action = msg.actions[i];
+                                if (action.type === 'tool' && action.tool.name === data.tool && !action.tool.result) {
+                                    // 只保留最后一部分，避免长时间运行的命令占用过多内存
+                                    const output = (action.tool.liveOutput || '') + data.data;
+                                    action.tool.liveOutput = output.length > 20000 ? output.slice(-20000) : output;
+                                    this.$forceUpdate();
+                                    this.conditionalScrollToBottom();
+                                    break;
+                                }
+                            }
+                        }
+                    });
+
                     // 工具开始（从准备转为执行）
                     this.socket.on('tool_start', (data) => {
                         console.log('工具开始执行:', data.name);
@@ -610,6 +645,19 @@ window.onload = function() {
                         // 可以显示提示信息
                     });
                     
+                    // 任务排队：首次排队和开始执行时提示，中间只更新位置
+                    this.socket.on('task_queue_update', (data) => {
+                        if ((data.position > 0 && !this.taskQueuePosition) || (data.position === 0 && this.taskQueuePosition)) {
+                            this.addSystemMessage(data.message);
+                        }
+                        this.taskQueuePosition = data.position;
+                    });
+                    
+                    // 模型请求并发已满，等待空闲槽位
+                    this.socket.on('llm_stream_waiting', (data) => {
+                        console.log('等待模型请求槽位:', data.message);
+                    });
+                    
                     // 任务停止
                     this.socket.on('task_stopped', (data) => {
                         console.log('任务已停止:', data.message);
@@ -639,6 +687,11 @@ window.onload = function() {
                         }
                     });
                     
+                    // 文件树增量更新（新增/删除/修改的路径）
+                    this.socket.on('file_tree_delta', (data) => {
+                        this.applyFileTreeDelta(data);
+                    });
+                    
                     // 文件树更新
                     this.socket.on('file_tree_update', (data) => {
                         this.updateFileTree(data);
@@ -703,6 +756,7 @@ window.onload = function() {
                 this.streamingMessage = false;
                 this.currentMessageIndex = -1;
                 this.stopRequested = false;
+                this.taskQueuePosition = 0;
                 
                 // 清理工具状态
                 this.preparingTools.clear();
@@ -1420,8 +1474,87 @@ window.onload = function() {
             // 原有功能保持不变
             // ==========================================
             
+            async refreshFileTree() {
+                try {
+                    const url = this.fileTreeData && this.fileTreeRevision !== null
+                        ? `/api/files?since=${this.fileTreeRevision}`
+                        : '/api/files';
+                    const response = await fetch(url);
+                    const data = await response.json();
+                    if (data.delta) {
+                        this.applyFileTreeDelta(data);
+                    } else {
+                        this.updateFileTree(data);
+                    }
+                } catch (error) {
+                    console.error('刷新文件树失败:', error);
+                }
+            },
+
+            applyFileTreeDelta(delta) {
+                // 本地版本与增量的起点不一致（漏掉了推送）时，向服务器补取
+                if (!this.fileTreeData || delta.since !== this.fileTreeRevision) {
+                    this.refreshFileTree();
+                    return;
+                }
+
+                const locate = (path, create) => {
+                    const parts = path.split('/');
+                    let children = this.fileTreeData;
+                    for (let i = 0; i < parts.length - 1; i++) {
+                        let node = children[parts[i]];
+                        if (!node || node.type !== 'folder') {
+                            if (!create) {
+                                return null;
+                            }
+                            node = children[parts[i]] = {
+                                type: 'folder',
+                                path: parts.slice(0, i + 1).join('/'),
+                                children: {}
+                            };
+                        }
+                        children = node.children;
+                    }
+                    return { children, name: parts[parts.length - 1] };
+                };
+
+                (delta.removed || []).forEach((path) => {
+                    const slot = locate(path, false);
+                    if (slot) {
+                        delete slot.children[slot.name];
+                    }
+                });
+
+                (delta.upserts || []).forEach((entry) => {
+                    const slot = locate(entry.path, true);
+                    if (entry.size !== undefined) {
+                        slot.children[slot.name] = {
+                            type: 'file',
+                            path: entry.path,
+                            size: entry.size,
+                            annotation: entry.annotation || ''
+                        };
+                    } else if (!slot.children[slot.name] || slot.children[slot.name].type !== 'folder') {
+                        slot.children[slot.name] = { type: 'folder', path: entry.path, children: {} };
+                    }
+                });
+
+                this.fileTreeRevision = delta.revision;
+                this.updateFileTree({ tree: this.fileTreeData });
+
+                if (this.currentConversationId) {
+                    setTimeout(() => {
+                        this.updateCurrentContextTokens();
+                    }, 500);
+                }
+            },
+
             updateFileTree(structure) {
                 const treeDictionary = structure && structure.tree ? structure.tree : {};
+                this.fileTreeData = treeDictionary;
+                if (structure && structure.revision !== undefined) {
+                    this.fileTreeRevision = structure.revision;
+                }
 
                 const buildNodes = (treeMap) => {
                     if (!treeMap) {
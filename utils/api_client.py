@@ -1,19 +1,24 @@
 # ========== api_client.py ==========
 # utils/api_client.py - DeepSeek API 客户端（支持Web模式）- 简化版
 
-import httpx
 import json
 import asyncio
 from typing import List, Dict, Optional, AsyncGenerator
+from utils import serialization
+from utils.http_pool import http_client
+from utils.lazy_import import lazy_import
+from utils.sse_decoder import Delta, ToolCallAccumulator, decode_delta, iter_sse_data, normalize_usage, loads as sse_loads
 try:
-    from config import API_BASE_URL, API_KEY, MODEL_ID, OUTPUT_FORMATS, DEFAULT_RESPONSE_MAX_TOKENS
+    from config import API_BASE_URL, API_KEY, MODEL_ID, OUTPUT_FORMATS, DEFAULT_RESPONSE_MAX_TOKENS, STREAM_INCLUDE_USAGE
 except ImportError:
     import sys
     from pathlib import Path
     project_root = Path(__file__).resolve().parents[1]
     if str(project_root) not in sys.path:
         sys.path.insert(0, str(project_root))
-    from config import API_BASE_URL, API_KEY, MODEL_ID, OUTPUT_FORMATS, DEFAULT_RESPONSE_MAX_TOKENS
+    from config import API_BASE_URL, API_KEY, MODEL_ID, OUTPUT_FORMATS, DEFAULT_RESPONSE_MAX_TOKENS, STREAM_INCLUDE_USAGE
+
+httpx = lazy_import("httpx")
 
 class DeepSeekClient:
     def __init__(self, thinking_mode: bool = True, web_mode: bool = False):
@@ -26,11 +31,13 @@ class DeepSeekClient:
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
+        # 最近一次流式调用服务端返回的用量（normalize_usage格式，未返回时为None）
+        self.last_usage: Optional[Dict] = None
         # 每个任务的独立状态
         self.current_task_first_call = True  # 当前任务是否是第一次调用
         self.current_task_thinking = ""  # 当前任务的思考内容
     
-    def _print(self, message: str, end: str = "\n", flush: bool = False):
+    def _print(self, message: str = "", end: str = "\n", flush: bool = False):
         """安全的打印函数，在Web模式下不输出"""
         if not self.web_mode:
             print(message, end=end, flush=flush)
@@ -190,27 +197,12 @@ class DeepSeekClient:
         preview = original[:preview_length] + "..." if len(original) > preview_length else original
         
         return False, {}, f"JSON解析失败且无法自动修复: {error_msg}\n参数预览: {preview}"
-    async def chat(
-        self,
-        messages: List[Dict],
-        tools: Optional[List[Dict]] = None,
-        stream: bool = True
-    ) -> AsyncGenerator[Dict, None]:
-        """
-        异步调用DeepSeek API
-        
-        Args:
-            messages: 消息列表
-            tools: 工具定义列表
-            stream: 是否流式输出
-        
-        Yields:
-            响应内容块
-        """
+    def _build_payload(self, messages: List[Dict], tools: Optional[List[Dict]], stream: bool) -> Optional[Dict]:
+        """构建请求体，API密钥未配置时返回None"""
         # 检查API密钥
         if not self.api_key or self.api_key == "your-deepseek-api-key":
             self._print(f"{OUTPUT_FORMATS['error']} API密钥未配置，请在config.py中设置API_KEY")
-            return
+            return None
         
         # 决定是否使用思考模式
         current_thinking_mode = self.get_current_thinking_mode()
@@ -234,47 +226,88 @@ class DeepSeekClient:
             "max_tokens": max_tokens
         }
         
+        if stream and STREAM_INCLUDE_USAGE:
+            # 流结束前返回一个只包含usage的块，用于精确统计token
+            payload["stream_options"] = {"include_usage": True}
+        
         if tools:
             payload["tools"] = tools
             payload["tool_choice"] = "auto"
-        
+        return payload
+    
+    async def _stream_payloads(self, payload: Dict) -> AsyncGenerator[bytes, None]:
+        """发送流式请求，逐个产出SSE的data负载（bytes）"""
         try:
-            async with httpx.AsyncClient(http2=True, timeout=300) as client:
-                if stream:
-                    async with client.stream(
-                        "POST",
-                        f"{self.api_base_url}/chat/completions",
-                        json=payload,
-                        headers=self.headers
-                    ) as response:
-                        # 检查响应状态
-                        if response.status_code != 200:
-                            error_text = await response.aread()
-                            self._print(f"{OUTPUT_FORMATS['error']} API请求失败 ({response.status_code}): {error_text}")
-                            return
-                            
-                        async for line in response.aiter_lines():
-                            if line.startswith("data:"):
-                                json_str = line[5:].strip()
-                                if json_str == "[DONE]":
-                                    break
-                                
-                                try:
-                                    data = json.loads(json_str)
-                                    yield data
-                                except json.JSONDecodeError:
-                                    continue
-                else:
-                    response = await client.post(
-                        f"{self.api_base_url}/chat/completions",
-                        json=payload,
-                        headers=self.headers
-                    )
+            async with http_client("llm_api", http2=True, timeout=300) as client:
+                async with client.stream(
+                    "POST",
+                    f"{self.api_base_url}/chat/completions",
+                    json=payload,
+                    headers=self.headers
+                ) as response:
+                    # 检查响应状态
                     if response.status_code != 200:
-                        error_text = response.text
+                        error_text = await response.aread()
                         self._print(f"{OUTPUT_FORMATS['error']} API请求失败 ({response.status_code}): {error_text}")
                         return
-                    yield response.json()
+                    
+                    async for data in iter_sse_data(response.aiter_bytes()):
+                        yield data
+                        
+        except httpx.ConnectError:
+            self._print(f"{OUTPUT_FORMATS['error']} 无法连接到API服务器，请检查网络连接")
+        except httpx.TimeoutException:
+            self._print(f"{OUTPUT_FORMATS['error']} API请求超时")
+        except Exception as e:
+            self._print(f"{OUTPUT_FORMATS['error']} API调用异常: {e}")
+    
+    async def chat(
+        self,
+        messages: List[Dict],
+        tools: Optional[List[Dict]] = None,
+        stream: bool = True
+    ) -> AsyncGenerator[Dict, None]:
+        """
+        异步调用DeepSeek API
+        
+        Args:
+            messages: 消息列表
+            tools: 工具定义列表
+            stream: 是否流式输出
+        
+        Yields:
+            响应内容块（完整的chunk字典；热路径请使用 chat_deltas）。服务端返回用量时记录到 last_usage
+        """
+        self.last_usage = None
+        payload = self._build_payload(messages, tools, stream)
+        if payload is None:
+            return
+        
+        if stream:
+            async for data in self._stream_payloads(payload):
+                try:
+                    chunk = sse_loads(data)
+                except ValueError:
+                    continue
+                if isinstance(chunk, dict) and chunk.get("usage"):
+                    self.last_usage = normalize_usage(chunk["usage"]) or self.last_usage
+                yield chunk
+            return
+        
+        try:
+            async with http_client("llm_api", http2=True, timeout=300) as client:
+                response = await client.post(
+                    f"{self.api_base_url}/chat/completions",
+                    json=payload,
+                    headers=self.headers
+                )
+                if response.status_code != 200:
+                    error_text = response.text
+                    self._print(f"{OUTPUT_FORMATS['error']} API请求失败 ({response.status_code}): {error_text}")
+                    return
+                result = response.json()
+                self.last_usage = normalize_usage(result.get("usage"))
+                yield result
                     
         except httpx.ConnectError:
             self._print(f"{OUTPUT_FORMATS['error']} 无法连接到API服务器，请检查网络连接")
@@ -283,6 +316,33 @@ class DeepSeekClient:
         except Exception as e:
             self._print(f"{OUTPUT_FORMATS['error']} API调用异常: {e}")
     
+    async def chat_deltas(
+        self,
+        messages: List[Dict],
+        tools: Optional[List[Dict]] = None
+    ) -> AsyncGenerator[Delta, None]:
+        """
+        流式调用API，产出解码后的Delta（只取第一个choice需要的字段）
+        
+        Args:
+            messages: 消息列表
+            tools: 工具定义列表
+        
+        Yields:
+            Delta对象；无法解析的块会被跳过。服务端返回用量时记录到 last_usage
+        """
+        self.last_usage = None
+        payload = self._build_payload(messages, tools, True)
+        if payload is None:
+            return
+        
+        async for data in self._stream_payloads(payload):
+            delta = decode_delta(data)
+            if delta is not None:
+                if delta.usage is not None:
+                    self.last_usage = delta.usage
+                yield delta
+    
     async def chat_with_tools(
         self,
         messages: List[Dict],
@@ -295,7 +355,7 @@ class DeepSeekClient:
         Args:
             messages: 消息列表
             tools: 工具定义
-            tool_handler: 工具处理函数
+            tool_handler: 工具处理函数，返回结果字典，或已格式化好的工具消息内容（字符串）
         
         Returns:
             最终回答
@@ -326,7 +386,6 @@ class DeepSeekClient:
             
             # 调用API（始终提供工具定义）
             full_response = ""
-            tool_calls = []
             current_thinking = ""
             
             # 状态标志
@@ -336,66 +395,37 @@ class DeepSeekClient:
             # 获取当前是否应该显示思考
             should_show_thinking = self.get_current_thinking_mode()
             
-            async for chunk in self.chat(messages, tools, stream=True):
-                if "choices" not in chunk:
+            tool_accumulator = ToolCallAccumulator()
+            tool_calls = tool_accumulator.calls
+            
+            async for delta in self.chat_deltas(messages, tools):
+                if not delta.has_choice:
                     continue
-                    
-                delta = chunk["choices"][0].get("delta", {})
                 
                 # 处理思考内容（只在思考模式开启时）
-                if "reasoning_content" in delta and should_show_thinking:
-                    reasoning_content = delta["reasoning_content"]
-                    if reasoning_content:  # 只处理非空内容
-                        if not in_thinking:
-                            self._print("💭 [正在思考]\n", end="", flush=True)
-                            in_thinking = True
-                            thinking_printed = True
-                        current_thinking += reasoning_content
-                        self._print(reasoning_content, end="", flush=True)
+                reasoning_content = delta.reasoning_content
+                if reasoning_content and should_show_thinking:
+                    if not in_thinking:
+                        self._print("💭 [正在思考]\n", end="", flush=True)
+                        in_thinking = True
+                        thinking_printed = True
+                    current_thinking += reasoning_content
+                    self._print(reasoning_content, end="", flush=True)
                 
                 # 处理正常内容 - 独立的if，不是elif
-                if "content" in delta:
-                    content = delta["content"]
-                    if content:  # 只处理非空内容
-                        # 如果之前在输出思考，先结束思考输出
-                        if in_thinking:
-                            self._print("\n\n💭 [思考结束]\n\n", end="", flush=True)
-                            in_thinking = False
-                        full_response += content
-                        self._print(content, end="", flush=True)
+                content = delta.content
+                if content:
+                    # 如果之前在输出思考，先结束思考输出
+                    if in_thinking:
+                        self._print("\n\n💭 [思考结束]\n\n", end="", flush=True)
+                        in_thinking = False
+                    full_response += content
+                    self._print(content, end="", flush=True)
                 
-                # 收集工具调用 - 改进的拼接逻辑
-                # 收集工具调用 - 修复JSON分片问题
-                if "tool_calls" in delta:
-                    for tool_call in delta["tool_calls"]:
-                        tool_index = tool_call.get("index", 0)
-                        
-                        # 查找或创建对应索引的工具调用
-                        existing_call = None
-                        for existing in tool_calls:
-                            if existing.get("index") == tool_index:
-                                existing_call = existing
-                                break
-                        
-                        if not existing_call and tool_call.get("id"):
-                            # 创建新的工具调用
-                            new_call = {
-                                "id": tool_call.get("id"),
-                                "index": tool_index,
-                                "type": tool_call.get("type", "function"),
-                                "function": {
-                                    "name": tool_call.get("function", {}).get("name", ""),
-                                    "arguments": ""
-                                }
-                            }
-                            tool_calls.append(new_call)
-                            existing_call = new_call
-                        
-                        # 安全地拼接arguments - 简单字符串拼接，不尝试JSON验证
-                        if existing_call and "function" in tool_call and "arguments" in tool_call["function"]:
-                            new_args = tool_call["function"]["arguments"]
-                            if new_args:  # 只拼接非空内容
-                                existing_call["function"]["arguments"] += new_args
+                # 收集工具调用 - 按index合并分片，arguments只做字符串拼接
+                if delta.tool_calls:
+                    for fragment in delta.tool_calls:
+                        tool_accumulator.add(fragment)
             
             self._print()  # 最终换行
             
@@ -474,7 +504,7 @@ class DeepSeekClient:
                         "role": "tool",
                         "tool_call_id": tool_call["id"],
                         "name": function_name,
-                        "content": json.dumps(error_response, ensure_ascii=False)
+                        "content": serialization.dumps(error_response)
                     })
                     
                     # 记录失败的调用，防止死循环检测失效
@@ -498,11 +528,11 @@ class DeepSeekClient:
                             "role": "tool",
                             "tool_call_id": tool_call["id"],
                             "name": function_name,
-                            "content": json.dumps({
+                            "content": serialization.dumps({
                                 "success": False,
                                 "error": error_msg,
                                 "suggestion": "请将内容分成多个小块分别修改，或使用replace操作只修改必要部分"
-                            }, ensure_ascii=False)
+                            })
                         })
                         
                         all_tool_results.append({
@@ -514,17 +544,16 @@ class DeepSeekClient:
                 
                 tool_result = await tool_handler(function_name, arguments)
                 
-                # 解析工具结果，提取关键信息
-                try:
-                    result_data = json.loads(tool_result)
+                # 结果字典在这里序列化为工具消息内容；字符串视为已格式化的内容
+                if isinstance(tool_result, dict):
                     # 特殊处理read_file的结果
-                    if function_name == "read_file" and result_data.get("success"):
-                        file_content = result_data.get("content", "")
+                    if function_name == "read_file" and tool_result.get("success"):
+                        file_content = tool_result.get("content", "")
                         # 将文件内容作为明确的上下文信息
-                        tool_result_msg = f"文件 {result_data.get('path')} 的内容:\n```\n{file_content}\n```\n文件大小: {result_data.get('size')} 字节"
+                        tool_result_msg = f"文件 {tool_result.get('path')} 的内容:\n```\n{file_content}\n```\n文件大小: {tool_result.get('size')} 字节"
                     else:
-                        tool_result_msg = tool_result
-                except:
+                        tool_result_msg = serialization.dumps(tool_result)
+                else:
                     tool_result_msg = tool_result
                 
                 messages.append({
@@ -579,31 +608,27 @@ class DeepSeekClient:
             })
         
         try:
-            async for chunk in self.chat(messages, tools=None, stream=True):
-                if "choices" not in chunk:
+            async for delta in self.chat_deltas(messages):
+                if not delta.has_choice:
                     continue
-                    
-                delta = chunk["choices"][0].get("delta", {})
                 
                 # 处理思考内容
-                if "reasoning_content" in delta and should_show_thinking:
-                    reasoning_content = delta["reasoning_content"]
-                    if reasoning_content:  # 只处理非空内容
-                        if not in_thinking:
-                            self._print("💭 [正在思考]\n", end="", flush=True)
-                            in_thinking = True
-                        thinking_content += reasoning_content
-                        self._print(reasoning_content, end="", flush=True)
+                reasoning_content = delta.reasoning_content
+                if reasoning_content and should_show_thinking:
+                    if not in_thinking:
+                        self._print("💭 [正在思考]\n", end="", flush=True)
+                        in_thinking = True
+                    thinking_content += reasoning_content
+                    self._print(reasoning_content, end="", flush=True)
                 
                 # 处理正常内容 - 独立的if而不是elif
-                if "content" in delta:
-                    content = delta["content"]
-                    if content:  # 只处理非空内容
-                        if in_thinking:
-                            self._print("\n\n💭 [思考结束]\n\n", end="", flush=True)
-                            in_thinking = False
-                        full_response += content
-                        self._print(content, end="", flush=True)
+                content = delta.content
+                if content:
+                    if in_thinking:
+                        self._print("\n\n💭 [思考结束]\n\n", end="", flush=True)
+                        in_thinking = False
+                    full_response += content
+                    self._print(content, end="", flush=True)
             
             self._print()  # 最终换行
             
@@ -0,0 +1,109 @@
+# utils/blob_store.py - 按内容哈希寻址的压缩文本存储
+
+import gzip
+import hashlib
+import re
+from pathlib import Path
+from typing import Optional
+
+from utils.file_io import atomic_write
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+_DIGEST_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+def content_hash(text: str) -> str:
+    """文本内容的sha256（十六进制）"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def resolve_codec(compression: str = "auto") -> str:
+    """auto/zstd/gzip -> 实际可用的压缩方式（未安装zstandard时为gzip）"""
+    if compression in ("auto", "zstd") and zstandard is not None:
+        return "zstd"
+    return "gzip"
+
+
+def codec_suffix(codec: str) -> str:
+    return ".zst" if codec == "zstd" else ".gz"
+
+
+def compress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=6).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    """解压数据；zstd格式但未安装zstandard时抛出 ValueError"""
+    if codec == "zstd":
+        if zstandard is None:
+            raise ValueError("未安装zstandard，无法读取zstd压缩数据")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+class BlobStore:
+    """
+    内容寻址存储：相同内容只保存一份，文件名为内容的sha256
+
+    写入时使用zstd（已安装zstandard时）或gzip压缩；读取时两种格式都支持，
+    切换压缩方式后旧文件仍可读取。
+    """
+
+    def __init__(self, directory: str, compression: str = "auto"):
+        self.directory = Path(directory)
+        self.compression = resolve_codec(compression)
+
+    def _path(self, digest: str, codec: str) -> Path:
+        # 按前两位分目录，避免单个目录下文件过多
+        return self.directory / digest[:2] / f"{digest}{codec_suffix(codec)}"
+
+    def exists(self, digest: str) -> bool:
+        return any(self._path(digest, codec).exists() for codec in ("zstd", "gzip"))
+
+    def put(self, text: str) -> str:
+        """保存文本，返回内容哈希（内容已存在时不重复写入）"""
+        digest = content_hash(text)
+        if self.exists(digest):
+            return digest
+        data = compress(text.encode("utf-8"), self.compression)
+        path = self._path(digest, self.compression)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write(path, data)
+        return digest
+
+    def remove(self, digest: str) -> bool:
+        """删除blob（两种压缩格式都删除），返回是否删除了文件"""
+        if not digest or not _DIGEST_PATTERN.match(digest):
+            return False
+        removed = False
+        for codec in ("zstd", "gzip"):
+            try:
+                self._path(digest, codec).unlink()
+                removed = True
+            except FileNotFoundError:
+                continue
+        return removed
+
+    def get(self, digest: str) -> Optional[str]:
+        """按哈希读取文本，不存在或无法解压时返回None"""
+        if not digest or not _DIGEST_PATTERN.match(digest):
+            return None
+        for codec in ("zstd", "gzip"):
+            if codec == "zstd" and zstandard is None:
+                continue
+            path = self._path(digest, codec)
+            try:
+                data = path.read_bytes()
+            except OSError:
+                continue
+            try:
+                return decompress(data, codec).decode("utf-8")
+            except Exception:
+                return None
+        return None
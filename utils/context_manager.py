@@ -2,47 +2,112 @@
 
 import os
 import json
-import tiktoken
+import threading
+import time
 from copy import deepcopy
 from typing import Dict, List, Optional, Any
 from pathlib import Path
 from datetime import datetime
 try:
-    from config import MAX_CONTEXT_SIZE, DATA_DIR, PROMPTS_DIR
+    from config import (
+        MAX_CONTEXT_SIZE, DATA_DIR, PROMPTS_DIR, FILE_TREE_CACHE_TTL,
+        FILE_WATCHER_ENABLED, FILE_WATCHER_DEBOUNCE, TOKEN_GAUGE_MODE
+    )
 except ImportError:
     import sys
     from pathlib import Path
     project_root = Path(__file__).resolve().parents[1]
     if str(project_root) not in sys.path:
         sys.path.insert(0, str(project_root))
-    from config import MAX_CONTEXT_SIZE, DATA_DIR, PROMPTS_DIR
-from utils.conversation_manager import ConversationManager
+    from config import (
+        MAX_CONTEXT_SIZE, DATA_DIR, PROMPTS_DIR, FILE_TREE_CACHE_TTL,
+        FILE_WATCHER_ENABLED, FILE_WATCHER_DEBOUNCE, TOKEN_GAUGE_MODE
+    )
+from utils.conversation_manager import ConversationManager, STORED_CONTENT_KEY
+from utils import serialization, tracing
+from utils.file_io import file_lock
+from utils.fs_watcher import ProjectWatcher
+from utils.revisions import RevisionLog
+from utils.timeline import timeline_span
+from utils.tokenizer import get_tokenizer
+
+# 文件树扫描深度（项目根目录下第0层起，最多到第5层的子目录）
+TREE_MAX_LEVEL = 5
+
+
+def format_focused_files(focused_files: Dict[str, str]) -> str:
+    """聚焦文件注入上下文时的系统消息内容"""
+    focused_content = "\n\n=== 🔍 正在聚焦的文件 ===\n"
+    focused_content += f"(共 {len(focused_files)} 个文件处于聚焦状态)\n"
+    
+    for path, content in focused_files.items():
+        size_kb = len(content) / 1024
+        focused_content += f"\n--- 文件: {path} ({size_kb:.1f}KB) ---\n"
+        focused_content += f"```\n{content}\n```\n"
+    
+    focused_content += "\n=== 聚焦文件结束 ===\n"
+    focused_content += "提示：以上文件正在被聚焦，你可以直接看到完整内容并进行修改，禁止再次读取。"
+    return focused_content
+
 
 class ContextManager:
     def __init__(self, project_path: str):
         self.project_path = Path(project_path)
         self.temp_files = {}  # 临时加载的文件内容
         self.file_annotations = {}  # 文件备注
+        # 版本号：对话历史、项目文件树（用于ETag与增量接口）
+        self.conversation_revisions = RevisionLog("conversation")
+        self.file_tree_revisions = RevisionLog("files")
         self.conversation_history = []  # 当前对话历史（内存中）
         
+        # 文件树缓存与路径索引：由FileManager操作和文件监听增量维护
+        self._tree_lock = threading.RLock()
+        self._structure_cache: Optional[Dict] = None
+        self._structure_built_at = 0.0
+        self._structure_root: Optional[Path] = None
+        self._file_index: Dict[str, Dict] = {}
+        self._file_tree_listener = None
+        self._file_watcher: Optional[ProjectWatcher] = None
+        
         # 新增：对话持久化管理器
         self.conversation_manager = ConversationManager()
         self.current_conversation_id: Optional[str] = None
         self.auto_save_enabled = True
         
-        # 新增：Token计算相关
-        try:
-            self.encoding = tiktoken.get_encoding("cl100k_base")
-        except Exception as e:
-            print(f"⚠️ tiktoken初始化失败: {e}")
-            self.encoding = None
+        # 新增：Token计算相关（分词编码表在第一次计数时才加载）
+        self.tokenizer = get_tokenizer()
+        self._gauge_exact = TOKEN_GAUGE_MODE != "estimate"
         
         # 用于接收Web终端的回调函数
         self._web_terminal_callback = None
         self._focused_files = {}
         
+        # 当前上下文token仪表：各部分token数分别缓存，只在对应内容变化时重新计算
+        self._gauge_lock = threading.Lock()
+        self._main_memory = ""
+        self._tool_definitions: Optional[List[Dict]] = None
+        self._tools_tokens: Optional[int] = None
+        self._terminal_source = None
+        self._system_prompt_cache = (None, 0)  # (缓存键, token数)
+        self._focused_tokens_cache = (None, 0)
+        self._terminal_tokens_cache = (None, 0)
+        
+        # 当前任务的时间线（由web_server在任务开始时设置）
+        self.task_timeline = None
+        
         self.load_annotations()
     
+    @property
+    def conversation_history(self) -> List[Dict]:
+        return self._conversation_history
+    
+    @conversation_history.setter
+    def conversation_history(self, messages: List[Dict]):
+        """整体替换对话历史（新建、加载、删除对话）时，之前的版本只能获取全量"""
+        self._conversation_history = messages
+        self._message_tokens: Optional[List[int]] = None  # 与对话历史一一对应，按需整体重算
+        self.conversation_revisions.reset()
+    
     def set_web_terminal_callback(self, callback):
         """设置Web终端回调函数，用于广播事件"""
         self._web_terminal_callback = callback
@@ -51,15 +116,28 @@ class ContextManager:
         """设置聚焦文件信息，用于token计算"""
         self._focused_files = focused_files
     
+    def set_main_memory(self, memory_content: str):
+        """记录系统提示中使用的主记忆内容（记忆更新后调用）"""
+        self._main_memory = memory_content or ""
+    
+    def set_tool_definitions(self, tools: List[Dict]):
+        """记录请求中发送的工具定义（token数在第一次读取仪表时计算一次）"""
+        self._tool_definitions = tools
+        self._tools_tokens = None
+    
+    def set_terminal_source(self, source):
+        """设置获取活动终端快照的函数（返回注入上下文的终端内容或None）"""
+        self._terminal_source = source
+    
     def load_annotations(self):
         """加载文件备注"""
         annotations_file = Path(DATA_DIR) / "file_annotations.json"
         if annotations_file.exists():
             try:
-                with open(annotations_file, 'r', encoding='utf-8') as f:
+                with open(annotations_file, 'rb') as f:
                     content = f.read()
                     if content.strip():
-                        self.file_annotations = json.loads(content)
+                        self.file_annotations = serialization.loads(content)
                     else:
                         self.file_annotations = {}
             except (json.JSONDecodeError, KeyError):
@@ -68,48 +146,127 @@ class ContextManager:
                 self.save_annotations()
     
     def save_annotations(self):
-        """保存文件备注"""
+        """保存文件备注，并同步到文件树中对应的文件"""
+        self._write_annotations()
+        with self._tree_lock:
+            if self._structure_cache is None:
+                return
+            index = dict(self._file_index)
+            changed = set()
+            for path, entry in self._file_index.items():
+                annotation = self.file_annotations.get(path, "")
+                if "size" in entry and entry["annotation"] != annotation:
+                    index[path] = dict(entry, annotation=annotation)
+                    changed.add(path)
+            if self._commit_file_index(index, changed):
+                self._structure_cache = self._structure_from_index(index)
+    
+    def _write_annotations(self):
         annotations_file = Path(DATA_DIR) / "file_annotations.json"
-        with open(annotations_file, 'w', encoding='utf-8') as f:
-            json.dump(self.file_annotations, f, ensure_ascii=False, indent=2)
+        with file_lock(annotations_file):
+            serialization.dump_file(annotations_file, self.file_annotations)
     
     # ===========================================
     # 新增：Token统计相关方法
     # ===========================================
     
     def calculate_input_tokens(self, messages: List[Dict], tools: List[Dict] = None) -> int:
-        if not self.encoding:
-            return 0
-        
         try:
-            total_tokens = 0
-            
-            print(f"[Debug] 开始计算输入token，messages数量: {len(messages)}")
-            
-            # 详细分析每条消息
-            for i, message in enumerate(messages):
-                content = message.get("content", "")
-                role = message.get("role", "unknown")
-                if content:
-                    msg_tokens = len(self.encoding.encode(content))
-                    total_tokens += msg_tokens
-                    print(f"[Debug] 消息 {i+1} ({role}): {msg_tokens} tokens - {content[:50]}...")
-            
-            print(f"[Debug] 消息总token: {total_tokens}")
-            
-            # 工具定义
-            if tools:
-                tools_str = json.dumps(tools, ensure_ascii=False)
-                tools_tokens = len(self.encoding.encode(tools_str))
-                total_tokens += tools_tokens
-                print(f"[Debug] 工具定义token: {tools_tokens}")
-            
-            print(f"[Debug] 最终输入token: {total_tokens}")
-            return total_tokens
+            with tracing.span(tracing.SPAN_TOKENIZE):
+                texts = [message["content"] for message in messages if message.get("content")]
+                
+                # 工具定义
+                if tools:
+                    texts.append(serialization.dumps(tools))
+                
+                return sum(self.tokenizer.count_batch(texts))
         except Exception as e:
             print(f"计算输入token失败: {e}")
             return 0
     
+    def _count_text_tokens(self, text: str) -> int:
+        """上下文仪表使用的计数（TOKEN_GAUGE_MODE=estimate 时为估算）"""
+        if not text:
+            return 0
+        with tracing.span(tracing.SPAN_TOKENIZE):
+            return self.tokenizer.count(text, exact=self._gauge_exact)
+    
+    def get_context_tokens(self, messages: List[Dict] = None) -> Dict:
+        """
+        当前上下文token仪表（与calculate_input_tokens的计数方式一致）
+        
+        系统提示、聚焦文件、终端快照和工具定义按各自的版本/内容缓存，对话历史按消息累加，
+        内容未变化时读取不需要重新分词。
+        
+        Args:
+            messages: 指定对话消息时按其计算历史部分（非当前对话），默认使用当前对话历史
+        """
+        with self._gauge_lock:
+            if messages is None:
+                history = self.conversation_history
+                if self._message_tokens is None or len(self._message_tokens) != len(history):
+                    self._message_tokens = self._count_message_tokens(history)
+                history_tokens = sum(self._message_tokens)
+            else:
+                history_tokens = sum(self._count_message_tokens(messages))
+            
+            sections = {
+                "system_prompt_tokens": self._system_prompt_tokens(),
+                "history_tokens": history_tokens,
+                "focused_tokens": self._focused_files_tokens(),
+                "terminal_tokens": self._terminal_snapshot_tokens(),
+                "tools_tokens": self._tool_definitions_tokens()
+            }
+        sections["total_tokens"] = sum(sections.values())
+        return sections
+    
+    def _count_message_tokens(self, messages: List[Dict]) -> List[int]:
+        with tracing.span(tracing.SPAN_TOKENIZE):
+            return self.tokenizer.count_batch(
+                [msg.get("content") or "" for msg in messages], exact=self._gauge_exact
+            )
+    
+    def _tool_definitions_tokens(self) -> int:
+        if self._tools_tokens is None:
+            tools = self._tool_definitions
+            self._tools_tokens = self._count_text_tokens(serialization.dumps(tools)) if tools else 0
+        return self._tools_tokens
+    
+    def _system_prompt_tokens(self) -> int:
+        # 系统提示只随文件树和主记忆变化（时间戳长度固定）
+        key = (self._structure_root, self.file_tree_revisions.revision, self._main_memory)
+        if self._structure_cache is None or self._system_prompt_cache[0] != key:
+            structure = self.get_project_structure()
+            key = (self._structure_root, self.file_tree_revisions.revision, self._main_memory)
+            system_prompt = self.load_prompt("main_system").format(
+                project_path=self.project_path,
+                file_tree=self._build_file_tree(structure),
+                memory=self._main_memory,
+                current_time=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            )
+            self._system_prompt_cache = (key, self._count_text_tokens(system_prompt))
+        return self._system_prompt_cache[1]
+    
+    def _focused_files_tokens(self) -> int:
+        focused_files = self._focused_files
+        if not focused_files:
+            return 0
+        log = getattr(focused_files, "log", None)
+        key = (id(focused_files), log.revision) if log is not None else None
+        if key is None or self._focused_tokens_cache[0] != key:
+            self._focused_tokens_cache = (key, self._count_text_tokens(format_focused_files(focused_files)))
+        return self._focused_tokens_cache[1]
+    
+    def _terminal_snapshot_tokens(self) -> int:
+        if not self._terminal_source:
+            return 0
+        content = self._terminal_source()
+        if not content:
+            return 0
+        if self._terminal_tokens_cache[0] != content:
+            self._terminal_tokens_cache = (content, self._count_text_tokens(content))
+        return self._terminal_tokens_cache[1]
+    
     def calculate_output_tokens(self, ai_content: str) -> int:
         """
         计算AI输出的token数量
@@ -120,22 +277,64 @@ class ContextManager:
         Returns:
             int: 输出token数量
         """
-        if not self.encoding or not ai_content:
+        if not ai_content:
             return 0
         
         try:
-            return len(self.encoding.encode(ai_content))
+            with tracing.span(tracing.SPAN_TOKENIZE):
+                return self.tokenizer.count(ai_content)
         except Exception as e:
             print(f"计算输出token失败: {e}")
             return 0
     
-    def update_token_statistics(self, input_tokens: int, output_tokens: int) -> bool:
+    def record_api_usage(
+        self,
+        usage: Optional[Dict],
+        messages: List[Dict],
+        tools: Optional[List[Dict]],
+        output_content: str
+    ) -> Dict:
+        """
+        记录一次API调用的token用量
+        
+        Args:
+            usage: 服务端返回的用量（normalize_usage格式）；为None时用本地分词估算
+            messages: 本次请求的消息（仅估算时使用）
+            tools: 本次请求的工具定义（仅估算时使用）
+            output_content: 本次输出的完整内容（仅估算时使用）
+        
+        Returns:
+            Dict: input_tokens / output_tokens / cached_tokens / source（provider 或 estimate）
+        """
+        if usage:
+            recorded = {
+                "input_tokens": usage["prompt_tokens"],
+                "output_tokens": usage["completion_tokens"],
+                "cached_tokens": usage.get("cached_tokens", 0),
+                "source": "provider"
+            }
+        else:
+            recorded = {
+                "input_tokens": self.calculate_input_tokens(messages, tools),
+                "output_tokens": self.calculate_output_tokens(output_content) if output_content.strip() else 0,
+                "cached_tokens": 0,
+                "source": "estimate"
+            }
+        
+        if recorded["input_tokens"] or recorded["output_tokens"]:
+            self.update_token_statistics(
+                recorded["input_tokens"], recorded["output_tokens"], recorded["cached_tokens"]
+            )
+        return recorded
+    
+    def update_token_statistics(self, input_tokens: int, output_tokens: int, cached_tokens: int = 0) -> bool:
         """
         更新当前对话的token统计
         
         Args:
             input_tokens: 输入token数量
             output_tokens: 输出token数量
+            cached_tokens: 输入中命中服务端缓存的token数量
         
         Returns:
             bool: 更新是否成功
@@ -145,11 +344,13 @@ class ContextManager:
             return False
         
         try:
-            success = self.conversation_manager.update_token_statistics(
-                self.current_conversation_id,
-                input_tokens,
-                output_tokens
-            )
+            with timeline_span(self.task_timeline, "save", "token_statistics"):
+                success = self.conversation_manager.update_token_statistics(
+                    self.current_conversation_id,
+                    input_tokens,
+                    output_tokens,
+                    cached_tokens
+                )
             
             if success:
                 # 广播token更新事件
@@ -357,7 +558,7 @@ class ContextManager:
                     payload = deepcopy(raw_content)
                 elif isinstance(raw_content, str):
                     try:
-                        payload = json.loads(raw_content)
+                        payload = serialization.loads(raw_content)
                     except Exception:
                         payload = None
 
@@ -372,9 +573,15 @@ class ContextManager:
                         payload["content"] = extract_placeholder
                         compressed_types.add("extract_webpage")
                         updated = True
+                    elif tool_name == "extract_webpage" and payload.get("pages"):
+                        for page in payload["pages"]:
+                            if isinstance(page, dict) and page.get("content"):
+                                page["content"] = extract_placeholder
+                                compressed_types.add("extract_webpage")
+                                updated = True
 
                     if updated:
-                        new_msg["content"] = json.dumps(payload, ensure_ascii=False)
+                        new_msg["content"] = serialization.dumps(payload)
                 else:
                     if tool_name in {"read_file", "confirm_read_or_focus"}:
                         new_msg["content"] = append_placeholder
@@ -383,6 +590,9 @@ class ContextManager:
                         new_msg["content"] = extract_placeholder
                         compressed_types.add("extract_webpage")
 
+            if new_msg.get("content") != message.get("content"):
+                # 内容已替换为占位符，原来的引用形式不再对应
+                new_msg.pop(STORED_CONTENT_KEY, None)
             compressed_messages.append(new_msg)
 
         if not compressed_types:
@@ -477,47 +687,30 @@ class ContextManager:
     
     def safe_broadcast_token_update(self):
         """安全的token更新广播（只广播累计统计，不重新计算）"""
+        if not getattr(self, '_web_terminal_callback', None) or not self.current_conversation_id:
+            return
+        
         try:
-            print(f"[Debug] 尝试广播token更新")
-            
-            # 检查是否有回调函数
-            if not hasattr(self, '_web_terminal_callback'):
-                print(f"[Debug] 没有_web_terminal_callback属性")
-                return
+            with tracing.span(tracing.SPAN_BROADCAST):
+                # 只获取已有的累计token统计，不重新计算
+                cumulative_stats = self.get_conversation_token_statistics()
                 
-            if not self._web_terminal_callback:
-                print(f"[Debug] _web_terminal_callback为None")
-                return
-            
-            if not self.current_conversation_id:
-                print(f"[Debug] 没有当前对话ID")
-                return
+                # 准备广播数据
+                broadcast_data = {
+                    'conversation_id': self.current_conversation_id,
+                    'cumulative_input_tokens': cumulative_stats.get("total_input_tokens", 0) if cumulative_stats else 0,
+                    'cumulative_output_tokens': cumulative_stats.get("total_output_tokens", 0) if cumulative_stats else 0,
+                    'cumulative_total_tokens': cumulative_stats.get("total_tokens", 0) if cumulative_stats else 0,
+                    'cumulative_cached_tokens': cumulative_stats.get("total_cached_tokens", 0) if cumulative_stats else 0,
+                    'context_tokens': self.get_context_tokens()["total_tokens"],
+                    'updated_at': datetime.now().isoformat()
+                }
                 
-            print(f"[Debug] 广播token统计，对话ID: {self.current_conversation_id}")
-            
-            # 只获取已有的累计token统计，不重新计算
-            cumulative_stats = self.get_conversation_token_statistics()
-            
-            # 准备广播数据
-            broadcast_data = {
-                'conversation_id': self.current_conversation_id,
-                'cumulative_input_tokens': cumulative_stats.get("total_input_tokens", 0) if cumulative_stats else 0,
-                'cumulative_output_tokens': cumulative_stats.get("total_output_tokens", 0) if cumulative_stats else 0,
-                'cumulative_total_tokens': cumulative_stats.get("total_tokens", 0) if cumulative_stats else 0,
-                'updated_at': datetime.now().isoformat()
-            }
-            
-            print(f"[Debug] Token统计: 累计输入={broadcast_data['cumulative_input_tokens']}, 累计输出={broadcast_data['cumulative_output_tokens']}")
-            
-            # 广播到前端
-            self._web_terminal_callback('token_update', broadcast_data)
-            
-            print(f"[Debug] token更新已广播")
+                # 广播到前端
+                self._web_terminal_callback('token_update', broadcast_data)
             
         except Exception as e:
-            print(f"[Debug] 广播token更新失败: {e}")
-            import traceback
-            traceback.print_exc()
+            print(f"广播token更新失败: {e}")
     
     def add_conversation(
         self,
@@ -561,38 +754,31 @@ class ContextManager:
                 message["tool_call_id"] = tool_call_id
             if name:
                 message["name"] = name
+            # 大体积工具结果只在加入时计算一次引用形式，之后每次自动保存直接使用
+            self.conversation_manager.attach_content_ref(message)
         
-        self.conversation_history.append(message)
+        with self._gauge_lock:
+            self.conversation_history.append(message)
+            if self._message_tokens is not None:
+                self._message_tokens.append(self._count_text_tokens(content))
+        self.conversation_revisions.bump(len(self.conversation_history) - 1)
         
         # 自动保存
-        self.auto_save_conversation()
+        with tracing.span(tracing.SPAN_PERSIST), timeline_span(self.task_timeline, "save", role):
+            self.auto_save_conversation()
         
         # 特殊处理：如果是用户消息，需要计算并更新输入token
         if role == "user":
             self._handle_user_message_token_update()
         else:
             # 其他消息只需要广播现有统计
-            print(f"[Debug] 添加{role}消息后广播token更新")
             self.safe_broadcast_token_update()
     
     def _handle_user_message_token_update(self):
         """处理用户消息的token更新（计算输入token并更新统计）"""
-        try:
-            print(f"[Debug] 用户发送消息，开始计算输入token")
-            
-            # 需要访问web_terminal来构建完整的messages
-            # 这里有个问题：add_conversation是在用户消息添加后调用的
-            # 但我们需要构建包含这条消息的完整context来计算输入token
-            
-            # 临时解决方案：延迟计算，让web_server负责在构建messages后计算输入token
-            # 这里只广播现有统计
-            print(f"[Debug] 用户消息添加完成，广播现有token统计")
-            self.safe_broadcast_token_update()
-            
-        except Exception as e:
-            print(f"[Debug] 处理用户消息token更新失败: {e}")
-            # 失败时仍然广播现有统计
-            self.safe_broadcast_token_update()
+        # add_conversation在用户消息添加后调用，此时还没有包含该消息的完整context，
+        # 输入token由web_server在构建messages后计算，这里只广播现有统计
+        self.safe_broadcast_token_update()
     
     def add_tool_result(self, tool_call_id: str, function_name: str, result: str):
         """添加工具调用结果（保留方法以兼容）"""
@@ -626,8 +812,224 @@ class ContextManager:
     # 保持原有的其他方法不变
     # ===========================================
     
-    def get_project_structure(self) -> Dict:
-        """获取项目文件结构"""
+    def get_project_structure(self, refresh: bool = False) -> Dict:
+        """
+        获取项目文件结构（带缓存，返回的字典不要修改）
+        
+        文件监听运行时缓存一直有效（由增量更新维护），否则超过 FILE_TREE_CACHE_TTL 后重新扫描。
+        
+        Args:
+            refresh: 忽略缓存重新扫描
+        """
+        with self._tree_lock:
+            if not refresh and self._structure_is_fresh():
+                return self._structure_cache
+            
+            structure = self._scan_project_structure()
+            index = {entry["path"]: entry for entry in structure["folders"]}
+            index.update((entry["path"], entry) for entry in structure["files"])
+            
+            if self._structure_root != self.project_path:
+                # 首次扫描或项目路径已切换：之前的版本只能获取全量
+                self.file_tree_revisions.reset()
+                self._file_index = index
+                self._structure_root = self.project_path
+                self._start_file_watcher()
+            else:
+                changed = {
+                    path for path in index.keys() | self._file_index.keys()
+                    if index.get(path) != self._file_index.get(path)
+                }
+                self._commit_file_index(index, changed)
+            
+            self._structure_cache = structure
+            self._structure_built_at = time.time()
+            return structure
+    
+    def _structure_is_fresh(self) -> bool:
+        if self._structure_cache is None or self._structure_root != self.project_path:
+            return False
+        if self._file_watcher_running():
+            return True
+        return time.time() - self._structure_built_at < FILE_TREE_CACHE_TTL
+    
+    def invalidate_project_structure(self):
+        """文件可能已变化（无法增量跟踪的操作），下次获取时重新扫描"""
+        with self._tree_lock:
+            self._structure_cache = None
+    
+    def notify_external_file_changes(self):
+        """终端命令等可能修改了文件：文件监听运行时由其增量更新，否则下次获取时重新扫描"""
+        if not self._file_watcher_running():
+            self.invalidate_project_structure()
+    
+    def set_file_tree_listener(self, listener):
+        """设置文件树变化回调，参数为 file_tree_changes 格式的增量（附带 revision/since）"""
+        self._file_tree_listener = listener
+    
+    def apply_file_changes(self, paths):
+        """
+        按变化的相对路径增量更新文件树（来自FileManager操作或文件监听），不扫描整个项目
+        """
+        with self._tree_lock:
+            if self._structure_cache is None or self._structure_root != self.project_path:
+                return
+            index = dict(self._file_index)
+            changed = set()
+            for path in paths:
+                changed |= self._refresh_index_path(index, path)
+            if self._commit_file_index(index, changed):
+                self._structure_cache = self._structure_from_index(index)
+    
+    def _commit_file_index(self, index: Dict[str, Dict], changed) -> bool:
+        """保存新的文件索引，有变化时递增版本号并通知监听者"""
+        changed = {path for path in changed if index.get(path) != self._file_index.get(path)}
+        self._file_index = index
+        if not changed:
+            return False
+        since = self.file_tree_revisions.revision
+        revision = self.file_tree_revisions.bump(*changed)
+        if self._file_tree_listener:
+            upserts = [index[path] for path in sorted(changed) if path in index]
+            removed = sorted(path for path in changed if path not in index)
+            try:
+                self._file_tree_listener({
+                    "revision": revision,
+                    "since": since,
+                    "upserts": upserts,
+                    "removed": removed
+                })
+            except Exception as e:
+                print(f"⚠️ 推送文件树变化失败: {e}")
+        return True
+    
+    def _refresh_index_path(self, index: Dict[str, Dict], relative_path: str) -> set:
+        """按磁盘现状更新索引中的一个路径（目录包含其子树），返回变化的路径"""
+        parts = Path(relative_path).parts
+        if not parts or any(part.startswith('.') for part in parts) or len(parts) > TREE_MAX_LEVEL + 1:
+            return set()
+        relative_path = str(Path(*parts))
+        full_path = self.project_path / relative_path
+        prefix = relative_path + os.sep
+        changed = set()
+        
+        # 先移除该路径及其子项，再按磁盘现状加回
+        for path in [p for p in index if p == relative_path or p.startswith(prefix)]:
+            changed.add(path)
+            del index[path]
+        
+        if full_path.is_dir():
+            subtree = self._scan_project_structure(start=full_path)
+            index[relative_path] = {"name": full_path.name, "path": relative_path}
+            for entry in subtree["folders"] + subtree["files"]:
+                index[entry["path"]] = entry
+                changed.add(entry["path"])
+            changed.add(relative_path)
+        elif full_path.is_file():
+            try:
+                stat = full_path.stat()
+            except OSError:
+                return changed
+            index[relative_path] = {
+                "name": full_path.name,
+                "path": relative_path,
+                "size": stat.st_size,
+                "modified": datetime.fromtimestamp(stat.st_mtime).isoformat(),
+                "annotation": self.file_annotations.get(relative_path, "")
+            }
+            changed.add(relative_path)
+        else:
+            return changed
+        
+        # 新建的深层路径：补上缺失的上级文件夹
+        for depth in range(1, len(parts)):
+            ancestor = str(Path(*parts[:depth]))
+            if ancestor not in index:
+                index[ancestor] = {"name": parts[depth - 1], "path": ancestor}
+                changed.add(ancestor)
+        return changed
+    
+    def _structure_from_index(self, index: Dict[str, Dict]) -> Dict:
+        """由文件索引生成与完整扫描相同格式的文件结构（不访问磁盘）"""
+        structure = {
+            "path": str(self.project_path),
+            "files": [],
+            "folders": [],
+            "total_files": 0,
+            "total_size": 0,
+            "tree": {}
+        }
+        children: Dict[str, List[Dict]] = {}
+        for path, entry in index.items():
+            children.setdefault(os.path.dirname(path), []).append(entry)
+        
+        def build(parent: str, parent_tree: Dict):
+            # 与扫描顺序一致：文件夹在前，文件在后，按名称排序
+            for entry in sorted(children.get(parent, []), key=lambda e: ("size" in e, e["name"].lower())):
+                if "size" in entry:
+                    structure["files"].append(entry)
+                    structure["total_files"] += 1
+                    structure["total_size"] += entry["size"]
+                    parent_tree[entry["name"]] = {
+                        "type": "file",
+                        "path": entry["path"],
+                        "size": entry["size"],
+                        "annotation": entry["annotation"]
+                    }
+                else:
+                    structure["folders"].append(entry)
+                    parent_tree[entry["name"]] = {
+                        "type": "folder",
+                        "path": entry["path"],
+                        "children": {}
+                    }
+                    build(entry["path"], parent_tree[entry["name"]]["children"])
+        
+        build("", structure["tree"])
+        return structure
+    
+    def _file_watcher_running(self) -> bool:
+        return self._file_watcher is not None and self._file_watcher.running
+    
+    def _start_file_watcher(self):
+        """监听当前项目目录（需要watchdog；项目路径切换时重新订阅）"""
+        self.stop_file_watcher()
+        if not FILE_WATCHER_ENABLED or not ProjectWatcher.available:
+            return
+        watcher = ProjectWatcher(str(self.project_path), self.apply_file_changes, FILE_WATCHER_DEBOUNCE)
+        try:
+            if watcher.start():
+                self._file_watcher = watcher
+        except OSError as e:
+            print(f"⚠️ 启动文件监听失败，改为定期扫描: {e}")
+    
+    def stop_file_watcher(self):
+        if self._file_watcher:
+            self._file_watcher.stop()
+            self._file_watcher = None
+    
+    def file_tree_changes(self, since: int) -> Optional[Dict]:
+        """
+        文件树自版本since以来的变化
+        
+        Returns:
+            {"upserts": [新增或修改的文件/文件夹], "removed": [已删除的路径]}；无法增量时返回None
+        """
+        with self._tree_lock:
+            changed = self.file_tree_revisions.changes_since(since)
+            if changed is None:
+                return None
+            upserts = [self._file_index[path] for path in sorted(changed) if path in self._file_index]
+            removed = sorted(path for path in changed if path not in self._file_index)
+        return {"upserts": upserts, "removed": removed}
+    
+    def _scan_project_structure(self, start: Path = None) -> Dict:
+        """
+        扫描项目目录，生成文件结构
+        
+        Args:
+            start: 只扫描该子目录（增量更新时使用，不清理备注）
+        """
         structure = {
             "path": str(self.project_path),
             "files": [],
@@ -640,7 +1042,7 @@ class ContextManager:
         # 记录实际存在的文件
         existing_files = set()
         
-        def scan_directory(path: Path, level: int = 0, max_level: int = 5, parent_tree: Dict = None):
+        def scan_directory(path: Path, level: int = 0, max_level: int = TREE_MAX_LEVEL, parent_tree: Dict = None):
             if level > max_level:
                 return
             
@@ -697,6 +1099,10 @@ class ContextManager:
             except PermissionError:
                 pass
         
+        if start is not None:
+            scan_directory(start, level=len(start.relative_to(self.project_path).parts))
+            return structure
+        
         scan_directory(self.project_path)
         
         # 清理不存在文件的备注
@@ -709,7 +1115,7 @@ class ContextManager:
             for path in invalid_annotations:
                 del self.file_annotations[path]
                 print(f"🧹 清理无效备注: {path}")
-            self.save_annotations()
+            self._write_annotations()
         
         return structure
     
@@ -753,6 +1159,7 @@ class ContextManager:
     
     def build_main_context(self, memory_content: str) -> Dict:
         """构建主终端上下文"""
+        self.set_main_memory(memory_content)
         structure = self.get_project_structure()
         
         context = {
@@ -953,7 +1360,7 @@ class ContextManager:
         """检查上下文大小"""
         sizes = {
             "temp_files": sum(len(content) for content in self.temp_files.values()),
-            "conversation": sum(len(json.dumps(msg, ensure_ascii=False)) for msg in self.conversation_history),
+            "conversation": sum(len(serialization.dumps(msg)) for msg in self.conversation_history),
             "total": 0
         }
         sizes["total"] = sum(sizes.values())
@@ -1006,18 +1413,9 @@ class ContextManager:
         
         # 添加聚焦文件内容
         if self._focused_files:
-            focused_content = "\n\n=== 🔍 正在聚焦的文件 ===\n"
-            focused_content += f"(共 {len(self._focused_files)} 个文件处于聚焦状态)\n"
-            
-            for path, content in self._focused_files.items():
-                size_kb = len(content) / 1024
-                focused_content += f"\n--- 文件: {path} ({size_kb:.1f}KB) ---\n"
-                focused_content += f"```\n{content}\n```\n"
-            
-            focused_content += "\n=== 聚焦文件结束 ===\n"
             messages.append({
                 "role": "system",
-                "content": focused_content
+                "content": format_focused_files(self._focused_files)
             })
         
         # 添加终端内容（如果有的话）
@@ -2,21 +2,32 @@
 
 import json
 import os
+import re
 import time
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Set
 from dataclasses import dataclass
 try:
-    from config import DATA_DIR
+    from config import DATA_DIR, TASK_TIMELINE_MAX_PER_CONVERSATION, EXTRACT_CACHE_DIR, EXTRACT_BLOB_COMPRESSION, EXTRACT_CACHE_TTL
 except ImportError:
     import sys
     from pathlib import Path
     project_root = Path(__file__).resolve().parents[1]
     if str(project_root) not in sys.path:
         sys.path.insert(0, str(project_root))
-    from config import DATA_DIR
-import tiktoken
+    from config import DATA_DIR, TASK_TIMELINE_MAX_PER_CONVERSATION, EXTRACT_CACHE_DIR, EXTRACT_BLOB_COMPRESSION, EXTRACT_CACHE_TTL
+from utils import serialization, tracing
+from utils.blob_store import BlobStore
+from utils.file_io import file_lock
+from utils.result_cache import DiskCache
+
+# 在对话文件中以内容引用代替全文保存的工具结果（内容存放于网页提取缓存的blob存储）
+CONTENT_REF_TOOLS = {"extract_webpage"}
+# 内存中的工具消息在该字段保存引用形式的内容（消息加入时计算一次），写入对话文件时直接替换content
+STORED_CONTENT_KEY = "stored_content"
+# 对话文件中的内容引用（工具结果是嵌套的JSON字符串，引号带转义）
+_CONTENT_REF_PATTERN = re.compile(r'content_ref\\*"\s*:\s*\\*"([0-9a-f]{64})')
 
 @dataclass
 class ConversationMetadata:
@@ -38,15 +49,9 @@ class ConversationManager:
         self.conversations_dir = Path(DATA_DIR) / "conversations"
         self.index_file = self.conversations_dir / "index.json"
         self.current_conversation_id: Optional[str] = None
+        self.content_blobs = BlobStore(f"{EXTRACT_CACHE_DIR}/blobs", EXTRACT_BLOB_COMPRESSION)
+        self.extract_index = DiskCache(f"{EXTRACT_CACHE_DIR}/urls", EXTRACT_CACHE_TTL)
         self._ensure_directories()
-        self._load_index()
-        
-        # 初始化tiktoken编码器
-        try:
-            self.encoding = tiktoken.get_encoding("cl100k_base")
-        except Exception as e:
-            print(f"⚠️ tiktoken初始化失败: {e}")
-            self.encoding = None
     
     def _ensure_directories(self):
         """确保必要的目录存在"""
@@ -56,24 +61,59 @@ class ConversationManager:
         if not self.index_file.exists():
             self._save_index({})
     
+    def _read_index_file(self) -> Dict:
+        """读取索引文件，文件为空或损坏时抛出 ValueError"""
+        with open(self.index_file, 'rb') as f:
+            content = f.read().strip()
+        if not content:
+            raise ValueError("索引文件为空")
+        index = serialization.loads(content)
+        if not isinstance(index, dict):
+            raise ValueError("索引格式错误")
+        return index
+    
     def _load_index(self) -> Dict:
-        """加载对话索引"""
+        """加载对话索引（损坏时从对话文件重建，不会丢失对话列表）"""
         try:
             if self.index_file.exists():
-                with open(self.index_file, 'r', encoding='utf-8') as f:
-                    content = f.read().strip()
-                    if content:
-                        return json.loads(content)
-            return {}
-        except (json.JSONDecodeError, Exception) as e:
-            print(f"⚠️ 加载对话索引失败，将重新创建: {e}")
+                return self._read_index_file()
             return {}
+        except Exception as e:
+            print(f"⚠️ 加载对话索引失败，将从对话文件重建: {e}")
+            return self._rebuild_index()
+    
+    def _rebuild_index(self) -> Dict:
+        """扫描对话文件重建索引，损坏的索引另存为 index.json.corrupt-<时间>"""
+        with file_lock(self.index_file):
+            # 等锁期间可能已有其他进程完成重建
+            try:
+                return self._read_index_file()
+            except Exception:
+                pass
+            
+            if self.index_file.exists():
+                backup = self.index_file.with_name(f"index.json.corrupt-{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+                try:
+                    os.replace(self.index_file, backup)
+                except OSError:
+                    pass
+            
+            index = {}
+            for file_path in sorted(self.conversations_dir.glob("conv_*.json")):
+                try:
+                    data = serialization.load_file(file_path)
+                    index[data.get("id") or file_path.stem] = self._build_index_entry(data)
+                except Exception as e:
+                    print(f"⚠️ 跳过无法读取的对话文件 {file_path.name}: {e}")
+            self._save_index(index)
+        
+        print(f"🔧 已从 {len(index)} 个对话文件重建对话索引")
+        return index
     
     def _save_index(self, index: Dict):
         """保存对话索引"""
         try:
-            with open(self.index_file, 'w', encoding='utf-8') as f:
-                json.dump(index, f, ensure_ascii=False, indent=2)
+            serialization.dump_file(self.index_file, index)
         except Exception as e:
             print(f"⌘ 保存对话索引失败: {e}")
     
@@ -118,6 +158,7 @@ class ConversationManager:
         return {
             "total_input_tokens": 0,
             "total_output_tokens": 0,
+            "total_cached_tokens": 0,
             "updated_at": datetime.now().isoformat()
         }
     
@@ -199,43 +240,143 @@ class ConversationManager:
             # 确保Token统计数据有效
             data = self._validate_token_statistics(data)
             
+            if data.get("messages"):
+                data = dict(data, messages=self._store_content_refs(data["messages"]))
+            
             file_path = self._get_conversation_file_path(conversation_id)
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            with file_lock(file_path):
+                serialization.dump_file(file_path, data)
         except Exception as e:
             print(f"⌘ 保存对话文件失败 {conversation_id}: {e}")
     
+    def _store_content_refs(self, messages: List[Dict]) -> List[Dict]:
+        """
+        保存前把带 stored_content 的工具消息替换为引用形式的内容
+        
+        只在副本上替换，内存中的消息保持不变；不再重新解析消息内容，保存开销与消息体积无关。
+        """
+        result = None
+        for i, msg in enumerate(messages):
+            if STORED_CONTENT_KEY not in msg:
+                continue
+            if result is None:
+                result = list(messages)
+            stored = dict(msg, content=msg[STORED_CONTENT_KEY])
+            stored.pop(STORED_CONTENT_KEY)
+            result[i] = stored
+        return messages if result is None else result
+    
+    def attach_content_ref(self, message: Dict) -> Dict:
+        """
+        为工具消息计算一次引用形式的内容，记录在 stored_content 中
+        
+        内容已在blob存储中时才替换为content_ref；批量提取结果（pages）中的每个页面分别替换。
+        """
+        if message.get("role") != "tool" or message.get("name") not in CONTENT_REF_TOOLS:
+            return message
+        try:
+            payload = serialization.loads(message.get("content") or "")
+        except ValueError:
+            return message
+        if not isinstance(payload, dict):
+            return message
+        entries = [payload] + [page for page in payload.get("pages") or [] if isinstance(page, dict)]
+        replaced = False
+        for entry in entries:
+            content_hash = entry.get("content_hash")
+            if "content" in entry and content_hash and self.content_blobs.exists(content_hash):
+                entry.pop("content")
+                entry["content_ref"] = content_hash
+                replaced = True
+        if replaced:
+            message[STORED_CONTENT_KEY] = serialization.dumps(payload)
+        return message
+    
+    def _resolve_content_refs(self, messages: List[Dict]):
+        """加载后把内容引用还原为全文（blob缺失时保留引用并注明），引用形式保存在 stored_content 中"""
+        for msg in messages:
+            if msg.get("role") != "tool" or msg.get("name") not in CONTENT_REF_TOOLS:
+                continue
+            content = msg.get("content") or ""
+            if '"content_ref"' not in content:
+                # 旧版本保存的全文：加载时计算一次引用形式
+                self.attach_content_ref(msg)
+                continue
+            try:
+                payload = serialization.loads(content)
+            except ValueError:
+                continue
+            if not isinstance(payload, dict):
+                continue
+            entries = [payload] + [page for page in payload.get("pages") or [] if isinstance(page, dict)]
+            for entry in entries:
+                if "content_ref" not in entry:
+                    continue
+                text = self.content_blobs.get(entry["content_ref"])
+                if text is None:
+                    entry["content"] = "（网页内容缓存已失效，如需查看请重新提取）"
+                else:
+                    entry.pop("content_ref")
+                    entry["content"] = text
+            msg[STORED_CONTENT_KEY] = content
+            msg["content"] = serialization.dumps(payload)
+    
+    def _release_content_refs(self, digests: Set[str], deleted_id: str):
+        """
+        删除对话后回收其引用的网页内容blob
+        
+        其他对话文件或未过期的网页提取缓存仍引用的blob保留。
+        """
+        if not digests:
+            return
+        for file_path in self.conversations_dir.glob("*.json"):
+            if file_path == self.index_file or file_path.stem == deleted_id:
+                continue
+            try:
+                text = file_path.read_text(encoding="utf-8")
+            except (OSError, UnicodeDecodeError):
+                continue
+            digests = {digest for digest in digests if digest not in text}
+            if not digests:
+                return
+        for record in self.extract_index.values():
+            if isinstance(record, dict):
+                digests.discard(record.get("content_hash"))
+        for digest in digests:
+            self.content_blobs.remove(digest)
+    
+    def _build_index_entry(self, conversation_data: Dict) -> Dict:
+        """由对话数据生成索引条目"""
+        metadata = ConversationMetadata(
+            id=conversation_data["id"],
+            title=conversation_data["title"],
+            created_at=conversation_data["created_at"],
+            updated_at=conversation_data["updated_at"],
+            project_path=conversation_data["metadata"]["project_path"],
+            thinking_mode=conversation_data["metadata"]["thinking_mode"],
+            total_messages=conversation_data["metadata"]["total_messages"],
+            total_tools=conversation_data["metadata"]["total_tools"],
+            status=conversation_data["metadata"].get("status", "active")
+        )
+        return {
+            "title": metadata.title,
+            "created_at": metadata.created_at,
+            "updated_at": metadata.updated_at,
+            "project_path": metadata.project_path,
+            "thinking_mode": metadata.thinking_mode,
+            "total_messages": metadata.total_messages,
+            "total_tools": metadata.total_tools,
+            "status": metadata.status
+        }
+    
     def _update_index(self, conversation_id: str, conversation_data: Dict):
-        """更新对话索引"""
+        """更新对话索引（加锁读-改-写，多个进程可同时更新）"""
         try:
-            index = self._load_index()
-            
-            # 创建元数据
-            metadata = ConversationMetadata(
-                id=conversation_id,
-                title=conversation_data["title"],
-                created_at=conversation_data["created_at"],
-                updated_at=conversation_data["updated_at"],
-                project_path=conversation_data["metadata"]["project_path"],
-                thinking_mode=conversation_data["metadata"]["thinking_mode"],
-                total_messages=conversation_data["metadata"]["total_messages"],
-                total_tools=conversation_data["metadata"]["total_tools"],
-                status=conversation_data["metadata"].get("status", "active")
-            )
-            
-            # 添加到索引
-            index[conversation_id] = {
-                "title": metadata.title,
-                "created_at": metadata.created_at,
-                "updated_at": metadata.updated_at,
-                "project_path": metadata.project_path,
-                "thinking_mode": metadata.thinking_mode,
-                "total_messages": metadata.total_messages,
-                "total_tools": metadata.total_tools,
-                "status": metadata.status
-            }
-            
-            self._save_index(index)
+            entry = self._build_index_entry(dict(conversation_data, id=conversation_id))
+            with file_lock(self.index_file):
+                index = self._load_index()
+                index[conversation_id] = entry
+                self._save_index(index)
         except Exception as e:
             print(f"⌘ 更新对话索引失败: {e}")
     
@@ -259,53 +400,56 @@ class ConversationManager:
             bool: 保存是否成功
         """
         try:
-            # 加载现有对话数据
-            existing_data = self.load_conversation(conversation_id)
-            if not existing_data:
-                print(f"⚠️ 对话 {conversation_id} 不存在，无法更新")
-                return False
-            
-            # 更新数据
-            existing_data["messages"] = messages
-            existing_data["updated_at"] = datetime.now().isoformat()
-            
-            # 更新标题（如果消息发生变化）
-            new_title = self._extract_title_from_messages(messages)
-            if new_title != "新对话":
-                existing_data["title"] = new_title
-            
-            # 更新元数据
-            if project_path is not None:
-                existing_data["metadata"]["project_path"] = project_path
-            if thinking_mode is not None:
-                existing_data["metadata"]["thinking_mode"] = thinking_mode
-            
-            existing_data["metadata"]["total_messages"] = len(messages)
-            existing_data["metadata"]["total_tools"] = self._count_tools_in_messages(messages)
-            
-            # 确保Token统计结构存在（向后兼容）
-            if "token_statistics" not in existing_data:
-                existing_data["token_statistics"] = self._initialize_token_statistics()
-            else:
-                existing_data["token_statistics"]["updated_at"] = datetime.now().isoformat()
-            
-            # 保存文件
-            self._save_conversation_file(conversation_id, existing_data)
-            
-            # 更新索引
-            self._update_index(conversation_id, existing_data)
-            
-            return True
+            # 读-改-写在同一把文件锁内完成，避免并发写入互相覆盖
+            with file_lock(self._get_conversation_file_path(conversation_id)):
+                # 加载现有对话数据
+                existing_data = self.load_conversation(conversation_id, resolve_refs=False)
+                if not existing_data:
+                    print(f"⚠️ 对话 {conversation_id} 不存在，无法更新")
+                    return False
+                
+                # 更新数据
+                existing_data["messages"] = messages
+                existing_data["updated_at"] = datetime.now().isoformat()
+                
+                # 更新标题（如果消息发生变化）
+                new_title = self._extract_title_from_messages(messages)
+                if new_title != "新对话":
+                    existing_data["title"] = new_title
+                
+                # 更新元数据
+                if project_path is not None:
+                    existing_data["metadata"]["project_path"] = project_path
+                if thinking_mode is not None:
+                    existing_data["metadata"]["thinking_mode"] = thinking_mode
+                
+                existing_data["metadata"]["total_messages"] = len(messages)
+                existing_data["metadata"]["total_tools"] = self._count_tools_in_messages(messages)
+                
+                # 确保Token统计结构存在（向后兼容）
+                if "token_statistics" not in existing_data:
+                    existing_data["token_statistics"] = self._initialize_token_statistics()
+                else:
+                    existing_data["token_statistics"]["updated_at"] = datetime.now().isoformat()
+                
+                # 保存文件
+                self._save_conversation_file(conversation_id, existing_data)
+                
+                # 更新索引
+                self._update_index(conversation_id, existing_data)
+                
+                return True
         except Exception as e:
             print(f"⌘ 保存对话失败 {conversation_id}: {e}")
             return False
     
-    def load_conversation(self, conversation_id: str) -> Optional[Dict]:
+    def load_conversation(self, conversation_id: str, resolve_refs: bool = True) -> Optional[Dict]:
         """
         加载对话数据
         
         Args:
             conversation_id: 对话ID
+            resolve_refs: 是否把工具结果中的内容引用还原为全文（仅修改元数据后写回时不需要）
         
         Returns:
             Dict: 对话数据，如果不存在返回None
@@ -315,12 +459,12 @@ class ConversationManager:
             if not file_path.exists():
                 return None
             
-            with open(file_path, 'r', encoding='utf-8') as f:
+            with open(file_path, 'rb') as f:
                 content = f.read().strip()
                 if not content:
                     return None
                 
-                data = json.loads(content)
+                data = serialization.loads(content)
                 
                 # 向后兼容：确保Token统计结构存在
                 if "token_statistics" not in data:
@@ -332,12 +476,15 @@ class ConversationManager:
                     # 验证现有Token统计数据
                     data = self._validate_token_statistics(data)
                 
+                if resolve_refs and data.get("messages"):
+                    self._resolve_content_refs(data["messages"])
+                
                 return data
         except (json.JSONDecodeError, Exception) as e:
             print(f"⌘ 加载对话失败 {conversation_id}: {e}")
             return None
     
-    def update_token_statistics(self, conversation_id: str, input_tokens: int, output_tokens: int) -> bool:
+    def update_token_statistics(self, conversation_id: str, input_tokens: int, output_tokens: int, cached_tokens: int = 0) -> bool:
         """
         更新对话的Token统计
         
@@ -345,33 +492,35 @@ class ConversationManager:
             conversation_id: 对话ID
             input_tokens: 输入Token数量
             output_tokens: 输出Token数量
+            cached_tokens: 输入中命中服务端缓存的Token数量
         
         Returns:
             bool: 更新是否成功
         """
         try:
-            conversation_data = self.load_conversation(conversation_id)
-            if not conversation_data:
-                print(f"⚠️ 无法找到对话 {conversation_id}，跳过Token统计")
-                return False
-            
-            # 确保Token统计结构存在
-            if "token_statistics" not in conversation_data:
-                conversation_data["token_statistics"] = self._initialize_token_statistics()
-            
-            # 更新统计数据
-            token_stats = conversation_data["token_statistics"]
-            token_stats["total_input_tokens"] = token_stats.get("total_input_tokens", 0) + input_tokens
-            token_stats["total_output_tokens"] = token_stats.get("total_output_tokens", 0) + output_tokens
-            token_stats["updated_at"] = datetime.now().isoformat()
-            
-            # 保存更新
-            self._save_conversation_file(conversation_id, conversation_data)
-            
-            print(f"📊 Token统计已更新: +{input_tokens}输入, +{output_tokens}输出 "
-                  f"(总计: {token_stats['total_input_tokens']}输入, {token_stats['total_output_tokens']}输出)")
-            
-            return True
+            # 读-改-写在同一把文件锁内完成，避免并发写入互相覆盖
+            with file_lock(self._get_conversation_file_path(conversation_id)):
+                conversation_data = self.load_conversation(conversation_id, resolve_refs=False)
+                if not conversation_data:
+                    print(f"⚠️ 无法找到对话 {conversation_id}，跳过Token统计")
+                    return False
+                
+                # 确保Token统计结构存在
+                if "token_statistics" not in conversation_data:
+                    conversation_data["token_statistics"] = self._initialize_token_statistics()
+                
+                # 更新统计数据
+                token_stats = conversation_data["token_statistics"]
+                token_stats["total_input_tokens"] = token_stats.get("total_input_tokens", 0) + input_tokens
+                token_stats["total_output_tokens"] = token_stats.get("total_output_tokens", 0) + output_tokens
+                token_stats["total_cached_tokens"] = token_stats.get("total_cached_tokens", 0) + cached_tokens
+                token_stats["updated_at"] = datetime.now().isoformat()
+                
+                # 保存更新
+                with tracing.span(tracing.SPAN_PERSIST):
+                    self._save_conversation_file(conversation_id, conversation_data)
+                
+                return True
         except Exception as e:
             print(f"⌘ 更新Token统计失败 {conversation_id}: {e}")
             return False
@@ -387,7 +536,7 @@ class ConversationManager:
             Dict: Token统计数据
         """
         try:
-            conversation_data = self.load_conversation(conversation_id)
+            conversation_data = self.load_conversation(conversation_id, resolve_refs=False)
             if not conversation_data:
                 return None
             
@@ -398,6 +547,7 @@ class ConversationManager:
                 "total_input_tokens": token_stats.get("total_input_tokens", 0),
                 "total_output_tokens": token_stats.get("total_output_tokens", 0),
                 "total_tokens": token_stats.get("total_input_tokens", 0) + token_stats.get("total_output_tokens", 0),
+                "total_cached_tokens": token_stats.get("total_cached_tokens", 0),
                 "updated_at": token_stats.get("updated_at"),
                 "conversation_id": conversation_id
             }
@@ -407,6 +557,47 @@ class ConversationManager:
             print(f"⌘ 获取Token统计失败 {conversation_id}: {e}")
             return None
     
+    def save_task_timeline(self, conversation_id: str, timeline: Dict) -> bool:
+        """
+        将任务时间线写入对话元数据（只保留最近若干条）
+        
+        Args:
+            conversation_id: 对话ID
+            timeline: TaskTimeline.to_dict() 的结果
+        
+        Returns:
+            bool: 保存是否成功
+        """
+        try:
+            # 读-改-写在同一把文件锁内完成，避免并发写入互相覆盖
+            with file_lock(self._get_conversation_file_path(conversation_id)):
+                conversation_data = self.load_conversation(conversation_id, resolve_refs=False)
+                if not conversation_data:
+                    return False
+                
+                metadata = conversation_data.setdefault("metadata", {})
+                timelines = metadata.get("task_timelines", [])
+                timelines.append(timeline)
+                metadata["task_timelines"] = timelines[-TASK_TIMELINE_MAX_PER_CONVERSATION:]
+                
+                with tracing.span(tracing.SPAN_PERSIST):
+                    self._save_conversation_file(conversation_id, conversation_data)
+                return True
+        except Exception as e:
+            print(f"⌘ 保存任务时间线失败 {conversation_id}: {e}")
+            return False
+    
+    def get_task_timelines(self, conversation_id: str) -> Optional[List[Dict]]:
+        """获取对话中记录的任务时间线，对话不存在返回None"""
+        conversation_data = self.load_conversation(conversation_id, resolve_refs=False)
+        if not conversation_data:
+            return None
+        return conversation_data.get("metadata", {}).get("task_timelines", [])
+    
+    def get_conversation_summary(self, conversation_id: str) -> Optional[Dict]:
+        """从索引读取对话摘要（标题、时间、消息数等），不加载对话文件"""
+        return self._load_index().get(conversation_id)
+    
     def get_conversation_list(self, limit: int = 50, offset: int = 0) -> Dict:
         """
         获取对话列表
@@ -477,19 +668,31 @@ class ConversationManager:
         try:
             # 删除对话文件
             file_path = self._get_conversation_file_path(conversation_id)
+            content_refs = set()
             if file_path.exists():
+                try:
+                    content_refs = set(_CONTENT_REF_PATTERN.findall(file_path.read_text(encoding="utf-8")))
+                except (OSError, UnicodeDecodeError):
+                    pass
                 file_path.unlink()
             
             # 从索引中删除
-            index = self._load_index()
-            if conversation_id in index:
-                del index[conversation_id]
-                self._save_index(index)
+            with file_lock(self.index_file):
+                index = self._load_index()
+                if conversation_id in index:
+                    del index[conversation_id]
+                    self._save_index(index)
             
             # 如果删除的是当前对话，清除当前对话ID
             if self.current_conversation_id == conversation_id:
                 self.current_conversation_id = None
             
+            # 回收不再被引用的网页内容
+            try:
+                self._release_content_refs(content_refs, conversation_id)
+            except OSError as e:
+                print(f"⚠️ 回收网页内容缓存失败 {conversation_id}: {e}")
+            
             print(f"🗑️ 已删除对话: {conversation_id}")
             return True
         except Exception as e:
@@ -507,20 +710,22 @@ class ConversationManager:
             bool: 归档是否成功
         """
         try:
-            # 更新对话状态
-            conversation_data = self.load_conversation(conversation_id)
-            if not conversation_data:
-                return False
-            
-            conversation_data["metadata"]["status"] = "archived"
-            conversation_data["updated_at"] = datetime.now().isoformat()
-            
-            # 保存更新
-            self._save_conversation_file(conversation_id, conversation_data)
-            self._update_index(conversation_id, conversation_data)
-            
-            print(f"📦 已归档对话: {conversation_id}")
-            return True
+            # 读-改-写在同一把文件锁内完成，避免并发写入互相覆盖
+            with file_lock(self._get_conversation_file_path(conversation_id)):
+                # 更新对话状态
+                conversation_data = self.load_conversation(conversation_id, resolve_refs=False)
+                if not conversation_data:
+                    return False
+                
+                conversation_data["metadata"]["status"] = "archived"
+                conversation_data["updated_at"] = datetime.now().isoformat()
+                
+                # 保存更新
+                self._save_conversation_file(conversation_id, conversation_data)
+                self._update_index(conversation_id, conversation_data)
+                
+                print(f"📦 已归档对话: {conversation_id}")
+                return True
         except Exception as e:
             print(f"⌘ 归档对话失败 {conversation_id}: {e}")
             return False
@@ -677,47 +882,25 @@ class ConversationManager:
         """设置当前对话ID"""
         self.current_conversation_id = conversation_id
     
-    def calculate_conversation_tokens(self, conversation_id: str, context_manager=None, focused_files=None, terminal_content="") -> dict:
-        """计算对话的真实API token消耗"""
+    def calculate_conversation_tokens(self, conversation_id: str, context_manager=None) -> dict:
+        """
+        对话的当前上下文token数（系统提示、对话历史、聚焦文件、终端快照和工具定义）
+        
+        当前对话直接读取上下文管理器中增量维护的token仪表；其他对话只按其历史消息重新计算历史部分。
+        """
         try:
             if not context_manager:
                 return {"total_tokens": 0}
             
+            if conversation_id == context_manager.current_conversation_id:
+                return context_manager.get_context_tokens()
+            
             conversation_data = self.load_conversation(conversation_id)
             if not conversation_data:
                 return {"total_tokens": 0}
             
-            # 构建context和messages...
-            context = context_manager.build_main_context(memory_content="")
-            messages = context_manager.build_messages(context, "")
-            
-            # 计算消息token
-            message_tokens = context_manager.calculate_input_tokens(messages, [])
-            
-            # 硬编码添加工具定义token
-            tools_tokens = 2400  # 基于你的日志
-            
-            total_tokens = message_tokens + tools_tokens
-            
-            return {"total_tokens": total_tokens}
+            return context_manager.get_context_tokens(conversation_data.get("messages", []))
             
         except Exception as e:
             print(f"计算token失败: {e}")
             return {"total_tokens": 0}
-    def _get_tools_definition(self, context_manager):
-        """获取工具定义"""
-        try:
-            # 需要找到工具定义的来源，通常在 main_terminal 中
-            # 你需要找到 main_terminal 的引用或者 define_tools 方法
-            
-            # 方法1: 如果 context_manager 有 main_terminal 引用
-            if hasattr(context_manager, 'main_terminal') and context_manager.main_terminal:
-                return context_manager.main_terminal.define_tools()
-            
-            # 方法2: 如果有其他方式获取工具定义
-            # 你需要去找一下在哪里调用了 calculate_input_tokens，看看 tools 参数是怎么传的
-            
-            return []
-        except Exception as e:
-            print(f"获取工具定义失败: {e}")
-            return []
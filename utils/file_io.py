@@ -0,0 +1,141 @@
+# utils/file_io.py - 崩溃安全的文件写入与跨进程文件锁
+
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Union
+try:
+    from config import ATOMIC_WRITE_FSYNC
+except ImportError:
+    import sys
+    project_root = Path(__file__).resolve().parents[1]
+    if str(project_root) not in sys.path:
+        sys.path.insert(0, str(project_root))
+    from config import ATOMIC_WRITE_FSYNC
+
+try:
+    import fcntl
+except ImportError:  # Windows：退化为进程内锁
+    fcntl = None
+
+# 当前线程已持有的锁（路径 -> 重入次数），同一线程可嵌套加锁
+_held = threading.local()
+# 无fcntl时使用的进程内锁
+_process_locks: Dict[str, threading.Lock] = {}
+_process_locks_guard = threading.Lock()
+
+
+def _lock_path(path: Union[str, Path]) -> str:
+    """锁文件放在目标文件旁（.<文件名>.lock），目标文件被替换时锁依然有效"""
+    path = Path(path).resolve()
+    return str(path.parent / f".{path.name}.lock")
+
+
+def _held_locks() -> Dict[str, int]:
+    held = getattr(_held, "locks", None)
+    if held is None:
+        held = _held.locks = {}
+    return held
+
+
+@contextmanager
+def file_lock(path: Union[str, Path], shared: bool = False):
+    """
+    对文件加咨询锁（跨进程，基于flock）
+
+    读-改-写操作需要在同一把锁内完成；同一线程可重入。
+
+    Args:
+        path: 要保护的文件路径（锁加在旁边的 .lock 文件上）
+        shared: 是否为共享锁（仅读取时使用）
+    """
+    lock_path = _lock_path(path)
+    held = _held_locks()
+    if lock_path in held:
+        held[lock_path] += 1
+        try:
+            yield
+        finally:
+            held[lock_path] -= 1
+        return
+
+    if fcntl is not None:
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            held[lock_path] = 1
+            try:
+                yield
+            finally:
+                del held[lock_path]
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+    else:
+        with _process_locks_guard:
+            lock = _process_locks.setdefault(lock_path, threading.Lock())
+        with lock:
+            held[lock_path] = 1
+            try:
+                yield
+            finally:
+                del held[lock_path]
+
+
+def atomic_write(path: Union[str, Path], data: Union[str, bytes], encoding: str = "utf-8"):
+    """
+    原子写入文件：写临时文件 -> fsync -> os.replace
+
+    写入过程中崩溃时，目标文件保持旧内容；读取方不会看到写了一半的文件。
+
+    Args:
+        path: 目标文件路径
+        data: 文件内容（字符串按encoding编码）
+        encoding: 字符串内容的编码
+    """
+    path = Path(path)
+    if isinstance(data, str):
+        data = data.encode(encoding)
+
+    # 沿用原文件的权限（mkstemp默认只有所有者可读写）
+    try:
+        mode = os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        mode = 0o644
+
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=str(path.parent))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            if ATOMIC_WRITE_FSYNC:
+                os.fsync(f.fileno())
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    if ATOMIC_WRITE_FSYNC:
+        _fsync_dir(path.parent)
+
+
+def _fsync_dir(directory: Path):
+    """把目录项（rename结果）落盘；不支持的平台忽略"""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    try:
+        fd = os.open(str(directory), os.O_RDONLY | os.O_DIRECTORY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
@@ -0,0 +1,107 @@
+# utils/fs_watcher.py - 项目目录监听（watchdog可选），合并短时间内的变更后回调
+
+import threading
+from pathlib import Path
+from typing import Callable, Iterable, Optional, Set
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
+
+# 所有会话共用一个Observer：同一目录只注册一组系统监听，各会话各自挂一个处理器
+_observer = None
+_observer_lock = threading.Lock()
+
+
+def _shared_observer():
+    global _observer
+    with _observer_lock:
+        if _observer is None:
+            _observer = Observer()
+            _observer.daemon = True
+            _observer.start()
+        return _observer
+
+
+class ProjectWatcher(FileSystemEventHandler):
+    """
+    监听项目目录下的文件变化
+
+    一次保存往往产生多个事件，在 debounce 秒内收到的变化合并为一次回调，
+    回调参数为变化的相对路径集合（隐藏文件/目录忽略）。未安装watchdog时 start() 返回False。
+    """
+
+    available = Observer is not None
+
+    def __init__(self, root: str, callback: Callable[[Set[str]], None], debounce: float = 0.3):
+        super().__init__()
+        self.root = Path(root).resolve()
+        self.callback = callback
+        self.debounce = debounce
+        self._watch = None
+        self._pending: Set[str] = set()
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> bool:
+        if not self.available or not self.root.is_dir():
+            return False
+        self._watch = _shared_observer().schedule(self, str(self.root), recursive=True)
+        return True
+
+    @property
+    def running(self) -> bool:
+        return self._watch is not None
+
+    def stop(self):
+        if self._watch is not None:
+            try:
+                _shared_observer().remove_handler_for_watch(self, self._watch)
+            except (KeyError, ValueError):
+                pass
+            self._watch = None
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            self._pending.clear()
+
+    def on_any_event(self, event):
+        if event.event_type in ("opened", "closed_no_write"):
+            return
+        paths = [event.src_path, getattr(event, "dest_path", "")]
+        self._add(path for path in paths if path)
+
+    def _add(self, paths: Iterable[str]):
+        relative_paths = []
+        for path in paths:
+            try:
+                relative = Path(path).resolve().relative_to(self.root)
+            except (ValueError, OSError):
+                continue
+            if not relative.parts or any(part.startswith('.') for part in relative.parts):
+                continue
+            relative_paths.append(str(relative))
+        if not relative_paths:
+            return
+        with self._lock:
+            self._pending.update(relative_paths)
+            if self._timer is None:
+                self._timer = threading.Timer(self.debounce, self._flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _flush(self):
+        with self._lock:
+            paths, self._pending = self._pending, set()
+            self._timer = None
+        if not paths:
+            return
+        try:
+            self.callback(paths)
+        except Exception as e:
+            print(f"⚠️ 处理文件变更失败: {e}")
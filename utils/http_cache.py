@@ -0,0 +1,56 @@
+# utils/http_cache.py - 条件请求（ETag）与响应压缩的辅助函数
+
+import gzip
+import hashlib
+from typing import Optional, Tuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def content_etag(body: bytes) -> str:
+    """按内容生成弱ETag（压缩前后视为同一资源）"""
+    return f'W/"{hashlib.sha1(body).hexdigest()[:20]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 是否命中（弱比较，支持多个值和 *）"""
+    if not if_none_match:
+        return False
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def _accepts(accept_encoding: str, coding: str) -> bool:
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip().lower() != coding:
+            continue
+        # q=0 表示明确拒绝
+        return params.replace(" ", "").lower() not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+def compress_body(body: bytes, accept_encoding: str) -> Tuple[bytes, Optional[str]]:
+    """
+    按Accept-Encoding压缩响应体
+
+    Returns:
+        (压缩后的内容, Content-Encoding)；客户端不支持时原样返回且编码为None
+    """
+    accept_encoding = accept_encoding or ""
+    if brotli is not None and _accepts(accept_encoding, "br"):
+        return brotli.compress(body, quality=5), "br"
+    if _accepts(accept_encoding, "gzip"):
+        return gzip.compress(body, compresslevel=6), "gzip"
+    return body, None
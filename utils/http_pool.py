@@ -0,0 +1,58 @@
+# utils/http_pool.py - 长生命周期事件循环上的HTTP连接池
+
+import asyncio
+import weakref
+from contextlib import asynccontextmanager
+from typing import Dict
+
+from utils.lazy_import import lazy_import
+
+# httpx（及HTTP/2依赖）在第一次创建客户端时才加载
+httpx = lazy_import("httpx")
+
+# 允许池化的事件循环（由常驻的Agent运行时登记），以及每个循环上的客户端
+_pooled_loops = weakref.WeakSet()
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, httpx.AsyncClient]]" = weakref.WeakKeyDictionary()
+
+
+def enable_pooling(loop: asyncio.AbstractEventLoop):
+    """登记常驻事件循环：在该循环上创建的客户端会被复用，直到 close_pooled_clients"""
+    _pooled_loops.add(loop)
+
+
+async def close_pooled_clients():
+    """关闭当前事件循环上的所有池化客户端（在该循环内调用）"""
+    loop = asyncio.get_running_loop()
+    clients = _clients.pop(loop, {})
+    _pooled_loops.discard(loop)
+    for client in clients.values():
+        try:
+            await client.aclose()
+        except Exception:
+            pass
+
+
+@asynccontextmanager
+async def http_client(name: str, **kwargs):
+    """
+    获取httpx异步客户端
+
+    在常驻事件循环上按name复用同一个客户端（保持连接、HTTP/2会话）；
+    其他场景（CLI的asyncio.run、临时事件循环）每次新建并在退出时关闭。
+
+    Args:
+        name: 连接池名称，同名客户端共享配置与连接
+        **kwargs: 首次创建时传给 httpx.AsyncClient 的参数
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _pooled_loops:
+        async with httpx.AsyncClient(**kwargs) as client:
+            yield client
+        return
+
+    clients = _clients.setdefault(loop, {})
+    client = clients.get(name)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(**kwargs)
+        clients[name] = client
+    yield client
@@ -0,0 +1,27 @@
+# utils/lazy_import.py - 延迟导入（首次访问属性时才执行模块代码，缩短启动时间）
+
+import importlib
+import importlib.util
+import sys
+from types import ModuleType
+
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    返回延迟加载的模块：导入语句几乎无开销，第一次访问其属性时才真正执行模块
+
+    模块不存在时立即抛出 ImportError（与普通import一致）；已导入的模块直接返回。
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None or spec.loader is None:
+        # 交给普通导入给出标准的错误信息
+        return importlib.import_module(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
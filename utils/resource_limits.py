@@ -0,0 +1,167 @@
+# utils/resource_limits.py - 终端进程的资源限制（rlimit）与资源占用统计
+
+import os
+import sys
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    from config import (
+        TERMINAL_LIMIT_CPU_SECONDS,
+        TERMINAL_LIMIT_MEMORY_MB,
+        TERMINAL_LIMIT_PROCESSES
+    )
+except ImportError:
+    project_root = Path(__file__).resolve().parents[1]
+    if str(project_root) not in sys.path:
+        sys.path.insert(0, str(project_root))
+    from config import (
+        TERMINAL_LIMIT_CPU_SECONDS,
+        TERMINAL_LIMIT_MEMORY_MB,
+        TERMINAL_LIMIT_PROCESSES
+    )
+
+
+def get_terminal_limits() -> Dict[str, int]:
+    """当前配置的终端资源上限（0表示不限制）"""
+    return {
+        "cpu_seconds": TERMINAL_LIMIT_CPU_SECONDS or 0,
+        "memory_mb": TERMINAL_LIMIT_MEMORY_MB or 0,
+        "max_processes": TERMINAL_LIMIT_PROCESSES or 0
+    }
+
+
+def build_preexec_fn(limits: Dict[str, int] = None) -> Optional[Callable[[], None]]:
+    """
+    生成在shell子进程exec前调用的函数，设置rlimit（shell启动的命令会继承）
+
+    - cpu_seconds: 每个进程可用的CPU时间（RLIMIT_CPU）
+    - memory_mb: 每个进程的虚拟地址空间（RLIMIT_AS，不是实际内存占用；预留大块地址空间的程序会失败）
+    - max_processes: 运行用户的进程总数（RLIMIT_NPROC，按用户而非按会话计数）
+
+    Windows或未配置任何限制时返回None。
+    """
+    if resource is None:
+        return None
+    limits = limits if limits is not None else get_terminal_limits()
+    settings = []
+    if limits.get("cpu_seconds"):
+        settings.append((resource.RLIMIT_CPU, int(limits["cpu_seconds"])))
+    if limits.get("memory_mb") and hasattr(resource, "RLIMIT_AS"):
+        settings.append((resource.RLIMIT_AS, int(limits["memory_mb"]) * 1024 * 1024))
+    if limits.get("max_processes") and hasattr(resource, "RLIMIT_NPROC"):
+        settings.append((resource.RLIMIT_NPROC, int(limits["max_processes"])))
+    if not settings:
+        return None
+
+    def apply_limits():
+        for kind, value in settings:
+            _, hard = resource.getrlimit(kind)
+            if hard != resource.RLIM_INFINITY:
+                value = min(value, hard)
+            try:
+                resource.setrlimit(kind, (value, hard))
+            except (ValueError, OSError):
+                pass
+
+    return apply_limits
+
+
+def _proc_children_map() -> Dict[int, List[int]]:
+    children: Dict[int, List[int]] = {}
+    for entry in os.scandir("/proc"):
+        if not entry.name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry.name}/stat", "rb") as f:
+                stat = f.read().decode("utf-8", "replace")
+        except OSError:
+            continue
+        # 进程名可能包含空格和括号，从最后一个')'之后解析
+        fields = stat[stat.rfind(")") + 2:].split()
+        children.setdefault(int(fields[1]), []).append(int(entry.name))
+    return children
+
+
+def _proc_usage(pid: int) -> Optional[Dict]:
+    children = _proc_children_map()
+    pids = [pid]
+    index = 0
+    while index < len(pids):
+        pids.extend(children.get(pids[index], []))
+        index += 1
+
+    ticks = os.sysconf("SC_CLK_TCK")
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    cpu_ticks = 0
+    rss_pages = 0
+    alive = 0
+    for child_pid in pids:
+        try:
+            with open(f"/proc/{child_pid}/stat", "rb") as f:
+                stat = f.read().decode("utf-8", "replace")
+        except OSError:
+            continue
+        fields = stat[stat.rfind(")") + 2:].split()
+        # fields[0]为state，utime/stime/rss分别是stat的第14/15/24个字段
+        cpu_ticks += int(fields[11]) + int(fields[12])
+        rss_pages += int(fields[21])
+        alive += 1
+    if not alive:
+        return None
+    return {
+        "pid": pid,
+        "processes": alive,
+        "cpu_seconds": round(cpu_ticks / ticks, 2),
+        "memory_rss_mb": round(rss_pages * page_size / 1024 / 1024, 1)
+    }
+
+
+def get_process_usage(pid: int) -> Optional[Dict]:
+    """
+    进程及其所有子进程的资源占用
+
+    Returns:
+        {"pid", "processes", "cpu_seconds", "memory_rss_mb"}；进程不存在或平台不支持时返回None
+    """
+    if not pid:
+        return None
+    if psutil is not None:
+        try:
+            root = psutil.Process(pid)
+            procs = [root] + root.children(recursive=True)
+        except psutil.Error:
+            return None
+        cpu = 0.0
+        rss = 0
+        alive = 0
+        for proc in procs:
+            try:
+                times = proc.cpu_times()
+                cpu += times.user + times.system
+                rss += proc.memory_info().rss
+                alive += 1
+            except psutil.Error:
+                continue
+        return {
+            "pid": pid,
+            "processes": alive,
+            "cpu_seconds": round(cpu, 2),
+            "memory_rss_mb": round(rss / 1024 / 1024, 1)
+        }
+    if os.path.isdir("/proc"):
+        try:
+            return _proc_usage(pid)
+        except (OSError, ValueError, IndexError):
+            return None
+    return None
@@ -0,0 +1,152 @@
+# utils/result_cache.py - 带TTL的LRU缓存、磁盘缓存与并发请求合并
+
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, Tuple
+
+from utils import serialization
+
+
+def cache_key(*parts: Any) -> str:
+    """由若干参数生成稳定的缓存键（sha256十六进制）"""
+    return hashlib.sha256(serialization.dumps_bytes(list(parts))).hexdigest()
+
+
+class TTLCache:
+    """
+    线程安全的内存LRU缓存，条目超过ttl秒后失效
+
+    值按 (写入时间, 值) 保存，get_with_age 可取得条目年龄用于标记缓存结果。
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_with_age(self, key: str) -> Tuple[Optional[Any], float]:
+        """返回 (值, 年龄秒数)，未命中或已过期时值为None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or now - entry[0] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None, 0.0
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], now - entry[0]
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.get_with_age(key)[0]
+
+    def set(self, key: str, value: Any, stored_at: float = None):
+        with self._lock:
+            self._entries[key] = (stored_at or time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+class DiskCache:
+    """
+    磁盘JSON缓存：每个键一个文件，记录写入时间，读取时按ttl判断是否过期
+
+    用于进程重启或多个worker之间共享结果；写入为原子写入。
+    """
+
+    def __init__(self, directory: str, ttl: float):
+        self.directory = Path(directory)
+        self.ttl = ttl
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def get_with_age(self, key: str) -> Tuple[Optional[Any], float]:
+        try:
+            record = serialization.load_file(self._path(key))
+        except (OSError, ValueError):
+            return None, 0.0
+        age = time.time() - record.get("stored_at", 0)
+        if age > self.ttl:
+            return None, 0.0
+        return record.get("value"), age
+
+    def values(self) -> Iterator[Any]:
+        """所有未过期的值"""
+        now = time.time()
+        for path in self.directory.glob("*.json"):
+            try:
+                record = serialization.load_file(path)
+            except (OSError, ValueError):
+                continue
+            if now - record.get("stored_at", 0) <= self.ttl:
+                yield record.get("value")
+
+    def set(self, key: str, value: Any, meta: Dict = None):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        record = {"stored_at": time.time(), "value": value}
+        if meta:
+            record["meta"] = meta
+        try:
+            serialization.dump_file(self._path(key), record, pretty=False)
+        except OSError:
+            pass
+
+
+class SingleFlight:
+    """
+    合并并发的相同请求：同一个键同时只执行一次，其他调用方等待同一结果
+
+    请求在独立的Task中执行，某个调用方被取消不会影响其他等待者。
+    只在同一事件循环内合并（CLI模式每次 asyncio.run 都是新循环，互不影响）。
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Tuple[int, str], asyncio.Task] = {}
+        self.coalesced = 0
+
+    async def run(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Returns:
+            (结果, 是否复用了进行中的请求)
+        """
+        loop = asyncio.get_running_loop()
+        slot = (id(loop), key)
+        task = self._inflight.get(slot)
+        shared = task is not None
+        if shared:
+            self.coalesced += 1
+        else:
+            task = loop.create_task(factory())
+            self._inflight[slot] = task
+            task.add_done_callback(lambda t: self._finish(slot, t))
+        return await asyncio.shield(task), shared
+
+    def _finish(self, slot: Tuple[int, str], task: asyncio.Task):
+        self._inflight.pop(slot, None)
+        # 所有调用方都已取消时，读取异常以免出现 "exception was never retrieved"
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,101 @@
+# utils/revisions.py - 资源版本号与变更记录（ETag / 增量接口）
+
+import threading
+import uuid
+from collections import deque
+from typing import Any, Hashable, Optional, Set
+
+
+class RevisionLog:
+    """
+    单个资源的单调递增版本号，以及最近若干次变更涉及的键
+
+    - etag(): 由实例标识和版本号组成，进程重启或切换实例后不会与旧ETag混淆
+    - changes_since(n): 返回版本n之后变化过的键；记录已被淘汰或资源被整体替换时返回None，
+      调用方应返回全量数据
+    """
+
+    def __init__(self, name: str, max_changes: int = 1024):
+        self.name = name
+        self.max_changes = max_changes
+        self.revision = 0
+        self._epoch = uuid.uuid4().hex[:8]
+        self._floor = 0  # 小于该版本号的增量请求无法满足
+        self._changes: "deque[tuple]" = deque()
+        self._lock = threading.Lock()
+
+    def bump(self, *keys: Hashable) -> int:
+        """记录一次变更（keys为变化的键），返回新版本号"""
+        with self._lock:
+            self.revision += 1
+            for key in keys:
+                self._changes.append((self.revision, key))
+            while len(self._changes) > self.max_changes:
+                revision, _ = self._changes.popleft()
+                self._floor = max(self._floor, revision)
+            return self.revision
+
+    def reset(self) -> int:
+        """资源被整体替换：版本号递增，之前的版本只能获取全量"""
+        with self._lock:
+            self.revision += 1
+            self._changes.clear()
+            self._floor = self.revision
+            return self.revision
+
+    def changes_since(self, since: int) -> Optional[Set[Any]]:
+        with self._lock:
+            if since < self._floor or since > self.revision:
+                return None
+            return {key for revision, key in self._changes if revision > since}
+
+    def etag(self, revision: int = None) -> str:
+        """版本号对应的弱ETag（默认当前版本）"""
+        if revision is None:
+            revision = self.revision
+        return f'W/"{self.name}-{self._epoch}-{revision}"'
+
+
+class TrackedDict(dict):
+    """修改时自动在RevisionLog中记录变化键的字典（值未变化的赋值不计为变更）"""
+
+    def __init__(self, log: RevisionLog, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.log = log
+
+    def __setitem__(self, key, value):
+        if key in self and dict.__getitem__(self, key) == value:
+            return
+        super().__setitem__(key, value)
+        self.log.bump(key)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.log.bump(key)
+
+    def pop(self, key, *default):
+        had_key = key in self
+        value = super().pop(key, *default)
+        if had_key:
+            self.log.bump(key)
+        return value
+
+    def popitem(self):
+        key, value = super().popitem()
+        self.log.bump(key)
+        return key, value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return dict.__getitem__(self, key)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        keys = list(self)
+        super().clear()
+        if keys:
+            self.log.bump(*keys)
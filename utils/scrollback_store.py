@@ -0,0 +1,245 @@
+# utils/scrollback_store.py - 终端输出与命令历史的分段压缩持久化
+
+import hashlib
+import re
+import shutil
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from utils.blob_store import codec_suffix, compress, decompress, resolve_codec
+from utils.file_io import atomic_write
+from utils.serialization import dump_file, dumps, load_file, loads
+
+try:
+    from config import (
+        OUTPUT_FORMATS,
+        TERMINAL_SCROLLBACK_DIR,
+        TERMINAL_SCROLLBACK_COMPRESSION,
+        TERMINAL_SCROLLBACK_SEGMENT_CHARS,
+        TERMINAL_SCROLLBACK_FLUSH_INTERVAL,
+        TERMINAL_SCROLLBACK_MAX_CHARS,
+        TERMINAL_SCROLLBACK_MAX_SEGMENTS
+    )
+except ImportError:
+    import sys
+    project_root = Path(__file__).resolve().parents[1]
+    if str(project_root) not in sys.path:
+        sys.path.insert(0, str(project_root))
+    from config import (
+        OUTPUT_FORMATS,
+        TERMINAL_SCROLLBACK_DIR,
+        TERMINAL_SCROLLBACK_COMPRESSION,
+        TERMINAL_SCROLLBACK_SEGMENT_CHARS,
+        TERMINAL_SCROLLBACK_FLUSH_INTERVAL,
+        TERMINAL_SCROLLBACK_MAX_CHARS,
+        TERMINAL_SCROLLBACK_MAX_SEGMENTS
+    )
+
+INDEX_FILE = "index.json"
+
+
+def _read_segment(path: Path) -> List[Dict]:
+    codec = "zstd" if path.suffix == ".zst" else "gzip"
+    data = decompress(path.read_bytes(), codec).decode("utf-8")
+    return [loads(line) for line in data.splitlines() if line]
+
+
+class ScrollbackStore:
+    """
+    某个项目下所有终端会话的输出存储：<目录>/<项目路径哈希>/<会话名>/
+
+    每个会话目录包含 index.json 和若干只写一次的压缩分段（JSON Lines，
+    记录输出行 {"k": "o"} 与命令 {"k": "c"}）。进程重启后不做任何预加载，
+    重新打开同名会话时才读取（load）。
+    """
+
+    def __init__(self, project_path: str, root: str = None, compression: str = None):
+        project_key = hashlib.sha1(str(Path(project_path).resolve()).encode("utf-8")).hexdigest()[:16]
+        self.directory = Path(root or TERMINAL_SCROLLBACK_DIR) / project_key
+        self.compression = resolve_codec(compression or TERMINAL_SCROLLBACK_COMPRESSION)
+
+    def session_dir(self, session_name: str) -> Path:
+        safe = re.sub(r'[^\w.-]', '_', session_name)[:48]
+        digest = hashlib.sha1(session_name.encode("utf-8")).hexdigest()[:8]
+        return self.directory / f"{safe}-{digest}"
+
+    def has(self, session_name: str) -> bool:
+        return (self.session_dir(session_name) / INDEX_FILE).exists()
+
+    def load(self, session_name: str) -> Optional[Dict]:
+        """
+        读取会话保存的输出与命令历史
+
+        Returns:
+            {"output": [行], "commands": [...], "working_dir", "shell", "updated_at", "index"}；
+            没有保存过时返回None
+        """
+        directory = self.session_dir(session_name)
+        try:
+            index = load_file(directory / INDEX_FILE)
+        except (OSError, ValueError):
+            return None
+
+        output: List[str] = []
+        commands: List[Dict] = []
+        for segment in index.get("segments", []):
+            try:
+                records = _read_segment(directory / segment["file"])
+            except Exception as e:
+                print(f"{OUTPUT_FORMATS['warning']} 终端输出分段读取失败 {segment['file']}: {e}")
+                continue
+            for record in records:
+                if record.get("k") == "c":
+                    commands.append({"command": record.get("d", ""), "timestamp": record.get("t")})
+                else:
+                    output.append(record.get("d", ""))
+        return {
+            "output": output,
+            "commands": commands,
+            "working_dir": index.get("working_dir"),
+            "shell": index.get("shell"),
+            "updated_at": index.get("updated_at"),
+            "index": index
+        }
+
+    def open_writer(self, session_name: str, working_dir: str = None, shell: str = None,
+                    index: Dict = None) -> "ScrollbackWriter":
+        """打开会话的写入器（index为load()返回的索引时在已有分段之后继续写）"""
+        return ScrollbackWriter(self, session_name, working_dir, shell, index)
+
+    def discard(self, session_name: str):
+        """删除会话保存的所有输出（会话被明确关闭时）"""
+        shutil.rmtree(self.session_dir(session_name), ignore_errors=True)
+
+
+class ScrollbackWriter:
+    """
+    单个会话的增量写入器
+
+    输出先在内存中累积，达到 TERMINAL_SCROLLBACK_SEGMENT_CHARS 或累积超过
+    TERMINAL_SCROLLBACK_FLUSH_INTERVAL 秒时写出一个新分段并更新索引。
+    磁盘上只保留最近 TERMINAL_SCROLLBACK_MAX_CHARS 字符的输出，分段过多时合并。
+    """
+
+    def __init__(self, store: ScrollbackStore, session_name: str, working_dir: str = None,
+                 shell: str = None, index: Dict = None):
+        self.store = store
+        self.session_name = session_name
+        self.directory = store.session_dir(session_name)
+        self.index = index or {
+            "session": session_name,
+            "segments": [],
+            "next_segment": 1
+        }
+        self.index["working_dir"] = working_dir
+        self.index["shell"] = shell
+        self._pending: List[Dict] = []
+        self._pending_chars = 0
+        self._pending_since: Optional[float] = None
+        self._lock = threading.Lock()
+        self.closed = False
+
+    def _append(self, record: Dict, chars: int):
+        with self._lock:
+            if self.closed:
+                return
+            if not self._pending:
+                self._pending_since = time.time()
+            self._pending.append(record)
+            self._pending_chars += chars
+            due = (
+                self._pending_chars >= TERMINAL_SCROLLBACK_SEGMENT_CHARS
+                or time.time() - self._pending_since >= TERMINAL_SCROLLBACK_FLUSH_INTERVAL
+            )
+        if due:
+            self.flush()
+
+    def append_output(self, text: str):
+        self._append({"k": "o", "d": text}, len(text))
+
+    def append_command(self, command: str, timestamp: str = None):
+        self._append({"k": "c", "d": command, "t": timestamp or datetime.now().isoformat()}, len(command))
+
+    def flush_if_due(self) -> bool:
+        """累积时间超过刷新间隔时写出（供定期巡检调用）"""
+        with self._lock:
+            due = self._pending and time.time() - self._pending_since >= TERMINAL_SCROLLBACK_FLUSH_INTERVAL
+        return self.flush() if due else False
+
+    def flush(self) -> bool:
+        """把内存中累积的记录写成一个分段"""
+        with self._lock:
+            if not self._pending:
+                return False
+            records, chars = self._pending, self._pending_chars
+            self._pending, self._pending_chars, self._pending_since = [], 0, None
+            try:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                number = self.index["next_segment"]
+                self.index["next_segment"] = number + 1
+                filename = f"segment-{number:06d}.jsonl{codec_suffix(self.store.compression)}"
+                self._write_segment(filename, records)
+                self.index["segments"].append({
+                    "file": filename,
+                    "chars": chars,
+                    "records": len(records),
+                    "written_at": datetime.now().isoformat()
+                })
+                self._apply_retention()
+                self.index["updated_at"] = datetime.now().isoformat()
+                dump_file(self.directory / INDEX_FILE, self.index)
+                return True
+            except Exception as e:
+                print(f"{OUTPUT_FORMATS['warning']} 终端输出写入失败 {self.session_name}: {e}")
+                return False
+
+    def _write_segment(self, filename: str, records: List[Dict]):
+        data = "".join(dumps(record) + "\n" for record in records).encode("utf-8")
+        atomic_write(self.directory / filename, compress(data, self.store.compression))
+
+    def _apply_retention(self):
+        segments = self.index["segments"]
+        # 从最新的分段往前累计，超过保留字符数之前的分段删除（至少保留最新一个）
+        kept, total = [], 0
+        for segment in reversed(segments):
+            if kept and total + segment["chars"] > TERMINAL_SCROLLBACK_MAX_CHARS:
+                break
+            kept.append(segment)
+            total += segment["chars"]
+        kept.reverse()
+        removed = segments[:len(segments) - len(kept)]
+
+        if len(kept) > TERMINAL_SCROLLBACK_MAX_SEGMENTS:
+            # 合并为一个分段：先写新分段再更新索引，旧分段最后删除
+            records = []
+            for segment in kept:
+                records.extend(_read_segment(self.directory / segment["file"]))
+            number = self.index["next_segment"]
+            self.index["next_segment"] = number + 1
+            filename = f"segment-{number:06d}.jsonl{codec_suffix(self.store.compression)}"
+            self._write_segment(filename, records)
+            removed += kept
+            kept = [{
+                "file": filename,
+                "chars": total,
+                "records": len(records),
+                "written_at": datetime.now().isoformat()
+            }]
+
+        self.index["segments"] = kept
+        if removed:
+            dump_file(self.directory / INDEX_FILE, self.index)
+            for segment in removed:
+                try:
+                    (self.directory / segment["file"]).unlink()
+                except OSError:
+                    pass
+
+    def close(self):
+        """写出剩余内容，之后的追加被忽略"""
+        self.flush()
+        with self._lock:
+            self.closed = True
@@ -0,0 +1,83 @@
+# utils/serialization.py - 统一的JSON序列化（orjson可选，标准库兜底）
+
+import json
+from pathlib import Path
+from typing import Any, Union
+try:
+    from config import JSON_PRETTY_PRINT
+except ImportError:
+    import sys
+    project_root = Path(__file__).resolve().parents[1]
+    if str(project_root) not in sys.path:
+        sys.path.insert(0, str(project_root))
+    from config import JSON_PRETTY_PRINT
+
+from utils.file_io import atomic_write
+
+try:
+    import orjson
+
+    JSON_BACKEND = "orjson"
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+except ImportError:
+    orjson = None
+    JSON_BACKEND = "json"
+    _ORJSON_OPTIONS = 0
+
+
+def dumps_bytes(obj: Any, pretty: bool = False) -> bytes:
+    """序列化为UTF-8字节（不转义非ASCII字符）"""
+    if orjson is not None:
+        options = _ORJSON_OPTIONS | orjson.OPT_INDENT_2 if pretty else _ORJSON_OPTIONS
+        try:
+            return orjson.dumps(obj, option=options)
+        except TypeError:
+            # orjson不支持的类型（超大整数、自定义对象等）交给标准库处理
+            pass
+    return _stdlib_dumps(obj, pretty).encode("utf-8")
+
+
+def dumps(obj: Any, pretty: bool = False) -> str:
+    """
+    序列化为字符串
+
+    Args:
+        obj: 要序列化的对象
+        pretty: 是否缩进（默认紧凑格式）
+    """
+    if orjson is not None:
+        return dumps_bytes(obj, pretty).decode("utf-8")
+    return _stdlib_dumps(obj, pretty)
+
+
+def loads(data: Union[str, bytes, bytearray]) -> Any:
+    """反序列化，解析失败抛出 ValueError"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dump_file(path: Union[str, Path], obj: Any, pretty: bool = None):
+    """
+    原子写入JSON文件（临时文件 + os.replace，崩溃时保留旧内容）
+
+    Args:
+        path: 文件路径
+        obj: 要写入的对象
+        pretty: 是否缩进，默认使用配置 JSON_PRETTY_PRINT
+    """
+    if pretty is None:
+        pretty = JSON_PRETTY_PRINT
+    atomic_write(path, dumps_bytes(obj, pretty))
+
+
+def load_file(path: Union[str, Path]) -> Any:
+    """读取JSON文件，解析失败抛出 ValueError"""
+    with open(path, "rb") as f:
+        return loads(f.read())
+
+
+def _stdlib_dumps(obj: Any, pretty: bool) -> str:
+    if pretty:
+        return json.dumps(obj, ensure_ascii=False, indent=2)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
@@ -0,0 +1,202 @@
+# utils/sse_decoder.py - 流式响应（SSE）快速解码
+
+from typing import AsyncIterator, Dict, List, Optional
+
+from utils import serialization
+
+# JSON解码后端：orjson > msgspec > 标准库（orjson与标准库由 utils.serialization 统一选择）
+_loads = serialization.loads
+JSON_BACKEND = serialization.JSON_BACKEND
+if JSON_BACKEND == "json":
+    try:
+        import msgspec
+
+        _msgspec_decode = msgspec.json.Decoder().decode
+
+        def _loads(payload):
+            try:
+                return _msgspec_decode(payload)
+            except msgspec.DecodeError as e:
+                # 与其他后端一致，解析失败统一抛出 ValueError
+                raise ValueError(str(e)) from e
+
+        JSON_BACKEND = "msgspec"
+    except ImportError:
+        pass
+
+_DATA_PREFIX = b"data:"
+_DONE = b"[DONE]"
+
+
+class ToolCallFragment:
+    """一个工具调用分片（同一index的分片依次拼接arguments）"""
+
+    __slots__ = ("index", "id", "type", "name", "arguments")
+
+    def __init__(self, index: int, id: Optional[str], type: str, name: str, arguments: str):
+        self.index = index
+        self.id = id
+        self.type = type
+        self.name = name
+        self.arguments = arguments
+
+
+class Delta:
+    """一个流式响应块中需要的字段（第一个choice的delta + finish_reason + usage（normalize_usage格式））"""
+
+    __slots__ = ("has_choice", "content", "reasoning_content", "tool_calls", "finish_reason", "usage")
+
+    def __init__(self):
+        self.has_choice = False
+        self.content: Optional[str] = None
+        self.reasoning_content: Optional[str] = None
+        self.tool_calls: Optional[List[ToolCallFragment]] = None
+        self.finish_reason: Optional[str] = None
+        self.usage: Optional[Dict] = None
+
+
+async def iter_sse_data(byte_stream: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    按字节切分SSE行，逐个产出 data: 后的负载（不做UTF-8解码），遇到 [DONE] 结束
+
+    Args:
+        byte_stream: 响应字节流（如 httpx 的 response.aiter_bytes()）
+    """
+    buffer = b""
+    async for block in byte_stream:
+        if buffer:
+            block = buffer + block
+        lines = block.split(b"\n")
+        buffer = lines.pop()
+        for line in lines:
+            if not line.startswith(_DATA_PREFIX):
+                continue
+            payload = line[5:].strip()
+            if payload == _DONE:
+                return
+            if payload:
+                yield payload
+
+    # 流结束时没有换行的最后一行
+    if buffer.startswith(_DATA_PREFIX):
+        payload = buffer[5:].strip()
+        if payload and payload != _DONE:
+            yield payload
+
+
+def loads(payload: bytes):
+    """使用可用的最快后端解码JSON，解析失败抛出 ValueError"""
+    return _loads(payload)
+
+
+def normalize_usage(usage) -> Optional[Dict]:
+    """
+    统一各服务商的用量字段，缺失或为空时返回None
+
+    缓存命中的输入token：prompt_tokens_details.cached_tokens（OpenAI/通义）、
+    prompt_cache_hit_tokens（DeepSeek）、cached_tokens（Kimi）
+    """
+    if not isinstance(usage, dict) or usage.get("prompt_tokens") is None:
+        return None
+    prompt_details = usage.get("prompt_tokens_details") or {}
+    completion_details = usage.get("completion_tokens_details") or {}
+    cached = (prompt_details.get("cached_tokens")
+              or usage.get("prompt_cache_hit_tokens")
+              or usage.get("cached_tokens")
+              or 0)
+    prompt_tokens = int(usage.get("prompt_tokens") or 0)
+    completion_tokens = int(usage.get("completion_tokens") or 0)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": int(usage.get("total_tokens") or prompt_tokens + completion_tokens),
+        "cached_tokens": int(cached),
+        "reasoning_tokens": int(completion_details.get("reasoning_tokens") or 0)
+    }
+
+
+def decode_delta(payload: bytes) -> Optional[Delta]:
+    """把一个SSE负载解码为Delta，无法解析时返回None"""
+    try:
+        data = _loads(payload)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+
+    delta = Delta()
+    delta.usage = normalize_usage(data.get("usage"))
+
+    choices = data.get("choices")
+    if not choices:
+        return delta
+    choice = choices[0]
+    delta.has_choice = True
+    if delta.usage is None and "usage" in choice:
+        # Kimi 在最后一个choice中返回用量
+        delta.usage = normalize_usage(choice.get("usage"))
+    delta.finish_reason = choice.get("finish_reason")
+
+    raw = choice.get("delta")
+    if not raw:
+        return delta
+    delta.content = raw.get("content")
+    delta.reasoning_content = raw.get("reasoning_content")
+
+    raw_calls = raw.get("tool_calls")
+    if raw_calls:
+        fragments = []
+        for call in raw_calls:
+            function = call.get("function") or {}
+            fragments.append(ToolCallFragment(
+                call.get("index") or 0,
+                call.get("id"),
+                call.get("type") or "function",
+                function.get("name") or "",
+                function.get("arguments") or ""
+            ))
+        delta.tool_calls = fragments
+    return delta
+
+
+class ToolCallAccumulator:
+    """按index累积工具调用分片（字典查找，替代逐个扫描）"""
+
+    __slots__ = ("calls", "_by_index")
+
+    def __init__(self):
+        self.calls: List[Dict] = []  # 按首次出现顺序，元素为OpenAI格式的tool_call字典
+        self._by_index: Dict[int, Dict] = {}
+
+    def add(self, fragment: ToolCallFragment) -> Optional[Dict]:
+        """
+        合并一个分片
+
+        Returns:
+            分片开启了一个新的工具调用时返回该调用，否则返回None
+        """
+        existing = self._by_index.get(fragment.index)
+        if existing is not None:
+            if fragment.arguments:
+                existing["function"]["arguments"] += fragment.arguments
+            return None
+
+        # 没有id的首个分片无法对应到工具调用，与原有逻辑一致直接忽略
+        if not fragment.id:
+            return None
+
+        call = {
+            "id": fragment.id,
+            "index": fragment.index,
+            "type": fragment.type,
+            "function": {
+                "name": fragment.name,
+                "arguments": fragment.arguments
+            }
+        }
+        self._by_index[fragment.index] = call
+        self.calls.append(call)
+        return call
+
+    def __bool__(self):
+        return bool(self.calls)
@@ -0,0 +1,86 @@
+# utils/startup.py - 启动耗时记录与后台预热
+
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    from config import OUTPUT_FORMATS
+except ImportError:
+    import sys
+    from pathlib import Path
+    project_root = Path(__file__).resolve().parents[1]
+    if str(project_root) not in sys.path:
+        sys.path.insert(0, str(project_root))
+    from config import OUTPUT_FORMATS
+
+
+class StartupProfile:
+    """
+    记录启动各阶段完成时距离开始的毫秒数（入口模块最先导入本模块，开始时间即进程启动后不久）
+
+    - mark(name): 记录阶段完成
+    - warm_up: 后台预热各项的耗时
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.marks: Dict[str, float] = {}
+        self.warm_up: Dict[str, float] = {}
+
+    def elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self.started) * 1000, 1)
+
+    def mark(self, name: str) -> float:
+        self.marks[name] = self.elapsed_ms()
+        return self.marks[name]
+
+    def to_dict(self) -> Dict:
+        return {"marks": dict(self.marks), "warm_up": dict(self.warm_up)}
+
+
+startup_profile = StartupProfile()
+
+
+def _warm_http():
+    import httpx
+    httpx.AsyncClient  # 触发延迟导入
+
+
+def _warm_tokenizer():
+    from utils.tokenizer import get_tokenizer
+    get_tokenizer().available
+
+
+def _warm_terminal_probes():
+    from modules.terminal_ops import TerminalOperator
+    from utils.terminal_factory import TerminalFactory
+    TerminalFactory().available_shells
+    TerminalOperator(".").python_cmd
+
+
+# 启动完成后在后台执行的预热项：首个请求不再承担这些开销
+WARM_UP_TASKS: List[Tuple[str, Callable[[], None]]] = [
+    ("http_client", _warm_http),
+    ("tokenizer", _warm_tokenizer),
+    ("terminal_probes", _warm_terminal_probes),
+]
+
+
+def warm_up(tasks: Optional[List[Tuple[str, Callable[[], None]]]] = None) -> Dict[str, float]:
+    """依次执行预热项，记录耗时（毫秒）；单项失败不影响其他项"""
+    for name, func in tasks or WARM_UP_TASKS:
+        started = time.perf_counter()
+        try:
+            func()
+        except Exception as e:
+            print(f"{OUTPUT_FORMATS['warning']} 预热 {name} 失败: {e}")
+        startup_profile.warm_up[name] = round((time.perf_counter() - started) * 1000, 1)
+    return dict(startup_profile.warm_up)
+
+
+def start_warm_up() -> threading.Thread:
+    """在守护线程中执行预热"""
+    thread = threading.Thread(target=warm_up, name="startup-warm-up", daemon=True)
+    thread.start()
+    return thread
@@ -7,13 +7,22 @@ import shutil
 from typing import Optional, Dict, List
 from pathlib import Path
 
+# 检测到的可用shell（进程内只检测一次）
+_detected_shells: Optional[Dict[str, str]] = None
+
 class TerminalFactory:
     """跨平台终端工厂，用于创建合适的终端进程"""
     
     def __init__(self):
-        """初始化终端工厂"""
+        """初始化终端工厂（可用shell在第一次创建终端时才检测）"""
         self.platform = sys.platform
-        self.available_shells = self._detect_available_shells()
+    
+    @property
+    def available_shells(self) -> Dict[str, str]:
+        global _detected_shells
+        if _detected_shells is None:
+            _detected_shells = self._detect_available_shells()
+        return _detected_shells
     
     def _detect_available_shells(self) -> Dict[str, str]:
         """检测系统中可用的shell"""
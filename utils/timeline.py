@@ -0,0 +1,146 @@
+# utils/timeline.py - 单次任务的迭代时间线（用于定位慢任务的耗时分布）
+
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+
+class _TimelineSpan:
+    """时间线上的一段区间，结束时写入所属迭代"""
+    __slots__ = ("_timeline", "_record", "_ended")
+
+    def __init__(self, timeline: "TaskTimeline", record: Dict):
+        self._timeline = timeline
+        self._record = record
+        self._ended = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end(error=exc_type is not None)
+        return False
+
+    def end(self, error: bool = False):
+        """结束区间（重复调用只记录一次）"""
+        if self._ended:
+            return
+        self._ended = True
+        self._record["end_ms"] = self._timeline.now_ms()
+        if error:
+            self._record["error"] = True
+
+
+class _NullTimelineSpan:
+    """没有活动时间线时使用的空区间"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def end(self, error: bool = False):
+        pass
+
+
+_NULL_TIMELINE_SPAN = _NullTimelineSpan()
+
+
+class TaskTimeline:
+    """
+    记录一次任务中每轮迭代的关键时间点（毫秒，相对任务开始）
+
+    迭代字段:
+        request_sent_ms / first_byte_ms / last_byte_ms: 模型请求、首字节、末字节
+        spans: 区间列表，kind 取 tool / save / tokenize / sleep 等
+    """
+
+    def __init__(self, message: str = ""):
+        self.started_at = datetime.now().isoformat()
+        self.message_preview = message[:100] if message else ""
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+        self.iterations: List[Dict] = []
+        self.task_spans: List[Dict] = []  # 不属于任何迭代的区间（如首条用户消息保存）
+        self.current: Optional[Dict] = None
+        self.status = "running"
+        self.total_ms: Optional[float] = None
+
+    def now_ms(self) -> float:
+        """距任务开始的毫秒数"""
+        return round((time.perf_counter() - self._t0) * 1000, 3)
+
+    def begin_iteration(self, index: int):
+        """开始新一轮迭代（自动结束上一轮）"""
+        with self._lock:
+            now = self.now_ms()
+            if self.current is not None and self.current.get("end_ms") is None:
+                self.current["end_ms"] = now
+            self.current = {
+                "iteration": index,
+                "start_ms": now,
+                "end_ms": None,
+                "request_sent_ms": None,
+                "first_byte_ms": None,
+                "last_byte_ms": None,
+                "spans": []
+            }
+            self.iterations.append(self.current)
+
+    def mark(self, point: str, once: bool = False):
+        """
+        记录当前迭代的时间点
+
+        Args:
+            point: 时间点名称（request_sent / first_byte / last_byte）
+            once: 为True时只记录第一次
+        """
+        current = self.current
+        if current is None:
+            return
+        key = f"{point}_ms"
+        if once and current.get(key) is not None:
+            return
+        current[key] = self.now_ms()
+
+    def span(self, kind: str, name: str = None) -> _TimelineSpan:
+        """开始一个区间，可用作上下文管理器，也可手动调用end()"""
+        record = {"kind": kind, "name": name or kind, "start_ms": self.now_ms(), "end_ms": None}
+        with self._lock:
+            target = self.current["spans"] if self.current is not None else self.task_spans
+            target.append(record)
+        return _TimelineSpan(self, record)
+
+    def finish(self, status: str = "completed"):
+        """结束任务"""
+        with self._lock:
+            now = self.now_ms()
+            if self.current is not None and self.current.get("end_ms") is None:
+                self.current["end_ms"] = now
+            self.status = status
+            self.total_ms = now
+
+    def to_dict(self) -> Dict:
+        """导出为可持久化的字典"""
+        with self._lock:
+            return {
+                "started_at": self.started_at,
+                "message_preview": self.message_preview,
+                "status": self.status,
+                "total_ms": self.total_ms if self.total_ms is not None else self.now_ms(),
+                "task_spans": [dict(s) for s in self.task_spans],
+                "iterations": [
+                    {**it, "spans": [dict(s) for s in it["spans"]]}
+                    for it in self.iterations
+                ]
+            }
+
+
+def timeline_span(timeline: Optional[TaskTimeline], kind: str, name: str = None):
+    """在时间线上开区间；没有活动时间线时返回空区间"""
+    if timeline is None:
+        return _NULL_TIMELINE_SPAN
+    return timeline.span(kind, name)
@@ -0,0 +1,140 @@
+# utils/tokenizer.py - 分词器注册表（按模型选择编码，首次使用时才加载）
+
+import threading
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from config import MODEL_ID, TOKENIZER_BATCH_THREADS
+except ImportError:
+    import sys
+    from pathlib import Path
+    project_root = Path(__file__).resolve().parents[1]
+    if str(project_root) not in sys.path:
+        sys.path.insert(0, str(project_root))
+    from config import MODEL_ID, TOKENIZER_BATCH_THREADS
+
+# 模型ID前缀 -> (tiktoken编码名, 每token平均UTF-8字节数的初始值)
+# Kimi/通义/DeepSeek 没有公开的tiktoken编码，用 cl100k_base 近似；字节数比例会随精确计数自动校准
+MODEL_TOKENIZERS: List[Tuple[str, str, float]] = [
+    ("gpt-4o", "o200k_base", 4.0),
+    ("gpt-4.1", "o200k_base", 4.0),
+    ("gpt-5", "o200k_base", 4.0),
+    ("o1", "o200k_base", 4.0),
+    ("o3", "o200k_base", 4.0),
+    ("o4", "o200k_base", 4.0),
+    ("gpt-4", "cl100k_base", 3.5),
+    ("gpt-3.5", "cl100k_base", 3.5),
+    ("kimi", "cl100k_base", 3.5),
+    ("moonshot", "cl100k_base", 3.5),
+    ("qwen", "cl100k_base", 3.3),
+    ("deepseek", "cl100k_base", 3.5),
+]
+DEFAULT_TOKENIZER = ("cl100k_base", 3.5)
+
+# 少于该数量的文本逐个分词（线程池的开销大于收益）
+BATCH_MIN_TEXTS = 16
+# 只用足够长的文本校准估算比例
+CALIBRATE_MIN_TOKENS = 64
+
+
+class Tokenizer:
+    """
+    单个模型的token计数器
+
+    - count(): 精确计数（tiktoken），编码表在第一次使用时加载；加载失败时退化为估算
+    - estimate(): 按UTF-8字节数 / 每token字节数估算，用于开销敏感的场景（如界面仪表）
+    - count_batch(): 多线程批量计数
+    """
+
+    def __init__(self, encoding_name: str, bytes_per_token: float):
+        self.encoding_name = encoding_name
+        self.bytes_per_token = bytes_per_token
+        self._encoding = None
+        self._load_failed = False
+        self._lock = threading.Lock()
+
+    def _get_encoding(self):
+        if self._encoding is None and not self._load_failed:
+            with self._lock:
+                if self._encoding is None and not self._load_failed:
+                    try:
+                        import tiktoken
+                        self._encoding = tiktoken.get_encoding(self.encoding_name)
+                    except Exception as e:
+                        print(f"⚠️ tiktoken初始化失败（{self.encoding_name}），改用估算: {e}")
+                        self._load_failed = True
+        return self._encoding
+
+    @property
+    def available(self) -> bool:
+        """精确分词是否可用（会触发加载）"""
+        return self._get_encoding() is not None
+
+    def encode(self, text: str) -> List[int]:
+        """精确分词（特殊token按普通文本处理），不可用时抛出 RuntimeError"""
+        encoding = self._get_encoding()
+        if encoding is None:
+            raise RuntimeError(f"分词器不可用: {self.encoding_name}")
+        return encoding.encode_ordinary(text)
+
+    def estimate(self, text: str) -> int:
+        if not text:
+            return 0
+        return max(1, round(len(text.encode("utf-8")) / self.bytes_per_token))
+
+    def count(self, text: str, exact: bool = True) -> int:
+        if not text:
+            return 0
+        encoding = self._get_encoding() if exact else None
+        if encoding is None:
+            return self.estimate(text)
+        tokens = len(encoding.encode_ordinary(text))
+        self._calibrate(text, tokens)
+        return tokens
+
+    def count_batch(self, texts: List[str], exact: bool = True, num_threads: int = None) -> List[int]:
+        """批量计数，结果与texts一一对应"""
+        encoding = self._get_encoding() if exact else None
+        if encoding is None:
+            return [self.estimate(text) for text in texts]
+        if len(texts) < BATCH_MIN_TEXTS:
+            return [len(encoding.encode_ordinary(text)) if text else 0 for text in texts]
+        encoded = encoding.encode_ordinary_batch(
+            [text or "" for text in texts],
+            num_threads=num_threads or TOKENIZER_BATCH_THREADS
+        )
+        return [len(tokens) for tokens in encoded]
+
+    def _calibrate(self, text: str, tokens: int):
+        # 精确计数时顺便修正估算比例（指数滑动平均）
+        if tokens >= CALIBRATE_MIN_TOKENS:
+            ratio = len(text.encode("utf-8")) / tokens
+            self.bytes_per_token = 0.9 * self.bytes_per_token + 0.1 * ratio
+
+
+_registry: Dict[str, Tokenizer] = {}
+_registry_lock = threading.Lock()
+
+
+def register_tokenizer(model_prefix: str, encoding_name: str, bytes_per_token: float):
+    """为模型ID前缀指定分词编码（优先于内置映射）"""
+    with _registry_lock:
+        MODEL_TOKENIZERS.insert(0, (model_prefix.lower(), encoding_name, bytes_per_token))
+        for model_id in [m for m in _registry if m.startswith(model_prefix.lower())]:
+            del _registry[model_id]
+
+
+def get_tokenizer(model_id: Optional[str] = None) -> Tokenizer:
+    """获取模型对应的分词器（默认 config.MODEL_ID），同一模型共享一个实例"""
+    model_id = (model_id or MODEL_ID or "").lower()
+    with _registry_lock:
+        tokenizer = _registry.get(model_id)
+        if tokenizer is None:
+            encoding_name, bytes_per_token = DEFAULT_TOKENIZER
+            for prefix, name, ratio in MODEL_TOKENIZERS:
+                if model_id.startswith(prefix):
+                    encoding_name, bytes_per_token = name, ratio
+                    break
+            tokenizer = Tokenizer(encoding_name, bytes_per_token)
+            _registry[model_id] = tokenizer
+        return tokenizer
@@ -0,0 +1,153 @@
+# utils/tracing.py - 轻量级追踪门面（按名称聚合span耗时）
+
+import threading
+import time
+from typing import Dict, Optional
+try:
+    from config import TRACING_ENABLED
+except ImportError:
+    import sys
+    from pathlib import Path
+    project_root = Path(__file__).resolve().parents[1]
+    if str(project_root) not in sys.path:
+        sys.path.insert(0, str(project_root))
+    from config import TRACING_ENABLED
+
+# 约定的span名称
+SPAN_TOKENIZE = "tokenize"      # token计算
+SPAN_PERSIST = "persist"        # 对话/统计落盘
+SPAN_BROADCAST = "broadcast"    # WebSocket广播
+SPAN_API_CALL = "api_call"      # 模型流式调用
+SPAN_TOOL_EXEC = "tool_exec"    # 工具执行
+
+KNOWN_SPANS = (SPAN_TOKENIZE, SPAN_PERSIST, SPAN_BROADCAST, SPAN_API_CALL, SPAN_TOOL_EXEC)
+
+
+class _NullSpan:
+    """关闭追踪时返回的空span，不做任何计时"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def end(self, error: bool = False):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    """一次计时，结束时写入Tracer的聚合数据"""
+    __slots__ = ("_tracer", "name", "_start", "_ended")
+
+    def __init__(self, tracer: "Tracer", name: str):
+        self._tracer = tracer
+        self.name = name
+        self._start = time.perf_counter()
+        self._ended = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end(error=exc_type is not None)
+        return False
+
+    def end(self, error: bool = False):
+        """结束计时（重复调用只记录一次）"""
+        if self._ended:
+            return
+        self._ended = True
+        self._tracer.record(self.name, time.perf_counter() - self._start, error=error)
+
+
+class Tracer:
+    """span聚合器：关闭时span为空操作，开启时在内存中累计次数与耗时"""
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict] = {}
+        self._since = time.time()
+
+    def span(self, name: str):
+        """
+        创建span，可用作上下文管理器，也可手动调用end()
+
+        Args:
+            name: span名称（见KNOWN_SPANS）
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def record(self, name: str, duration: float, error: bool = False):
+        """记录一次耗时（秒）"""
+        if not self.enabled:
+            return
+        with self._lock:
+            stat = self._stats.get(name)
+            if stat is None:
+                stat = self._stats[name] = {
+                    "count": 0,
+                    "errors": 0,
+                    "total": 0.0,
+                    "min": duration,
+                    "max": duration
+                }
+            stat["count"] += 1
+            stat["total"] += duration
+            if error:
+                stat["errors"] += 1
+            if duration < stat["min"]:
+                stat["min"] = duration
+            if duration > stat["max"]:
+                stat["max"] = duration
+
+    def set_enabled(self, enabled: bool):
+        """运行时开关追踪"""
+        self.enabled = bool(enabled)
+
+    def reset(self):
+        """清空聚合数据"""
+        with self._lock:
+            self._stats = {}
+            self._since = time.time()
+
+    def snapshot(self) -> Dict:
+        """导出聚合结果（毫秒）"""
+        with self._lock:
+            spans = {}
+            for name, stat in self._stats.items():
+                count = stat["count"]
+                spans[name] = {
+                    "count": count,
+                    "errors": stat["errors"],
+                    "total_ms": round(stat["total"] * 1000, 3),
+                    "avg_ms": round(stat["total"] * 1000 / count, 3) if count else 0.0,
+                    "min_ms": round(stat["min"] * 1000, 3),
+                    "max_ms": round(stat["max"] * 1000, 3)
+                }
+            return {
+                "enabled": self.enabled,
+                "since": self._since,
+                "spans": spans
+            }
+
+
+# 进程级单例
+tracer = Tracer(enabled=TRACING_ENABLED)
+
+
+def span(name: str):
+    """使用全局tracer创建span"""
+    return tracer.span(name)
+
+
+def get_metrics() -> Dict:
+    """获取全局tracer的聚合结果"""
+    return tracer.snapshot()
@@ -1,16 +1,21 @@
 # web_server.py - Web服务器（修复版 - 确保text_end事件正确发送 + 停止功能）
 
+# 最先导入：记录启动各阶段耗时（导入、初始化）
+from utils.startup import startup_profile, start_warm_up
 import asyncio
+import concurrent.futures
 import json
 import os
 import sys
 import re
 from typing import Dict, List, Optional, Callable
-from flask import Flask, request, jsonify, send_from_directory
-from flask_socketio import SocketIO, emit, join_room, leave_room
+from flask import Flask, request, jsonify, send_from_directory, session
+from flask_socketio import SocketIO
+import flask_socketio
 from flask_cors import CORS
 from pathlib import Path
 import time
+import uuid
 from datetime import datetime
 from collections import defaultdict
 
@@ -18,6 +23,16 @@ from collections import defaultdict
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from core.web_terminal import WebTerminal
+from core.agent_runtime import get_runtime
+from core.session_registry import SessionRegistry, SessionLimitError
+from core.task_scheduler import FairTaskScheduler, StreamLimiter
+from core.multi_worker import ConversationLeases, EventBus, get_worker_id
+from modules.search_engine import search_cache_stats
+from modules.webpage_extractor import extract_cache_stats
+from utils import serialization, tracing
+from utils.http_cache import compress_body, content_etag, etag_matches
+from utils.timeline import TaskTimeline, timeline_span
+from utils.sse_decoder import ToolCallAccumulator
 from config import (
     OUTPUT_FORMATS,
     AUTO_FIX_TOOL_CALL,
@@ -34,8 +49,15 @@ from config import (
     DEFAULT_CONVERSATIONS_LIMIT, 
     MAX_CONVERSATIONS_LIMIT,
     CONVERSATIONS_DIR,
-    DEFAULT_RESPONSE_MAX_TOKENS
+    DEFAULT_RESPONSE_MAX_TOKENS,
+    SESSION_REAP_INTERVAL,
+    WEB_SERVER_MODE,
+    MULTI_WORKER_ENABLED,
+    RESPONSE_COMPRESSION_ENABLED,
+    RESPONSE_COMPRESSION_MIN_BYTES,
+    STARTUP_WARM_UP_ENABLED
 )
+startup_profile.mark("imports")
 
 app = Flask(__name__, static_folder='static')
 app.config['SECRET_KEY'] = 'your-secret-key-here'
@@ -43,19 +65,75 @@ CORS(app)
 
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
 
+# ASGI模式下由 asgi_server 注入的Socket.IO桥接（None 表示使用 Flask-SocketIO）
+socket_bridge = None
+socket_handlers = {}  # 事件名 → 处理函数（ASGI模式据此注册到AsyncServer）
+
+def on_socket_event(event):
+    """注册Socket.IO事件处理函数（两种服务模式共用）"""
+    def decorator(func):
+        socket_handlers[event] = func
+        return socketio.on(event)(func)
+    return decorator
+
+def emit(event, data=None):
+    """回复当前连接"""
+    if socket_bridge:
+        socket_bridge.emit(event, data, to=request.sid)
+    else:
+        flask_socketio.emit(event, data)
+
+def join_room(room):
+    if socket_bridge:
+        socket_bridge.enter_room(request.sid, room)
+    else:
+        flask_socketio.join_room(room)
+
+def leave_room(room):
+    if socket_bridge:
+        socket_bridge.leave_room(request.sid, room)
+    else:
+        flask_socketio.leave_room(room)
+
+def socket_emit(event, data, room=None):
+    """向房间（或所有连接）发送事件，可在任意线程调用"""
+    if socket_bridge:
+        socket_bridge.emit(event, data, to=room)
+    else:
+        socketio.emit(event, data, room=room)
+
+def publish_to_room(event, data, room):
+    """向房间发送事件，多worker模式下同时转发给其他worker（客户端可能连在别的进程上）"""
+    socket_emit(event, data, room=room)
+    if event_bus:
+        event_bus.publish(room, event, data)
+
+def deliver_remote_event(room, event, data):
+    """其他worker转发来的事件，只在本进程内投递"""
+    socket_emit(event, data, room=room)
+
+def start_background_task(target, *args):
+    if socket_bridge:
+        return socket_bridge.start_background_task(target, *args)
+    return socketio.start_background_task(target, *args)
+
 # 全局变量
-web_terminal = None
+session_registry = None  # 客户端ID → 独立的WebTerminal
+task_scheduler = None  # 会话内串行、会话间轮转的任务调度
+llm_stream_limiter = StreamLimiter()  # 全局LLM流并发上限
 project_path = None
+default_thinking_mode = False
 terminal_rooms = {}  # 跟踪终端订阅者
-stop_flags = {}  # 新增：停止标志字典，按连接ID管理
+stop_flags = {}  # 停止标志字典，按客户端ID管理
+worker_id = get_worker_id()  # 当前worker标识（多worker模式下用于粘滞路由）
+event_bus = None  # 跨进程事件总线（多worker模式）
+conversation_leases = None  # 对话租约（多worker模式）
 
 # 创建调试日志文件
 DEBUG_LOG_FILE = "debug_stream.log"
 
-def reset_system_state():
-    """完整重置系统状态，确保停止后能正常开始新任务"""
-    global web_terminal
-    
+def reset_system_state(web_terminal):
+    """完整重置会话状态，确保停止后能正常开始新任务"""
     if not web_terminal:
         return
     
@@ -100,27 +178,166 @@ def debug_log(message):
         timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
         f.write(f"[{timestamp}] {message}\n")
 
+def client_room(client_id, name=None):
+    """客户端专属房间名：不带name时为该客户端的所有连接，否则为其终端订阅房间"""
+    if name is None:
+        return f"client_{client_id}"
+    return f"{client_id}:{name}"
+
 # 终端广播回调函数
-def terminal_broadcast(event_type, data):
-    """广播终端事件到所有订阅者"""
+def terminal_broadcast(client_id, event_type, data):
+    """广播终端事件到该客户端的订阅者"""
     try:
-        # 对于token_update事件，发送给所有连接的客户端
-        if event_type == 'token_update':
-            socketio.emit(event_type, data)  # 全局广播，不限制房间
-            debug_log(f"全局广播token更新: {data}")
+        # token_update、工具进度、工具实时输出与文件树增量发送给该客户端的所有连接（聊天页面也需要）
+        if event_type in ('token_update', 'tool_status', 'tool_output', 'file_tree_delta'):
+            publish_to_room(event_type, data, client_room(client_id))
+            debug_log(f"广播token更新 [{client_id}]: {data}")
         else:
             # 其他终端事件发送到终端订阅者房间
-            socketio.emit(event_type, data, room='terminal_subscribers')
+            publish_to_room(event_type, data, client_room(client_id, 'terminal_subscribers'))
             
             # 如果是特定会话的事件，也发送到该会话的专属房间
             if 'session' in data:
-                session_room = f"terminal_{data['session']}"
-                socketio.emit(event_type, data, room=session_room)
+                session_room = client_room(client_id, f"terminal_{data['session']}")
+                publish_to_room(event_type, data, session_room)
         
-        debug_log(f"终端广播: {event_type} - {data}")
+        debug_log(f"终端广播 [{client_id}]: {event_type} - {data}")
     except Exception as e:
         debug_log(f"终端广播错误: {e}")
 
+def make_client_broadcast(client_id):
+    """生成绑定到客户端的广播回调"""
+    def broadcast(event_type, data):
+        terminal_broadcast(client_id, event_type, data)
+    return broadcast
+
+def create_web_terminal(client_id):
+    """为客户端创建独立的WebTerminal（对话、聚焦文件、终端互不影响）"""
+    broadcast = make_client_broadcast(client_id)
+    terminal = WebTerminal(
+        project_path=project_path,
+        thinking_mode=default_thinking_mode,
+        message_callback=broadcast
+    )
+    if terminal.terminal_manager:
+        terminal.terminal_manager.broadcast = broadcast
+    return terminal
+
+@app.before_request
+def ensure_client_id():
+    """为每个浏览器分配客户端ID（保存在会话cookie中）"""
+    if 'client_id' not in session:
+        session['client_id'] = uuid.uuid4().hex
+
+def get_client_id():
+    """当前请求的客户端ID：只取服务端签发的会话cookie（请求头/参数可被伪造，不作为会话依据）"""
+    return session.get('client_id')
+
+def current_terminal():
+    """HTTP请求对应的WebTerminal，系统未初始化或会话数已满时返回None"""
+    if session_registry is None:
+        return None
+    try:
+        return session_registry.get(get_client_id())
+    except SessionLimitError as e:
+        print(f"{OUTPUT_FORMATS['warning']} {e}")
+        return None
+
+def client_terminal():
+    """Socket连接对应的WebTerminal"""
+    if session_registry is None:
+        return None
+    client_id = session_registry.key_for_sid(request.sid)
+    if not client_id:
+        return None
+    try:
+        return session_registry.get(client_id)
+    except SessionLimitError:
+        return None
+
+def emit_to_client(event_type, data):
+    """HTTP接口触发的事件只发给当前客户端"""
+    publish_to_room(event_type, data, client_room(get_client_id()))
+
+def conversation_owned_elsewhere(conversation_id):
+    """
+    多worker模式下申领对话租约
+
+    Returns:
+        对话已由其他worker持有时返回409响应，否则返回None
+    """
+    if not conversation_leases:
+        return None
+    try:
+        owner = conversation_leases.claim(conversation_id)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    if not owner:
+        return None
+    response = jsonify({
+        "success": False,
+        "error": "Conversation is owned by another worker",
+        "owner": owner,
+        "message": f"对话 {conversation_id} 正由其他进程处理，请通过 {owner} 访问"
+    })
+    response.headers['X-Agent-Worker-Owner'] = owner
+    return response, 409
+
+@app.after_request
+def add_worker_header(response):
+    """多worker模式下标记处理请求的worker，负载均衡可据此做粘滞路由"""
+    if MULTI_WORKER_ENABLED:
+        response.headers['X-Agent-Worker'] = worker_id
+        if request.cookies.get('agent_worker') != worker_id:
+            response.set_cookie('agent_worker', worker_id, httponly=True, samesite='Lax')
+    return response
+
+@app.after_request
+def compress_response(response):
+    """按Accept-Encoding压缩较大的JSON响应"""
+    if (not RESPONSE_COMPRESSION_ENABLED or response.status_code != 200
+            or response.direct_passthrough or response.is_streamed
+            or response.mimetype != 'application/json'
+            or 'Content-Encoding' in response.headers):
+        return response
+    body = response.get_data()
+    if len(body) < RESPONSE_COMPRESSION_MIN_BYTES:
+        return response
+    response.vary.add('Accept-Encoding')
+    data, encoding = compress_body(body, request.headers.get('Accept-Encoding', ''))
+    if encoding:
+        response.set_data(data)
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+def not_modified(etag):
+    """304响应（客户端缓存仍然有效）"""
+    response = app.response_class(status=304)
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def cached_json(payload, etag=None, revision=None):
+    """
+    返回带ETag的JSON响应，If-None-Match命中时返回304
+
+    Args:
+        payload: 响应数据
+        etag: 资源版本对应的ETag，默认按内容计算
+        revision: 资源版本号（写入 X-Resource-Revision 头，供增量请求使用）
+    """
+    body = serialization.dumps_bytes(payload)
+    etag = etag or content_etag(body)
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        return not_modified(etag)
+    response = app.response_class(body, mimetype='application/json')
+    response.headers['ETag'] = etag
+    # no-cache：浏览器可以缓存，但每次使用前都要带ETag向服务器确认
+    response.headers['Cache-Control'] = 'no-cache'
+    if revision is not None:
+        response.headers['X-Resource-Revision'] = str(revision)
+    return response
+
 @app.route('/')
 def index():
     """主页"""
@@ -139,6 +356,7 @@ def static_files(filename):
 @app.route('/api/status')
 def get_status():
     """获取系统状态（增强版：包含对话信息）"""
+    web_terminal = current_terminal()
     if not web_terminal:
         return jsonify({"error": "System not initialized"}), 503
     
@@ -149,48 +367,86 @@ def get_status():
         terminal_status = web_terminal.terminal_manager.list_terminals()
         status['terminals'] = terminal_status
     
-    # 【新增】添加当前对话的详细信息
-    if web_terminal.context_manager.current_conversation_id:
+    # 【新增】添加当前对话的详细信息（从索引读取，不加载整个对话文件）
+    context_manager = web_terminal.context_manager
+    if context_manager.current_conversation_id:
         try:
-            current_conv_data = web_terminal.context_manager.conversation_manager.load_conversation(
-                web_terminal.context_manager.current_conversation_id
+            summary = context_manager.conversation_manager.get_conversation_summary(
+                context_manager.current_conversation_id
             )
-            if current_conv_data:
-                status['conversation']['title'] = current_conv_data.get('title', '未知对话')
-                status['conversation']['created_at'] = current_conv_data.get('created_at')
-                status['conversation']['updated_at'] = current_conv_data.get('updated_at')
+            if summary:
+                status['conversation']['title'] = summary.get('title', '未知对话')
+                status['conversation']['created_at'] = summary.get('created_at')
+                status['conversation']['updated_at'] = summary.get('updated_at')
         except Exception as e:
             print(f"[Status] 获取当前对话信息失败: {e}")
     
-    return jsonify(status)
+    # 各资源当前版本号（用于 /api/files、/api/focused、对话消息的增量请求）
+    status['revisions'] = {
+        'files': context_manager.file_tree_revisions.revision,
+        'focused': web_terminal.focused_files.log.revision,
+        'conversation': context_manager.conversation_revisions.revision
+    }
+    
+    return cached_json(status)
 
 @app.route('/api/files')
 def get_files():
     """获取文件树"""
+    web_terminal = current_terminal()
     if not web_terminal:
         return jsonify({"error": "System not initialized"}), 503
     
-    structure = web_terminal.context_manager.get_project_structure()
-    return jsonify(structure)
+    context_manager = web_terminal.context_manager
+    structure = context_manager.get_project_structure()
+    revisions = context_manager.file_tree_revisions
+    revision = revisions.revision
+    etag = revisions.etag(revision)
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        return not_modified(etag)
+    
+    # ?since=N：只返回版本N之后新增/修改/删除的路径（无法增量时返回全量）
+    since = request.args.get('since', type=int)
+    if since is not None:
+        changes = context_manager.file_tree_changes(since)
+        if changes is not None:
+            changes.update(revision=revision, since=since, delta=True)
+            return cached_json(changes, etag=etag, revision=revision)
+    
+    return cached_json(dict(structure, revision=revision), etag=etag, revision=revision)
 
 @app.route('/api/focused')
 def get_focused_files():
-    """获取聚焦文件"""
+    """获取聚焦文件（支持 ?since=N 增量获取）"""
+    web_terminal = current_terminal()
     if not web_terminal:
         return jsonify({"error": "System not initialized"}), 503
     
-    focused = {}
-    for path, content in web_terminal.focused_files.items():
-        focused[path] = {
-            "content": content,
-            "size": len(content),
-            "lines": content.count('\n') + 1
-        }
-    return jsonify(focused)
+    revisions = web_terminal.focused_files.log
+    revision = revisions.revision
+    etag = revisions.etag(revision)
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        return not_modified(etag)
+    
+    focused = web_terminal.get_focused_files_info()
+    since = request.args.get('since', type=int)
+    if since is not None:
+        changed = revisions.changes_since(since)
+        if changed is not None:
+            return cached_json({
+                "revision": revision,
+                "since": since,
+                "delta": True,
+                "changes": {path: focused[path] for path in changed if path in focused},
+                "removed": sorted(path for path in changed if path not in focused)
+            }, etag=etag, revision=revision)
+    
+    return cached_json(focused, etag=etag, revision=revision)
 
 @app.route('/api/terminals')
 def get_terminals():
     """获取终端会话列表"""
+    web_terminal = current_terminal()
     if not web_terminal:
         return jsonify({"error": "System not initialized"}), 503
     
@@ -200,115 +456,150 @@ def get_terminals():
     else:
         return jsonify({"sessions": [], "active": None, "total": 0})
 
-@socketio.on('connect')
+@on_socket_event('connect')
 def handle_connect():
     """客户端连接"""
     print(f"[WebSocket] 客户端连接: {request.sid}")
-    emit('connected', {'status': 'Connected to server'})
     
-    # 清理可能存在的停止标志和状态
-    stop_flags.pop(request.sid, None)
+    if session_registry is None:
+        emit('connected', {'status': 'Connected to server'})
+        return
+    
+    # 同一浏览器的多个标签页共享一个会话；没有cookie时按连接隔离
+    client_id = get_client_id() or request.sid
+    try:
+        session_registry.attach(client_id, request.sid)
+    except SessionLimitError as e:
+        emit('error', {'message': str(e)})
+        return False
+    join_room(client_room(client_id))
+    web_terminal = session_registry.get(client_id)
+    
+    emit('connected', {'status': 'Connected to server', 'client_id': client_id})
     
     # 如果是终端页面的连接，自动加入终端订阅房间
     if request.path == '/socket.io/' and request.referrer and '/terminal' in request.referrer:
-        join_room('terminal_subscribers')
+        join_room(client_room(client_id, 'terminal_subscribers'))
         print(f"[WebSocket] {request.sid} 自动加入终端订阅房间")
     
-    if web_terminal:
-        # 确保系统状态是干净的
-        reset_system_state()
-        
-        emit('system_ready', {
-            'project_path': project_path,
-            'thinking_mode': web_terminal.get_thinking_mode_status()
+    # 该会话没有任务时才清理停止标志并重置状态，避免打断其他标签页的任务
+    if not task_scheduler.is_busy(client_id):
+        stop_flags.pop(client_id, None)
+        reset_system_state(web_terminal)
+    
+    emit('system_ready', {
+        'project_path': project_path,
+        'thinking_mode': web_terminal.get_thinking_mode_status()
+    })
+    
+    # 发送当前终端列表和状态
+    if web_terminal.terminal_manager:
+        terminals = web_terminal.terminal_manager.get_terminal_list()
+        emit('terminal_list_update', {
+            'terminals': terminals,
+            'active': web_terminal.terminal_manager.active_terminal
         })
         
-        # 发送当前终端列表和状态
-        if web_terminal.terminal_manager:
-            terminals = web_terminal.terminal_manager.get_terminal_list()
-            emit('terminal_list_update', {
-                'terminals': terminals,
-                'active': web_terminal.terminal_manager.active_terminal
-            })
-            
-            # 如果有活动终端，发送其状态
-            if web_terminal.terminal_manager.active_terminal:
-                for name, terminal in web_terminal.terminal_manager.terminals.items():
-                    emit('terminal_started', {
-                        'session': name,
-                        'working_dir': str(terminal.working_dir),
-                        'shell': terminal.shell_command,
-                        'time': terminal.start_time.isoformat() if terminal.start_time else None
-                    })
+        # 如果有活动终端，发送其状态
+        if web_terminal.terminal_manager.active_terminal:
+            for name, terminal in web_terminal.terminal_manager.terminals.items():
+                emit('terminal_started', {
+                    'session': name,
+                    'working_dir': str(terminal.working_dir),
+                    'shell': terminal.shell_command,
+                    'time': terminal.start_time.isoformat() if terminal.start_time else None
+                })
 
-@socketio.on('disconnect')
+@on_socket_event('disconnect')
 def handle_disconnect():
     """客户端断开"""
     print(f"[WebSocket] 客户端断开: {request.sid}")
     
-    # 清理停止标志
-    stop_flags.pop(request.sid, None)
+    client_id = session_registry.detach(request.sid) if session_registry is not None else None
+    
+    # 会话没有任务时清理停止标志
+    if client_id and not task_scheduler.is_busy(client_id):
+        stop_flags.pop(client_id, None)
     
     # 从所有房间移除
-    leave_room('terminal_subscribers')
+    if client_id:
+        leave_room(client_room(client_id))
+        leave_room(client_room(client_id, 'terminal_subscribers'))
     for room in list(terminal_rooms.get(request.sid, [])):
         leave_room(room)
     if request.sid in terminal_rooms:
         del terminal_rooms[request.sid]
 
-@socketio.on('stop_task')
+@on_socket_event('stop_task')
 def handle_stop_task():
     """处理停止任务请求"""
     print(f"[停止] 收到停止请求: {request.sid}")
     
+    client_id = session_registry.key_for_sid(request.sid) if session_registry is not None else None
+    if not client_id:
+        emit('error', {'message': 'System not initialized'})
+        return
+    
+    # 丢弃尚未开始的排队任务
+    dropped = task_scheduler.cancel_pending(client_id)
+    if dropped:
+        debug_log(f"丢弃排队任务 {dropped} 个: {client_id}")
+    
     # 检查是否有正在运行的任务
-    if request.sid in stop_flags and isinstance(stop_flags[request.sid], dict):
+    if client_id in stop_flags and isinstance(stop_flags[client_id], dict):
         # 获取任务引用并取消
-        task_info = stop_flags[request.sid]
+        task_info = stop_flags[client_id]
         if 'task' in task_info and not task_info['task'].done():
-            debug_log(f"正在取消任务: {request.sid}")
+            debug_log(f"正在取消任务: {client_id}")
             task_info['task'].cancel()
         
         # 设置停止标志
         task_info['stop'] = True
     else:
         # 如果没有任务引用，使用旧的布尔标志
-        stop_flags[request.sid] = True
+        stop_flags[client_id] = True
     
     emit('stop_requested', {
         'message': '停止请求已接收，正在取消任务...'
     })
 
-@socketio.on('terminal_subscribe')
+@on_socket_event('terminal_subscribe')
 def handle_terminal_subscribe(data):
     """订阅终端事件"""
     session_name = data.get('session')
     subscribe_all = data.get('all', False)
     
+    web_terminal = client_terminal()
+    if not web_terminal:
+        emit('error', {'message': 'System not initialized'})
+        return
+    client_id = session_registry.key_for_sid(request.sid)
+    
     if request.sid not in terminal_rooms:
         terminal_rooms[request.sid] = set()
     
     if subscribe_all:
         # 订阅所有终端事件
-        join_room('terminal_subscribers')
-        terminal_rooms[request.sid].add('terminal_subscribers')
+        room_name = client_room(client_id, 'terminal_subscribers')
+        join_room(room_name)
+        terminal_rooms[request.sid].add(room_name)
         print(f"[Terminal] {request.sid} 订阅所有终端事件")
         
         # 发送当前终端状态
-        if web_terminal and web_terminal.terminal_manager:
+        if web_terminal.terminal_manager:
             emit('terminal_subscribed', {
                 'type': 'all',
                 'terminals': web_terminal.terminal_manager.get_terminal_list()
             })
     elif session_name:
         # 订阅特定终端会话
-        room_name = f'terminal_{session_name}'
+        room_name = client_room(client_id, f'terminal_{session_name}')
         join_room(room_name)
         terminal_rooms[request.sid].add(room_name)
         print(f"[Terminal] {request.sid} 订阅终端: {session_name}")
         
         # 发送该终端的当前输出
-        if web_terminal and web_terminal.terminal_manager:
+        if web_terminal.terminal_manager:
             output_result = web_terminal.terminal_manager.get_terminal_output(session_name, 100)
             if output_result['success']:
                 emit('terminal_history', {
@@ -316,24 +607,26 @@ def handle_terminal_subscribe(data):
                     'output': output_result['output']
                 })
 
-@socketio.on('terminal_unsubscribe')
+@on_socket_event('terminal_unsubscribe')
 def handle_terminal_unsubscribe(data):
     """取消订阅终端事件"""
     session_name = data.get('session')
+    client_id = session_registry.key_for_sid(request.sid) if session_registry is not None else None
     
-    if session_name:
-        room_name = f'terminal_{session_name}'
+    if session_name and client_id:
+        room_name = client_room(client_id, f'terminal_{session_name}')
         leave_room(room_name)
         if request.sid in terminal_rooms:
             terminal_rooms[request.sid].discard(room_name)
         print(f"[Terminal] {request.sid} 取消订阅终端: {session_name}")
 
-@socketio.on('get_terminal_output')
+@on_socket_event('get_terminal_output')
 def handle_get_terminal_output(data):
     """获取终端输出历史"""
     session_name = data.get('session')
     lines = data.get('lines', 50)
     
+    web_terminal = client_terminal()
     if not web_terminal or not web_terminal.terminal_manager:
         emit('error', {'message': 'Terminal system not initialized'})
         return
@@ -350,23 +643,42 @@ def handle_get_terminal_output(data):
     else:
         emit('error', {'message': result['error']})
 
-@socketio.on('send_message')
+@on_socket_event('send_message')
 def handle_message(data):
     """处理用户消息"""
     message = data.get('message', '')
     print(f"[WebSocket] 收到消息: {message}")
     debug_log(f"\n{'='*80}\n新任务开始: {message}\n{'='*80}")
     
+    web_terminal = client_terminal()
     if not web_terminal:
         emit('error', {'message': 'System not initialized'})
         return
+    client_id = session_registry.key_for_sid(request.sid)
+    
+    if session_registry.is_over_memory_limit(client_id):
+        emit('error', {'message': '当前会话占用内存超过上限，请压缩或新建对话、关闭不用的终端后重试'})
+        return
+    
+    room = client_room(client_id)
     
     def send_to_client(event_type, data):
-        """发送消息到客户端"""
-        socketio.emit(event_type, data)
+        """发送消息到该客户端的所有连接"""
+        socket_emit(event_type, data, room=room)
+    
+    def send_queue_position(position):
+        """排队位置变化时通知客户端（0表示开始执行）"""
+        send_to_client('task_queue_update', {
+            'position': position,
+            'message': f'任务排队中，前面还有 {position - 1} 个任务' if position else '排队结束，任务开始执行'
+        })
     
-    # 传递客户端ID
-    socketio.start_background_task(process_message_task, message, send_to_client, request.sid)
+    # 同一会话的任务串行执行，全局并发受工作线程池限制
+    task_scheduler.submit(
+        client_id,
+        lambda: process_message_task(web_terminal, message, send_to_client, client_id),
+        on_position=send_queue_position
+    )
 
 # 在 web_server.py 中添加以下对话管理API接口
 # 添加在现有路由之后，@socketio 事件处理之前
@@ -378,6 +690,7 @@ def handle_message(data):
 @app.route('/api/conversations', methods=['GET'])
 def get_conversations():
     """获取对话列表"""
+    web_terminal = current_terminal()
     if not web_terminal:
         return jsonify({"error": "System not initialized"}), 503
     
@@ -415,6 +728,7 @@ def get_conversations():
 @app.route('/api/conversations', methods=['POST'])
 def create_conversation():
     """创建新对话"""
+    web_terminal = current_terminal()
     if not web_terminal:
         return jsonify({"error": "System not initialized"}), 503
     
@@ -425,14 +739,17 @@ def create_conversation():
         result = web_terminal.create_new_conversation(thinking_mode=thinking_mode)
         
         if result["success"]:
+            if conversation_leases:
+                conversation_leases.claim(result["conversation_id"])
+            
             # 广播对话列表更新事件
-            socketio.emit('conversation_list_update', {
+            emit_to_client('conversation_list_update', {
                 'action': 'created',
                 'conversation_id': result["conversation_id"]
             })
             
             # 广播当前对话切换事件
-            socketio.emit('conversation_changed', {
+            emit_to_client('conversation_changed', {
                 'conversation_id': result["conversation_id"],
                 'title': "新对话"
             })
@@ -452,6 +769,7 @@ def create_conversation():
 @app.route('/api/conversations/<conversation_id>', methods=['GET'])
 def get_conversation_info(conversation_id):
     """获取特定对话信息"""
+    web_terminal = current_terminal()
     if not web_terminal:
         return jsonify({"error": "System not initialized"}), 503
     
@@ -492,15 +810,20 @@ def get_conversation_info(conversation_id):
 @app.route('/api/conversations/<conversation_id>/load', methods=['PUT'])
 def load_conversation(conversation_id):
     """加载特定对话"""
+    web_terminal = current_terminal()
     if not web_terminal:
         return jsonify({"error": "System not initialized"}), 503
     
+    conflict = conversation_owned_elsewhere(conversation_id)
+    if conflict:
+        return conflict
+    
     try:
         result = web_terminal.load_conversation(conversation_id)
         
         if result["success"]:
             # 广播对话切换事件
-            socketio.emit('conversation_changed', {
+            emit_to_client('conversation_changed', {
                 'conversation_id': conversation_id,
                 'title': result.get("title", "未知对话"),
                 'messages_count': result.get("messages_count", 0)
@@ -508,10 +831,10 @@ def load_conversation(conversation_id):
             
             # 广播系统状态更新（因为当前对话改变了）
             status = web_terminal.get_status()
-            socketio.emit('status_update', status)
+            emit_to_client('status_update', status)
             
             # 清理和重置相关UI状态
-            socketio.emit('conversation_loaded', {
+            emit_to_client('conversation_loaded', {
                 'conversation_id': conversation_id,
                 'clear_ui': True  # 提示前端清理当前UI状态
             })
@@ -531,6 +854,7 @@ def load_conversation(conversation_id):
 @app.route('/api/conversations/<conversation_id>', methods=['DELETE'])
 def delete_conversation(conversation_id):
     """删除特定对话"""
+    web_terminal = current_terminal()
     if not web_terminal:
         return jsonify({"error": "System not initialized"}), 503
     
@@ -542,14 +866,14 @@ def delete_conversation(conversation_id):
         
         if result["success"]:
             # 广播对话列表更新事件
-            socketio.emit('conversation_list_update', {
+            emit_to_client('conversation_list_update', {
                 'action': 'deleted',
                 'conversation_id': conversation_id
             })
             
             # 如果删除的是当前对话，广播对话清空事件
             if is_current:
-                socketio.emit('conversation_changed', {
+                emit_to_client('conversation_changed', {
                     'conversation_id': None,
                     'title': None,
                     'cleared': True
@@ -557,7 +881,7 @@ def delete_conversation(conversation_id):
                 
                 # 更新系统状态
                 status = web_terminal.get_status()
-                socketio.emit('status_update', status)
+                emit_to_client('status_update', status)
             
             return jsonify(result)
         else:
@@ -574,6 +898,7 @@ def delete_conversation(conversation_id):
 @app.route('/api/conversations/search', methods=['GET'])
 def search_conversations():
     """搜索对话"""
+    web_terminal = current_terminal()
     if not web_terminal:
         return jsonify({"error": "System not initialized"}), 503
     
@@ -610,15 +935,57 @@ def search_conversations():
             "message": "搜索对话时发生异常"
         }), 500
 
+def conversation_etag(context_manager, conversation_id):
+    """
+    对话消息的ETag：当前对话用内存版本号，其他对话用对话文件的修改时间
+
+    两者都带上文件mtime，绕过版本号直接改写文件的操作也会让缓存失效；文件不存在时返回None。
+    """
+    try:
+        file_path = context_manager.conversation_manager._get_conversation_file_path(conversation_id)
+        mtime_ns = file_path.stat().st_mtime_ns
+    except OSError:
+        return None
+    if conversation_id == context_manager.current_conversation_id:
+        revisions = context_manager.conversation_revisions
+        return revisions.etag().rstrip('"') + f'-{mtime_ns}"'
+    return f'W/"conversation-{conversation_id}-{mtime_ns}"'
+
 @app.route('/api/conversations/<conversation_id>/messages', methods=['GET'])
 def get_conversation_messages(conversation_id):
     """获取对话的消息历史（可选功能，用于调试或详细查看）"""
+    web_terminal = current_terminal()
     if not web_terminal:
         return jsonify({"error": "System not initialized"}), 503
     
     try:
+        context_manager = web_terminal.context_manager
+        etag = conversation_etag(context_manager, conversation_id)
+        if etag and etag_matches(request.headers.get('If-None-Match'), etag):
+            return not_modified(etag)
+        
+        # ?since=N：当前对话只返回版本N之后追加的消息
+        since = request.args.get('since', type=int)
+        if since is not None and conversation_id == context_manager.current_conversation_id:
+            revision = context_manager.conversation_revisions.revision
+            changed = context_manager.conversation_revisions.changes_since(since)
+            if changed is not None:
+                history = context_manager.conversation_history
+                from_index = min(changed) if changed else len(history)
+                return cached_json({
+                    "success": True,
+                    "data": {
+                        "conversation_id": conversation_id,
+                        "messages": history[from_index:],
+                        "from_index": from_index,
+                        "total_count": len(history),
+                        "revision": revision,
+                        "delta": True
+                    }
+                }, etag=etag, revision=revision)
+        
         # 获取完整对话数据
-        conversation_data = web_terminal.context_manager.conversation_manager.load_conversation(conversation_id)
+        conversation_data = context_manager.conversation_manager.load_conversation(conversation_id)
         
         if conversation_data:
             messages = conversation_data.get("messages", [])
@@ -628,14 +995,17 @@ def get_conversation_messages(conversation_id):
             if limit:
                 messages = messages[-limit:]  # 获取最后N条消息
             
-            return jsonify({
+            revision = (context_manager.conversation_revisions.revision
+                        if conversation_id == context_manager.current_conversation_id else None)
+            return cached_json({
                 "success": True,
                 "data": {
                     "conversation_id": conversation_id,
                     "messages": messages,
-                    "total_count": len(conversation_data.get("messages", []))
+                    "total_count": len(conversation_data.get("messages", [])),
+                    "revision": revision
                 }
-            })
+            }, etag=etag, revision=revision)
         else:
             return jsonify({
                 "success": False,
@@ -655,6 +1025,7 @@ def get_conversation_messages(conversation_id):
 @app.route('/api/conversations/<conversation_id>/compress', methods=['POST'])
 def compress_conversation(conversation_id):
     """压缩指定对话的大体积消息，生成压缩版新对话"""
+    web_terminal = current_terminal()
     if not web_terminal:
         return jsonify({"error": "System not initialized"}), 503
 
@@ -670,16 +1041,19 @@ def compress_conversation(conversation_id):
         load_result = web_terminal.load_conversation(new_conversation_id)
 
         if load_result.get("success"):
-            socketio.emit('conversation_list_update', {
+            if conversation_leases:
+                conversation_leases.claim(new_conversation_id)
+            
+            emit_to_client('conversation_list_update', {
                 'action': 'compressed',
                 'conversation_id': new_conversation_id
             })
-            socketio.emit('conversation_changed', {
+            emit_to_client('conversation_changed', {
                 'conversation_id': new_conversation_id,
                 'title': load_result.get('title', '压缩后的对话'),
                 'messages_count': load_result.get('messages_count', 0)
             })
-            socketio.emit('conversation_loaded', {
+            emit_to_client('conversation_loaded', {
                 'conversation_id': new_conversation_id,
                 'clear_ui': True
             })
@@ -706,6 +1080,7 @@ def compress_conversation(conversation_id):
 @app.route('/api/conversations/<conversation_id>/duplicate', methods=['POST'])
 def duplicate_conversation(conversation_id):
     """复制指定对话，生成新的对话副本"""
+    web_terminal = current_terminal()
     if not web_terminal:
         return jsonify({"error": "System not initialized"}), 503
 
@@ -720,16 +1095,19 @@ def duplicate_conversation(conversation_id):
         load_result = web_terminal.load_conversation(new_conversation_id)
 
         if load_result.get("success"):
-            socketio.emit('conversation_list_update', {
+            if conversation_leases:
+                conversation_leases.claim(new_conversation_id)
+            
+            emit_to_client('conversation_list_update', {
                 'action': 'duplicated',
                 'conversation_id': new_conversation_id
             })
-            socketio.emit('conversation_changed', {
+            emit_to_client('conversation_changed', {
                 'conversation_id': new_conversation_id,
                 'title': load_result.get('title', '复制的对话'),
                 'messages_count': load_result.get('messages_count', 0)
             })
-            socketio.emit('conversation_loaded', {
+            emit_to_client('conversation_loaded', {
                 'conversation_id': new_conversation_id,
                 'clear_ui': True
             })
@@ -753,6 +1131,7 @@ def duplicate_conversation(conversation_id):
 @app.route('/api/conversations/statistics', methods=['GET'])
 def get_conversations_statistics():
     """获取对话统计信息"""
+    web_terminal = current_terminal()
     if not web_terminal:
         return jsonify({"error": "System not initialized"}), 503
     
@@ -775,6 +1154,7 @@ def get_conversations_statistics():
 @app.route('/api/conversations/current', methods=['GET'])
 def get_current_conversation():
     """获取当前对话信息"""
+    web_terminal = current_terminal()
     if not web_terminal:
         return jsonify({"error": "System not initialized"}), 503
     
@@ -818,34 +1198,48 @@ def get_current_conversation():
             "error": str(e)
         }), 500
     
-def process_message_task(message, sender, client_sid):
-    """在后台处理消息任务"""
+def finish_task_timeline(web_terminal, status: str):
+    """结束当前任务时间线并写入对话元数据"""
+    if not web_terminal:
+        return
+    context_manager = web_terminal.context_manager
+    timeline = context_manager.task_timeline
+    if timeline is None:
+        return
+    context_manager.task_timeline = None
+    timeline.finish(status)
+    
+    if context_manager.current_conversation_id:
+        context_manager.conversation_manager.save_task_timeline(
+            context_manager.current_conversation_id,
+            timeline.to_dict()
+        )
+
+def process_message_task(web_terminal, message, sender, client_id):
+    """在后台处理消息任务（协程在常驻的Agent运行时中执行，本线程等待其结束）"""
     try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        # 创建可取消的任务
-        task = loop.create_task(handle_task_with_sender(message, sender, client_sid))
+        # 提交可取消的任务
+        task = get_runtime().spawn(handle_task_with_sender(web_terminal, message, sender, client_id))
         
         # 存储任务引用，以便取消
-        if client_sid not in stop_flags:
-            stop_flags[client_sid] = {'stop': False, 'task': task}
+        if not isinstance(stop_flags.get(client_id), dict):
+            stop_flags[client_id] = {'stop': False, 'task': task}
         else:
-            stop_flags[client_sid]['task'] = task
+            stop_flags[client_id]['task'] = task
         
         try:
-            loop.run_until_complete(task)
-        except asyncio.CancelledError:
-            debug_log(f"任务 {client_sid} 被成功取消")
+            task.result()
+            finish_task_timeline(web_terminal, "completed")
+        except concurrent.futures.CancelledError:
+            finish_task_timeline(web_terminal, "cancelled")
+            debug_log(f"任务 {client_id} 被成功取消")
             sender('task_stopped', {
                 'message': '任务已停止',
                 'reason': 'user_requested'
             })
-            reset_system_state()
-        
-        loop.close()
+            reset_system_state(web_terminal)
     except Exception as e:
-        # 【新增】错误时确保对话状态不丢失
+        # 错误时确保对话状态不丢失
         try:
             if web_terminal and web_terminal.context_manager:
                 # 尝试保存当前对话状态
@@ -854,18 +1248,8 @@ def process_message_task(message, sender, client_sid):
         except Exception as save_error:
             debug_log(f"错误恢复：保存对话状态失败: {save_error}")
         
-    # 修改为：
-    except Exception as e:
-        # 【新增】错误时确保对话状态不丢失
-        try:
-            if web_terminal and web_terminal.context_manager:
-                # 尝试保存当前对话状态
-                web_terminal.context_manager.auto_save_conversation()
-                debug_log("错误恢复：对话状态已保存")
-        except Exception as save_error:
-            debug_log(f"错误恢复：保存对话状态失败: {save_error}")
+        finish_task_timeline(web_terminal, "error")
         
-        # 原有的错误处理逻辑
         print(f"[Task] 错误: {e}")
         debug_log(f"任务处理错误: {e}")
         import traceback
@@ -874,8 +1258,8 @@ def process_message_task(message, sender, client_sid):
 
     finally:
         # 清理任务引用
-        if client_sid in stop_flags and isinstance(stop_flags[client_sid], dict):
-            stop_flags.pop(client_sid, None)
+        if client_id in stop_flags and isinstance(stop_flags[client_id], dict):
+            stop_flags.pop(client_id, None)
 
 def detect_malformed_tool_call(text):
     """检测文本中是否包含格式错误的工具调用"""
@@ -904,9 +1288,18 @@ def detect_malformed_tool_call(text):
             
     return False
 
-async def handle_task_with_sender(message, sender, client_sid):
+async def handle_task_with_sender(web_terminal, message, sender, client_id):
     """处理任务并发送消息 - 集成token统计版本"""
     
+    # 本次任务的时间线（迭代、首末字节、工具、保存等），任务结束后写入对话元数据
+    task_timeline = TaskTimeline(message)
+    web_terminal.context_manager.task_timeline = task_timeline
+    
+    async def paced_sleep(seconds: float, reason: str):
+        """界面节奏用的等待，记录到时间线以便和真实耗时区分"""
+        with timeline_span(task_timeline, "sleep", reason):
+            await asyncio.sleep(seconds)
+    
     # 如果是思考模式，重置状态
     if web_terminal.thinking_mode:
         web_terminal.api_client.start_new_task()
@@ -992,10 +1385,10 @@ async def handle_task_with_sender(message, sender, client_sid):
             error_msg = "append_to_file 状态不完整，缺少路径或ID。"
             debug_log(error_msg)
             result["error"] = error_msg
-            result["tool_content"] = json.dumps({
+            result["tool_content"] = serialization.dumps({
                 "success": False,
                 "error": error_msg
-            }, ensure_ascii=False)
+            })
             pending_append = None
             return result
         
@@ -1003,11 +1396,11 @@ async def handle_task_with_sender(message, sender, client_sid):
             error_msg = f"未检测到格式正确的开始标识 {start_marker}。"
             debug_log(error_msg)
             result["error"] = error_msg
-            result["tool_content"] = json.dumps({
+            result["tool_content"] = serialization.dumps({
                 "success": False,
                 "path": path,
                 "error": error_msg
-            }, ensure_ascii=False)
+            })
             pending_append = None
             return result
         
@@ -1031,11 +1424,11 @@ async def handle_task_with_sender(message, sender, client_sid):
             debug_log(error_msg)
             result["error"] = error_msg
             result["forced"] = forced
-            result["tool_content"] = json.dumps({
+            result["tool_content"] = serialization.dumps({
                 "success": False,
                 "path": path,
                 "error": error_msg
-            }, ensure_ascii=False)
+            })
             pending_append = None
             return result
         
@@ -1076,7 +1469,7 @@ async def handle_task_with_sender(message, sender, client_sid):
                 "lines": line_count,
                 "bytes": bytes_written,
                 "appended_content": content,
-                "tool_content": json.dumps({
+                "tool_content": serialization.dumps({
                     "success": True,
                     "path": path,
                     "lines": line_count,
@@ -1084,7 +1477,7 @@ async def handle_task_with_sender(message, sender, client_sid):
                     "forced": forced,
                     "message": summary,
                     "finish_reason": finish_reason
-                }, ensure_ascii=False)
+                })
             })
             
             assistant_meta_payload = result["assistant_metadata"]["append_payload"]
@@ -1125,12 +1518,12 @@ async def handle_task_with_sender(message, sender, client_sid):
                 "summary_message": error_msg,
                 "forced": forced,
                 "appended_content": content,
-                "tool_content": json.dumps({
+                "tool_content": serialization.dumps({
                     "success": False,
                     "path": path,
                     "error": error_msg,
                     "finish_reason": finish_reason
-                }, ensure_ascii=False)
+                })
             })
             debug_log(f"追加写入失败: {error_msg}")
             
@@ -1210,12 +1603,12 @@ async def handle_task_with_sender(message, sender, client_sid):
             debug_log(error_msg)
             result["error"] = error_msg
             result["summary_message"] = error_msg
-            result["tool_content"] = json.dumps({
+            result["tool_content"] = serialization.dumps({
                 "success": False,
                 "path": path,
                 "error": error_msg,
                 "finish_reason": finish_reason
-            }, ensure_ascii=False)
+            })
             if hasattr(web_terminal, "pending_modify_request"):
                 web_terminal.pending_modify_request = None
             pending_modify = None
@@ -1378,7 +1771,7 @@ async def handle_task_with_sender(message, sender, client_sid):
         if apply_result.get("error"):
             tool_payload["error"] = apply_result["error"]
         
-        result["tool_content"] = json.dumps(tool_payload, ensure_ascii=False)
+        result["tool_content"] = serialization.dumps(tool_payload)
         result["assistant_metadata"] = {
             "modify_payload": {
                 "path": path,
@@ -1413,6 +1806,7 @@ async def handle_task_with_sender(message, sender, client_sid):
     
     for iteration in range(max_iterations):
         total_iterations += 1
+        task_timeline.begin_iteration(iteration + 1)
         debug_log(f"\n--- 迭代 {iteration + 1}/{max_iterations} 开始 ---")
         
         # 检查是否超过总工具调用限制
@@ -1423,18 +1817,9 @@ async def handle_task_with_sender(message, sender, client_sid):
             })
             break
         
-        # === 修改：每次API调用前都计算输入token ===
-        try:
-            input_tokens = web_terminal.context_manager.calculate_input_tokens(messages, tools)
-            debug_log(f"第{iteration + 1}次API调用输入token: {input_tokens}")
-            
-            # 更新输入token统计
-            web_terminal.context_manager.update_token_statistics(input_tokens, 0)
-        except Exception as e:
-            debug_log(f"输入token统计失败: {e}")
-        
         full_response = ""
-        tool_calls = []
+        tool_accumulator = ToolCallAccumulator()
+        tool_calls = tool_accumulator.calls
         current_thinking = ""
         detected_tools = {}
         
@@ -1464,289 +1849,299 @@ async def handle_task_with_sender(message, sender, client_sid):
         print(f"[API] 第{iteration + 1}次调用 (总工具调用: {total_tool_calls}/{MAX_TOTAL_TOOL_CALLS})")
         
         # 收集流式响应
-        async for chunk in web_terminal.api_client.chat(messages, tools, stream=True):
-            chunk_count += 1
-            
-            # 检查停止标志
-            client_stop_info = stop_flags.get(client_sid)
-            if client_stop_info:
-                stop_requested = client_stop_info.get('stop', False) if isinstance(client_stop_info, dict) else client_stop_info
-                if stop_requested:
-                    debug_log(f"检测到停止请求，中断流处理")
-                    if pending_append:
-                        append_result = await finalize_pending_append(full_response, False, finish_reason="user_stop")
-                        break
-                    if pending_modify:
-                        modify_result = await finalize_pending_modify(full_response, False, finish_reason="user_stop")
-                        break
+        api_span = tracing.span(tracing.SPAN_API_CALL)
+        task_timeline.mark("request_sent")
+        
+        def notify_stream_wait(waiting):
+            sender('llm_stream_waiting', {
+                'waiting': waiting,
+                'message': f'模型请求并发已满，等待空闲槽位（排队 {waiting}）'
+            })
+        
+        # 全局LLM流并发受限，流结束或中断时释放槽位
+        api_stream = llm_stream_limiter.limit_stream(
+            web_terminal.api_client.chat_deltas(messages, tools),
+            on_wait=notify_stream_wait
+        )
+        try:
+            async for delta in api_stream:
+                chunk_count += 1
+                if chunk_count == 1:
+                    task_timeline.mark("first_byte")
+                task_timeline.mark("last_byte")
+            
+                # 检查停止标志
+                client_stop_info = stop_flags.get(client_id)
+                if client_stop_info:
+                    stop_requested = client_stop_info.get('stop', False) if isinstance(client_stop_info, dict) else client_stop_info
+                    if stop_requested:
+                        debug_log(f"检测到停止请求，中断流处理")
+                        if pending_append:
+                            append_result = await finalize_pending_append(full_response, False, finish_reason="user_stop")
+                            break
+                        if pending_modify:
+                            modify_result = await finalize_pending_modify(full_response, False, finish_reason="user_stop")
+                            break
             
-            if "choices" not in chunk:
-                debug_log(f"Chunk {chunk_count}: 无choices字段")
-                continue
+                if not delta.has_choice:
+                    debug_log(f"Chunk {chunk_count}: 无choices字段")
+                    continue
                 
-            choice = chunk["choices"][0]
-            delta = choice.get("delta", {})
-            finish_reason = choice.get("finish_reason")
-            if finish_reason:
-                last_finish_reason = finish_reason
-            
-            # 处理思考内容
-            if "reasoning_content" in delta:
-                reasoning_content = delta["reasoning_content"]
-                if reasoning_content:
-                    reasoning_chunks += 1
-                    debug_log(f"  思考内容 #{reasoning_chunks}: {len(reasoning_content)} 字符")
+                if delta.finish_reason:
+                    last_finish_reason = delta.finish_reason
+            
+                # 处理思考内容
+                if delta.reasoning_content is not None:
+                    reasoning_content = delta.reasoning_content
+                    if reasoning_content:
+                        reasoning_chunks += 1
+                        debug_log(f"  思考内容 #{reasoning_chunks}: {len(reasoning_content)} 字符")
                     
-                    if should_show_thinking:
-                        if not thinking_started:
-                            in_thinking = True
-                            thinking_started = True
-                            sender('thinking_start', {})
-                            await asyncio.sleep(0.05)
+                        if should_show_thinking:
+                            if not thinking_started:
+                                in_thinking = True
+                                thinking_started = True
+                                sender('thinking_start', {})
+                                await paced_sleep(0.05, "thinking_start")
                         
-                        current_thinking += reasoning_content
-                        sender('thinking_chunk', {'content': reasoning_content})
-            
-            # 处理正常内容
-            if "content" in delta:
-                content = delta["content"]
-                if content:
-                    content_chunks += 1
-                    debug_log(f"  正式内容 #{content_chunks}: {repr(content[:100] if content else 'None')}")
+                            current_thinking += reasoning_content
+                            sender('thinking_chunk', {'content': reasoning_content})
+            
+                # 处理正常内容
+                if delta.content is not None:
+                    content = delta.content
+                    if content:
+                        content_chunks += 1
+                        debug_log(f"  正式内容 #{content_chunks}: {repr(content[:100] if content else 'None')}")
                     
-                    # 通过文本内容提前检测工具调用意图
-                    if not detected_tools:
-                        # 检测常见的工具调用模式
-                        tool_patterns = [
-                            (r'(创建|新建|生成).*(文件|file)', 'create_file'),
-                            (r'(读取|查看|打开).*(文件|file)', 'read_file'),
-                            (r'(修改|编辑|更新).*(文件|file)', 'modify_file'),
-                            (r'(删除|移除).*(文件|file)', 'delete_file'),
-                            (r'(搜索|查找|search)', 'web_search'),
-                            (r'(执行|运行).*(Python|python|代码)', 'run_python'),
-                            (r'(执行|运行).*(命令|command)', 'run_command'),
-                            (r'(等待|sleep|延迟)', 'sleep'),
-                            (r'(聚焦|focus).*(文件|file)', 'focus_file'),
-                            (r'(终端|terminal|会话|session)', 'terminal_session'),
-                        ]
+                        # 通过文本内容提前检测工具调用意图
+                        if not detected_tools:
+                            # 检测常见的工具调用模式
+                            tool_patterns = [
+                                (r'(创建|新建|生成).*(文件|file)', 'create_file'),
+                                (r'(读取|查看|打开).*(文件|file)', 'read_file'),
+                                (r'(修改|编辑|更新).*(文件|file)', 'modify_file'),
+                                (r'(删除|移除).*(文件|file)', 'delete_file'),
+                                (r'(搜索|查找|search)', 'web_search'),
+                                (r'(执行|运行).*(Python|python|代码)', 'run_python'),
+                                (r'(执行|运行).*(命令|command)', 'run_command'),
+                                (r'(等待|sleep|延迟)', 'sleep'),
+                                (r'(聚焦|focus).*(文件|file)', 'focus_file'),
+                                (r'(终端|terminal|会话|session)', 'terminal_session'),
+                            ]
                         
-                        for pattern, tool_name in tool_patterns:
-                            if re.search(pattern, content, re.IGNORECASE):
-                                early_tool_id = f"early_{tool_name}_{time.time()}"
-                                if early_tool_id not in detected_tools:
-                                    sender('tool_hint', {
-                                        'id': early_tool_id,
-                                        'name': tool_name,
-                                        'message': f'检测到可能需要调用 {tool_name}...',
-                                        'confidence': 'low'
-                                    })
-                                    detected_tools[early_tool_id] = tool_name
-                                    debug_log(f"    ⚡ 提前检测到工具意图: {tool_name}")
-                                    break
+                            for pattern, tool_name in tool_patterns:
+                                if re.search(pattern, content, re.IGNORECASE):
+                                    early_tool_id = f"early_{tool_name}_{time.time()}"
+                                    if early_tool_id not in detected_tools:
+                                        sender('tool_hint', {
+                                            'id': early_tool_id,
+                                            'name': tool_name,
+                                            'message': f'检测到可能需要调用 {tool_name}...',
+                                            'confidence': 'low'
+                                        })
+                                        detected_tools[early_tool_id] = tool_name
+                                        debug_log(f"    ⚡ 提前检测到工具意图: {tool_name}")
+                                        break
                     
-                    if in_thinking and not thinking_ended:
-                        in_thinking = False
-                        thinking_ended = True
-                        sender('thinking_end', {'full_content': current_thinking})
-                        await asyncio.sleep(0.1)
+                        if in_thinking and not thinking_ended:
+                            in_thinking = False
+                            thinking_ended = True
+                            sender('thinking_end', {'full_content': current_thinking})
+                            await paced_sleep(0.1, "thinking_end")
                         
-                        # ===== 增量保存：保存思考内容 =====
-                        if current_thinking and not has_saved_thinking and is_first_iteration:
-                            thinking_content = f"<think>\n{current_thinking}\n</think>"
-                            web_terminal.context_manager.add_conversation("assistant", thinking_content)
-                            has_saved_thinking = True
-                            debug_log(f"💾 增量保存：思考内容 ({len(current_thinking)} 字符)")
+                            # ===== 增量保存：保存思考内容 =====
+                            if current_thinking and not has_saved_thinking and is_first_iteration:
+                                thinking_content = f"<think>\n{current_thinking}\n</think>"
+                                web_terminal.context_manager.add_conversation("assistant", thinking_content)
+                                has_saved_thinking = True
+                                debug_log(f"💾 增量保存：思考内容 ({len(current_thinking)} 字符)")
                     
-                    if pending_modify:
-                        if not pending_modify.get("start_seen"):
-                            probe_buffer = pending_modify.get("probe_buffer", "") + content
-                            if len(probe_buffer) > 10000:
-                                probe_buffer = probe_buffer[-10000:]
-                            marker = pending_modify.get("start_marker")
-                            marker_index = probe_buffer.find(marker)
-                            if marker_index == -1:
-                                pending_modify["probe_buffer"] = probe_buffer
-                                continue
-                            after_marker = marker_index + len(marker)
-                            remainder = probe_buffer[after_marker:]
-                            pending_modify["buffer"] = remainder
-                            pending_modify["raw_buffer"] = marker + remainder
-                            pending_modify["start_seen"] = True
-                            pending_modify["detected_blocks"] = set()
-                            pending_modify["probe_buffer"] = ""
-                            if pending_modify.get("display_id"):
-                                sender('update_action', {
-                                    'id': pending_modify["display_id"],
-                                    'status': 'running',
-                                    'preparing_id': pending_modify.get("tool_call_id"),
-                                    'message': f"正在修改 {pending_modify['path']}..."
-                                })
-                        else:
-                            pending_modify["buffer"] += content
-                            pending_modify["raw_buffer"] += content
-                        
-                        if pending_modify.get("start_seen"):
-                            block_text = pending_modify["buffer"]
-                            for match in re.finditer(r"\[replace:(\d+)\]", block_text):
-                                try:
-                                    block_index = int(match.group(1))
-                                except ValueError:
+                        if pending_modify:
+                            if not pending_modify.get("start_seen"):
+                                probe_buffer = pending_modify.get("probe_buffer", "") + content
+                                if len(probe_buffer) > 10000:
+                                    probe_buffer = probe_buffer[-10000:]
+                                marker = pending_modify.get("start_marker")
+                                marker_index = probe_buffer.find(marker)
+                                if marker_index == -1:
+                                    pending_modify["probe_buffer"] = probe_buffer
                                     continue
-                                detected_blocks = pending_modify.setdefault("detected_blocks", set())
-                                if block_index not in detected_blocks:
-                                    detected_blocks.add(block_index)
-                                    if pending_modify.get("display_id"):
-                                        sender('update_action', {
-                                            'id': pending_modify["display_id"],
-                                            'status': 'running',
-                                            'preparing_id': pending_modify.get("tool_call_id"),
-                                            'message': f"正在对 {pending_modify['path']} 进行第 {block_index} 处修改..."
-                                        })
+                                after_marker = marker_index + len(marker)
+                                remainder = probe_buffer[after_marker:]
+                                pending_modify["buffer"] = remainder
+                                pending_modify["raw_buffer"] = marker + remainder
+                                pending_modify["start_seen"] = True
+                                pending_modify["detected_blocks"] = set()
+                                pending_modify["probe_buffer"] = ""
+                                if pending_modify.get("display_id"):
+                                    sender('update_action', {
+                                        'id': pending_modify["display_id"],
+                                        'status': 'running',
+                                        'preparing_id': pending_modify.get("tool_call_id"),
+                                        'message': f"正在修改 {pending_modify['path']}..."
+                                    })
+                            else:
+                                pending_modify["buffer"] += content
+                                pending_modify["raw_buffer"] += content
+                        
+                            if pending_modify.get("start_seen"):
+                                block_text = pending_modify["buffer"]
+                                for match in re.finditer(r"\[replace:(\d+)\]", block_text):
+                                    try:
+                                        block_index = int(match.group(1))
+                                    except ValueError:
+                                        continue
+                                    detected_blocks = pending_modify.setdefault("detected_blocks", set())
+                                    if block_index not in detected_blocks:
+                                        detected_blocks.add(block_index)
+                                        if pending_modify.get("display_id"):
+                                            sender('update_action', {
+                                                'id': pending_modify["display_id"],
+                                                'status': 'running',
+                                                'preparing_id': pending_modify.get("tool_call_id"),
+                                                'message': f"正在对 {pending_modify['path']} 进行第 {block_index} 处修改..."
+                                            })
                         
-                        if pending_modify.get("start_seen"):
-                            end_pos = pending_modify["buffer"].find(pending_modify["end_marker"])
-                            if end_pos != -1:
-                                pending_modify["end_index"] = end_pos
-                                modify_break_triggered = True
-                                debug_log("检测到<<<END_MODIFY>>>，即将终止流式输出并应用修改")
-                                break
-                        continue
-                    else:
-                        modify_probe_buffer += content
-                        if len(modify_probe_buffer) > 10000:
-                            modify_probe_buffer = modify_probe_buffer[-10000:]
+                            if pending_modify.get("start_seen"):
+                                end_pos = pending_modify["buffer"].find(pending_modify["end_marker"])
+                                if end_pos != -1:
+                                    pending_modify["end_index"] = end_pos
+                                    modify_break_triggered = True
+                                    debug_log("检测到<<<END_MODIFY>>>，即将终止流式输出并应用修改")
+                                    break
+                            continue
+                        else:
+                            modify_probe_buffer += content
+                            if len(modify_probe_buffer) > 10000:
+                                modify_probe_buffer = modify_probe_buffer[-10000:]
                         
-                        marker_match = re.search(r"<<<MODIFY:\s*([\s\S]*?)>>>", modify_probe_buffer)
-                        if marker_match:
-                            detected_raw_path = marker_match.group(1)
-                            detected_path = detected_raw_path.strip()
-                            marker_full = marker_match.group(0)
-                            after_marker_index = modify_probe_buffer.find(marker_full) + len(marker_full)
-                            remainder = modify_probe_buffer[after_marker_index:]
-                            modify_probe_buffer = ""
+                            marker_match = re.search(r"<<<MODIFY:\s*([\s\S]*?)>>>", modify_probe_buffer)
+                            if marker_match:
+                                detected_raw_path = marker_match.group(1)
+                                detected_path = detected_raw_path.strip()
+                                marker_full = marker_match.group(0)
+                                after_marker_index = modify_probe_buffer.find(marker_full) + len(marker_full)
+                                remainder = modify_probe_buffer[after_marker_index:]
+                                modify_probe_buffer = ""
                             
-                            if not detected_path:
-                                debug_log("检测到 MODIFY 起始标记但路径为空，忽略。")
-                                continue
+                                if not detected_path:
+                                    debug_log("检测到 MODIFY 起始标记但路径为空，忽略。")
+                                    continue
                             
-                            pending_modify = {
-                                "path": detected_path,
-                                "tool_call_id": None,
-                                "buffer": remainder,
-                                "raw_buffer": marker_full + remainder,
-                                "start_marker": marker_full,
-                                "end_marker": "<<<END_MODIFY>>>",
-                                "start_seen": True,
-                                "end_index": None,
-                                "display_id": None,
-                                "detected_blocks": set()
-                            }
-                            if hasattr(web_terminal, "pending_modify_request"):
-                                web_terminal.pending_modify_request = {"path": detected_path}
-                            debug_log(f"直接检测到modify起始标记，构建修改缓冲: {detected_path}")
+                                pending_modify = {
+                                    "path": detected_path,
+                                    "tool_call_id": None,
+                                    "buffer": remainder,
+                                    "raw_buffer": marker_full + remainder,
+                                    "start_marker": marker_full,
+                                    "end_marker": "<<<END_MODIFY>>>",
+                                    "start_seen": True,
+                                    "end_index": None,
+                                    "display_id": None,
+                                    "detected_blocks": set()
+                                }
+                                if hasattr(web_terminal, "pending_modify_request"):
+                                    web_terminal.pending_modify_request = {"path": detected_path}
+                                debug_log(f"直接检测到modify起始标记，构建修改缓冲: {detected_path}")
                             
-                            end_pos = pending_modify["buffer"].find(pending_modify["end_marker"])
-                            if end_pos != -1:
-                                pending_modify["end_index"] = end_pos
-                                modify_break_triggered = True
-                                debug_log("检测到<<<END_MODIFY>>>，即将终止流式输出并应用修改")
-                                break
-                            continue
+                                end_pos = pending_modify["buffer"].find(pending_modify["end_marker"])
+                                if end_pos != -1:
+                                    pending_modify["end_index"] = end_pos
+                                    modify_break_triggered = True
+                                    debug_log("检测到<<<END_MODIFY>>>，即将终止流式输出并应用修改")
+                                    break
+                                continue
                     
-                    if pending_append:
-                        pending_append["buffer"] += content
+                        if pending_append:
+                            pending_append["buffer"] += content
                         
-                        if pending_append.get("content_start") is None:
-                            marker_index = pending_append["buffer"].find(pending_append["start_marker"])
-                            if marker_index != -1:
-                                pending_append["content_start"] = marker_index + len(pending_append["start_marker"])
-                                debug_log(f"检测到追加起始标识: {pending_append['start_marker']}")
+                            if pending_append.get("content_start") is None:
+                                marker_index = pending_append["buffer"].find(pending_append["start_marker"])
+                                if marker_index != -1:
+                                    pending_append["content_start"] = marker_index + len(pending_append["start_marker"])
+                                    debug_log(f"检测到追加起始标识: {pending_append['start_marker']}")
                         
-                        if pending_append.get("content_start") is not None:
-                            end_index = pending_append["buffer"].find(
-                                pending_append["end_marker"],
-                                pending_append["content_start"]
-                            )
-                            if end_index != -1:
-                                pending_append["end_index"] = end_index
-                                append_break_triggered = True
-                                debug_log("检测到<<<END_APPEND>>>，即将终止流式输出并写入文件")
-                                break
-                        
-                        # 继续累积追加内容
-                        continue
-                    else:
-                        append_probe_buffer += content
-                        # 限制缓冲区大小防止过长
-                        if len(append_probe_buffer) > 10000:
-                            append_probe_buffer = append_probe_buffer[-10000:]
-
-                        marker_match = re.search(r"<<<APPEND:\s*([\s\S]*?)>>>", append_probe_buffer)
-                        if marker_match:
-                            detected_raw_path = marker_match.group(1)
-                            detected_path = detected_raw_path.strip()
-                            if not detected_path:
-                                append_probe_buffer = append_probe_buffer[marker_match.end():]
-                                continue
-                            marker_full = marker_match.group(0)
-                            after_marker_index = append_probe_buffer.find(marker_full) + len(marker_full)
-                            remainder = append_probe_buffer[after_marker_index:]
-                            append_probe_buffer = ""
-                            pending_append = {
-                                "path": detected_path,
-                                "tool_call_id": None,
-                                "buffer": remainder,
-                                "start_marker": marker_full,
-                                "end_marker": "<<<END_APPEND>>>",
-                                "content_start": 0,
-                                "end_index": None,
-                                "display_id": None
-                            }
-                            if hasattr(web_terminal, "pending_append_request"):
-                                web_terminal.pending_append_request = {"path": detected_path}
-                            debug_log(f"直接检测到append起始标记，构建追加缓冲: {detected_path}")
-                            # 检查是否立即包含结束标记
-                            if pending_append["buffer"]:
-                                end_index = pending_append["buffer"].find(pending_append["end_marker"], pending_append["content_start"])
+                            if pending_append.get("content_start") is not None:
+                                end_index = pending_append["buffer"].find(
+                                    pending_append["end_marker"],
+                                    pending_append["content_start"]
+                                )
                                 if end_index != -1:
                                     pending_append["end_index"] = end_index
                                     append_break_triggered = True
                                     debug_log("检测到<<<END_APPEND>>>，即将终止流式输出并写入文件")
                                     break
+                        
+                            # 继续累积追加内容
                             continue
+                        else:
+                            append_probe_buffer += content
+                            # 限制缓冲区大小防止过长
+                            if len(append_probe_buffer) > 10000:
+                                append_probe_buffer = append_probe_buffer[-10000:]
+
+                            marker_match = re.search(r"<<<APPEND:\s*([\s\S]*?)>>>", append_probe_buffer)
+                            if marker_match:
+                                detected_raw_path = marker_match.group(1)
+                                detected_path = detected_raw_path.strip()
+                                if not detected_path:
+                                    append_probe_buffer = append_probe_buffer[marker_match.end():]
+                                    continue
+                                marker_full = marker_match.group(0)
+                                after_marker_index = append_probe_buffer.find(marker_full) + len(marker_full)
+                                remainder = append_probe_buffer[after_marker_index:]
+                                append_probe_buffer = ""
+                                pending_append = {
+                                    "path": detected_path,
+                                    "tool_call_id": None,
+                                    "buffer": remainder,
+                                    "start_marker": marker_full,
+                                    "end_marker": "<<<END_APPEND>>>",
+                                    "content_start": 0,
+                                    "end_index": None,
+                                    "display_id": None
+                                }
+                                if hasattr(web_terminal, "pending_append_request"):
+                                    web_terminal.pending_append_request = {"path": detected_path}
+                                debug_log(f"直接检测到append起始标记，构建追加缓冲: {detected_path}")
+                                # 检查是否立即包含结束标记
+                                if pending_append["buffer"]:
+                                    end_index = pending_append["buffer"].find(pending_append["end_marker"], pending_append["content_start"])
+                                    if end_index != -1:
+                                        pending_append["end_index"] = end_index
+                                        append_break_triggered = True
+                                        debug_log("检测到<<<END_APPEND>>>，即将终止流式输出并写入文件")
+                                        break
+                                continue
                     
-                    if not text_started:
-                        text_started = True
-                        text_streaming = True
-                        sender('text_start', {})
-                        await asyncio.sleep(0.05)
+                        if not text_started:
+                            text_started = True
+                            text_streaming = True
+                            sender('text_start', {})
+                            await paced_sleep(0.05, "text_start")
                     
-                    if not pending_append:
-                        full_response += content
-                        accumulated_response += content
-                        text_has_content = True
-                        sender('text_chunk', {'content': content})
-            
-            # 收集工具调用 - 实时发送准备状态
-            if "tool_calls" in delta:
-                tool_chunks += 1
-                for tc in delta["tool_calls"]:
-                    found = False
-                    for existing in tool_calls:
-                        if existing.get("index") == tc.get("index"):
-                            if "function" in tc and "arguments" in tc["function"]:
-                                existing["function"]["arguments"] += tc["function"]["arguments"]
-                            found = True
-                            break
+                        if not pending_append:
+                            full_response += content
+                            accumulated_response += content
+                            text_has_content = True
+                            sender('text_chunk', {'content': content})
+            
+                # 收集工具调用 - 按index合并分片，新工具实时发送准备状态
+                if delta.tool_calls:
+                    tool_chunks += 1
+                    for fragment in delta.tool_calls:
+                        new_call = tool_accumulator.add(fragment)
+                        if new_call is None:
+                            continue
+                    
+                        tool_id = new_call["id"]
+                        tool_name = new_call["function"]["name"]
                     
-                    if not found and tc.get("id"):
-                        tool_id = tc["id"]
-                        tool_name = tc.get("function", {}).get("name", "")
-                        
                         # 新工具检测到，立即发送准备事件
                         if tool_id not in detected_tools and tool_name:
                             detected_tools[tool_id] = tool_name
-                            
+                        
                             # 立即发送工具准备中事件
                             sender('tool_preparing', {
                                 'id': tool_id,
@@ -1754,48 +2149,45 @@ async def handle_task_with_sender(message, sender, client_sid):
                                 'message': f'准备调用 {tool_name}...'
                             })
                             debug_log(f"    发送工具准备事件: {tool_name}")
-                            await asyncio.sleep(0.1)
-                        
-                        tool_calls.append({
-                            "id": tool_id,
-                            "index": tc.get("index"),
-                            "type": "function",
-                            "function": {
-                                "name": tool_name,
-                                "arguments": tc.get("function", {}).get("arguments", "")
-                            }
-                        })
+                            await paced_sleep(0.1, "tool_preparing")
+                    
                         debug_log(f"    新工具: {tool_name}")
-        
-        # 检查是否被停止
-        client_stop_info = stop_flags.get(client_sid)
-        if client_stop_info:
-            stop_requested = client_stop_info.get('stop', False) if isinstance(client_stop_info, dict) else client_stop_info
-            if stop_requested:
-                debug_log("任务在流处理完成后检测到停止状态")
-                return
-        
-        # === API响应完成后只计算输出token ===
+        except BaseException:
+            api_span.end(error=True)
+            raise
+        finally:
+            # 用户停止（任务被取消）或异常时也要关闭流，否则生成器一直挂起并占用并发槽位
+            await api_stream.aclose()
+        api_span.end()
+        
+        # === 记录本次API调用的token用量：优先使用服务端返回的usage，缺失时本地估算 ===
         try:
-            # 计算AI输出的token（包括thinking、文本内容、工具调用）
             ai_output_content = ""
             if current_thinking:
                 ai_output_content += f"<think>\n{current_thinking}\n</think>\n"
             if full_response:
                 ai_output_content += full_response
             if tool_calls:
-                ai_output_content += json.dumps(tool_calls, ensure_ascii=False)
+                ai_output_content += serialization.dumps(tool_calls)
             
-            if ai_output_content.strip():
-                output_tokens = web_terminal.context_manager.calculate_output_tokens(ai_output_content)
-                debug_log(f"第{iteration + 1}次API调用输出token: {output_tokens}")
-                
-                # 只更新输出token统计
-                web_terminal.context_manager.update_token_statistics(0, output_tokens)
-            else:
-                debug_log("没有AI输出内容，跳过输出token统计")
+            with task_timeline.span("tokenize", "usage"):
+                usage = web_terminal.context_manager.record_api_usage(
+                    web_terminal.api_client.last_usage, messages, tools, ai_output_content
+                )
+            debug_log(
+                f"第{iteration + 1}次API调用token({usage['source']}): "
+                f"输入={usage['input_tokens']} (缓存命中 {usage['cached_tokens']}), 输出={usage['output_tokens']}"
+            )
         except Exception as e:
-            debug_log(f"输出token统计失败: {e}")
+            debug_log(f"token统计失败: {e}")
+        
+        # 检查是否被停止
+        client_stop_info = stop_flags.get(client_id)
+        if client_stop_info:
+            stop_requested = client_stop_info.get('stop', False) if isinstance(client_stop_info, dict) else client_stop_info
+            if stop_requested:
+                debug_log("任务在流处理完成后检测到停止状态")
+                return
         
         # 流结束后的处理
         debug_log(f"\n流结束统计:")
@@ -1815,7 +2207,7 @@ async def handle_task_with_sender(message, sender, client_sid):
         # 结束未完成的流
         if in_thinking and not thinking_ended:
             sender('thinking_end', {'full_content': current_thinking})
-            await asyncio.sleep(0.1)
+            await paced_sleep(0.1, "thinking_end")
             
             # 保存思考内容
             if current_thinking and not has_saved_thinking and is_first_iteration:
@@ -1828,7 +2220,7 @@ async def handle_task_with_sender(message, sender, client_sid):
         if text_started and text_has_content and not append_result["handled"] and not modify_result["handled"]:
             debug_log(f"发送text_end事件，完整内容长度: {len(full_response)}")
             sender('text_end', {'full_content': full_response})
-            await asyncio.sleep(0.1)
+            await paced_sleep(0.1, "text_end")
             text_streaming = False
             
             # ===== 增量保存：保存当前轮次的文本内容 =====
@@ -2015,7 +2407,7 @@ async def handle_task_with_sender(message, sender, client_sid):
                         "content": fix_message
                     })
                     
-                    await asyncio.sleep(1)
+                    await paced_sleep(1, "auto_fix")
                     continue
                 else:
                     debug_log(f"自动修复尝试已达上限 ({AUTO_FIX_MAX_ATTEMPTS})")
@@ -2122,7 +2514,7 @@ async def handle_task_with_sender(message, sender, client_sid):
         # 执行每个工具
         for tool_call in tool_calls:
             # 检查停止标志
-            client_stop_info = stop_flags.get(client_sid)
+            client_stop_info = stop_flags.get(client_id)
             if client_stop_info:
                 stop_requested = client_stop_info.get('stop', False) if isinstance(client_stop_info, dict) else client_stop_info
                 if stop_requested:
@@ -2134,7 +2526,7 @@ async def handle_task_with_sender(message, sender, client_sid):
             if last_tool_call_time > 0:
                 elapsed = current_time - last_tool_call_time
                 if elapsed < TOOL_CALL_COOLDOWN:
-                    await asyncio.sleep(TOOL_CALL_COOLDOWN - elapsed)
+                    await paced_sleep(TOOL_CALL_COOLDOWN - elapsed, "tool_cooldown")
             last_tool_call_time = time.time()
             
             function_name = tool_call["function"]["name"]
@@ -2206,23 +2598,21 @@ async def handle_task_with_sender(message, sender, client_sid):
                 'preparing_id': tool_call_id
             })
             
-            await asyncio.sleep(0.3)
+            await paced_sleep(0.3, "tool_start")
             start_time = time.time()
             
             # 执行工具
-            tool_result = await web_terminal.handle_tool_call(function_name, arguments)
+            with tracing.span(tracing.SPAN_TOOL_EXEC):
+                result_data = await web_terminal.execute_tool(function_name, arguments)
+            # 工具结果在内部以字典传递，只在写入对话/发送给模型时序列化一次
+            tool_result = serialization.dumps(result_data)
             debug_log(f"工具结果: {tool_result[:200]}...")
             
             execution_time = time.time() - start_time
             if execution_time < 1.5:
-                await asyncio.sleep(1.5 - execution_time)
+                await paced_sleep(1.5 - execution_time, "tool_min_duration")
             
             # 更新工具状态
-            try:
-                result_data = json.loads(tool_result)
-            except:
-                result_data = {'output': tool_result}
-            
             action_status = 'completed'
             action_message = None
             awaiting_flag = False
@@ -2296,19 +2686,13 @@ async def handle_task_with_sender(message, sender, client_sid):
             if function_name in ['focus_file', 'unfocus_file', 'modify_file', 'confirm_read_or_focus']:
                 sender('focused_files_update', web_terminal.get_focused_files_info())
             
-            if function_name in ['create_file', 'delete_file', 'rename_file', 'create_folder']:
-                structure = web_terminal.context_manager.get_project_structure()
-                sender('file_tree_update', structure)
+            # 文件树变化已由 file_tree_delta 增量推送
             
             # ===== 增量保存：立即保存工具结果 =====
-            try:
-                result_data = json.loads(tool_result)
-                if function_name == "read_file" and result_data.get("success"):
-                    file_content = result_data.get("content", "")
-                    tool_result_content = f"文件内容:\n```\n{file_content}\n```\n大小: {result_data.get('size')} 字节"
-                else:
-                    tool_result_content = tool_result
-            except:
+            if function_name == "read_file" and result_data.get("success"):
+                file_content = result_data.get("content", "")
+                tool_result_content = f"文件内容:\n```\n{file_content}\n```\n大小: {result_data.get('size')} 字节"
+            else:
                 tool_result_content = tool_result
             
             # 立即保存工具结果
@@ -2328,7 +2712,7 @@ async def handle_task_with_sender(message, sender, client_sid):
                 "content": tool_result_content
             })
             
-            await asyncio.sleep(0.2)
+            await paced_sleep(0.2, "tool_result")
         
         # 标记不再是第一次迭代
         is_first_iteration = False
@@ -2349,11 +2733,12 @@ async def handle_task_with_sender(message, sender, client_sid):
         'auto_fix_attempts': auto_fix_attempts
     })
     
-@socketio.on('send_command')
+@on_socket_event('send_command')
 def handle_command(data):
     """处理系统命令"""
     command = data.get('command', '')
     
+    web_terminal = client_terminal()
     if not web_terminal:
         emit('error', {'message': 'System not initialized'})
         return
@@ -2365,7 +2750,7 @@ def handle_command(data):
     cmd = parts[0].lower()
     
     if cmd == "clear":
-        web_terminal.context_manager.conversation_history.clear()
+        web_terminal.context_manager.conversation_history = []
         if web_terminal.thinking_mode:
             web_terminal.api_client.start_new_task()
         emit('command_result', {
@@ -2409,6 +2794,7 @@ def handle_command(data):
 @app.route('/api/conversations/<conversation_id>/token-statistics', methods=['GET'])
 def get_conversation_token_statistics(conversation_id):
     """获取特定对话的token统计"""
+    web_terminal = current_terminal()
     if not web_terminal:
         return jsonify({"error": "System not initialized"}), 503
     
@@ -2439,21 +2825,15 @@ def get_conversation_token_statistics(conversation_id):
 @app.route('/api/conversations/<conversation_id>/tokens', methods=['GET'])
 def get_conversation_tokens(conversation_id):
     """获取对话的当前完整上下文token数（包含所有动态内容）"""
+    web_terminal = current_terminal()
+    if not web_terminal:
+        return jsonify({"error": "System not initialized"}), 503
+    
     try:
-        # 获取当前聚焦文件状态
-        focused_files = web_terminal.get_focused_files_info()
-        
-        # 获取当前终端内容
-        terminal_content = ""
-        if web_terminal.terminal_manager:
-            terminal_content = web_terminal.terminal_manager.get_active_terminal_content()
-        
-        # 计算完整token
+        # 读取增量维护的上下文token仪表
         tokens = web_terminal.context_manager.conversation_manager.calculate_conversation_tokens(
             conversation_id=conversation_id,
-            context_manager=web_terminal.context_manager,
-            focused_files=focused_files,
-            terminal_content=terminal_content
+            context_manager=web_terminal.context_manager
         )
         
         return jsonify({
@@ -2466,9 +2846,119 @@ def get_conversation_tokens(conversation_id):
             "error": str(e)
         }), 500
 
+@app.route('/api/conversations/<conversation_id>/timeline', methods=['GET'])
+def get_conversation_timeline(conversation_id):
+    """获取对话的任务时间线（已完成任务 + 正在运行的任务）"""
+    web_terminal = current_terminal()
+    if not web_terminal:
+        return jsonify({"error": "System not initialized"}), 503
+    
+    try:
+        context_manager = web_terminal.context_manager
+        timelines = context_manager.conversation_manager.get_task_timelines(conversation_id)
+        if timelines is None:
+            return jsonify({
+                "success": False,
+                "error": "Conversation not found",
+                "message": f"对话 {conversation_id} 不存在"
+            }), 404
+        
+        running = None
+        if context_manager.task_timeline and context_manager.current_conversation_id == conversation_id:
+            running = context_manager.task_timeline.to_dict()
+        
+        return jsonify({
+            "success": True,
+            "data": {
+                "conversation_id": conversation_id,
+                "timelines": timelines,
+                "running": running
+            }
+        })
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """获取追踪聚合指标（span次数与耗时），?reset=1 读取后清空"""
+    try:
+        metrics = tracing.get_metrics()
+        if task_scheduler:
+            metrics["scheduler"] = task_scheduler.stats()
+        metrics["llm_streams"] = llm_stream_limiter.stats()
+        metrics["search_cache"] = search_cache_stats()
+        metrics["extract_cache"] = extract_cache_stats()
+        metrics["startup"] = startup_profile.to_dict()
+        if MULTI_WORKER_ENABLED:
+            metrics["worker"] = {
+                "id": worker_id,
+                "event_bus": event_bus.stats() if event_bus else None,
+                "leases": conversation_leases.held() if conversation_leases else []
+            }
+        if request.args.get('reset') in ('1', 'true'):
+            tracing.tracer.reset()
+        
+        return jsonify({
+            "success": True,
+            "data": metrics
+        })
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+@app.route('/api/sessions', methods=['GET'])
+def get_sessions():
+    """获取会话注册表与任务调度状态"""
+    if session_registry is None:
+        return jsonify({"error": "System not initialized"}), 503
+    
+    try:
+        return jsonify({
+            "success": True,
+            "data": {
+                "client_id": get_client_id(),
+                "max_sessions": session_registry.max_sessions,
+                "sessions": session_registry.list_sessions(),
+                "scheduler": task_scheduler.stats()
+            }
+        })
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+def reap_idle_sessions():
+    """后台定期回收空闲会话"""
+    while True:
+        time.sleep(SESSION_REAP_INTERVAL)
+        if session_registry is None:
+            continue
+        try:
+            evicted = session_registry.evict_idle()
+            if evicted:
+                debug_log(f"回收空闲会话: {evicted}")
+        except Exception as e:
+            debug_log(f"回收空闲会话失败: {e}")
+        
+        # 续期本进程正在使用的对话租约，释放已关闭会话的租约
+        if conversation_leases:
+            try:
+                conflicts = conversation_leases.sync(session_registry.conversation_ids())
+                if conflicts:
+                    debug_log(f"对话租约被其他worker持有: {conflicts}")
+            except Exception as e:
+                debug_log(f"续期对话租约失败: {e}")
+
 def initialize_system(path: str, thinking_mode: bool = False):
     """初始化系统"""
-    global web_terminal, project_path
+    global session_registry, task_scheduler, project_path, default_thinking_mode
+    global event_bus, conversation_leases
     
     # 清空或创建调试日志
     with open(DEBUG_LOG_FILE, 'w', encoding='utf-8') as f:
@@ -2487,6 +2977,7 @@ def initialize_system(path: str, thinking_mode: bool = False):
     print(f"[Init] 调试日志: {DEBUG_LOG_FILE}")
     
     project_path = path
+    default_thinking_mode = thinking_mode
     
     try:
         from config import CONVERSATIONS_DIR
@@ -2494,32 +2985,67 @@ def initialize_system(path: str, thinking_mode: bool = False):
         conversations_dir.mkdir(parents=True, exist_ok=True)
         print(f"[Init] 对话存储目录: {conversations_dir}")
         
-        # 创建WebTerminal
-        web_terminal = WebTerminal(
-            project_path=path,
-            thinking_mode=thinking_mode,
-            message_callback=terminal_broadcast
+        # 启动常驻的Agent运行时（所有任务共享一个事件循环与连接池）
+        get_runtime()
+        print(f"[Init] Agent运行时已启动")
+        
+        # 每个客户端首次访问时创建独立的WebTerminal
+        task_scheduler = FairTaskScheduler()
+        session_registry = SessionRegistry(
+            factory=create_web_terminal,
+            busy_check=task_scheduler.is_busy
         )
+        start_background_task(reap_idle_sessions)
         
-        # 设置终端管理器的广播回调
-        if web_terminal.terminal_manager:
-            web_terminal.terminal_manager.broadcast = terminal_broadcast
-            print(f"[Init] 终端管理器已配置，支持{web_terminal.terminal_manager.max_terminals}个会话")
+        print(f"[Init] 会话注册表已创建，最多{session_registry.max_sessions}个会话，"
+              f"空闲{session_registry.idle_timeout}秒后回收，最多{task_scheduler.max_concurrent}个任务、"
+              f"{llm_stream_limiter.limit}个LLM流并发")
         
-        print(f"[Init] WebTerminal创建成功")
+        # 多worker：对话租约 + 跨进程事件总线
+        if MULTI_WORKER_ENABLED:
+            conversation_leases = ConversationLeases(worker_id)
+            event_bus = EventBus(worker_id, deliver_remote_event).start()
+            print(f"[Init] 多worker模式: {worker_id}，事件总线 {event_bus.path}")
     except Exception as e:
-        print(f"[Init] WebTerminal创建失败: {e}")
+        print(f"[Init] 会话注册表创建失败: {e}")
         import traceback
         traceback.print_exc()
         return
     
+    startup_profile.mark("ready")
+    print(f"[Init] 启动耗时: 导入 {startup_profile.marks['imports']}ms，就绪 {startup_profile.marks['ready']}ms")
+    if STARTUP_WARM_UP_ENABLED:
+        start_warm_up()
+    
     print(f"{OUTPUT_FORMATS['success']} Web系统初始化完成")
     print(f"{OUTPUT_FORMATS['info']} 项目路径: {path}")
     print(f"{OUTPUT_FORMATS['info']} 访问 http://localhost:8091 开始使用")
     print(f"{OUTPUT_FORMATS['info']} 访问 http://localhost:8091/terminal 查看终端")
     print(f"{OUTPUT_FORMATS['info']} 调试日志文件: {DEBUG_LOG_FILE}")
 
-def run_server(path: str, thinking_mode: bool = False, port: int = 8091):
-    """运行Web服务器"""
+def shutdown_multi_worker():
+    """释放本worker持有的对话租约并断开事件总线"""
+    if conversation_leases:
+        conversation_leases.release_all()
+    if event_bus:
+        event_bus.close()
+
+def run_server(path: str, thinking_mode: bool = False, port: int = 8091, mode: str = None):
+    """
+    运行Web服务器
+    
+    Args:
+        mode: threading（Flask-SocketIO，默认）或 asgi（uvicorn + 原生WebSocket），
+              未指定时使用配置 WEB_SERVER_MODE
+    """
+    mode = (mode or WEB_SERVER_MODE).lower()
+    if mode == "asgi":
+        from asgi_server import run_asgi_server
+        run_asgi_server(path, thinking_mode, port)
+        return
+    
     initialize_system(path, thinking_mode)
-    socketio.run(app, host='0.0.0.0', port=port, debug=False)
+    try:
+        socketio.run(app, host='0.0.0.0', port=port, debug=False)
+    finally:
+        shutdown_multi_worker()